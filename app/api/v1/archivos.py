@@ -2,12 +2,14 @@
 from __future__ import annotations
 from typing import List, Optional
 
-from fastapi import APIRouter, UploadFile, File, Depends, Query
-from fastapi.responses import Response, JSONResponse
+from fastapi import APIRouter, UploadFile, File, Depends, Query, Request
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
 from app.db.session import get_db
 from app.schemas.archivos import TipoArchivoDTO
+from app.services import download_service
 from app.services.archivo_adjunto_service import (
     ArchivoAdjuntoService,
     get_ext_permitidas_factura,
@@ -23,7 +25,7 @@ def ext_permitidas(db: Session = Depends(get_db)):
 
 
 @router.post("/facturas/division/{division_id}")
-def add_factura(
+async def add_factura(
     division_id: int,
     archivo: UploadFile = File(...),
     compraId: Optional[int] = Query(default=None),
@@ -32,10 +34,12 @@ def add_factura(
     """
     Sube una factura y devuelve múltiples alias de Id para compatibilidad con el front:
     - Id, id, newId, archivoId, facturaId
-    Además añade el header X-Archivo-Id.
+    Además añade los headers X-Archivo-Id y X-Content-SHA256.
+    El archivo se copia por bloques (corte temprano > 4 MB) fuera del event loop
+    y se deduplica por contenido (un solo archivo físico por SHA-256).
     """
-    new_id = svc.add_for_compra(db, division_id, compraId, archivo)
-    db.commit()
+    new_id, stored = await svc.add_for_compra_async(db, division_id, compraId, archivo)
+    await run_in_threadpool(db.commit)
 
     payload = {
         "success": True,
@@ -45,11 +49,14 @@ def add_factura(
         "archivoId": new_id,
         "facturaId": new_id,
     }
-    return JSONResponse(content=payload, headers={"X-Archivo-Id": str(new_id)})
+    return JSONResponse(
+        content=payload,
+        headers={"X-Archivo-Id": str(new_id), "X-Content-SHA256": stored.sha256},
+    )
 
 
 @router.put("/facturas/{archivo_id}/division/{division_id}")
-def replace_factura(
+async def replace_factura(
     archivo_id: int,
     division_id: int,
     archivo: UploadFile = File(...),
@@ -59,25 +66,30 @@ def replace_factura(
     Reemplaza el archivo físico de una factura existente.
     Mantiene el mismo Id, retorna success e incluye X-Archivo-Id.
     """
-    svc.replace(db, archivo_id, division_id, archivo)
-    db.commit()
+    stored = await svc.replace_async(db, archivo_id, division_id, archivo)
+    await run_in_threadpool(db.commit)
     return JSONResponse(
         content={"success": True, "Id": archivo_id, "id": archivo_id, "archivoId": archivo_id},
-        headers={"X-Archivo-Id": str(archivo_id)},
+        headers={"X-Archivo-Id": str(archivo_id), "X-Content-SHA256": stored.sha256},
     )
 
 
 @router.get("/facturas/{factura_id}")
-def download_factura(factura_id: int, db: Session = Depends(get_db)):
-    data, mime, nombre = svc.get_by_factura_id(db, factura_id)
+def download_factura(factura_id: int, request: Request, db: Session = Depends(get_db)):
+    """
+    Descarga con ETag (SHA-256 del blob), 304 condicionales y Range.
+    La URL es por Id (el archivo puede reemplazarse): se revalida, no es immutable.
+    """
+    path, mime, nombre, sha = svc.get_file_by_factura_id(db, factura_id)
 
     # filename “seguro” para header
     safe_name = nombre.replace('"', "").replace("\n", "").replace("\r", "")
-    return Response(
-        content=data,
+    return download_service.file_response(
+        request,
+        path,
+        filename=safe_name,
         media_type=mime,
-        headers={
-            "Content-Disposition": f'attachment; filename="{safe_name}"',
-            "X-Archivo-Id": str(factura_id),
-        },
+        sha256=sha,
+        headers={"X-Archivo-Id": str(factura_id)},
+        not_found_status=400,
     )
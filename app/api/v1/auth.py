@@ -4,8 +4,10 @@ from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 
 from app.dependencies.db import get_db             # 👈 usa el get_db que inyecta metadatos
-from app.schemas.auth import TokenResponse
-from app.services.auth_service import login_and_issue_token  # 👈 solo lo que existe
+from app.core import session_store
+from app.core.security import decode_token
+from app.schemas.auth import RefreshRequest, TokenResponse
+from app.services.auth_service import login_and_issue_token, refresh_access_token
 from app.db.models.audit import AuditLog
 
 router = APIRouter(prefix="/api/v1/auth", tags=["Auth"])
@@ -26,7 +28,12 @@ def login(
     form: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db),
 ):
-    token, user = login_and_issue_token(db, form.username, form.password)
+    meta = getattr(request.state, "audit_meta", {}) or {}
+    resp = login_and_issue_token(
+        db, form.username, form.password,
+        ip=meta.get("ip"), user_agent=meta.get("user_agent"),
+    )
+    user = resp.user
 
     db.info["actor"] = {"id": str(getattr(user, "id", None)), "username": getattr(user, "username", None)}
     meta = getattr(request.state, "audit_meta", {}) or {}
@@ -43,7 +50,20 @@ def login(
         request_id=meta.get("request_id"),
     ))
     db.commit()
-    return TokenResponse(access_token=token, user=user)
+    return resp
+
+@router.post("/refresh", response_model=TokenResponse)
+def refresh(
+    request: Request,
+    payload: RefreshRequest,
+    db: Session = Depends(get_db),
+):
+    """
+    Renueva el access token sin contraseña. El refresh token se rota:
+    el cliente debe reemplazarlo por el que viene en la respuesta.
+    """
+    meta = getattr(request.state, "audit_meta", {}) or {}
+    return refresh_access_token(db, payload.refresh_token, ip=meta.get("ip"))
 
 @router.post("/logout")
 def logout(
@@ -51,7 +71,15 @@ def logout(
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user_token),
 ):
-    # Si implementas revocación, hazla aquí con current_user.token
+    # Revoca la sesión (refresh token y access tokens con el mismo `sid`)
+    try:
+        claims = decode_token(current_user.token)
+    except Exception:
+        claims = {}
+    session_store.revoke(db, claims.get(session_store.CLAIM_SESSION))
+    current_user.id = claims.get("sub")
+    current_user.username = claims.get("username")
+
     db.info["actor"] = {
         "id": str(getattr(current_user, "id", None)),
         "username": getattr(current_user, "username", None),
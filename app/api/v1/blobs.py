@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+from typing import Annotated, Dict, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+
+from app.db.session import get_db
+from app.core.security import require_roles
+from app.schemas.auth import UserPublic
+from app.services.archivo_adjunto_service import FACTURAS_STORE
+from app.services.documento_service import DOCUMENTOS_STORE
+from app.utils import blob_store
+
+router = APIRouter(prefix="/api/v1/blobs", tags=["Archivos adjuntos"])
+DbDep = Annotated[Session, Depends(get_db)]
+
+_STORES = {s.name: s for s in (DOCUMENTOS_STORE, FACTURAS_STORE)}
+
+
+@router.post("/gc", summary="Borra archivos sin referencias del almacén por contenido (ADMINISTRADOR)")
+def collect_garbage(
+    db: DbDep,
+    _admin: Annotated[UserPublic, Depends(require_roles("ADMINISTRADOR"))],
+    store: Optional[str] = Query(None, description="documentos | facturas (vacío = todos)"),
+) -> Dict[str, int]:
+    if not blob_store.refcount_available(db):
+        raise HTTPException(status_code=409, detail="Conteo de referencias no disponible (falta dbo.FileBlobs)")
+    if store is not None and store not in _STORES:
+        raise HTTPException(status_code=400, detail=f"Store inválido: {store}")
+    targets = [_STORES[store]] if store else list(_STORES.values())
+    return {s.name: len(s.collect_garbage(db)) for s in targets}
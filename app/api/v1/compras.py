@@ -2,14 +2,15 @@
 from __future__ import annotations
 
 import logging
+from datetime import datetime
 from typing import Annotated, List, Union, Optional, Tuple, TypeAlias
 
-from fastapi import APIRouter, Depends, Query, Path, status, HTTPException
+from fastapi import APIRouter, Depends, File, Query, Path, status, HTTPException, UploadFile
 from fastapi.responses import JSONResponse
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
-from app.db.session import get_db
+from app.db.session import ReadDbDep, get_db
 from app.core.security import require_roles
 from app.schemas.auth import UserPublic
 from app.schemas.compra import (
@@ -23,10 +24,15 @@ from app.schemas.compra import (
     CompraFullDetalleDTO,
     CompraFullDTO,
     CompraMedidorItemFullDTO,
+    CompraLoteResult,
+    DistribuidoraImportResult,
+    CompraSolapesReport,
 )
 
 from app.services.unidad_scope import division_id_from_unidad
 from app.services.compra_service import CompraService
+from app.services import compra_bulk, compra_overlap, distribuidora_import
+from app.utils.id_params import parse_ids
 
 router = APIRouter(prefix="/api/v1/compras", tags=["Compras / Consumos"])
 svc = CompraService()
@@ -154,7 +160,7 @@ def _ensure_actor_can_access_division(db: Session, actor: UserPublic, division_i
     response_model=Union[CompraFullPage, CompraPage],
 )
 def list_compras(
-    db: DbDep,
+    db: ReadDbDep,
     u: ReadUserDep,
     q: str | None = Query(default=None, description="Busca en Observacion"),
     page: int = Query(1, ge=1),
@@ -264,6 +270,41 @@ def list_compras(
 # ==========================================================
 # DETALLE (LECTURA) -> GLOBAL (sin scope)
 # ==========================================================
+@router.get(
+    "/overlaps",
+    response_model=CompraSolapesReport,
+    summary="Compras con periodos de lectura solapados por NumeroCliente/Medidor en un servicio (global)",
+)
+def compras_overlaps(
+    db: ReadDbDep,
+    u: ReadUserDep,
+    servicio_id: int = Query(..., ge=1),
+    desde: Optional[str] = Query(default=None, description="YYYY-MM-DD (periodos que terminan después)"),
+    hasta: Optional[str] = Query(default=None, description="YYYY-MM-DD (periodos que empiezan antes)"),
+):
+    try:
+        d = datetime.strptime(desde[:10], "%Y-%m-%d") if desde else None
+        h = datetime.strptime(hasta[:10], "%Y-%m-%d") if hasta else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="desde/hasta deben ser YYYY-MM-DD")
+    return compra_overlap.report_servicio(db, servicio_id, desde=d, hasta=h)
+
+
+@router.get(
+    "/detalle",
+    response_model=List[CompraFullDetalleDTO],
+    summary="Detalle enriquecido de varias compras (?ids=1,2,3) en consultas fijas (global)",
+    response_model_exclude_none=True,
+)
+def get_compras_detalle(
+    db: ReadDbDep,
+    u: ReadUserDep,
+    ids: List[str] = Query(..., description="IDs de compras: ?ids=1,2,3 o ?ids=1&ids=2 (máx. 200)"),
+):
+    parsed = parse_ids(ids, 200)
+    return [CompraFullDetalleDTO(**x) for x in svc.get_full_many(db, parsed)]
+
+
 @router.get(
     "/{compra_id}",
     response_model=CompraFullDTO,
@@ -272,7 +313,7 @@ def list_compras(
 )
 def get_compra(
     compra_id: Annotated[int, Path(..., ge=1)],
-    db: DbDep,
+    db: ReadDbDep,
     u: ReadUserDep,
 ):
     c = svc.get(db, int(compra_id))
@@ -290,7 +331,7 @@ def get_compra(
 )
 def get_compra_detalle(
     compra_id: Annotated[int, Path(..., ge=1)],
-    db: DbDep,
+    db: ReadDbDep,
     u: ReadUserDep,
 ):
     data = svc.get_full(db, int(compra_id))
@@ -327,6 +368,86 @@ def create_compra(
     return dto
 
 
+def _actor_division_scope(db: Session, actor: UserPublic) -> Optional[set[int]]:
+    """
+    (ESCRITURAS EN LOTE) Divisiones permitidas al actor en una consulta.
+    None = sin restricción (ADMINISTRADOR).
+    """
+    if _is_admin(actor):
+        return None
+    if UsuarioDivision is None:
+        raise HTTPException(
+            status_code=403,
+            detail={
+                "code": "forbidden_scope",
+                "msg": "No se puede verificar alcance del gestor (UsuarioDivision no disponible).",
+            },
+        )
+    rows = db.execute(
+        select(UsuarioDivision.DivisionId).where(UsuarioDivision.UsuarioId == actor.id)
+    ).scalars().all()
+    return {int(x) for x in rows if x is not None}
+
+
+@router.post(
+    "/lote",
+    response_model=CompraLoteResult,
+    status_code=status.HTTP_201_CREATED,
+    summary="Ingesta masiva de compras con items (ADMINISTRADOR | GESTOR_*)",
+)
+def create_compras_lote(
+    payload: List[dict],
+    db: DbDep,
+    current_user: WriteUserDep,
+    parcial: bool = Query(
+        False,
+        description="false=si alguna fila falla no se crea ninguna; true=crea las válidas y reporta el resto",
+    ),
+):
+    if len(payload) > compra_bulk.COMPRA_BULK_MAX:
+        raise HTTPException(status_code=400, detail=f"Máximo {compra_bulk.COMPRA_BULK_MAX} compras por lote")
+    allowed = _actor_division_scope(db, current_user)
+    return compra_bulk.ingest(
+        db,
+        payload,
+        created_by=current_user.id,
+        allowed_division_ids=allowed,
+        parcial=parcial,
+    )
+
+
+@router.post(
+    "/importar/distribuidora/{empresa_id}",
+    response_model=DistribuidoraImportResult,
+    status_code=status.HTTP_201_CREATED,
+    summary="Importar estado de cuenta de una distribuidora (CSV/XLSX) como compras (ADMINISTRADOR | GESTOR_*)",
+)
+def importar_distribuidora(
+    db: DbDep,
+    current_user: WriteUserDep,
+    empresa_id: int = Path(..., ge=1),
+    archivo: UploadFile = File(...),
+    factura_id: int = Query(..., ge=1, description="Archivo de factura ya subido (dbo.ArchivoAdjuntos) al que se asocian las compras"),
+    unidad_medida_id: Optional[int] = Query(default=None, ge=1),
+    parcial: bool = Query(
+        False,
+        description="false=si alguna línea no empareja o falla no se crea ninguna; true=crea las emparejadas y reporta el resto",
+    ),
+):
+    allowed = _actor_division_scope(db, current_user)
+    return distribuidora_import.import_file(
+        db,
+        empresa_id,
+        archivo.filename or "",
+        archivo.file,
+        factura_id=factura_id,
+        created_by=current_user.id,
+        allowed_division_ids=allowed,
+        unidad_medida_id=unidad_medida_id,
+        parcial=parcial,
+    )
+
+
 @router.put(
     "/{compra_id}",
     response_model=CompraDTO,
@@ -2,21 +2,16 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 
 from app.db.session import get_db
-from app.db.models.comuna import Region, Comuna
 from app.schemas.comuna import ComunaDTO
+from app.services import territorio
 
 router = APIRouter(prefix="/api/v1/comunas", tags=["Comunas"])
 
 @router.get("/byRegionId/{id}", response_model=list[ComunaDTO])
 def get_by_region_id(id: int, db: Session = Depends(get_db)):
-    region = db.query(Region).filter(Region.Id == id).first()
-    if not region:
+    tree = territorio.get(db)
+    if tree.region(id) is None:
         raise HTTPException(status_code=404, detail="La región seleccionada no existe")
 
-    comunas = (
-        db.query(Comuna)
-        .filter(Comuna.RegionId == id)
-        .order_by(Comuna.Nombre)
-        .all()
-    )
-    return comunas
+    # ordenadas por Nombre
+    return list(tree.comunas_of_region(id))
@@ -15,7 +15,7 @@ from fastapi import (
 from sqlalchemy.orm import Session
 
 from app.core.security import require_roles
-from app.db.session import get_db
+from app.db.session import ReadDbDep, get_db
 from app.schemas.auth import UserPublic
 from app.schemas.division import (
     DivisionBusquedaEspecificaPage,
@@ -80,7 +80,7 @@ def _enforce_self_or_admin(user: UserPublic, path_user_id: str) -> None:
 # ------------------------------------------------------------
 @router.get("", response_model=DivisionPage, summary="Listado paginado")
 def list_divisiones(
-    db: DbDep,
+    db: ReadDbDep,
     q: Optional[str] = Query(None, description="Busca en Dirección o Nombre"),
     page: int = Query(1, ge=1),
     page_size: int = Query(15, ge=1, le=500),
@@ -127,7 +127,7 @@ def create_division_full(
 
 @router.get("/select", response_model=List[DivisionSelectDTO], summary="(picker) Id/Dirección")
 def select_divisiones(
-    db: DbDep,
+    db: ReadDbDep,
     q: Optional[str] = Query(None),
     ServicioId: Optional[int] = Query(None),
     RegionId: Optional[int] = Query(None),
@@ -142,7 +142,7 @@ def select_divisiones(
     summary="Búsqueda específica paginada",
 )
 def list_divisiones_busqueda_especifica(
-    db: DbDep,
+    db: ReadDbDep,
     q: Optional[str] = Query(None),
     ServicioId: Optional[int] = Query(None),
     RegionId: Optional[int] = Query(None),
@@ -160,14 +160,14 @@ def list_divisiones_busqueda_especifica(
 
 
 @router.get("/{division_id}", response_model=DivisionDTO, summary="Detalle")
-def get_division(division_id: Annotated[int, Path(..., ge=1)], db: DbDep):
+def get_division(division_id: Annotated[int, Path(..., ge=1)], db: ReadDbDep):
     return svc.get(db, division_id)
 
 
 @router.get("/servicio/{servicio_id}", response_model=List[DivisionListDTO], summary="Por servicio")
 def get_divisiones_by_servicio(
     servicio_id: Annotated[int, Path(..., ge=1)],
-    db: DbDep,
+    db: ReadDbDep,
     searchText: Optional[str] = Query(None),
 ):
     return svc.by_servicio(db, servicio_id, searchText)
@@ -176,7 +176,7 @@ def get_divisiones_by_servicio(
 @router.get("/edificio/{edificio_id}", response_model=List[DivisionListDTO], summary="Por edificio")
 def get_divisiones_by_edificio(
     edificio_id: Annotated[int, Path(..., ge=1)],
-    db: DbDep,
+    db: ReadDbDep,
 ):
     return svc.by_edificio(db, edificio_id)
 
@@ -184,7 +184,7 @@ def get_divisiones_by_edificio(
 @router.get("/region/{region_id}", response_model=List[DivisionListDTO], summary="Por región")
 def get_divisiones_by_region(
     region_id: Annotated[int, Path(..., ge=1)],
-    db: DbDep,
+    db: ReadDbDep,
 ):
     return svc.by_region(db, region_id)
 
@@ -199,7 +199,7 @@ def get_divisiones_by_region(
 )
 def get_divisiones_by_user(
     user_id: Annotated[str, Path(...)],
-    db: DbDep,
+    db: ReadDbDep,
     auth_user: Annotated[
         UserPublic,
         Depends(
@@ -220,7 +220,7 @@ def get_divisiones_by_user(
 # Observaciones / flags / años
 # ------------------------------------------------------------
 @router.get("/observacion-papel/{division_id}", response_model=ObservacionDTO)
-def get_obs_papel(division_id: Annotated[int, Path(..., ge=1)], db: DbDep):
+def get_obs_papel(division_id: Annotated[int, Path(..., ge=1)], db: ReadDbDep):
     return svc.get_observacion_papel(db, division_id)
 
 
@@ -235,7 +235,7 @@ def put_obs_papel(
 
 
 @router.get("/observacion-residuos/{division_id}", response_model=ObservacionDTO)
-def get_obs_residuos(division_id: Annotated[int, Path(..., ge=1)], db: DbDep):
+def get_obs_residuos(division_id: Annotated[int, Path(..., ge=1)], db: ReadDbDep):
     return svc.get_observacion_residuos(db, division_id)
 
 
@@ -250,7 +250,7 @@ def put_obs_residuos(
 
 
 @router.get("/reporta-residuos/{division_id}", response_model=ReportaResiduosDTO)
-def get_rep_residuos(division_id: Annotated[int, Path(..., ge=1)], db: DbDep):
+def get_rep_residuos(division_id: Annotated[int, Path(..., ge=1)], db: ReadDbDep):
     return svc.get_reporta_residuos(db, division_id)
 
 
@@ -267,7 +267,7 @@ def put_rep_residuos(
 @router.get("/inexistencia-eyv/{division_id}", response_model=ObservacionInexistenciaDTO)
 def get_inexistencia_eyv(
     division_id: Annotated[int, Path(..., ge=1)],
-    db: DbDep,
+    db: ReadDbDep,
 ):
     return svc.get_inexistencia_eyv(db, division_id)
 
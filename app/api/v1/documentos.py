@@ -4,26 +4,20 @@ import os
 from fastapi import APIRouter, Depends, HTTPException, status, Response, Query, Path, Request
 from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func
 
 from app.db.session import get_db
 from app.core.security import require_roles
 from app.schemas.auth import UserPublic
 from app.schemas.documentos import (
-    DocumentoResponse,
+    DocumentoResponse, DocumentoDashboardResponse, DocumentoCategoriaResumen,
     DocumentoBaseIn, ActaDTO, ReunionDTO, ListaIntegrantesDTO, PoliticaDTO, DifusionDTO,
     ProcedimientoPapelDTO, ProcReutilizacionPapelDTO, ProcedimientoResiduoDTO,
     ProcedimientoResiduoSistemaDTO, ProcedimientoBajaBienesDTO, ProcedimientoCompraSustentableDTO,
     CharlasDTO, ListadoColaboradorDTO, CapacitadosMPDTO, GestionCompraSustentableDTO,
     PacE3DTO, ResolucionApruebaPlanDTO, InformeDADTO,
 )
-from app.db.models.servicio import Servicio
-from app.services.documento_service import DocumentoService, CONSTANTS, save_file_from_base64, UPLOAD_DIR
-from app.db.models.documento import Documento
-
-from fastapi.responses import FileResponse
-from app.core.config import settings
-import os
+from app.services.documento_service import DocumentoService, save_file_from_base64, resolve_file_path, DOCUMENTOS_STORE
+from app.services import documento_listing, download_service
 
 
 
@@ -44,38 +38,33 @@ def _paginate_headers(response: Response, total: int, page: int, page_size: int)
     response.headers["X-Total-Pages"] = str(total_pages)
 
 def _inject_servicio_flags(db: Session, resp: DocumentoResponse, servicio_id: int) -> DocumentoResponse:
-    srv = db.query(Servicio).filter(Servicio.Id == servicio_id).first()
-    if not srv:
+    flags = documento_listing.servicio_flags(db, servicio_id)
+    if not flags:
         return resp
-    resp.NoRegistraPoliticaAmbiental = srv.NoRegistraPoliticaAmbiental
-    resp.NoRegistraDifusionInterna   = srv.NoRegistraDifusionInterna
-    resp.NoRegistraActividadInterna  = srv.NoRegistraActividadInterna
-    resp.NoRegistraReutilizacionPapel = srv.NoRegistraReutilizacionPapel
-    resp.NoRegistraProcFormalPapel    = srv.NoRegistraProcFormalPapel
-    resp.NoRegistraDocResiduosCertificados = srv.NoRegistraDocResiduosCertificados
-    resp.NoRegistraDocResiduosSistemas     = srv.NoRegistraDocResiduosSistemas
-    resp.NoRegistraProcBajaBienesMuebles   = srv.NoRegistraProcBajaBienesMuebles
-    resp.NoRegistraProcComprasSustentables = srv.NoRegistraProcComprasSustentables
+    for name, value in flags.items():
+        setattr(resp, name, value)
     return resp
 
+def _listar(response: Response, db: Session, categoria: str, servicio_id: int,
+            etapa: int | None, anio: int, page: int, page_size: int) -> List[dict]:
+    """Página + total en una consulta (documento_listing) y headers X-Total-*."""
+    pg = documento_listing.list_categoria(db, categoria, servicio_id, etapa, anio, page, page_size)
+    _paginate_headers(response, pg.total, page, page_size)
+    return pg.items
+
 # ------------------ DESCARGA de archivos ------------------
-@router.get("/file/{filename}", response_class=FileResponse, summary="Descarga de adjunto")
-def download_file(filename: str):
-    path = os.path.join(UPLOAD_DIR, filename)
-    if not os.path.isfile(path):
-        raise HTTPException(status_code=404, detail="Archivo no encontrado")
-    return FileResponse(path, filename=filename)
-
-@router.get("/file/{filename}", summary="Descarga un archivo adjunto por nombre")
-def download_file(filename: str):
-    # Evita path traversal
+@router.get("/file/{filename}", response_class=FileResponse, summary="Descarga un archivo adjunto por nombre")
+def download_file(filename: str, request: Request):
+    # basename evita path traversal; los nombres '<sha256>.ext' son inmutables
     safe_name = os.path.basename(filename)
-    base_dir = settings.FILES_DIR or "/tmp/gesp_documentos"
-    full = os.path.join(base_dir, safe_name)
-    if not os.path.isfile(full):
-        from fastapi import HTTPException, status
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Archivo no encontrado")
-    return FileResponse(full, filename=safe_name)
+    sha = DOCUMENTOS_STORE.sha_of(safe_name)
+    return download_service.file_response(
+        request,
+        resolve_file_path(safe_name),
+        filename=safe_name,
+        sha256=sha,
+        immutable=sha is not None,
+    )
 
 # ------------------ LISTADOS (varios tipos) ------------------
 
@@ -89,13 +78,8 @@ def get_actas_comite(
     page: int = Query(1, ge=1),
     page_size: int = Query(50, ge=1, le=200),
 ):
-    q = DocumentoService(db).q_by_servicio_tipo(ServicioId, CONSTANTS["TIPO_DOCUMENTO_ACTA"], Etapa)
-    if AnioDoc > 0:
-        q = q.filter(func.extract("year", Documento.CreatedAt) == AnioDoc)
-    total = q.count()
-    items = q.order_by(Documento.CreatedAt.desc()).offset((page-1)*page_size).limit(page_size).all()
-    _paginate_headers(response, total, page, page_size)
-    resp = DocumentoResponse(Ok=True, Actas=[{"Id": d.Id, "Fecha": d.Fecha, "AdjuntoNombre": d.AdjuntoNombre} for d in items])
+    items = _listar(response, db, "comite", ServicioId, Etapa, AnioDoc, page, page_size)
+    resp = DocumentoResponse(Ok=True, Actas=items)
     return _inject_servicio_flags(db, resp, ServicioId)
 
 @router.get("/politica", response_model=DocumentoResponse, summary="Políticas (paginado)")
@@ -108,13 +92,8 @@ def get_politicas(
     page: int = Query(1, ge=1),
     page_size: int = Query(50, ge=1, le=200),
 ):
-    q = DocumentoService(db).q_by_servicio_tipo(ServicioId, CONSTANTS["TIPO_DOCUMENTO_POLITICA"], Etapa)
-    if AnioDoc > 0:
-        q = q.filter(func.extract("year", Documento.CreatedAt) == AnioDoc)
-    total = q.count()
-    items = q.order_by(Documento.CreatedAt.desc()).offset((page-1)*page_size).limit(page_size).all()
-    _paginate_headers(response, total, page, page_size)
-    resp = DocumentoResponse(Ok=True, Politicas=[{"Id": d.Id, "Fecha": d.Fecha, "AdjuntoNombre": d.AdjuntoNombre} for d in items])
+    items = _listar(response, db, "politica", ServicioId, Etapa, AnioDoc, page, page_size)
+    resp = DocumentoResponse(Ok=True, Politicas=items)
     return _inject_servicio_flags(db, resp, ServicioId)
 
 @router.get("/difusiones", response_model=DocumentoResponse, summary="Difusiones (paginado)")
@@ -127,13 +106,8 @@ def get_difusiones(
     page: int = Query(1, ge=1),
     page_size: int = Query(50, ge=1, le=200),
 ):
-    q = DocumentoService(db).q_by_servicio_tipo(ServicioId, CONSTANTS["TIPO_DOCUMENTO_DIFUSION"], Etapa)
-    if AnioDoc > 0:
-        q = q.filter(func.extract("year", Documento.CreatedAt) == AnioDoc)
-    total = q.count()
-    items = q.order_by(Documento.CreatedAt.desc()).offset((page-1)*page_size).limit(page_size).all()
-    _paginate_headers(response, total, page, page_size)
-    resp = DocumentoResponse(Ok=True, Difusiones=[{"Id": d.Id, "Fecha": d.Fecha, "Cobertura": d.Cobertura} for d in items])
+    items = _listar(response, db, "difusiones", ServicioId, Etapa, AnioDoc, page, page_size)
+    resp = DocumentoResponse(Ok=True, Difusiones=items)
     return _inject_servicio_flags(db, resp, ServicioId)
 
 @router.get("/procedimientos", response_model=DocumentoResponse, summary="Procedimientos (todos, paginado)")
@@ -145,24 +119,8 @@ def get_procedimientos(
     page: int = Query(1, ge=1),
     page_size: int = Query(50, ge=1, le=200),
 ):
-    tipos = [
-        CONSTANTS["TIPO_DOCUMENTO_PROCEDIMIENTO_PAPEL"],
-        CONSTANTS["TIPO_DOCUMENTO_PROCEDIMIENTO_RESIDUO"],
-        CONSTANTS["TIPO_DOCUMENTO_PROCEDIMIENTO_RESIDUO_SISTEMA"],
-        CONSTANTS["TIPO_DOCUMENTO_PROCEDIMIENTO_BAJA_BIENES"],
-        CONSTANTS["TIPO_DOCUMENTO_PROCEDIMIENTO_COMPRA_SUSTENTABLE"],
-        CONSTANTS["TIPO_DOCUMENTO_PROC_REUTILIZACION_PAPEL"],
-    ]
-    q = db.query(Documento).filter(Documento.Active == True, Documento.ServicioId == ServicioId, Documento.TipoDocumentoId.in_(tipos))
-    if AnioDoc > 0:
-        q = q.filter(func.extract("year", Documento.CreatedAt) == AnioDoc)
-    total = q.count()
-    items = q.order_by(Documento.CreatedAt.desc()).offset((page-1)*page_size).limit(page_size).all()
-    _paginate_headers(response, total, page, page_size)
-    resp = DocumentoResponse(
-        Ok=True,
-        Procedimientos=[{"Id": d.Id, "Tipo": d.TipoDocumentoId, "Fecha": d.Fecha, "AdjuntoNombre": d.AdjuntoNombre} for d in items]
-    )
+    items = _listar(response, db, "procedimientos", ServicioId, None, AnioDoc, page, page_size)
+    resp = DocumentoResponse(Ok=True, Procedimientos=items)
     return _inject_servicio_flags(db, resp, ServicioId)
 
 @router.get("/charlas", response_model=DocumentoResponse, summary="Charlas (paginado)")
@@ -175,13 +133,8 @@ def get_charlas(
     page: int = Query(1, ge=1),
     page_size: int = Query(50, ge=1, le=200),
 ):
-    q = DocumentoService(db).q_by_servicio_tipo(ServicioId, CONSTANTS["TIPO_DOCUMENTO_CHARLA"], Etapa)
-    if AnioDoc > 0:
-        q = q.filter(func.extract("year", Documento.CreatedAt) == AnioDoc)
-    total = q.count()
-    items = q.order_by(Documento.CreatedAt.desc()).offset((page-1)*page_size).limit(page_size).all()
-    _paginate_headers(response, total, page, page_size)
-    resp = DocumentoResponse(Ok=True, Charlas=[{"Id": d.Id, "NParticipantes": getattr(d, "NParticipantes", 0)} for d in items])
+    items = _listar(response, db, "charlas", ServicioId, Etapa, AnioDoc, page, page_size)
+    resp = DocumentoResponse(Ok=True, Charlas=items)
     return _inject_servicio_flags(db, resp, ServicioId)
 
 @router.get("/listado-colaboradores", response_model=DocumentoResponse, summary="Listado colaboradores (paginado)")
@@ -193,16 +146,8 @@ def get_listado_colaboradores(
     page: int = Query(1, ge=1),
     page_size: int = Query(50, ge=1, le=200),
 ):
-    q = DocumentoService(db).q_by_servicio_tipo(ServicioId, CONSTANTS["TIPO_DOCUMENTO_LISTADO_COLABORADORES"])
-    if AnioDoc > 0:
-        q = q.filter(func.extract("year", Documento.CreatedAt) == AnioDoc)
-    total = q.count()
-    items = q.order_by(Documento.CreatedAt.desc()).offset((page-1)*page_size).limit(page_size).all()
-    _paginate_headers(response, total, page, page_size)
-    resp = DocumentoResponse(
-        Ok=True,
-        CapacitadosMP=[{"Id": d.Id, "TotalColaboradoresConcientizados": d.TotalColaboradoresConcientizados, "TotalColaboradoresCapacitados": d.TotalColaboradoresCapacitados} for d in items]
-    )
+    items = _listar(response, db, "listado-colaboradores", ServicioId, None, AnioDoc, page, page_size)
+    resp = DocumentoResponse(Ok=True, CapacitadosMP=items)
     return _inject_servicio_flags(db, resp, ServicioId)
 
 @router.get("/capacitados-mp", response_model=DocumentoResponse, summary="Capacitados MP (paginado)")
@@ -213,13 +158,8 @@ def get_capacitados_mp(
     page: int = Query(1, ge=1),
     page_size: int = Query(50, ge=1, le=200),
 ):
-    q = DocumentoService(db).q_by_servicio_tipo(ServicioId, CONSTANTS["TIPO_DOCUMENTO_CAPACITADOS_MP"])
-    if AnioDoc > 0:
-        q = q.filter(func.extract("year", Documento.CreatedAt) == AnioDoc)
-    total = q.count()
-    items = q.order_by(Documento.CreatedAt.desc()).offset((page-1)*page_size).limit(page_size).all()
-    _paginate_headers(response, total, page, page_size)
-    resp = DocumentoResponse(Ok=True, CapacitadosMP=[{"Id": d.Id, "TotalColaboradoresCapacitados": d.TotalColaboradoresCapacitados} for d in items])
+    items = _listar(response, db, "capacitados-mp", ServicioId, None, AnioDoc, page, page_size)
+    resp = DocumentoResponse(Ok=True, CapacitadosMP=items)
     return _inject_servicio_flags(db, resp, ServicioId)
 
 @router.get("/gestion-compra-sustentable", response_model=DocumentoResponse, summary="Gestión de compras sustentables (paginado)")
@@ -230,13 +170,8 @@ def get_gestion_compra_sustentable(
     page: int = Query(1, ge=1),
     page_size: int = Query(50, ge=1, le=200),
 ):
-    q = DocumentoService(db).q_by_servicio_tipo(ServicioId, CONSTANTS["TIPO_DOCUMENTO_GESTION_COMPRA_SUSTENTABLE"])
-    if AnioDoc > 0:
-        q = q.filter(func.extract("year", Documento.CreatedAt) == AnioDoc)
-    total = q.count()
-    items = q.order_by(Documento.CreatedAt.desc()).offset((page-1)*page_size).limit(page_size).all()
-    _paginate_headers(response, total, page, page_size)
-    resp = DocumentoResponse(Ok=True, CompraSustentables=[{"Id": d.Id, "NComprasRubros": d.NComprasRubros if hasattr(d, "NComprasRubros") else None} for d in items])
+    items = _listar(response, db, "gestion-compra-sustentable", ServicioId, None, AnioDoc, page, page_size)
+    resp = DocumentoResponse(Ok=True, CompraSustentables=items)
     return _inject_servicio_flags(db, resp, ServicioId)
 
 @router.get("/pac-e3", response_model=DocumentoResponse, summary="PAC E3 (paginado)")
@@ -247,13 +182,8 @@ def get_pac_e3(
     page: int = Query(1, ge=1),
     page_size: int = Query(50, ge=1, le=200),
 ):
-    q = DocumentoService(db).q_by_servicio_tipo(ServicioId, CONSTANTS["TIPO_DOCUMENTO_PAC_E3"])
-    if AnioDoc > 0:
-        q = q.filter(func.extract("year", Documento.CreatedAt) == AnioDoc)
-    total = q.count()
-    items = q.order_by(Documento.CreatedAt.desc()).offset((page-1)*page_size).limit(page_size).all()
-    _paginate_headers(response, total, page, page_size)
-    resp = DocumentoResponse(Ok=True, PacE3s=[{"Id": d.Id, "Fecha": d.Fecha} for d in items])
+    items = _listar(response, db, "pac-e3", ServicioId, None, AnioDoc, page, page_size)
+    resp = DocumentoResponse(Ok=True, PacE3s=items)
     return _inject_servicio_flags(db, resp, ServicioId)
 
 @router.get("/informes-da", response_model=DocumentoResponse, summary="Informes DA (paginado)")
@@ -264,13 +194,8 @@ def get_informes_da(
     page: int = Query(1, ge=1),
     page_size: int = Query(50, ge=1, le=200),
 ):
-    q = DocumentoService(db).q_by_servicio_tipo(ServicioId, CONSTANTS["TIPO_DOCUMENTO_INFORME_DA"])
-    if AnioDoc > 0:
-        q = q.filter(func.extract("year", Documento.CreatedAt) == AnioDoc)
-    total = q.count()
-    items = q.order_by(Documento.CreatedAt.desc()).offset((page-1)*page_size).limit(page_size).all()
-    _paginate_headers(response, total, page, page_size)
-    resp = DocumentoResponse(Ok=True, InformeDA=[{"Id": d.Id, "Fecha": d.Fecha} for d in items])
+    items = _listar(response, db, "informes-da", ServicioId, None, AnioDoc, page, page_size)
+    resp = DocumentoResponse(Ok=True, InformeDA=items)
     return _inject_servicio_flags(db, resp, ServicioId)
 
 @router.get("/resoluciones", response_model=DocumentoResponse, summary="Resoluciones aprueba plan (paginado)")
@@ -281,15 +206,29 @@ def get_resoluciones(
     page: int = Query(1, ge=1),
     page_size: int = Query(50, ge=1, le=200),
 ):
-    q = DocumentoService(db).q_by_servicio_tipo(ServicioId, CONSTANTS["TIPO_DOCUMENTO_RESOLUCION_APRUEBA_PLAN"])
-    if AnioDoc > 0:
-        q = q.filter(func.extract("year", Documento.CreatedAt) == AnioDoc)
-    total = q.count()
-    items = q.order_by(Documento.CreatedAt.desc()).offset((page-1)*page_size).limit(page_size).all()
-    _paginate_headers(response, total, page, page_size)
-    resp = DocumentoResponse(Ok=True, ResolucionApruebaPlanDTO=[{"Id": d.Id, "Nresolucion": d.Nresolucion, "Fecha": d.Fecha} for d in items])
+    items = _listar(response, db, "resoluciones", ServicioId, None, AnioDoc, page, page_size)
+    resp = DocumentoResponse(Ok=True, ResolucionApruebaPlanDTO=items)
     return _inject_servicio_flags(db, resp, ServicioId)
 
+@router.get("/dashboard", response_model=DocumentoDashboardResponse, summary="Tablero documental: totales y últimos N por categoría")
+def get_dashboard(
+    db: DbDep,
+    ServicioId: int = Query(..., ge=1),
+    Etapa: int | None = Query(default=None),
+    AnioDoc: int = Query(default=0, ge=0),
+    top: int = Query(5, ge=1, le=50, description="Últimos N documentos por categoría"),
+):
+    cats = documento_listing.dashboard(db, ServicioId, Etapa, AnioDoc, top)
+    resp = DocumentoDashboardResponse(
+        Ok=True,
+        ServicioId=ServicioId,
+        Etapa=Etapa,
+        Categorias={k: DocumentoCategoriaResumen(Total=pg.total, Items=pg.items) for k, pg in cats.items()},
+    )
+    for name, value in (documento_listing.servicio_flags(db, ServicioId) or {}).items():
+        setattr(resp, name, value)
+    return resp
+
 @router.get("/{id}", response_model=DocumentoResponse, summary="Detalle documento por Id")
 def get_documento_by_id(id: Annotated[int, Path(ge=1)], db: DbDep):
     obj = DocumentoService(db)._get(id)
@@ -8,7 +8,7 @@ from fastapi import APIRouter, Depends, Query, Path, status, Response, HTTPExcep
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
-from app.db.session import get_db
+from app.db.session import ReadDbDep, get_db
 from app.core.security import require_roles
 from app.schemas.auth import UserPublic
 from app.schemas.edificio import (
@@ -17,6 +17,7 @@ from app.schemas.edificio import (
     EdificioSelectDTO,
     EdificioCreate,
     EdificioUpdate,
+    EdificioLoteResult,
 )
 from app.services.edificio_service import EdificioService
 from app.db.models.edificio import Edificio  # ✅ para join a comuna en create scope (si aplica)
@@ -192,7 +193,7 @@ def _ensure_actor_can_create_edificio(db: Session, actor: UserPublic, comuna_id:
 )
 def list_edificios(
     response: Response,
-    db: DbDep,
+    db: ReadDbDep,
     u: ReadUserDep,
     q: str | None = Query(default=None),
     page: int = Query(1, ge=1),
@@ -243,7 +244,7 @@ def list_edificios(
     summary="Select (Id, Nombre) solo activos",
 )
 def select_edificios(
-    db: DbDep,
+    db: ReadDbDep,
     u: ReadUserDep,
     q: str | None = Query(default=None),
     ComunaId: int | None = Query(default=None),
@@ -278,7 +279,7 @@ def select_edificios(
 )
 def get_edificio(
     id: Annotated[int, Path(..., ge=1)],
-    db: DbDep,
+    db: ReadDbDep,
     u: ReadUserDep,
 ):
     _ensure_actor_can_access_edificio(db, u, int(id))
@@ -309,6 +310,34 @@ def create_edificio(
     return obj
 
 
+@router.post(
+    "/lote",
+    response_model=EdificioLoteResult,
+    status_code=status.HTTP_201_CREATED,
+    summary="Crear edificios en lote validando direcciones duplicadas en una sola consulta",
+)
+def create_edificios_lote(
+    payload: List[EdificioCreate],
+    db: DbDep,
+    current_user: WriteUserDep,
+    parcial: bool = Query(
+        False,
+        description="false=si hay conflictos no se crea ninguno (409); true=crea los que no tienen conflicto",
+    ),
+):
+    if len(payload) > 2000:
+        raise HTTPException(status_code=400, detail="Máximo 2000 edificios por lote")
+    for comuna_id in sorted({p.ComunaId for p in payload}, key=lambda c: (c is None, c or 0)):
+        _ensure_actor_can_create_edificio(db, current_user, comuna_id)
+
+    return svc.create_many(
+        db,
+        [p.model_dump(exclude_unset=True) for p in payload],
+        created_by=current_user.id,
+        parcial=parcial,
+    )
+
+
 @router.put(
     "/{id}",
     response_model=EdificioDTO,
@@ -7,7 +7,7 @@ from typing import Annotated, List, Tuple
 from fastapi import APIRouter, Depends, HTTPException, status, Response, Query, Path
 from sqlalchemy.orm import Session
 
-from app.db.session import get_db
+from app.db.session import ReadDbDep, get_db
 from app.core.security import require_roles
 from app.schemas.auth import UserPublic
 
@@ -74,7 +74,7 @@ ToggleUserDep = Annotated[UserPublic, Depends(require_roles(*INMUEBLES_TOGGLE_RO
 # ─────────────────────────────────────────────
 @router.get("", response_model=InmueblePage)
 def listar_inmuebles(
-    db: DbDep,
+    db: ReadDbDep,
     u: ReadUserDep,
     page: Annotated[int, Query(ge=1)] = 1,
     page_size: Annotated[int, Query(ge=1, le=200)] = 50,
@@ -144,7 +144,7 @@ def listar_inmuebles(
 )
 def obtener_inmueble(
     inmueble_id: Annotated[int, Path(ge=1)],
-    db: DbDep,
+    db: ReadDbDep,
     u: ReadUserDep,
 ):
     # 🔒 inmueble == Division => scope por división
@@ -190,7 +190,7 @@ def inmuebles_por_direccion(
 )
 def obtener_direccion_inmueble(
     inmueble_id: Annotated[int, Path(ge=1)],
-    db: DbDep,
+    db: ReadDbDep,
     u: ReadUserDep,
 ):
     ensure_actor_can_edit_division(db, u, int(inmueble_id))
@@ -209,7 +209,7 @@ def obtener_direccion_inmueble(
 )
 def listar_unidades_de_inmueble(
     inmueble_id: Annotated[int, Path(ge=1)],
-    db: DbDep,
+    db: ReadDbDep,
     u: ReadUserDep,
 ):
     # ✅ seguridad por división (scoped por servicio)
@@ -232,7 +232,7 @@ def listar_unidades_de_inmueble(
 )
 def get_inmueble_por_unidad(
     unidad_id: Annotated[int, Path(ge=1)],
-    db: DbDep,
+    db: ReadDbDep,
     u: ReadUserDep,
 ):
     svc = InmuebleService(db)
@@ -259,7 +259,7 @@ def get_inmueble_por_unidad(
 )
 def list_inmuebles_por_unidad(
     unidad_id: Annotated[int, Path(ge=1)],
-    db: DbDep,
+    db: ReadDbDep,
     u: ReadUserDep,
 ):
     svc = InmuebleService(db)
@@ -257,6 +257,8 @@ def list_medidores(
     servicio_id: int | None = Query(default=None),
     active: bool | None = Query(default=None),
     medidor_id: int | None = Query(default=None, ge=1),
+    after_id: int | None = Query(default=None, ge=0, description="Keyset: next_after_id de la página anterior (ignora page)"),
+    count: str = Query(default="exact", pattern="^(exact|estimate|none)$", description="exact | estimate | none"),
 ):
     """
     🔓 LISTADO GLOBAL
@@ -277,6 +279,8 @@ def list_medidores(
         servicio_id=servicio_id,
         active=active,
         medidor_id=medidor_id,
+        after_id=after_id,
+        count=count,
     )
 
 
@@ -54,19 +54,16 @@ def crear(
         raise HTTPException(status_code=409, detail="Ya existe un medidor inteligente con ese ChileMedidoId")
 
     obj = svc.create(db, payload.ChileMedidoId, created_by=current_user.id)
+    med_int_id = obj["Id"]
 
-    # Si vienen vínculos en el payload, los aplicamos
-    if payload.DivisionIds is not None:
-        svc.set_divisiones(db, obj.Id, payload.DivisionIds)
-    if payload.EdificioIds is not None:
-        svc.set_edificios(db, obj.Id, payload.EdificioIds)
-    if payload.ServicioIds is not None:
-        svc.set_servicios(db, obj.Id, payload.ServicioIds)
+    # Si vienen vínculos en el payload, los aplicamos (cada set_* retorna lo insertado)
+    divs = svc.set_divisiones(db, med_int_id, payload.DivisionIds) if payload.DivisionIds is not None else []
+    edis = svc.set_edificios(db, med_int_id, payload.EdificioIds) if payload.EdificioIds is not None else []
+    srvs = svc.set_servicios(db, med_int_id, payload.ServicioIds) if payload.ServicioIds is not None else []
 
-    divs, edis, srvs = svc.get_detail_ids(db, obj.Id)
     return MedidorInteligenteDTO(
-        Id=obj.Id,
-        ChileMedidoId=obj.ChileMedidoId,
+        Id=med_int_id,
+        ChileMedidoId=obj["ChileMedidoId"],
         DivisionIds=divs,
         EdificioIds=edis,
         ServicioIds=srvs,
@@ -85,36 +82,35 @@ def actualizar(
     db: DbDep,
     current_user: Annotated[UserPublic, Depends(require_roles("ADMINISTRADOR"))],
 ):
-    obj = svc.get(db, med_int_id)
-
     # Si llega un ChileMedidoId, validar que no esté usado por otro
     if payload.ChileMedidoId is not None:
         other = svc.find_by_chilemedido(db, payload.ChileMedidoId)
         if other and other.Id != med_int_id:
             raise HTTPException(status_code=409, detail="ChileMedidoId ya está asignado a otro medidor")
-        obj = svc.update_chilemedido(db, med_int_id, payload.ChileMedidoId, modified_by=current_user.id)
 
-    # Active directo si viene
-    if payload.Active is not None:
-        obj.Active = payload.Active
-        obj.Version = (obj.Version or 0) + 1
-        obj.UpdatedAt = __import__("datetime").datetime.utcnow()
-        obj.ModifiedBy = current_user.id
-        db.commit()
-        db.refresh(obj)
+    # ChileMedidoId/Active en un solo UPDATE ... OUTPUT (404 si no existe)
+    if payload.ChileMedidoId is not None or payload.Active is not None:
+        obj = svc.update(
+            db, med_int_id, current_user.id,
+            chilemedido_id=payload.ChileMedidoId,
+            active=payload.Active,
+        )
+        chilemedido_id = obj["ChileMedidoId"]
+    else:
+        chilemedido_id = svc.get(db, med_int_id).ChileMedidoId
 
     # Reemplazo de vínculos si el cliente los pasa (incluso lista vacía)
     if payload.DivisionIds is not None:
-        svc.set_divisiones(db, obj.Id, payload.DivisionIds)
+        svc.set_divisiones(db, med_int_id, payload.DivisionIds)
     if payload.EdificioIds is not None:
-        svc.set_edificios(db, obj.Id, payload.EdificioIds)
+        svc.set_edificios(db, med_int_id, payload.EdificioIds)
     if payload.ServicioIds is not None:
-        svc.set_servicios(db, obj.Id, payload.ServicioIds)
+        svc.set_servicios(db, med_int_id, payload.ServicioIds)
 
-    divs, edis, srvs = svc.get_detail_ids(db, obj.Id)
+    divs, edis, srvs = svc.get_detail_ids(db, med_int_id)
     return MedidorInteligenteDTO(
-        Id=obj.Id,
-        ChileMedidoId=obj.ChileMedidoId,
+        Id=med_int_id,
+        ChileMedidoId=chilemedido_id,
         DivisionIds=divs,
         EdificioIds=edis,
         ServicioIds=srvs,
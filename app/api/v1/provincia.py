@@ -1,9 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy import text
 from sqlalchemy.orm import Session
 
 from app.db.session import get_db
 from app.schemas.provincias import ProvinciaDTO
+from app.services import territorio
 
 router = APIRouter(prefix="/api/v1/provincias", tags=["Provincias"])
 
@@ -13,13 +13,8 @@ def listar_por_region(
     db: Session = Depends(get_db),
 ):
     try:
-        sql = text("""
-            SELECT [Id], [RegionId], [Nombre]
-            FROM dbo.[Provincias] WITH (NOLOCK)
-            WHERE [RegionId] = :region_id
-            ORDER BY [Nombre], [Id]
-        """)
-        rows = db.execute(sql, {"region_id": regionId}).mappings().all()
-        return [ProvinciaDTO(**dict(r)) for r in rows]
+        # ORDER BY Nombre, Id (árbol territorial en memoria)
+        provincias = territorio.get(db).provincias_of_region(regionId)
+        return [ProvinciaDTO(Id=p.Id, RegionId=p.RegionId, Nombre=p.Nombre) for p in provincias]
     except Exception as ex:
         raise HTTPException(status_code=500, detail="Error al obtener provincias") from ex
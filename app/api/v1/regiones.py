@@ -2,13 +2,12 @@ from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
 
 from app.db.session import get_db
-from app.db.models.comuna import Region
 from app.schemas.region import RegionDTO
+from app.services import territorio
 
 router = APIRouter(prefix="/api/v1/regiones", tags=["Regiones"])
 
 @router.get("", response_model=list[RegionDTO])
 def get_regiones(db: Session = Depends(get_db)):
-    # Igual que en .NET: order by Posicion
-    regs = db.query(Region).order_by(Region.Posicion).all()
-    return regs
+    # Igual que en .NET: order by Posicion (desde el árbol territorial en memoria)
+    return territorio.get(db).regiones_ordenadas()
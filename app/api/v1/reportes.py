@@ -1,21 +1,24 @@
 from __future__ import annotations
 
 import logging
+from datetime import date, datetime
 from typing import Annotated, List, Optional
 
 from fastapi import APIRouter, Depends, Query, HTTPException
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
-from app.db.session import get_db
+from app.db.session import ReadDbDep, get_db
 from app.core.security import require_roles
 from app.schemas.auth import UserPublic
 from app.services.reporte_service import ReporteService
+from app.services import prorrateo
 from app.schemas.reporte import (
     SerieMensualDTO,
     ConsumoMedidorDTO,
     ConsumoNumeroClienteDTO,
     KPIsDTO,
+    BrechasDTO,
 )
 
 router = APIRouter(prefix="/api/v1/reportes", tags=["Reportes"])
@@ -38,6 +41,13 @@ try:
 except Exception:
     UsuarioDivision = None  # type: ignore
 
+try:
+    from app.db.models.usuarios_servicios import UsuarioServicio  # type: ignore
+except Exception:
+    UsuarioServicio = None  # type: ignore
+
+_BRECHAS_MAX_MESES = 60
+
 
 def _is_admin(u: UserPublic) -> bool:
     return "ADMINISTRADOR" in (u.roles or [])
@@ -117,17 +127,18 @@ AuthUser = Annotated[UserPublic, Depends(require_roles(*REPORTES_READ_ROLES))]
     dependencies=[Depends(require_roles(*REPORTES_READ_ROLES))],
 )
 def consumo_mensual(
-    db: DbDep,
+    db: ReadDbDep,
     u: AuthUser,
     DivisionId: int = Query(..., ge=1),
     EnergeticoId: int = Query(..., ge=1),
     Desde: str = Query(..., description="YYYY-MM-01"),
     Hasta: str = Query(..., description="YYYY-MM-01 (exclusivo)"),
+    Prorrateo: bool = Query(True, description="true=reparte cada compra por su periodo de lectura; false=por mes de FechaCompra"),
 ):
     # Aquí DivisionId viene obligatorio, pero igual validamos scope.
     _ensure_actor_can_access_division(db, u, int(DivisionId))
 
-    rows = svc.serie_mensual(db, int(DivisionId), int(EnergeticoId), Desde, Hasta)
+    rows = svc.serie_mensual(db, int(DivisionId), int(EnergeticoId), Desde, Hasta, prorrateado=Prorrateo)
     return [SerieMensualDTO.model_validate(x) for x in rows]
 
 
@@ -137,7 +148,7 @@ def consumo_mensual(
     dependencies=[Depends(require_roles(*REPORTES_READ_ROLES))],
 )
 def consumo_por_medidor(
-    db: DbDep,
+    db: ReadDbDep,
     u: AuthUser,
     DivisionId: int | None = Query(default=None, ge=1),
     EnergeticoId: int | None = Query(default=None, ge=1),
@@ -164,7 +175,7 @@ def consumo_por_medidor(
     dependencies=[Depends(require_roles(*REPORTES_READ_ROLES))],
 )
 def consumo_por_num_cliente(
-    db: DbDep,
+    db: ReadDbDep,
     u: AuthUser,
     DivisionId: int | None = Query(default=None, ge=1),
     EnergeticoId: int | None = Query(default=None, ge=1),
@@ -190,7 +201,7 @@ def consumo_por_num_cliente(
     dependencies=[Depends(require_roles(*REPORTES_READ_ROLES))],
 )
 def kpis(
-    db: DbDep,
+    db: ReadDbDep,
     u: AuthUser,
     DivisionId: int | None = Query(default=None, ge=1),
     EnergeticoId: int | None = Query(default=None, ge=1),
@@ -208,3 +219,77 @@ def kpis(
         Hasta,
     )
     return KPIsDTO.model_validate(data)
+
+
+@router.post(
+    "/prorrateo/rebuild",
+    status_code=202,
+    summary="Reconstruye el prorrateo mensual de compras en segundo plano (ADMINISTRADOR)",
+)
+def prorrateo_rebuild(
+    db: DbDep,
+    _admin: Annotated[UserPublic, Depends(require_roles("ADMINISTRADOR"))],
+):
+    if not prorrateo.is_available(db):
+        raise HTTPException(status_code=409, detail="Prorrateo no disponible (falta dbo.CompraProrrateoMensual)")
+    if not prorrateo.start_rebuild():
+        raise HTTPException(status_code=409, detail="Ya hay una reconstrucción del prorrateo en curso")
+    return {"estado": "iniciado"}
+
+
+def _mes(v: str, campo: str) -> date:
+    try:
+        d = datetime.strptime(v.strip()[:7], "%Y-%m")
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{campo} debe ser YYYY-MM")
+    return date(d.year, d.month, 1)
+
+
+@router.get(
+    "/brechas",
+    response_model=BrechasDTO,
+    dependencies=[Depends(require_roles(*REPORTES_READ_ROLES))],
+    summary="Meses sin compra por NumeroCliente/Medidor de un servicio o institución",
+)
+def brechas(
+    db: ReadDbDep,
+    u: AuthUser,
+    Desde: str = Query(..., description="YYYY-MM"),
+    Hasta: str = Query(..., description="YYYY-MM (exclusivo)"),
+    ServicioId: int | None = Query(default=None, ge=1),
+    InstitucionId: int | None = Query(default=None, ge=1),
+    Nivel: str = Query("numero_cliente", pattern="^(numero_cliente|medidor)$"),
+):
+    if ServicioId is None and InstitucionId is None:
+        raise HTTPException(status_code=400, detail="ServicioId o InstitucionId es requerido")
+    desde, hasta = _mes(Desde, "Desde"), _mes(Hasta, "Hasta")
+    meses = (hasta.year - desde.year) * 12 + (hasta.month - desde.month)
+    if meses < 1 or meses > _BRECHAS_MAX_MESES:
+        raise HTTPException(status_code=400, detail=f"Rango debe cubrir entre 1 y {_BRECHAS_MAX_MESES} meses")
+
+    # No-admin: solo servicios vinculados al usuario (una consulta)
+    servicio_ids = None
+    if not _is_admin(u):
+        if UsuarioServicio is None:
+            raise HTTPException(
+                status_code=403,
+                detail={"code": "forbidden_scope", "msg": "No se puede verificar alcance (UsuarioServicio no disponible)."},
+            )
+        servicio_ids = set(
+            db.execute(select(UsuarioServicio.ServicioId).where(UsuarioServicio.UsuarioId == u.id)).scalars().all()
+        )
+        if ServicioId is not None and int(ServicioId) not in servicio_ids:
+            raise HTTPException(
+                status_code=403,
+                detail={"code": "forbidden_scope", "msg": "No tienes acceso a este servicio.", "servicio_id": int(ServicioId)},
+            )
+
+    return svc.brechas(
+        db,
+        desde,
+        hasta,
+        servicio_id=ServicioId,
+        institucion_id=InstitucionId,
+        nivel=Nivel,
+        servicio_ids=servicio_ids,
+    )
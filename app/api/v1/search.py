@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+from typing import Annotated, Dict, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+
+from app.db.session import get_db
+from app.core.security import require_roles
+from app.schemas.auth import UserPublic
+from app.search import index
+
+router = APIRouter(prefix="/api/v1/search", tags=["Búsqueda"])
+DbDep = Annotated[Session, Depends(get_db)]
+
+
+@router.post("/reindex", summary="Reconstruye el índice de búsqueda (ADMINISTRADOR)")
+def reindex(
+    db: DbDep,
+    _admin: Annotated[UserPublic, Depends(require_roles("ADMINISTRADOR"))],
+    entity: Optional[str] = Query(None, description="division | medidor | numero_cliente (vacío = todas)"),
+) -> Dict[str, int]:
+    if not index.is_available(db):
+        raise HTTPException(status_code=409, detail="Índice de búsqueda no disponible (falta dbo.SearchTokens)")
+    if entity is not None and entity not in index.ENTITIES:
+        raise HTTPException(status_code=400, detail=f"Entidad inválida: {entity}")
+    targets = [entity] if entity else list(index.ENTITIES)
+    return {e: index.rebuild(db, e) for e in targets}
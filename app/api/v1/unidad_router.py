@@ -18,6 +18,7 @@ from app.schemas.unidad import (
     UnidadUpdateDTO,   # ✅ NUEVO
 )
 from app.services.unidad_service import UnidadService
+from app.utils.id_params import parse_ids
 
 router = APIRouter(prefix="/api/v1/unidades", tags=["Unidades"])
 
@@ -51,6 +52,15 @@ def list_unidades_filter(
 
     page: int = Query(1, ge=1),
     page_size: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = Query(
+        None,
+        description="meta.next_cursor de la página anterior (keyset por Nombre, Id; ignora page)",
+    ),
+    count: str = Query(
+        "exact",
+        pattern="^(exact|estimate|none)$",
+        description="exact=COUNT, estimate=aproximado (meta.total_estimated), none=sin conteo",
+    ),
     db: Session = Depends(get_db),
     me: CurrentUser = Depends(get_current_user),
 ):
@@ -63,7 +73,7 @@ def list_unidades_filter(
         RegionId=regionId,
         Active=active,
     )
-    return svc.list_filter(f, page, page_size)
+    return svc.list_filter(f, page, page_size, cursor=cursor, count=count)
 
 
 @router.get("/getasociadosbyuser/{user_id}", response_model=List[UnidadListDTO])
@@ -125,6 +135,25 @@ def list_unidades_by_servicio(
     return [UnidadListDTO.model_validate(x) for x in page.data]
 
 
+@router.get("/expand", response_model=List[UnidadWithInmueblesDTO])
+def get_unidades_expand(
+    ids: List[str] = Query(
+        ...,
+        description="IDs de unidades: ?ids=1,2,3 o ?ids=1&ids=2 (máx. 500)",
+    ),
+    inmuebles_detalle: bool = Query(
+        False,
+        description="Incluir InmueblesDetallados (una lectura completa por inmueble; evitar en grillas)",
+    ),
+    db: Session = Depends(get_db),
+    me: CurrentUser = Depends(get_current_user),
+):
+    """Expand en lote para grillas: omite IDs inexistentes o inactivos."""
+    parsed = parse_ids(ids, 500)
+    svc = UnidadService(db, me.id, me.is_admin)
+    return svc.get_many_with_expand(parsed, inmuebles_detalle=inmuebles_detalle)
+
+
 @router.get("/check/{nombre}/{servicio_id}", response_model=bool)
 def check_unidad_nombre(
     nombre: str,
@@ -49,46 +49,55 @@ def _get_resource_id(obj) -> str | None:
         pass
     return None
 
-@event.listens_for(Session, "after_flush")
-def audit_after_flush(session: Session, flush_context):
+def audit_row(session: Session, action: str, resource_type: str, resource_id: str | None, changes: dict | None = None) -> None:
+    """
+    Agrega un AuditLog a la sesión con los metadatos del request/actor.
+    Lo usa el after_flush (ORM) y las escrituras Core con OUTPUT (app.db.returning).
+    """
     meta = session.info.get("request_meta") or {}
     actor = session.info.get("actor") or {}
+    try:
+        # cambios a español
+        changes_es = _spanish_changes(changes) if changes else None
+        changes_json = _to_json_safe(changes_es) if changes_es else None
+
+        rbj = meta.get("request_body_json")
+        if isinstance(rbj, (dict, list)):
+            rbj = _to_json_safe(rbj)
+
+        session.add(
+            AuditLog(
+                # ⚠️ Guardar SIEMPRE en INGLÉS para pasar el CHECK de SQL Server
+                action=action,  # "create"|"update"|"delete"|"login"|"logout"|"read"
+                resource_type=resource_type,
+                resource_id=resource_id,
+                http_method=meta.get("method"),
+                path=meta.get("path"),
+                status_code=meta.get("status_code"),
+                actor_id=actor.get("id"),
+                actor_username=actor.get("username"),
+                session_id=meta.get("session_id"),
+                request_id=meta.get("request_id"),
+                ip=meta.get("ip"),
+                user_agent=meta.get("user_agent"),
+                changes_json=changes_json,
+                request_body_sha256=meta.get("request_body_sha256"),
+                request_body_json=rbj,
+            )
+        )
+    except Exception as e:
+        session.info["audit_error"] = f"{type(e).__name__}: {e}"
+
+@event.listens_for(Session, "after_flush")
+def audit_after_flush(session: Session, flush_context):
+    if session.info.get("read_only"):
+        return
 
     def log(action: str, obj, changes: dict | None):
         # evita recursión
         if isinstance(obj, AuditLog):
             return
-        try:
-            # cambios a español
-            changes_es = _spanish_changes(changes) if changes else None
-            changes_json = _to_json_safe(changes_es) if changes_es else None
-
-            rbj = meta.get("request_body_json")
-            if isinstance(rbj, (dict, list)):
-                rbj = _to_json_safe(rbj)
-
-            session.add(
-                AuditLog(
-                    # ⚠️ Guardar SIEMPRE en INGLÉS para pasar el CHECK de SQL Server
-                    action=action,  # "create"|"update"|"delete"|"login"|"logout"|"read"
-                    resource_type=obj.__class__.__name__,
-                    resource_id=_get_resource_id(obj),
-                    http_method=meta.get("method"),
-                    path=meta.get("path"),
-                    status_code=meta.get("status_code"),
-                    actor_id=actor.get("id"),
-                    actor_username=actor.get("username"),
-                    session_id=meta.get("session_id"),
-                    request_id=meta.get("request_id"),
-                    ip=meta.get("ip"),
-                    user_agent=meta.get("user_agent"),
-                    changes_json=changes_json,
-                    request_body_sha256=meta.get("request_body_sha256"),
-                    request_body_json=rbj,
-                )
-            )
-        except Exception as e:
-            session.info["audit_error"] = f"{type(e).__name__}: {e}"
+        audit_row(session, action, obj.__class__.__name__, _get_resource_id(obj), changes)
 
     # create
     for obj in session.new:
@@ -0,0 +1,170 @@
+# app/core/auth_claims.py
+"""
+Ruta rápida de autenticación basada en claims del JWT.
+
+- Al emitir el token se firman `rv` (versión de autorización del usuario) y
+  `sh` (scope hash: sub + rv + roles), además de email/username/nombres.
+- get_current_user arma el principal directamente desde los claims cuando el
+  `rv` del token coincide con la versión vigente y `sh` calza con los roles
+  del token; así evita AspNetUsers/AspNetRoles en cada request.
+- La versión vive en dbo.UserAuthVersions y se cachea por proceso
+  (AUTH_VERSION_TTL_SECONDS). UsuarioVinculoService.set_roles/set_active la
+  incrementan en la misma transacción; al commit se invalida la caché local y
+  los demás procesos la ven al vencer el TTL.
+- Si la tabla no existe, el token no trae rv/sh o AUTH_CLAIMS_FAST_PATH=0, se
+  usa la carga completa desde BD (comportamiento histórico).
+
+Cambios de roles hechos fuera de esta API (p.ej. la aplicación .NET) no
+incrementan la versión; para esos casos basta con AUTH_CLAIMS_FAST_PATH=0.
+
+DDL: app/db/sql/005_user_auth_versions.sql
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+Log = logging.getLogger(__name__)
+
+AUTH_CLAIMS_FAST_PATH = os.getenv("AUTH_CLAIMS_FAST_PATH", "1") == "1"
+AUTH_VERSION_TTL_SECONDS = float(os.getenv("AUTH_VERSION_TTL_SECONDS", "30"))
+AUTH_VERSION_CACHE_MAX = int(os.getenv("AUTH_VERSION_CACHE_MAX", "50000"))
+
+CLAIM_VERSION = "rv"
+CLAIM_SCOPE_HASH = "sh"
+
+_AVAILABLE: Optional[bool] = None
+_CACHE: Dict[str, Tuple[int, float]] = {}   # user_id -> (versión, leída en monotonic)
+_LOCK = threading.Lock()
+
+
+def is_available(db) -> bool:
+    """True si dbo.UserAuthVersions existe (se consulta una vez por proceso)."""
+    global _AVAILABLE
+    if not AUTH_CLAIMS_FAST_PATH:
+        return False
+    if _AVAILABLE is None:
+        try:
+            row = db.execute(text("SELECT OBJECT_ID(N'dbo.UserAuthVersions', N'U')")).scalar()
+            _AVAILABLE = row is not None
+        except Exception as ex:
+            Log.warning("AUTH is_available falló: %s", ex)
+            return False
+        Log.info("AUTH versión de autorización disponible=%s", _AVAILABLE)
+    return _AVAILABLE
+
+
+def scope_hash(sub: str, version: int, roles: Iterable[str]) -> str:
+    norm = ",".join(sorted({(r or "").strip().upper() for r in roles if r}))
+    return hashlib.sha256(f"{sub}|{version}|{norm}".encode("utf-8")).hexdigest()[:32]
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Versión por usuario
+# ─────────────────────────────────────────────────────────────────────────────
+def current_version(db, user_id: str) -> int:
+    """Versión vigente (0 si el usuario no tiene fila); cacheada AUTH_VERSION_TTL_SECONDS."""
+    now = time.monotonic()
+    hit = _CACHE.get(user_id)
+    if hit is not None and now - hit[1] < AUTH_VERSION_TTL_SECONDS:
+        return hit[0]
+    v = db.execute(
+        text("SELECT Version FROM dbo.UserAuthVersions WITH (NOLOCK) WHERE UserId = :u"),
+        {"u": user_id},
+    ).scalar()
+    version = int(v or 0)
+    with _LOCK:
+        if len(_CACHE) >= AUTH_VERSION_CACHE_MAX:
+            _CACHE.clear()
+        _CACHE[user_id] = (version, now)
+    return version
+
+
+def bump(db: Session, user_id: str) -> None:
+    """
+    Incrementa la versión del usuario dentro de la transacción en curso.
+    Tokens emitidos antes pasan a la carga completa desde BD.
+    """
+    if not is_available(db):
+        return
+    db.execute(
+        text("""
+            MERGE dbo.UserAuthVersions WITH (HOLDLOCK) AS t
+            USING (SELECT :u AS UserId) AS s ON t.UserId = s.UserId
+            WHEN MATCHED THEN
+                UPDATE SET Version = t.Version + 1, UpdatedAt = SYSUTCDATETIME()
+            WHEN NOT MATCHED THEN
+                INSERT (UserId, Version, UpdatedAt) VALUES (:u, 1, SYSUTCDATETIME());
+        """),
+        {"u": user_id},
+    )
+    session_bumped = db.info.setdefault("auth_versions_bumped", set())
+    session_bumped.add(user_id)
+
+
+def invalidate(user_id: Optional[str] = None) -> None:
+    with _LOCK:
+        if user_id is None:
+            _CACHE.clear()
+        else:
+            _CACHE.pop(user_id, None)
+
+
+@event.listens_for(Session, "after_commit")
+def auth_versions_after_commit(session: Session):
+    for uid in session.info.pop("auth_versions_bumped", ()):
+        invalidate(uid)
+
+
+@event.listens_for(Session, "after_rollback")
+def auth_versions_after_rollback(session: Session):
+    session.info.pop("auth_versions_bumped", None)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Emisión / verificación
+# ─────────────────────────────────────────────────────────────────────────────
+def version_for_token(db, user_id: str) -> Optional[int]:
+    """
+    Versión leída al emitir (sin caché ni NOLOCK), o None si la ruta rápida
+    no aplica. Debe leerse ANTES que los roles: si entre medio alguien cambia
+    roles + versión, el token queda con versión vieja (va a BD), nunca al revés.
+    """
+    if not is_available(db):
+        return None
+    v = db.execute(
+        text("SELECT Version FROM dbo.UserAuthVersions WHERE UserId = :u"),
+        {"u": user_id},
+    ).scalar()
+    return int(v or 0)
+
+
+def signed_claims(user_id: str, version: Optional[int], roles: Iterable[str]) -> dict:
+    """Claims rv/sh para create_access_token (vacío si version es None)."""
+    if version is None:
+        return {}
+    return {CLAIM_VERSION: version, CLAIM_SCOPE_HASH: scope_hash(user_id, version, roles)}
+
+
+def claims_are_current(db, payload: dict) -> bool:
+    """
+    True si el principal puede armarse desde el token: trae rv/sh, el hash
+    calza con sub+rv+roles y rv es la versión vigente del usuario.
+    """
+    sub = payload.get("sub")
+    version = payload.get(CLAIM_VERSION)
+    sh = payload.get(CLAIM_SCOPE_HASH)
+    if not sub or not isinstance(version, int) or not sh:
+        return False
+    if not is_available(db):
+        return False
+    if sh != scope_hash(sub, version, payload.get("roles") or []):
+        return False
+    return current_version(db, sub) == version
@@ -9,6 +9,7 @@ from fastapi.security.utils import get_authorization_scheme_param
 from jose import jwt, JWTError, ExpiredSignatureError
 from sqlalchemy.orm import Session
 
+from app.core import auth_claims, session_store
 from app.core.config import settings
 from app.db.session import SessionLocal
 from app.db.models.identity import AspNetUser, AspNetRole  # 👈 asegúrate que exista AspNetRole
@@ -176,6 +177,24 @@ def get_current_user(token: Annotated[str, Depends(bearer_token_required)], db:
     if not sub:
         _raise_401("Token inválido: falta 'sub'", "invalid_token", "El token no contiene el subject (sub)")
 
+    if not session_store.is_active(db, payload.get(session_store.CLAIM_SESSION)):
+        _raise_401("Sesión revocada", "invalid_token", "La sesión del token fue cerrada o expiró")
+
+    # Ruta rápida: claims firmados vigentes (rv/sh) => sin AspNetUsers/AspNetRoles
+    if (
+        "nombres" in payload
+        and not any(_is_guid(str(r)) for r in roles_from_token)
+        and auth_claims.claims_are_current(db, payload)
+    ):
+        return UserPublic(
+            id=str(sub),
+            username=payload.get("username") or None,
+            email=payload.get("email") or None,
+            nombres=payload.get("nombres"),
+            apellidos=payload.get("apellidos"),
+            roles=_merge_roles(roles_from_token),
+        )
+
     user = db.query(AspNetUser).filter(AspNetUser.Id == sub).first()
     if not user:
         _raise_401("Usuario no encontrado", "invalid_token", "El 'sub' del token no corresponde a un usuario válido")
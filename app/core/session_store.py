@@ -0,0 +1,270 @@
+# app/core/session_store.py
+"""
+Sesiones de refresh token (dbo.AuthSessions) con rotación, revocación y
+expiración deslizante.
+
+- El refresh token es '<sid>.<secreto>'. En BD solo se guarda SHA-256 del
+  secreto; renovar cuesta una búsqueda por PK + hash (sin KDF de contraseña).
+- Rotación: cada renovación emite un secreto nuevo mediante un UPDATE
+  condicional (TokenHash = hash presentado), atómico entre procesos.
+- Reuso: presentar el secreto anterior fuera de SESSION_REUSE_GRACE_SECONDS
+  revoca la sesión completa (token filtrado). Dentro del periodo de gracia
+  (dos pestañas renovando a la vez) solo se rechaza.
+- Expiración: ExpiresAt se desliza REFRESH_TOKEN_IDLE_DAYS con cada uso, sin
+  pasar de AbsoluteExpiresAt (REFRESH_TOKEN_MAX_DAYS desde el login).
+- Los access tokens llevan el claim `sid`; is_active() se consulta en cada
+  request con un LRU en memoria (SESSION_CACHE_TTL_SECONDS) delante de la BD,
+  así el logout revoca también los access tokens vigentes.
+- Si la tabla no existe, no se emiten refresh tokens y is_active() es True
+  (comportamiento histórico).
+
+DDL: app/db/sql/006_auth_sessions.sql
+"""
+from __future__ import annotations
+
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+Log = logging.getLogger(__name__)
+
+REFRESH_TOKEN_IDLE_DAYS = float(os.getenv("REFRESH_TOKEN_IDLE_DAYS", "7"))
+REFRESH_TOKEN_MAX_DAYS = float(os.getenv("REFRESH_TOKEN_MAX_DAYS", "30"))
+SESSION_REUSE_GRACE_SECONDS = int(os.getenv("SESSION_REUSE_GRACE_SECONDS", "30"))
+SESSION_CACHE_TTL_SECONDS = float(os.getenv("SESSION_CACHE_TTL_SECONDS", "30"))
+SESSION_CACHE_MAX = int(os.getenv("SESSION_CACHE_MAX", "20000"))
+
+CLAIM_SESSION = "sid"
+
+_AVAILABLE: Optional[bool] = None
+_CACHE: "OrderedDict[str, Tuple[bool, str, float]]" = OrderedDict()   # sid -> (activa, user_id, leída en)
+_LOCK = threading.Lock()
+
+
+def is_available(db) -> bool:
+    """True si dbo.AuthSessions existe (se consulta una vez por proceso)."""
+    global _AVAILABLE
+    if _AVAILABLE is None:
+        try:
+            row = db.execute(text("SELECT OBJECT_ID(N'dbo.AuthSessions', N'U')")).scalar()
+            _AVAILABLE = row is not None
+        except Exception as ex:
+            Log.warning("SESSIONS is_available falló: %s", ex)
+            return False
+        Log.info("SESSIONS tabla de sesiones disponible=%s", _AVAILABLE)
+    return _AVAILABLE
+
+
+def _sha256(s: str) -> str:
+    return hashlib.sha256(s.encode("utf-8")).hexdigest()
+
+
+def _split(refresh_token: str) -> Tuple[str, str]:
+    sid, _, secret = (refresh_token or "").strip().partition(".")
+    if len(sid) != 32 or not secret:
+        raise _invalid()
+    return sid, secret
+
+
+def _invalid(detail: str = "Refresh token inválido") -> HTTPException:
+    return HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=detail)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# LRU de estado de sesión
+# ─────────────────────────────────────────────────────────────────────────────
+def _remember(sid: str, active: bool, user_id: str) -> None:
+    with _LOCK:
+        _CACHE[sid] = (active, user_id, time.monotonic())
+        _CACHE.move_to_end(sid)
+        while len(_CACHE) > SESSION_CACHE_MAX:
+            _CACHE.popitem(last=False)
+
+
+def _forget_user(user_id: str) -> None:
+    with _LOCK:
+        for sid in [k for k, v in _CACHE.items() if v[1] == user_id]:
+            _CACHE.pop(sid, None)
+
+
+def is_active(db, sid: Optional[str]) -> bool:
+    """True si la sesión `sid` sigue vigente (tokens sin sid: True)."""
+    if not sid or not is_available(db):
+        return True
+    now = time.monotonic()
+    with _LOCK:
+        hit = _CACHE.get(sid)
+        if hit is not None and now - hit[2] < SESSION_CACHE_TTL_SECONDS:
+            _CACHE.move_to_end(sid)
+            return hit[0]
+    row = db.execute(
+        text("""
+            SELECT UserId,
+                   CASE WHEN RevokedAt IS NULL AND ExpiresAt > SYSUTCDATETIME() THEN 1 ELSE 0 END
+              FROM dbo.AuthSessions WITH (NOLOCK)
+             WHERE Id = :sid
+        """),
+        {"sid": sid},
+    ).first()
+    active = bool(row and row[1])
+    _remember(sid, active, str(row[0]) if row else "")
+    return active
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Ciclo de vida
+# ─────────────────────────────────────────────────────────────────────────────
+def create_session(
+    db, user_id: str, ip: Optional[str] = None, user_agent: Optional[str] = None
+) -> Optional[Tuple[str, str, datetime]]:
+    """
+    Abre una sesión para `user_id` y hace commit.
+    Retorna (refresh_token, sid, expires_at) o None si la tabla no existe.
+    """
+    if not is_available(db):
+        return None
+    sid = secrets.token_hex(16)
+    secret = secrets.token_urlsafe(32)
+    # higiene: sesiones vencidas o revocadas del mismo usuario
+    db.execute(
+        text("""
+            DELETE FROM dbo.AuthSessions
+             WHERE UserId = :u AND (ExpiresAt <= SYSUTCDATETIME() OR RevokedAt IS NOT NULL)
+        """),
+        {"u": user_id},
+    )
+    expires_at = db.execute(
+        text("""
+            INSERT INTO dbo.AuthSessions
+                (Id, UserId, TokenHash, CreatedAt, LastUsedAt, ExpiresAt, AbsoluteExpiresAt, Ip, UserAgent)
+            OUTPUT INSERTED.ExpiresAt
+            VALUES (:sid, :u, :h, SYSUTCDATETIME(), SYSUTCDATETIME(),
+                    DATEADD(SECOND, :idle, SYSUTCDATETIME()),
+                    DATEADD(SECOND, :max, SYSUTCDATETIME()),
+                    :ip, :ua)
+        """),
+        {
+            "sid": sid, "u": user_id, "h": _sha256(secret),
+            "idle": int(min(REFRESH_TOKEN_IDLE_DAYS, REFRESH_TOKEN_MAX_DAYS) * 86400),
+            "max": int(REFRESH_TOKEN_MAX_DAYS * 86400),
+            "ip": ip, "ua": (user_agent or "")[:512] or None,
+        },
+    ).scalar()
+    db.commit()
+    _remember(sid, True, user_id)
+    return f"{sid}.{secret}", sid, expires_at
+
+
+def rotate(db, refresh_token: str, ip: Optional[str] = None) -> Tuple[str, str, str, datetime]:
+    """
+    Valida y rota el refresh token (commit incluido).
+    Retorna (nuevo_refresh_token, sid, user_id, expires_at); 401 si no es válido.
+    """
+    if not is_available(db):
+        raise _invalid("Refresh token no disponible")
+    sid, secret = _split(refresh_token)
+    old_hash = _sha256(secret)
+    new_secret = secrets.token_urlsafe(32)
+
+    row = db.execute(
+        text("""
+            UPDATE dbo.AuthSessions
+               SET PrevTokenHash = TokenHash,
+                   TokenHash     = :new,
+                   RotatedAt     = SYSUTCDATETIME(),
+                   LastUsedAt    = SYSUTCDATETIME(),
+                   ExpiresAt     = CASE WHEN DATEADD(SECOND, :idle, SYSUTCDATETIME()) < AbsoluteExpiresAt
+                                        THEN DATEADD(SECOND, :idle, SYSUTCDATETIME())
+                                        ELSE AbsoluteExpiresAt END,
+                   Ip            = COALESCE(:ip, Ip)
+            OUTPUT INSERTED.UserId, INSERTED.ExpiresAt
+             WHERE Id = :sid AND TokenHash = :old
+               AND RevokedAt IS NULL AND ExpiresAt > SYSUTCDATETIME()
+        """),
+        {
+            "sid": sid, "old": old_hash, "new": _sha256(new_secret),
+            "idle": int(REFRESH_TOKEN_IDLE_DAYS * 86400), "ip": ip,
+        },
+    ).first()
+    if row is not None:
+        db.commit()
+        user_id = str(row[0])
+        _remember(sid, True, user_id)
+        return f"{sid}.{new_secret}", sid, user_id, row[1]
+
+    db.rollback()
+    _handle_rejected(db, sid, old_hash)
+    raise _invalid()
+
+
+def _handle_rejected(db, sid: str, presented_hash: str) -> None:
+    """Clasifica un refresh rechazado; revoca la sesión si es reuso de un secreto rotado."""
+    row = db.execute(
+        text("""
+            SELECT UserId, PrevTokenHash, RevokedAt,
+                   DATEDIFF(SECOND, RotatedAt, SYSUTCDATETIME())
+              FROM dbo.AuthSessions
+             WHERE Id = :sid
+        """),
+        {"sid": sid},
+    ).first()
+    if row is None or row[2] is not None:
+        return
+    user_id, prev_hash, _, age = row
+    if not prev_hash or not hmac.compare_digest(str(prev_hash).strip(), presented_hash):
+        return
+    if age is not None and age <= SESSION_REUSE_GRACE_SECONDS:
+        # renovación concurrente (otra pestaña ganó la rotación): solo se rechaza
+        return
+    Log.warning("SESSIONS reuso de refresh token rotado: sid=%s user=%s → sesión revocada", sid, user_id)
+    revoke(db, sid)
+
+
+def revoke(db, sid: Optional[str]) -> None:
+    """Revoca una sesión (commit incluido)."""
+    if not sid or not is_available(db):
+        return
+    db.execute(
+        text("UPDATE dbo.AuthSessions SET RevokedAt = SYSUTCDATETIME() WHERE Id = :sid AND RevokedAt IS NULL"),
+        {"sid": sid},
+    )
+    db.commit()
+    with _LOCK:
+        hit = _CACHE.get(sid)
+    _remember(sid, False, hit[1] if hit else "")
+
+
+def revoke_user(db, user_id: str) -> None:
+    """
+    Revoca todas las sesiones del usuario dentro de la transacción en curso
+    (sin commit). Otros procesos lo ven al vencer SESSION_CACHE_TTL_SECONDS.
+    """
+    if not user_id or not is_available(db):
+        return
+    db.execute(
+        text("UPDATE dbo.AuthSessions SET RevokedAt = SYSUTCDATETIME() WHERE UserId = :u AND RevokedAt IS NULL"),
+        {"u": user_id},
+    )
+    db.info.setdefault("sessions_revoked_users", set()).add(user_id)
+
+
+@event.listens_for(Session, "after_commit")
+def sessions_after_commit(session: Session):
+    for uid in session.info.pop("sessions_revoked_users", ()):
+        _forget_user(uid)
+
+
+@event.listens_for(Session, "after_rollback")
+def sessions_after_rollback(session: Session):
+    session.info.pop("sessions_revoked_users", None)
@@ -0,0 +1,72 @@
+# app/db/id_list.py
+"""
+Listas de IDs como tabla temporal (#temp) en vez de IN (...) interpolado.
+
+- load() deja los IDs (únicos) en #<name> (Id BIGINT PRIMARY KEY) y retorna el
+  nombre de la tabla para usarlo en la sentencia:
+      t = id_list.load(db, ids, "compra_ids")
+      ... WHERE c.Id IN (SELECT Id FROM {t})
+  En consultas ORM: Model.Id.in_(id_list.select_ids(t)).
+  El texto SQL ya no depende de los valores ni del largo de la lista: el plan
+  se cachea (sin OPTION (RECOMPILE)), no hay tope de 2100 parámetros y la
+  tabla temporal tiene estadísticas reales para estimar cardinalidad.
+- El CREATE va sin parámetros (SQLExecDirect) para que la tabla viva en la
+  sesión y no dentro de un sp_executesql; si ya existe se vacía con TRUNCATE.
+- El INSERT es un executemany; con fast_executemany=True (app/db/session.py)
+  pyodbc lo envía en un solo viaje.
+- Las tablas #temp son por conexión: usar la misma Session entre load() y la
+  consulta. Se eliminan al cerrar la conexión física o con un ROLLBACK de la
+  transacción que las creó (el siguiente load() las vuelve a crear).
+"""
+from __future__ import annotations
+
+import re
+from typing import Iterable, List
+
+from sqlalchemy import BigInteger, column, text
+
+_NAME_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]{0,100}$")
+
+
+def _table(name: str) -> str:
+    if not _NAME_RE.match(name or ""):
+        raise ValueError(f"Nombre de lista de IDs inválido: {name!r}")
+    return f"#{name}"
+
+
+def unique_ids(ids: Iterable) -> List[int]:
+    """IDs enteros únicos, preservando el orden de llegada (ignora None)."""
+    return list(dict.fromkeys(int(i) for i in ids if i is not None))
+
+
+def load(db, ids: Iterable, name: str = "ids") -> str:
+    """
+    Carga `ids` en #<name> (crea o vacía la tabla) y retorna '#<name>'.
+    `db` puede ser Session o Connection.
+    """
+    t = _table(name)
+    db.execute(
+        text(
+            f"""
+            IF OBJECT_ID(N'tempdb..{t}') IS NULL
+                CREATE TABLE {t} (Id BIGINT NOT NULL PRIMARY KEY);
+            ELSE
+                TRUNCATE TABLE {t};
+            """
+        )
+    )
+    payload = [{"id": i} for i in unique_ids(ids)]
+    if payload:
+        db.execute(text(f"INSERT INTO {t} (Id) VALUES (:id)"), payload)
+    return t
+
+
+def select_ids(t: str):
+    """SELECT Id FROM <t> como subconsulta para Column.in_() en consultas ORM."""
+    return text(f"SELECT Id FROM {t}").columns(column("Id", BigInteger))
+
+
+def drop(db, name: str = "ids") -> None:
+    """Elimina #<name> si existe (opcional: la conexión la elimina al cerrarse)."""
+    t = _table(name)
+    db.execute(text(f"IF OBJECT_ID(N'tempdb..{t}') IS NOT NULL DROP TABLE {t};"))
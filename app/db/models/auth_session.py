@@ -0,0 +1,35 @@
+# app/db/models/auth_session.py
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import DateTime, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+
+
+class AuthSession(Base):
+    """
+    Sesión de refresh token (dbo.AuthSessions); la mantiene app.core.session_store.
+    DDL: app/db/sql/006_auth_sessions.sql
+    """
+    __tablename__ = "AuthSessions"
+    __table_args__ = {"schema": "dbo"}
+
+    Id:                Mapped[str] = mapped_column(String(32), primary_key=True)
+    UserId:            Mapped[str] = mapped_column(String(450), nullable=False)
+    TokenHash:         Mapped[str] = mapped_column(String(64), nullable=False)
+    PrevTokenHash:     Mapped[Optional[str]] = mapped_column(String(64))
+    RotatedAt:         Mapped[Optional[datetime]] = mapped_column(DateTime)
+    CreatedAt:         Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    LastUsedAt:        Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    ExpiresAt:         Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    AbsoluteExpiresAt: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    RevokedAt:         Mapped[Optional[datetime]] = mapped_column(DateTime)
+    Ip:                Mapped[Optional[str]] = mapped_column(String(64))
+    UserAgent:         Mapped[Optional[str]] = mapped_column(String(512))
+
+    def __repr__(self) -> str:
+        return f"<AuthSession {self.Id} user={self.UserId}>"
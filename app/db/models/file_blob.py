@@ -0,0 +1,30 @@
+# app/db/models/file_blob.py
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import BigInteger, DateTime, Integer, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+
+
+class FileBlob(Base):
+    """
+    Conteo de referencias de archivos direccionados por contenido (dbo.FileBlobs).
+    Un registro por (Store, Sha256); lo mantiene app.utils.blob_store.
+    DDL: app/db/sql/003_file_blobs.sql
+    """
+    __tablename__ = "FileBlobs"
+    __table_args__ = {"schema": "dbo"}
+
+    Store:     Mapped[str] = mapped_column(String(32), primary_key=True)
+    Sha256:    Mapped[str] = mapped_column(String(64), primary_key=True)
+    Size:      Mapped[Optional[int]] = mapped_column(BigInteger)
+    RefCount:  Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    CreatedAt: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    UpdatedAt: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<FileBlob {self.Store}:{self.Sha256[:12]} refs={self.RefCount}>"
@@ -0,0 +1,28 @@
+# app/db/models/search_token.py
+from __future__ import annotations
+
+from sqlalchemy import BigInteger, Index, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+
+
+class SearchToken(Base):
+    """
+    Índice invertido de búsqueda (dbo.SearchTokens).
+    Un registro por (EntityType, Token, EntityId); Token ya viene plegado
+    (sin tildes, minúsculas) por app.utils.normalize.tokenize.
+    DDL: app/db/sql/001_search_tokens.sql
+    """
+    __tablename__ = "SearchTokens"
+    __table_args__ = (
+        Index("IX_SearchTokens_Entity", "EntityType", "EntityId"),
+        {"schema": "dbo"},
+    )
+
+    EntityType: Mapped[str] = mapped_column(String(32), primary_key=True)
+    Token:      Mapped[str] = mapped_column(String(64), primary_key=True)
+    EntityId:   Mapped[int] = mapped_column(BigInteger, primary_key=True)
+
+    def __repr__(self) -> str:
+        return f"<SearchToken {self.EntityType}:{self.EntityId} {self.Token!r}>"
@@ -0,0 +1,137 @@
+# app/db/normalized.py
+"""
+Columnas normalizadas de búsqueda (*Norm): columnas calculadas PERSISTED en
+SQL Server con la misma regla que app.utils.normalize.norm_key (minúsculas,
+sin tildes, espacios colapsados) e indexadas.
+
+- Con ellas "valparaiso" calza con "VALPARAÍSO" usando un predicado sargable
+  (NombreNorm = :k  /  NombreNorm LIKE 'k%'), sin LOWER()/ISNULL() sobre la
+  columna ni LIKE '%q%'.
+- No se mapean en los modelos ORM (el ORM no debe escribirlas ni leerlas si
+  el DDL aún no está aplicado): se referencian con norm_col().
+- available() consulta COL_LENGTH una vez por proceso; si la columna no
+  existe los servicios mantienen su filtro LOWER(...) LIKE histórico.
+
+DDL: app/db/sql/002_normalized_columns.sql (generado con ddl()).
+"""
+from __future__ import annotations
+
+import logging
+from typing import Dict, List, Tuple
+
+from sqlalchemy import String, column, text
+from sqlalchemy.sql.elements import ColumnClause
+
+from app.db.models.comuna import Comuna
+from app.db.models.direccion import Direccion
+from app.db.models.division import Division
+from app.db.models.edificio import Edificio
+from app.db.models.institucion import Institucion
+from app.db.models.servicio import Servicio
+from app.utils.normalize import NORM_MAX_LEN, norm_key, norm_prefix, sql_norm_expr
+
+Log = logging.getLogger(__name__)
+
+# Tabla -> columna *Norm -> expresión fuente (T-SQL sobre columnas de la tabla)
+NORM_COLUMNS: Dict[str, Dict[str, str]] = {
+    "Divisiones": {"NombreNorm": "Nombre"},
+    "Direcciones": {
+        "DireccionNorm": "COALESCE(NULLIF(DireccionCompleta, N''), ISNULL(Calle, N'') + N' ' + ISNULL(Numero, N''))",
+    },
+    "Edificios": {
+        "DireccionNorm": "ISNULL(NULLIF(Calle, N''), ISNULL(Direccion, N'')) + N' ' + ISNULL(Numero, N'')",
+    },
+    "Comunas": {"NombreNorm": "Nombre"},
+    "Servicios": {"NombreNorm": "Nombre"},
+    "Instituciones": {"NombreNorm": "Nombre"},
+}
+
+_MODELS = {
+    "Divisiones": Division,
+    "Direcciones": Direccion,
+    "Edificios": Edificio,
+    "Comunas": Comuna,
+    "Servicios": Servicio,
+    "Instituciones": Institucion,
+}
+
+_AVAILABLE_CACHE: Dict[Tuple[str, str], bool] = {}
+
+
+def has_norm(model, name: str) -> bool:
+    """True si `model` declara la columna normalizada `name` en NORM_COLUMNS."""
+    return name in NORM_COLUMNS.get(model.__table__.name, {})
+
+
+def norm_col(model, name: str) -> ColumnClause:
+    """Columna *Norm de `model` como ColumnClause (no mapeada en el ORM)."""
+    table = model.__table__
+    if not has_norm(model, name):
+        raise ValueError(f"{table.name} no tiene columna normalizada {name}")
+    return column(name, String(NORM_MAX_LEN), _selectable=table)
+
+
+def available(db, model, name: str) -> bool:
+    """True si la columna calculada existe en la BD (cacheado por proceso)."""
+    if not has_norm(model, name):
+        return False
+    table = model.__table__
+    key = (table.name, name)
+    if key in _AVAILABLE_CACHE:
+        return _AVAILABLE_CACHE[key]
+    try:
+        exists = db.execute(
+            text("SELECT COL_LENGTH(:t, :c)"),
+            {"t": f"{table.schema or 'dbo'}.{table.name}", "c": name},
+        ).scalar() is not None
+    except Exception as ex:
+        Log.warning("NORM available(%s.%s) falló: %s", table.name, name, ex)
+        return False
+    _AVAILABLE_CACHE[key] = exists
+    Log.info("NORM columna %s.%s disponible=%s", table.name, name, exists)
+    return exists
+
+
+def prefix_filter(db, model, name: str, q: str | None):
+    """
+    Predicado sargable `<tabla>.<name> LIKE 'clave%'`, o None si la columna no
+    está disponible o q no aporta clave (el llamador usa su LIKE de respaldo).
+    """
+    if not q or not norm_key(q) or not available(db, model, name):
+        return None
+    return norm_col(model, name).like(norm_prefix(q), escape="\\")
+
+
+def equals_filter(db, model, name: str, value: str | None):
+    """Predicado `<tabla>.<name> = clave` (igualdad exacta normalizada) o None."""
+    if value is None or not available(db, model, name):
+        return None
+    return norm_col(model, name) == norm_key(value)
+
+
+def prefix_sql(db, model, name: str, q: str | None, alias: str, param: str):
+    """
+    Variante para SQL crudo: (fragmento, params) con
+    "<alias>.<name> LIKE :param ESCAPE '\\'", o None (ver prefix_filter).
+    """
+    if not q or not norm_key(q) or not available(db, model, name):
+        return None
+    return f"{alias}.{name} LIKE :{param} ESCAPE '\\'", {param: norm_prefix(q)}
+
+
+def ddl() -> List[str]:
+    """Sentencias idempotentes ALTER TABLE ... PERSISTED + índice por columna."""
+    out: List[str] = []
+    for tbl, cols in NORM_COLUMNS.items():
+        schema = _MODELS[tbl].__table__.schema or "dbo"
+        for name, src in cols.items():
+            out.append(
+                f"IF COL_LENGTH(N'{schema}.{tbl}', N'{name}') IS NULL\n"
+                f"    ALTER TABLE {schema}.{tbl} ADD {name} AS {sql_norm_expr(src)} PERSISTED;"
+            )
+            out.append(
+                f"IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'IX_{tbl}_{name}' "
+                f"AND object_id = OBJECT_ID(N'{schema}.{tbl}'))\n"
+                f"    CREATE NONCLUSTERED INDEX IX_{tbl}_{name} ON {schema}.{tbl} ({name});"
+            )
+    return out
@@ -0,0 +1,171 @@
+# app/db/returning.py
+"""
+Escrituras que devuelven la fila persistida en la misma sentencia con
+OUTPUT INSERTED.* (SQL Server), en vez de commit() + refresh() o re-consultar.
+
+- insert_one / insert_many / update_one / update_where retornan dicts
+  {atributo: valor} con las columnas mapeadas del modelo; sirven directo
+  para DTO.model_validate(...).
+- update_*: el OUTPUT trae además DELETED.<col> de las columnas asignadas, así
+  la auditoría registra anterior/nuevo sin leer la fila antes.
+- bump_version=True: Version = ISNULL(Version, 0) + 1 en la misma sentencia.
+- No pasan por el flush del ORM: audit=True agrega el AuditLog
+  (app.audit.hooks.audit_row); prorrateo y búsqueda quedan a cargo del
+  llamador (igual que compra_bulk). Los objetos ORM ya cargados en la
+  Session no se sincronizan.
+- SQL Server no admite OUTPUT sin INTO en tablas con triggers habilitados:
+  no usar con esas tablas.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import column, insert, inspect, text
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.schema import Column
+
+from app.audit.hooks import audit_row
+
+_COLS: Dict[type, List[Tuple[str, Column]]] = {}
+
+
+def _cols(model) -> List[Tuple[str, Column]]:
+    """[(atributo, Column)] del modelo, en orden de mapeo (cacheado por clase)."""
+    cols = _COLS.get(model)
+    if cols is None:
+        cols = [(attr.key, attr.columns[0]) for attr in inspect(model).column_attrs]
+        _COLS[model] = cols
+    return cols
+
+
+def _by_key(model) -> Dict[str, Column]:
+    return dict(_cols(model))
+
+
+def _table_sql(model) -> str:
+    tbl = model.__table__
+    return f"[{tbl.schema or 'dbo'}].[{tbl.name}]"
+
+
+def _pk_keys(model) -> List[str]:
+    mapper = inspect(model)
+    return [mapper.get_property_by_column(c).key for c in mapper.primary_key]
+
+
+def _resource_id(model, row: Dict[str, Any]) -> Optional[str]:
+    vals = [row.get(k) for k in _pk_keys(model)]
+    if all(v is None for v in vals):
+        return None
+    return "|".join("NULL" if v is None else str(v) for v in vals)
+
+
+def _check_keys(model, values: Dict[str, Any]) -> Dict[str, Column]:
+    by_key = _by_key(model)
+    unknown = [k for k in values if k not in by_key]
+    if unknown:
+        raise ValueError(f"{model.__name__}: columnas desconocidas {unknown}")
+    return by_key
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# INSERT
+# ─────────────────────────────────────────────────────────────────────────────
+def insert_one(db: Session, model, values: Dict[str, Any], audit: bool = True) -> Dict[str, Any]:
+    """INSERT ... OUTPUT INSERTED.* de una fila; retorna la fila persistida."""
+    return insert_many(db, model, [values], audit=audit)[0]
+
+
+def insert_many(
+    db: Session, model, rows: Iterable[Dict[str, Any]], audit: bool = True
+) -> List[Dict[str, Any]]:
+    """
+    INSERT de varias filas con OUTPUT INSERTED.*; SQLAlchemy las agrupa en
+    sentencias multi-VALUES (respetando el tope de parámetros). Retorna las
+    filas en el mismo orden de `rows`.
+    """
+    rows = list(rows)
+    if not rows:
+        return []
+    for r in rows:
+        _check_keys(model, r)
+    cols = _cols(model)
+    stmt = insert(model.__table__).returning(*(c for _, c in cols), sort_by_parameter_order=True)
+    res = db.execute(stmt, rows) if len(rows) > 1 else db.execute(stmt, rows[0])
+    out = [{k: m[c] for k, c in cols} for m in res.mappings().all()]
+    if audit:
+        for r in out:
+            audit_row(db, "create", model.__name__, _resource_id(model, r))
+    return out
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# UPDATE
+# ─────────────────────────────────────────────────────────────────────────────
+def update_where(
+    db: Session,
+    model,
+    where: str,
+    params: Dict[str, Any],
+    values: Dict[str, Any],
+    bump_version: bool = False,
+    audit: bool = True,
+) -> List[Dict[str, Any]]:
+    """
+    UPDATE <tabla> SET ... OUTPUT INSERTED.*, DELETED.<asignadas> WHERE <where>.
+    `where` es T-SQL sobre columnas de la tabla (sin alias); sus parámetros no
+    deben empezar con "v_". Retorna las filas actualizadas (ya con los cambios).
+    """
+    by_key = _check_keys(model, values)
+    cols = _cols(model)
+    sets = [f"[{by_key[k].name}] = :v_{k}" for k in values]
+    tracked = list(values)
+    if bump_version and "Version" in by_key and "Version" not in values:
+        sets.append(f"[{by_key['Version'].name}] = ISNULL([{by_key['Version'].name}], 0) + 1")
+        tracked.append("Version")
+    if not sets:
+        raise ValueError("update_where sin columnas a asignar")
+
+    output = [f"INSERTED.[{c.name}] AS [{k}]" for k, c in cols]
+    output += [f"DELETED.[{by_key[k].name}] AS [old_{k}]" for k in tracked]
+    stmt = text(
+        f"UPDATE {_table_sql(model)} SET {', '.join(sets)} "
+        f"OUTPUT {', '.join(output)} WHERE {where}"
+    ).columns(
+        *(column(k, c.type) for k, c in cols),
+        *(column(f"old_{k}", by_key[k].type) for k in tracked),
+    )
+    bind = dict(params or {})
+    bind.update({f"v_{k}": v for k, v in values.items()})
+
+    out: List[Dict[str, Any]] = []
+    for m in db.execute(stmt, bind).mappings().all():
+        row = {k: m[k] for k, _ in cols}
+        if audit:
+            changes = {
+                k: {"old": m[f"old_{k}"], "new": row[k]}
+                for k in tracked
+                if m[f"old_{k}"] != row[k]
+            }
+            if changes:
+                audit_row(db, "update", model.__name__, _resource_id(model, row), changes)
+        out.append(row)
+    return out
+
+
+def update_one(
+    db: Session,
+    model,
+    pk,
+    values: Dict[str, Any],
+    bump_version: bool = False,
+    audit: bool = True,
+) -> Optional[Dict[str, Any]]:
+    """UPDATE por PK con OUTPUT; None si la fila no existe."""
+    mapper = inspect(model)
+    if len(mapper.primary_key) != 1:
+        raise ValueError(f"{model.__name__}: update_one requiere PK simple")
+    rows = update_where(
+        db, model, f"[{mapper.primary_key[0].name}] = :pk", {"pk": pk}, values,
+        bump_version=bump_version, audit=audit,
+    )
+    return rows[0] if rows else None
@@ -2,9 +2,10 @@
 from __future__ import annotations
 
 import os
-from typing import Generator
+from typing import Annotated, Generator
 
-from sqlalchemy import create_engine, event
+from fastapi import Depends
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.orm import sessionmaker, Session as SASession, Session
 
 from app.core.config import settings
@@ -12,6 +13,8 @@ from app.audit.context import current_request_meta  # contextvar con metadatos d
 
 # Flags por variables de entorno (opcionales)
 READ_UNCOMMITTED = os.getenv("DB_READ_UNCOMMITTED", "1") == "1"
+# Lecturas (get_db_read) bajo SNAPSHOT: requiere ALLOW_SNAPSHOT_ISOLATION ON en la BD
+READONLY_SNAPSHOT = os.getenv("DB_READONLY_SNAPSHOT", "0") == "1"
 LOCK_TIMEOUT_MS = int(os.getenv("DB_LOCK_TIMEOUT_MS", "5000"))
 
 # -------------------------
@@ -83,3 +86,68 @@ def get_db() -> Generator[Session, None, None]:
         raise
     finally:
         db.close()
+
+
+# -------------------------
+# Sesión de solo lectura (GET)
+# -------------------------
+class ReadOnlySession(RequestAwareSession):
+    """
+    Session para endpoints de lectura:
+    - sin autoflush ni expire_on_commit (no recarga objetos ya leídos)
+    - flush() con cambios pendientes falla: ningún listener after_flush
+      (auditoría, búsqueda, prorrateo) corre en una lectura
+    - commit() nunca emite COMMIT: solo verifica que no haya cambios y deja la
+      transacción abierta (sin expirar objetos); get_db_read la cierra con
+      ROLLBACK al terminar el request
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.info["read_only"] = True
+
+    def flush(self, objects=None):
+        if self.new or self.deleted or any(self.is_modified(o) for o in self.dirty):
+            raise RuntimeError("Sesión de solo lectura: no se pueden persistir cambios")
+
+    def commit(self):
+        self.flush()
+
+
+ReadOnlySessionLocal = sessionmaker(
+    bind=engine,
+    autocommit=False,
+    autoflush=False,
+    expire_on_commit=False,
+    class_=ReadOnlySession,
+)
+
+_RESTORE_ISOLATION = "READ UNCOMMITTED" if READ_UNCOMMITTED else "READ COMMITTED"
+
+
+def get_db_read() -> Generator[Session, None, None]:
+    """
+    Dependency de FastAPI para GET de listados/detalle.
+    - ReadOnlySession: no flush, no auditoría, no COMMIT
+    - DB_READONLY_SNAPSHOT=1: la transacción corre en SNAPSHOT (lectura
+      consistente sin bloquear escritores) y al salir la conexión vuelve al
+      nivel de _set_session_pragmas. Las tablas leídas WITH (NOLOCK) siguen
+      siendo READ UNCOMMITTED (el hint manda sobre el nivel de la sesión).
+    """
+    db: Session = ReadOnlySessionLocal()
+    try:
+        if READONLY_SNAPSHOT:
+            db.execute(text("SET TRANSACTION ISOLATION LEVEL SNAPSHOT"))
+        yield db
+    finally:
+        try:
+            db.rollback()
+            if READONLY_SNAPSHOT:
+                db.execute(text(f"SET TRANSACTION ISOLATION LEVEL {_RESTORE_ISOLATION}"))
+                db.rollback()
+        except Exception:
+            pass
+        db.close()
+
+
+# Alias para routers: `db: ReadDbDep` en GET de listados/detalle
+ReadDbDep = Annotated[Session, Depends(get_db_read)]
@@ -0,0 +1,17 @@
+-- app/db/sql/001_search_tokens.sql
+-- Índice invertido de búsqueda para divisiones/inmuebles, medidores y números de cliente.
+-- Lo mantiene la API (app/search/hooks.py); backfill: POST /api/v1/search/reindex
+
+IF OBJECT_ID(N'dbo.SearchTokens', N'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.SearchTokens (
+        EntityType NVARCHAR(32) NOT NULL,
+        Token      NVARCHAR(64) NOT NULL,
+        EntityId   BIGINT       NOT NULL,
+        CONSTRAINT PK_SearchTokens PRIMARY KEY CLUSTERED (EntityType, Token, EntityId)
+    );
+
+    CREATE NONCLUSTERED INDEX IX_SearchTokens_Entity
+        ON dbo.SearchTokens (EntityType, EntityId);
+END
+GO
@@ -0,0 +1,52 @@
+-- app/db/sql/002_normalized_columns.sql
+-- Columnas calculadas *Norm (minúsculas, sin tildes, espacios colapsados) para
+-- búsquedas sargables por prefijo/igualdad. Misma regla que
+-- app.utils.normalize.norm_key; regenerar con app.db.normalized.ddl().
+
+IF COL_LENGTH(N'dbo.Divisiones', N'NombreNorm') IS NULL
+    ALTER TABLE dbo.Divisiones ADD NombreNorm AS CAST(LTRIM(RTRIM(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(LOWER(Nombre) COLLATE Latin1_General_100_BIN2, NCHAR(9), N' '), NCHAR(13), N' '), NCHAR(10), N' '), N'á', N'a'), N'à', N'a'), N'â', N'a'), N'ä', N'a'), N'ã', N'a'), N'é', N'e'), N'è', N'e'), N'ê', N'e'), N'ë', N'e'), N'í', N'i'), N'ì', N'i'), N'î', N'i'), N'ï', N'i'), N'ó', N'o'), N'ò', N'o'), N'ô', N'o'), N'ö', N'o'), N'õ', N'o'), N'ú', N'u'), N'ù', N'u'), N'û', N'u'), N'ü', N'u'), N'ñ', N'n'), N'ç', N'c'), N' ', N' ' + NCHAR(1)), NCHAR(1) + N' ', N''), NCHAR(1), N''))) AS NVARCHAR(400)) PERSISTED;
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'IX_Divisiones_NombreNorm' AND object_id = OBJECT_ID(N'dbo.Divisiones'))
+    CREATE NONCLUSTERED INDEX IX_Divisiones_NombreNorm ON dbo.Divisiones (NombreNorm);
+GO
+
+IF COL_LENGTH(N'dbo.Direcciones', N'DireccionNorm') IS NULL
+    ALTER TABLE dbo.Direcciones ADD DireccionNorm AS CAST(LTRIM(RTRIM(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(LOWER(COALESCE(NULLIF(DireccionCompleta, N''), ISNULL(Calle, N'') + N' ' + ISNULL(Numero, N''))) COLLATE Latin1_General_100_BIN2, NCHAR(9), N' '), NCHAR(13), N' '), NCHAR(10), N' '), N'á', N'a'), N'à', N'a'), N'â', N'a'), N'ä', N'a'), N'ã', N'a'), N'é', N'e'), N'è', N'e'), N'ê', N'e'), N'ë', N'e'), N'í', N'i'), N'ì', N'i'), N'î', N'i'), N'ï', N'i'), N'ó', N'o'), N'ò', N'o'), N'ô', N'o'), N'ö', N'o'), N'õ', N'o'), N'ú', N'u'), N'ù', N'u'), N'û', N'u'), N'ü', N'u'), N'ñ', N'n'), N'ç', N'c'), N' ', N' ' + NCHAR(1)), NCHAR(1) + N' ', N''), NCHAR(1), N''))) AS NVARCHAR(400)) PERSISTED;
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'IX_Direcciones_DireccionNorm' AND object_id = OBJECT_ID(N'dbo.Direcciones'))
+    CREATE NONCLUSTERED INDEX IX_Direcciones_DireccionNorm ON dbo.Direcciones (DireccionNorm);
+GO
+
+IF COL_LENGTH(N'dbo.Edificios', N'DireccionNorm') IS NULL
+    ALTER TABLE dbo.Edificios ADD DireccionNorm AS CAST(LTRIM(RTRIM(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(LOWER(ISNULL(NULLIF(Calle, N''), ISNULL(Direccion, N'')) + N' ' + ISNULL(Numero, N'')) COLLATE Latin1_General_100_BIN2, NCHAR(9), N' '), NCHAR(13), N' '), NCHAR(10), N' '), N'á', N'a'), N'à', N'a'), N'â', N'a'), N'ä', N'a'), N'ã', N'a'), N'é', N'e'), N'è', N'e'), N'ê', N'e'), N'ë', N'e'), N'í', N'i'), N'ì', N'i'), N'î', N'i'), N'ï', N'i'), N'ó', N'o'), N'ò', N'o'), N'ô', N'o'), N'ö', N'o'), N'õ', N'o'), N'ú', N'u'), N'ù', N'u'), N'û', N'u'), N'ü', N'u'), N'ñ', N'n'), N'ç', N'c'), N' ', N' ' + NCHAR(1)), NCHAR(1) + N' ', N''), NCHAR(1), N''))) AS NVARCHAR(400)) PERSISTED;
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'IX_Edificios_DireccionNorm' AND object_id = OBJECT_ID(N'dbo.Edificios'))
+    CREATE NONCLUSTERED INDEX IX_Edificios_DireccionNorm ON dbo.Edificios (DireccionNorm);
+GO
+
+IF COL_LENGTH(N'dbo.Comunas', N'NombreNorm') IS NULL
+    ALTER TABLE dbo.Comunas ADD NombreNorm AS CAST(LTRIM(RTRIM(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(LOWER(Nombre) COLLATE Latin1_General_100_BIN2, NCHAR(9), N' '), NCHAR(13), N' '), NCHAR(10), N' '), N'á', N'a'), N'à', N'a'), N'â', N'a'), N'ä', N'a'), N'ã', N'a'), N'é', N'e'), N'è', N'e'), N'ê', N'e'), N'ë', N'e'), N'í', N'i'), N'ì', N'i'), N'î', N'i'), N'ï', N'i'), N'ó', N'o'), N'ò', N'o'), N'ô', N'o'), N'ö', N'o'), N'õ', N'o'), N'ú', N'u'), N'ù', N'u'), N'û', N'u'), N'ü', N'u'), N'ñ', N'n'), N'ç', N'c'), N' ', N' ' + NCHAR(1)), NCHAR(1) + N' ', N''), NCHAR(1), N''))) AS NVARCHAR(400)) PERSISTED;
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'IX_Comunas_NombreNorm' AND object_id = OBJECT_ID(N'dbo.Comunas'))
+    CREATE NONCLUSTERED INDEX IX_Comunas_NombreNorm ON dbo.Comunas (NombreNorm);
+GO
+
+IF COL_LENGTH(N'dbo.Servicios', N'NombreNorm') IS NULL
+    ALTER TABLE dbo.Servicios ADD NombreNorm AS CAST(LTRIM(RTRIM(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(LOWER(Nombre) COLLATE Latin1_General_100_BIN2, NCHAR(9), N' '), NCHAR(13), N' '), NCHAR(10), N' '), N'á', N'a'), N'à', N'a'), N'â', N'a'), N'ä', N'a'), N'ã', N'a'), N'é', N'e'), N'è', N'e'), N'ê', N'e'), N'ë', N'e'), N'í', N'i'), N'ì', N'i'), N'î', N'i'), N'ï', N'i'), N'ó', N'o'), N'ò', N'o'), N'ô', N'o'), N'ö', N'o'), N'õ', N'o'), N'ú', N'u'), N'ù', N'u'), N'û', N'u'), N'ü', N'u'), N'ñ', N'n'), N'ç', N'c'), N' ', N' ' + NCHAR(1)), NCHAR(1) + N' ', N''), NCHAR(1), N''))) AS NVARCHAR(400)) PERSISTED;
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'IX_Servicios_NombreNorm' AND object_id = OBJECT_ID(N'dbo.Servicios'))
+    CREATE NONCLUSTERED INDEX IX_Servicios_NombreNorm ON dbo.Servicios (NombreNorm);
+GO
+
+IF COL_LENGTH(N'dbo.Instituciones', N'NombreNorm') IS NULL
+    ALTER TABLE dbo.Instituciones ADD NombreNorm AS CAST(LTRIM(RTRIM(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(LOWER(Nombre) COLLATE Latin1_General_100_BIN2, NCHAR(9), N' '), NCHAR(13), N' '), NCHAR(10), N' '), N'á', N'a'), N'à', N'a'), N'â', N'a'), N'ä', N'a'), N'ã', N'a'), N'é', N'e'), N'è', N'e'), N'ê', N'e'), N'ë', N'e'), N'í', N'i'), N'ì', N'i'), N'î', N'i'), N'ï', N'i'), N'ó', N'o'), N'ò', N'o'), N'ô', N'o'), N'ö', N'o'), N'õ', N'o'), N'ú', N'u'), N'ù', N'u'), N'û', N'u'), N'ü', N'u'), N'ñ', N'n'), N'ç', N'c'), N' ', N' ' + NCHAR(1)), NCHAR(1) + N' ', N''), NCHAR(1), N''))) AS NVARCHAR(400)) PERSISTED;
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'IX_Instituciones_NombreNorm' AND object_id = OBJECT_ID(N'dbo.Instituciones'))
+    CREATE NONCLUSTERED INDEX IX_Instituciones_NombreNorm ON dbo.Instituciones (NombreNorm);
+GO
@@ -0,0 +1,21 @@
+-- app/db/sql/003_file_blobs.sql
+-- Conteo de referencias del almacén por contenido (app/utils/blob_store.py).
+-- Documentos (Store = 'documentos') y facturas (Store = 'facturas').
+-- Limpieza de blobs sin referencias: POST /api/v1/blobs/gc
+
+IF OBJECT_ID(N'dbo.FileBlobs', N'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.FileBlobs (
+        Store     NVARCHAR(32) NOT NULL,
+        Sha256    CHAR(64)     NOT NULL,
+        Size      BIGINT       NULL,
+        RefCount  INT          NOT NULL CONSTRAINT DF_FileBlobs_RefCount DEFAULT (0),
+        CreatedAt DATETIME2    NOT NULL CONSTRAINT DF_FileBlobs_CreatedAt DEFAULT (SYSUTCDATETIME()),
+        UpdatedAt DATETIME2    NOT NULL CONSTRAINT DF_FileBlobs_UpdatedAt DEFAULT (SYSUTCDATETIME()),
+        CONSTRAINT PK_FileBlobs PRIMARY KEY CLUSTERED (Store, Sha256)
+    );
+
+    CREATE NONCLUSTERED INDEX IX_FileBlobs_Gc
+        ON dbo.FileBlobs (Store, RefCount, UpdatedAt);
+END
+GO
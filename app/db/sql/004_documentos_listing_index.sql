@@ -0,0 +1,12 @@
+-- app/db/sql/004_documentos_listing_index.sql
+-- Índice para los listados paginados de documentos (app/services/documento_listing.py):
+-- WHERE ServicioId = ? AND TipoDocumentoId [= ? | IN (...)] AND Active = 1
+--       [AND CreatedAt >= 1-ene AND CreatedAt < 1-ene siguiente]
+-- ORDER BY CreatedAt DESC, Id DESC
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'IX_Documentos_Servicio_Tipo_CreatedAt'
+               AND object_id = OBJECT_ID(N'dbo.Documentos'))
+    CREATE NONCLUSTERED INDEX IX_Documentos_Servicio_Tipo_CreatedAt
+        ON dbo.Documentos (ServicioId, TipoDocumentoId, CreatedAt DESC, Id DESC)
+        INCLUDE (Active, EtapaSEV_docs);
+GO
@@ -0,0 +1,15 @@
+-- app/db/sql/005_user_auth_versions.sql
+-- Versión de autorización por usuario (app/core/auth_claims.py).
+-- UsuarioVinculoService.set_roles / set_active la incrementan; los JWT que
+-- traen una versión anterior se validan con la carga completa desde BD.
+
+IF OBJECT_ID(N'dbo.UserAuthVersions', N'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.UserAuthVersions (
+        UserId    NVARCHAR(450) NOT NULL,
+        Version   INT           NOT NULL CONSTRAINT DF_UserAuthVersions_Version DEFAULT (0),
+        UpdatedAt DATETIME2     NOT NULL CONSTRAINT DF_UserAuthVersions_UpdatedAt DEFAULT (SYSUTCDATETIME()),
+        CONSTRAINT PK_UserAuthVersions PRIMARY KEY CLUSTERED (UserId)
+    );
+END
+GO
@@ -0,0 +1,26 @@
+-- app/db/sql/006_auth_sessions.sql
+-- Sesiones de refresh token (app/core/session_store.py).
+-- Solo se guarda SHA-256 del secreto; PrevTokenHash detecta reuso tras rotar.
+
+IF OBJECT_ID(N'dbo.AuthSessions', N'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.AuthSessions (
+        Id                CHAR(32)      NOT NULL,
+        UserId            NVARCHAR(450) NOT NULL,
+        TokenHash         CHAR(64)      NOT NULL,
+        PrevTokenHash     CHAR(64)      NULL,
+        RotatedAt         DATETIME2     NULL,
+        CreatedAt         DATETIME2     NOT NULL CONSTRAINT DF_AuthSessions_CreatedAt DEFAULT (SYSUTCDATETIME()),
+        LastUsedAt        DATETIME2     NOT NULL CONSTRAINT DF_AuthSessions_LastUsedAt DEFAULT (SYSUTCDATETIME()),
+        ExpiresAt         DATETIME2     NOT NULL,
+        AbsoluteExpiresAt DATETIME2     NOT NULL,
+        RevokedAt         DATETIME2     NULL,
+        Ip                NVARCHAR(64)  NULL,
+        UserAgent         NVARCHAR(512) NULL,
+        CONSTRAINT PK_AuthSessions PRIMARY KEY CLUSTERED (Id)
+    );
+
+    CREATE NONCLUSTERED INDEX IX_AuthSessions_User
+        ON dbo.AuthSessions (UserId, RevokedAt, ExpiresAt);
+END
+GO
@@ -0,0 +1,39 @@
+-- app/db/sql/007_edificios_direccion_key.sql
+-- Clave de dirección de Edificios: '<ComunaId>|<calle número normalizados>'
+-- (misma regla que app.utils.normalize.norm_key; ver
+-- app.services.edificio_service.edificio_address_key). Índice único filtrado
+-- (ComunaId IS NOT NULL) para detectar duplicados en create/update/lote.
+-- Si ya hay duplicados históricos se crea el índice NO único y se listan:
+-- depurarlos y volver a ejecutar este script para dejarlo único.
+
+IF COL_LENGTH(N'dbo.Edificios', N'DireccionKey') IS NULL
+    ALTER TABLE dbo.Edificios ADD DireccionKey AS CAST(CAST(ComunaId AS NVARCHAR(20)) + N'|' + CAST(LTRIM(RTRIM(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(LOWER(ISNULL(NULLIF(Calle, N''), ISNULL(Direccion, N'')) + N' ' + ISNULL(Numero, N'')) COLLATE Latin1_General_100_BIN2, NCHAR(9), N' '), NCHAR(13), N' '), NCHAR(10), N' '), N'á', N'a'), N'à', N'a'), N'â', N'a'), N'ä', N'a'), N'ã', N'a'), N'é', N'e'), N'è', N'e'), N'ê', N'e'), N'ë', N'e'), N'í', N'i'), N'ì', N'i'), N'î', N'i'), N'ï', N'i'), N'ó', N'o'), N'ò', N'o'), N'ô', N'o'), N'ö', N'o'), N'õ', N'o'), N'ú', N'u'), N'ù', N'u'), N'û', N'u'), N'ü', N'u'), N'ñ', N'n'), N'ç', N'c'), N' ', N' ' + NCHAR(1)), NCHAR(1) + N' ', N''), NCHAR(1), N''))) AS NVARCHAR(400)) AS NVARCHAR(430)) PERSISTED;
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'UX_Edificios_DireccionKey' AND object_id = OBJECT_ID(N'dbo.Edificios'))
+BEGIN
+    IF EXISTS (
+        SELECT DireccionKey FROM dbo.Edificios
+        WHERE ComunaId IS NOT NULL
+        GROUP BY DireccionKey HAVING COUNT(*) > 1
+    )
+    BEGIN
+        PRINT N'Edificios con dirección duplicada: se crea IX_Edificios_DireccionKey (no único).';
+        SELECT DireccionKey, COUNT(*) AS Cantidad, MIN(Id) AS PrimerId
+        FROM dbo.Edificios
+        WHERE ComunaId IS NOT NULL
+        GROUP BY DireccionKey HAVING COUNT(*) > 1;
+
+        IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'IX_Edificios_DireccionKey' AND object_id = OBJECT_ID(N'dbo.Edificios'))
+            CREATE NONCLUSTERED INDEX IX_Edificios_DireccionKey
+                ON dbo.Edificios (DireccionKey) WHERE ComunaId IS NOT NULL;
+    END
+    ELSE
+    BEGIN
+        IF EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'IX_Edificios_DireccionKey' AND object_id = OBJECT_ID(N'dbo.Edificios'))
+            DROP INDEX IX_Edificios_DireccionKey ON dbo.Edificios;
+        CREATE UNIQUE NONCLUSTERED INDEX UX_Edificios_DireccionKey
+            ON dbo.Edificios (DireccionKey) WHERE ComunaId IS NOT NULL;
+    END
+END
+GO
@@ -0,0 +1,47 @@
+-- app/db/sql/008_compra_prorrateo_mensual.sql
+-- Consumo/Costo de cada compra activa repartido por mes calendario según su
+-- periodo de lectura (app/services/prorrateo.py). Lo mantiene la API en cada
+-- flush; backfill: POST /api/v1/reportes/prorrateo/rebuild. Los reportes solo leen la tabla cuando
+-- dbo.CompraProrrateoEstado.ConstruidoAt no es NULL (lo marca el rebuild).
+
+IF OBJECT_ID(N'dbo.CompraProrrateoMensual', N'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.CompraProrrateoMensual (
+        CompraId        BIGINT NOT NULL,
+        Periodo         DATE   NOT NULL,          -- primer día del mes
+        DivisionId      BIGINT NOT NULL,
+        EnergeticoId    BIGINT NOT NULL,
+        NumeroClienteId BIGINT NULL,
+        Dias            INT    NOT NULL,          -- días del periodo de lectura en el mes (0 = sin periodo)
+        Fraccion        FLOAT  NOT NULL,
+        Consumo         FLOAT  NOT NULL,
+        Costo           FLOAT  NOT NULL,
+        CONSTRAINT PK_CompraProrrateoMensual PRIMARY KEY CLUSTERED (CompraId, Periodo)
+    );
+
+    -- serie_mensual: WHERE DivisionId = ? AND EnergeticoId = ? AND Periodo >= ? AND Periodo < ?
+    CREATE NONCLUSTERED INDEX IX_CompraProrrateoMensual_Div_Ene_Periodo
+        ON dbo.CompraProrrateoMensual (DivisionId, EnergeticoId, Periodo)
+        INCLUDE (Consumo, Costo);
+
+    -- cobertura por número de cliente
+    CREATE NONCLUSTERED INDEX IX_CompraProrrateoMensual_NumeroCliente_Periodo
+        ON dbo.CompraProrrateoMensual (NumeroClienteId, Periodo)
+        WHERE NumeroClienteId IS NOT NULL;
+END
+GO
+
+IF OBJECT_ID(N'dbo.CompraProrrateoEstado', N'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.CompraProrrateoEstado (
+        Id           TINYINT   NOT NULL CONSTRAINT DF_CompraProrrateoEstado_Id DEFAULT (1),
+        ConstruidoAt DATETIME2 NULL,              -- fin del último rebuild completo
+        CONSTRAINT PK_CompraProrrateoEstado PRIMARY KEY (Id),
+        CONSTRAINT CK_CompraProrrateoEstado_Id CHECK (Id = 1)
+    );
+END
+GO
+
+IF NOT EXISTS (SELECT 1 FROM dbo.CompraProrrateoEstado)
+    INSERT INTO dbo.CompraProrrateoEstado (Id, ConstruidoAt) VALUES (1, NULL);
+GO
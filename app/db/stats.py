@@ -0,0 +1,91 @@
+# app/db/stats.py
+"""
+Conteos aproximados para grillas grandes.
+
+- table_row_estimate(): filas de la tabla según sys.dm_db_partition_stats
+  (metadato, O(1); no escanea la tabla).
+- capped_count(): COUNT exacto hasta un tope (TOP N); sobre el tope se informa
+  el tope como estimación.
+- page_total(): total de una página según el modo count=exact|estimate|none
+  que exponen los listados (unidades, medidores).
+"""
+from __future__ import annotations
+
+import logging
+from typing import Optional, Tuple
+
+from sqlalchemy import func, literal, select, text
+
+Log = logging.getLogger(__name__)
+
+COUNT_MODES = ("exact", "estimate", "none")
+# Tope por defecto para capped_count (sobre esto la grilla muestra "10.000+")
+DEFAULT_COUNT_CAP = 10_000
+
+
+def table_row_estimate(db, table: str) -> Optional[int]:
+    """Filas (heap/índice clustered) de `table` ('dbo.Tabla'); None si no se puede leer."""
+    try:
+        return db.execute(
+            text(
+                """
+                SELECT SUM(ps.row_count)
+                FROM sys.dm_db_partition_stats ps
+                WHERE ps.object_id = OBJECT_ID(:t) AND ps.index_id IN (0, 1)
+                """
+            ),
+            {"t": table},
+        ).scalar()
+    except Exception as ex:
+        # requiere VIEW DATABASE STATE; sin permiso el llamador cae al conteo acotado
+        Log.warning("STATS table_row_estimate(%s) falló: %s", table, ex)
+        return None
+
+
+def capped_count(db, query, cap: int = DEFAULT_COUNT_CAP) -> Tuple[int, bool]:
+    """
+    (total, es_estimacion) para una ORM Query: cuenta a lo más cap+1 filas.
+    Si hay más de `cap`, devuelve (cap, True).
+    """
+    sub = query.with_entities(literal(1).label("x")).order_by(None).limit(cap + 1).subquery()
+    n = int(db.execute(select(func.count()).select_from(sub)).scalar() or 0)
+    if n > cap:
+        return cap, True
+    return n, False
+
+
+def page_total(
+    db,
+    mode: str,
+    query,
+    *,
+    page: int,
+    page_size: int,
+    n_items: int,
+    has_more: bool,
+    keyset: bool = False,
+    table: Optional[str] = None,
+    filtered: bool = True,
+) -> Tuple[int, bool]:
+    """
+    (total, es_estimacion) de una página. `query` es la ORM Query filtrada, sin
+    el predicado del cursor ni el orden.
+
+    - none: sin consulta extra. Paginando por número, filas hasta esta página
+      (+1 si hay más). Con keyset (`keyset=True`, cursor/after_id) `page` no
+      aplica y no se sabe cuántas filas quedaron antes del cursor: se informan
+      las filas desde el cursor (+1 si hay más) como estimación (cota inferior).
+    - estimate: sin filtros y con `table`, table_row_estimate(); si no,
+      capped_count().
+    - exact: COUNT(*).
+    """
+    if mode == "none":
+        if keyset:
+            return n_items + (1 if has_more else 0), True
+        return (page - 1) * page_size + n_items + (1 if has_more else 0), has_more
+    if mode == "estimate":
+        est = table_row_estimate(db, table) if table and not filtered else None
+        if est is not None:
+            return int(est), True
+        return capped_count(db, query)
+    return int(query.order_by(None).count()), False
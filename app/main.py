@@ -21,6 +21,10 @@ from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
 
 from app.db.session import engine
 from app.audit import hooks  # registra listeners al boot
+from app.search import hooks as search_hooks  # noqa: F401  mantiene dbo.SearchTokens
+from app.services import territorio  # árbol región/provincia/comuna en memoria
+from app.services import prorrateo  # noqa: F401  mantiene dbo.CompraProrrateoMensual
+from app.utils import mail, mail_queue  # cola de correo saliente (worker en segundo plano)
 from app.audit.context import current_request_meta
 
 # ───────────────────────────────────────────────────────────────────────────────
@@ -131,6 +135,7 @@ tags_metadata = [
     {"name": "Áreas", "description": "Gestión de áreas por piso."},
     {"name": "Direcciones", "description": "Catálogo/CRUD de direcciones y resolución exacta."},
     {"name": "Parámetros de medición", "description": "Catálogo y CRUD de parámetros (vinculados a UM)."},
+    {"name": "Búsqueda", "description": "Índice de búsqueda (divisiones, medidores, números de cliente)."},
 ]
 
 # ───────────────────────────────────────────────────────────────────────────────
@@ -356,6 +361,31 @@ def health_db():
     except Exception:
         raise HTTPException(status_code=503, detail="DB unavailable")
 
+# ───────────────────────────────────────────────────────────────────────────────
+# Startup: precarga de catálogos en memoria
+# ───────────────────────────────────────────────────────────────────────────────
+@app.on_event("startup")
+def preload_territorio():
+    # Si la BD no responde al arranque, territorio.get() lo carga en el primer uso
+    try:
+        with engine.connect() as conn:
+            territorio.load(conn)
+    except Exception as e:
+        log.warning("No se pudo precargar el árbol territorial: %s", e)
+
+@app.on_event("startup")
+def start_mail_worker():
+    # Retoma correos pendientes del spool (reinicios / caídas del servidor SMTP)
+    if mail.is_configured():
+        if mail_queue.is_configured():
+            mail_queue.start_worker()
+        else:
+            log.warning("MAIL_SPOOL_PATH no configurado: los correos se envían en línea, sin cola ni reintentos")
+
+@app.on_event("shutdown")
+def stop_mail_worker():
+    mail_queue.stop_worker()
+
 # ───────────────────────────────────────────────────────────────────────────────
 # Routers (importa SOLO routers; no módulos/servicios)
 # ───────────────────────────────────────────────────────────────────────────────
@@ -413,6 +443,8 @@ from app.api.v1.archivos import router as archivos_router
 from app.api.v1.auth_password_reset import router as auth_password_reset_router
 from app.api.v1.tipos_uso import router as tipo_usos_router
 from app.api.v1.tipos_propiedades import router as tipo_propiedades_router
+from app.api.v1.search import router as search_router
+from app.api.v1.blobs import router as blobs_router
 
 # Montaje
 app.include_router(debug.dbg)
@@ -469,4 +501,6 @@ app.include_router(archivos_router)
 app.include_router(auth_password_reset_router)
 app.include_router(sistemas_mantenedores.router)
 app.include_router(tipo_usos_router)
-app.include_router(tipo_propiedades_router)
\ No newline at end of file
+app.include_router(tipo_propiedades_router)
+app.include_router(search_router)
+app.include_router(blobs_router)
@@ -16,4 +16,9 @@ class UserPublic(BaseModel):
 class TokenResponse(BaseModel):
     access_token: str
     token_type: str = "bearer"
+    expires_in: int | None = None          # segundos de vida del access token
+    refresh_token: str | None = None       # None si no hay tabla de sesiones
     user: UserPublic
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
@@ -376,6 +376,36 @@ class CompraCreate(BaseModel):
         return self
 
 
+class CompraLoteFilaResult(BaseModel):
+    Indice: int                          # posición en el lote recibido
+    Linea: Optional[int] = None          # línea del archivo (importación de distribuidora)
+    CompraId: Optional[int] = None       # Id creado (si la fila entró)
+    Codigo: Optional[str] = None         # validacion | unidad_sin_inmueble | division_mismatch | forbidden_scope | error_bd ...
+    Error: Optional[str] = None
+
+
+class CompraLoteResult(BaseModel):
+    Total: int
+    Creadas: int
+    ConError: int
+    Resultados: List[CompraLoteFilaResult] = Field(default_factory=list)
+
+
+class DistribuidoraLineaSinEmparejar(BaseModel):
+    Linea: int
+    Codigo: str                          # numero_cliente_no_encontrado | medidor_no_encontrado | *_ambiguo | formato ...
+    Error: Optional[str] = None
+    NumeroCliente: Optional[str] = None
+    Medidor: Optional[str] = None
+
+
+class DistribuidoraImportResult(BaseModel):
+    Lineas: int
+    Emparejadas: int
+    SinEmparejar: List[DistribuidoraLineaSinEmparejar] = Field(default_factory=list)
+    Compras: CompraLoteResult
+
+
 class CompraUpdate(BaseModel):
     """
     Patch/put: mismos criterios; no rompemos llamados existentes.
@@ -486,3 +516,27 @@ class CompraFullPage(BaseModel):
     page: int
     page_size: int
     items: List[CompraFullDetalleDTO]
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Reporte de periodos solapados
+# ─────────────────────────────────────────────────────────────────────────────
+class CompraSolapeDTO(BaseModel):
+    CompraId: int
+    OtraCompraId: int
+    Claves: List[str] = Field(default_factory=list)   # "NumeroCliente:<id>" | "Medidor:<id>"
+    InicioSolape: DateLike = None
+    FinSolape: DateLike = None
+    Dias: int = 0
+
+    @field_serializer("InicioSolape", "FinSolape", when_used="json")
+    def _ser_dates(self, v: Optional[datetime], _info):
+        return _ser_date(v)
+
+
+class CompraSolapesReport(BaseModel):
+    ServicioId: int
+    Compras: int
+    Solapes: int
+    Truncado: bool = False
+    Pares: List[CompraSolapeDTO] = Field(default_factory=list)
@@ -1,5 +1,5 @@
 from __future__ import annotations
-from typing import Optional, List
+from typing import Dict, Optional, List
 from datetime import datetime
 from pydantic import BaseModel, ConfigDict
 
@@ -40,6 +40,29 @@ class DocumentoResponse(BaseModel):
     InformeDA: Optional[dict] = None
     ResolucionApruebaPlanDTO: Optional[dict] = None
 
+# ---------- Tablero documental (todas las categorías de un servicio) ----------
+class DocumentoCategoriaResumen(BaseModel):
+    Total: int = 0
+    Items: List[dict] = []
+
+class DocumentoDashboardResponse(BaseModel):
+    Ok: bool = True
+    ServicioId: int
+    Etapa: Optional[int] = None
+
+    NoRegistraPoliticaAmbiental: Optional[bool] = None
+    NoRegistraDifusionInterna:   Optional[bool] = None
+    NoRegistraActividadInterna:  Optional[bool] = None
+    NoRegistraReutilizacionPapel: Optional[bool] = None
+    NoRegistraProcFormalPapel:    Optional[bool] = None
+    NoRegistraDocResiduosCertificados: Optional[bool] = None
+    NoRegistraDocResiduosSistemas:     Optional[bool] = None
+    NoRegistraProcBajaBienesMuebles:   Optional[bool] = None
+    NoRegistraProcComprasSustentables: Optional[bool] = None
+
+    # clave = ruta del listado (comite, politica, difusiones, procedimientos, ...)
+    Categorias: Dict[str, DocumentoCategoriaResumen] = {}
+
 # ---------- DTOs base de creación/edición ----------
 class DocumentoBaseIn(BaseModel):
     ServicioId: int
@@ -1,6 +1,6 @@
 # app/schemas/edificio.py
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
 class EdificioSelectDTO(BaseModel):
     Id: int
@@ -42,3 +42,13 @@ class EdificioCreate(BaseModel):
 
 class EdificioUpdate(EdificioCreate):
     Active: Optional[bool] = None  # por si quieres activar/desactivar
+
+class EdificioConflictoDTO(BaseModel):
+    Indice: int                            # posición en el lote recibido
+    Motivo: str                            # "existente" | "duplicado_en_lote"
+    EdificioId: Optional[int] = None       # edificio ya registrado (Motivo = existente)
+    IndiceOriginal: Optional[int] = None   # primera aparición en el lote (duplicado_en_lote)
+
+class EdificioLoteResult(BaseModel):
+    Creados: List[EdificioDTO] = []
+    Conflictos: List[EdificioConflictoDTO] = []
@@ -69,6 +69,9 @@ class MedidorPage(BaseModel):
     page: int
     page_size: int
     items: List[MedidorListDTO]
+    # keyset: pasar como after_id para la página siguiente (None = no hay más)
+    next_after_id: Optional[int] = None
+    total_estimated: bool = False
 
 
 # ======================================
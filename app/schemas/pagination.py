@@ -1,5 +1,5 @@
 from __future__ import annotations
-from typing import Generic, List, TypeVar
+from typing import Generic, List, Optional, TypeVar
 from pydantic import BaseModel
 
 T = TypeVar("T")
@@ -9,6 +9,9 @@ class PageMeta(BaseModel):
     page: int
     page_size: int
     pages: int
+    # Paginación keyset / conteo aproximado (opcionales; solo algunos listados los usan)
+    next_cursor: Optional[str] = None
+    total_estimated: bool = False
 
 class Page(BaseModel, Generic[T]):
     data: List[T]
@@ -1,6 +1,6 @@
 from __future__ import annotations
 from pydantic import BaseModel, ConfigDict
-from typing import Optional
+from typing import List, Optional
 
 class SerieMensualDTO(BaseModel):
     model_config = ConfigDict(from_attributes=True)
@@ -29,3 +29,17 @@ class KPIsDTO(BaseModel):
     ConsumoTotal: float
     CostoTotal: float
     CostoUnitario: float
+
+class BrechaItemDTO(BaseModel):
+    Id: int                                  # NumeroClienteId o MedidorId según Nivel
+    Numero: Optional[str] = None
+    DivisionId: Optional[int] = None
+    NumeroClienteId: Optional[int] = None
+    MesesFaltantes: List[str] = []           # "YYYY-MM"
+
+class BrechasDTO(BaseModel):
+    Nivel: str                               # numero_cliente | medidor
+    Meses: int                               # meses evaluados
+    Total: int                               # sujetos evaluados
+    ConBrechas: int
+    Items: List[BrechaItemDTO] = []
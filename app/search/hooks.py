@@ -0,0 +1,91 @@
+# app/search/hooks.py
+"""
+Mantiene dbo.SearchTokens al día de forma incremental: en cada flush se
+reindexan solo las entidades creadas/borradas o cuyos campos de texto
+cambiaron, dentro de la misma transacción del request.
+(Se registra al importar el módulo, igual que app.audit.hooks)
+"""
+from __future__ import annotations
+
+import logging
+from typing import Dict, Set
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+
+from app.db.models.direccion import Direccion
+from app.db.models.division import Division
+from app.db.models.medidor import Medidor
+from app.db.models.numero_cliente import NumeroCliente
+from app.search import index
+
+Log = logging.getLogger(__name__)
+
+# Modelo -> (entidad del índice, campos que alimentan los tokens)
+_WATCHED = {
+    Division: (index.ENTITY_DIVISION, ("Nombre", "Direccion", "NroRol", "DireccionInmuebleId")),
+    Medidor: (index.ENTITY_MEDIDOR, ("Numero",)),
+    NumeroCliente: (index.ENTITY_NUMERO_CLIENTE, ("Numero", "NombreCliente")),
+}
+# Las direcciones no son entidad propia: reindexan las divisiones que las usan
+_DIRECCION_FIELDS = ("Calle", "Numero", "DireccionCompleta")
+
+
+def _text_changed(obj, fields) -> bool:
+    state = inspect(obj)
+    return any(state.attrs[f].history.has_changes() for f in fields)
+
+
+@event.listens_for(Session, "after_flush")
+def search_after_flush(session: Session, flush_context):
+    if not index.SEARCH_INDEX_ENABLED:
+        return
+
+    touched: Dict[str, Set[int]] = {}
+    removed: Dict[str, Set[int]] = {}
+    direccion_ids: Set[int] = set()
+
+    for obj in session.new:
+        if isinstance(obj, Direccion):
+            continue  # una dirección nueva aún no la referencia ninguna división
+        spec = _WATCHED.get(type(obj))
+        if spec and getattr(obj, "Id", None) is not None:
+            touched.setdefault(spec[0], set()).add(int(obj.Id))
+
+    for obj in session.dirty:
+        if isinstance(obj, Direccion):
+            if obj.Id is not None and _text_changed(obj, _DIRECCION_FIELDS):
+                direccion_ids.add(int(obj.Id))
+            continue
+        spec = _WATCHED.get(type(obj))
+        if spec and getattr(obj, "Id", None) is not None and _text_changed(obj, spec[1]):
+            touched.setdefault(spec[0], set()).add(int(obj.Id))
+
+    for obj in session.deleted:
+        spec = _WATCHED.get(type(obj))
+        if spec and getattr(obj, "Id", None) is not None:
+            removed.setdefault(spec[0], set()).add(int(obj.Id))
+
+    if not (touched or removed or direccion_ids):
+        return
+
+    try:
+        conn = session.connection()
+        if not index.is_available(conn):
+            return
+
+        if direccion_ids:
+            div_ids = conn.execute(
+                select(Division.Id).where(Division.DireccionInmuebleId.in_(sorted(direccion_ids)))
+            ).scalars().all()
+            touched.setdefault(index.ENTITY_DIVISION, set()).update(int(x) for x in div_ids)
+
+        for entity, ids in removed.items():
+            index.remove(conn, entity, ids)
+            touched.get(entity, set()).difference_update(ids)
+        for entity, ids in touched.items():
+            index.reindex(conn, entity, ids)
+    except Exception as e:
+        # El índice nunca debe botar la escritura de negocio: se recupera con /search/reindex
+        Log.warning("SEARCH after_flush no pudo actualizar tokens: %s", e)
+        session.info["search_index_error"] = f"{type(e).__name__}: {e}"
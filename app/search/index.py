@@ -0,0 +1,214 @@
+# app/search/index.py
+"""
+Índice invertido de búsqueda (dbo.SearchTokens).
+
+- Cada entidad indexada guarda sus tokens plegados (sin tildes, minúsculas).
+- Las búsquedas se resuelven con prefijo por token (Token LIKE 'valpa%'),
+  que es sargable sobre la PK (EntityType, Token, EntityId), y se intersectan
+  por palabra: "brasil 1450" => entidades con un token 'brasil%' Y uno '1450%'.
+- Los listados usan match_ids()/match_sql() como subconsulta de IDs candidatos
+  (sin materializar listas en Python) y luego hidratan solo la página.
+- Si la tabla no existe o SEARCH_INDEX_ENABLED=0, is_available() devuelve False
+  y los servicios mantienen su LIKE '%q%' histórico.
+"""
+from __future__ import annotations
+
+import logging
+import os
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, intersect, select, text
+from sqlalchemy.orm import Session
+
+from app.db.models.direccion import Direccion
+from app.db.models.division import Division
+from app.db.models.medidor import Medidor
+from app.db.models.numero_cliente import NumeroCliente
+from app.db.models.search_token import SearchToken
+from app.utils.normalize import tokenize
+
+Log = logging.getLogger(__name__)
+
+SEARCH_INDEX_ENABLED = os.getenv("SEARCH_INDEX_ENABLED", "1") == "1"
+
+ENTITY_DIVISION = "division"            # divisiones e inmuebles (misma tabla)
+ENTITY_MEDIDOR = "medidor"
+ENTITY_NUMERO_CLIENTE = "numero_cliente"
+ENTITIES = (ENTITY_DIVISION, ENTITY_MEDIDOR, ENTITY_NUMERO_CLIENTE)
+
+# Límite de palabras por búsqueda (cada una agrega un INTERSECT)
+MAX_QUERY_TOKENS = 6
+# SQL Server admite 2100 parámetros por sentencia; trabajamos en lotes holgados
+_ID_CHUNK = 1000
+
+ST_TBL = SearchToken.__table__
+
+_AVAILABLE: Optional[bool] = None
+
+
+def is_available(db) -> bool:
+    """True si dbo.SearchTokens existe (se consulta una vez por proceso)."""
+    global _AVAILABLE
+    if not SEARCH_INDEX_ENABLED:
+        return False
+    if _AVAILABLE is None:
+        try:
+            row = db.execute(text("SELECT OBJECT_ID(N'dbo.SearchTokens', N'U')")).scalar()
+            _AVAILABLE = row is not None
+        except Exception as ex:
+            Log.warning("SEARCH is_available falló: %s", ex)
+            return False
+        Log.info("SEARCH índice de tokens disponible=%s", _AVAILABLE)
+    return _AVAILABLE
+
+
+def query_tokens(q: Optional[str]) -> List[str]:
+    return tokenize(q)[:MAX_QUERY_TOKENS]
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Lectura: IDs candidatos
+# ─────────────────────────────────────────────────────────────────────────────
+def match_ids(entity: str, q: Optional[str]):
+    """
+    Subconsulta (SELECT EntityId ...) con los IDs que calzan con q.
+    Retorna None si q no genera tokens (el llamador no filtra).
+    Uso: query.filter(Division.Id.in_(match_ids(ENTITY_DIVISION, q)))
+    """
+    toks = query_tokens(q)
+    if not toks:
+        return None
+    selects = [
+        select(ST_TBL.c.EntityId).where(
+            ST_TBL.c.EntityType == entity,
+            ST_TBL.c.Token.like(f"{tok}%"),
+        )
+        for tok in toks
+    ]
+    return selects[0] if len(selects) == 1 else intersect(*selects)
+
+
+def candidates(db, entity: str, q: Optional[str]):
+    """match_ids() si el índice está disponible; None => el llamador usa su LIKE."""
+    if not q or not is_available(db):
+        return None
+    return match_ids(entity, q)
+
+
+def candidates_sql(db, entity: str, q: Optional[str], id_column: str, prefix: str = "st"):
+    """match_sql() si el índice está disponible; None => el llamador usa su LIKE."""
+    if not q or not is_available(db):
+        return None
+    return match_sql(entity, q, id_column, prefix)
+
+
+def match_sql(entity: str, q: Optional[str], id_column: str, prefix: str = "st") -> Optional[Tuple[str, Dict[str, Any]]]:
+    """
+    Variante para SQL crudo (text()): devuelve (fragmento, params) con
+    "<id_column> IN (SELECT EntityId ... INTERSECT ...)".
+    """
+    toks = query_tokens(q)
+    if not toks:
+        return None
+    params: Dict[str, Any] = {f"{prefix}_et": entity}
+    parts: List[str] = []
+    for i, tok in enumerate(toks):
+        params[f"{prefix}_t{i}"] = f"{tok}%"
+        parts.append(
+            f"SELECT {prefix}.EntityId FROM dbo.SearchTokens {prefix} WITH (NOLOCK) "
+            f"WHERE {prefix}.EntityType = :{prefix}_et AND {prefix}.Token LIKE :{prefix}_t{i}"
+        )
+    return f"{id_column} IN ({' INTERSECT '.join(parts)})", params
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Escritura: textos fuente por entidad
+# ─────────────────────────────────────────────────────────────────────────────
+def _source_stmt(entity: str):
+    if entity == ENTITY_DIVISION:
+        return (
+            select(
+                Division.Id,
+                Division.Nombre,
+                Division.Direccion,
+                Division.NroRol,
+                Direccion.Calle,
+                Direccion.Numero,
+                Direccion.DireccionCompleta,
+            )
+            .select_from(Division)
+            .outerjoin(Direccion, Direccion.Id == Division.DireccionInmuebleId)
+        ), Division.Id
+    if entity == ENTITY_MEDIDOR:
+        return select(Medidor.Id, Medidor.Numero), Medidor.Id
+    if entity == ENTITY_NUMERO_CLIENTE:
+        return select(NumeroCliente.Id, NumeroCliente.Numero, NumeroCliente.NombreCliente), NumeroCliente.Id
+    raise ValueError(f"Entidad de búsqueda desconocida: {entity}")
+
+
+def _token_rows(entity: str, rows: Iterable) -> List[dict]:
+    out: List[dict] = []
+    for r in rows:
+        for tok in tokenize(*[v for v in r[1:] if v is not None]):
+            out.append({"EntityType": entity, "Token": tok, "EntityId": int(r[0])})
+    return out
+
+
+def _chunks(ids: List[int], size: int = _ID_CHUNK):
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+
+def reindex(conn, entity: str, ids: Iterable[int]) -> int:
+    """
+    Reescribe los tokens de las entidades indicadas (borra + inserta).
+    `conn` puede ser Session o Connection (se usa dentro de after_flush).
+    Entidades que ya no existen quedan sin tokens.
+    """
+    id_list = sorted({int(i) for i in ids if i is not None})
+    if not id_list:
+        return 0
+    stmt, pk = _source_stmt(entity)
+    written = 0
+    for chunk in _chunks(id_list):
+        conn.execute(
+            delete(ST_TBL).where(ST_TBL.c.EntityType == entity, ST_TBL.c.EntityId.in_(chunk))
+        )
+        payload = _token_rows(entity, conn.execute(stmt.where(pk.in_(chunk))).all())
+        if payload:
+            conn.execute(ST_TBL.insert(), payload)
+            written += len(payload)
+    return written
+
+
+def remove(conn, entity: str, ids: Iterable[int]) -> None:
+    id_list = sorted({int(i) for i in ids if i is not None})
+    for chunk in _chunks(id_list):
+        conn.execute(
+            delete(ST_TBL).where(ST_TBL.c.EntityType == entity, ST_TBL.c.EntityId.in_(chunk))
+        )
+
+
+def rebuild(db: Session, entity: str, batch_size: int = 2000) -> int:
+    """
+    Reconstruye el índice completo de una entidad (backfill).
+    Recorre por keyset sobre Id y hace commit por lote.
+    """
+    stmt, pk = _source_stmt(entity)
+    db.execute(delete(ST_TBL).where(ST_TBL.c.EntityType == entity))
+    db.commit()
+
+    last_id = 0
+    total = 0
+    while True:
+        rows = db.execute(stmt.where(pk > last_id).order_by(pk.asc()).limit(batch_size)).all()
+        if not rows:
+            break
+        payload = _token_rows(entity, rows)
+        if payload:
+            db.execute(ST_TBL.insert(), payload)
+            total += len(payload)
+        db.commit()
+        last_id = int(rows[-1][0])
+    Log.info("SEARCH rebuild %s → %s tokens", entity, total)
+    return total
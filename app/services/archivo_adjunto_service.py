@@ -4,15 +4,17 @@ from __future__ import annotations
 import os
 import re
 from datetime import datetime
-from pathlib import Path
 from typing import List, Tuple
 
 from fastapi import UploadFile, HTTPException
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
 from app.db.models.archivo_adjunto import ArchivoAdjunto
 from app.db.models.tipo_archivo import TipoArchivo
 from app.db.models.compra import Compra  # para setear FacturaId
+from app.utils.blob_store import BlobStore
+from app.utils.uploads import StoredUpload
 
 # ─────────────────────────────────────────────────────────────────────────────
 # Config
@@ -21,26 +23,23 @@ FACTURAS_DIR = os.getenv("FACTURAS_DIR", "/var/app/data/facturas")
 SMB_UNC_PREFIX = os.getenv("SMB_UNC_PREFIX", "")
 SMB_MOUNT_PREFIX = os.getenv("SMB_MOUNT_PREFIX", "")
 MAX_SIZE = 4 * 1024 * 1024  # 4 MB
+MAX_SIZE_DETAIL = "El archivo supera los 4 MB."
+# Facturas por contenido (SHA-256) bajo FACTURAS_DIR/blobs; Url guarda la ruta del blob
+# (ArchivoAdjuntos no tiene borrado: toda fila cuenta como referencia para el GC)
+FACTURAS_STORE = BlobStore(
+    "facturas",
+    FACTURAS_DIR,
+    ref_queries=["SELECT Url FROM dbo.ArchivoAdjuntos WITH (NOLOCK) WHERE Url IS NOT NULL"],
+)
 
 # ─────────────────────────────────────────────────────────────────────────────
 # Helpers
 # ─────────────────────────────────────────────────────────────────────────────
-def _ensure_dir(path: str) -> None:
-    Path(path).mkdir(parents=True, exist_ok=True)
-
 def _map_unc_to_local(path: str) -> str:
     if SMB_UNC_PREFIX and SMB_MOUNT_PREFIX and path.startswith(SMB_UNC_PREFIX):
         return path.replace(SMB_UNC_PREFIX, SMB_MOUNT_PREFIX, 1)
     return path
 
-def _read_and_check_size(file: UploadFile) -> bytes:
-    # Nota: UploadFile.file es un SpooledTemporaryFile
-    file.file.seek(0)
-    data = file.file.read()
-    if len(data) > MAX_SIZE:
-        raise HTTPException(status_code=400, detail="El archivo supera los 4 MB.")
-    return data
-
 _slug_re = re.compile(r"[^a-zA-Z0-9._-]+")
 
 def _slugify_filename(name: str) -> str:
@@ -74,26 +73,27 @@ def get_ext_permitidas_factura(db: Session) -> List[TipoArchivo]:
 # Service
 # ─────────────────────────────────────────────────────────────────────────────
 class ArchivoAdjuntoService:
-    def add_for_compra(self, db: Session, division_id: int, compra_id: int | None, up: UploadFile) -> int:
-        # 1) Validaciones básicas y normalización
-        original_name = _slugify_filename(up.filename or "factura")
+    # ---------- pasos compartidos (sync / async) ----------
+    def _resolve_tipo(self, db: Session, filename: str | None) -> Tuple[str, TipoArchivo]:
+        """Valida extensión contra TipoArchivo (FormatoFactura) antes de tocar disco."""
+        original_name = _slugify_filename(filename or "factura")
         _, ext = os.path.splitext(original_name)
         ext = ext.lower()
 
         tipo = _tipo_por_extension_factura(db, ext)
         if not tipo:
             raise HTTPException(status_code=400, detail=f"Extensión no permitida para factura: {ext or '(sin extensión)'}")
-
-        # 2) Guardar archivo físico
-        _ensure_dir(FACTURAS_DIR)
-        stamp = datetime.now().strftime("%Y%m%d%H%M%S%f")
-        final_name = f"{stamp}_{original_name}"
-        destino = os.path.join(FACTURAS_DIR, final_name)
-
-        data = _read_and_check_size(up)
-        with open(destino, "wb") as f:
-            f.write(data)
-
+        return original_name, tipo
+
+    def _insert_for_compra(
+        self,
+        db: Session,
+        division_id: int,
+        compra_id: int | None,
+        original_name: str,
+        tipo: TipoArchivo,
+        stored: StoredUpload,
+    ) -> int:
         # 3) Insert en ArchivoAdjuntos (IMPORTANTE: UpdatedAt NOT NULL)
         now = datetime.now()  # tu esquema usa timezone=False
         adj = ArchivoAdjunto(
@@ -107,10 +107,11 @@ class ArchivoAdjuntoService:
             Descripcion=None,
             DivisionId=division_id,
             TipoArchivoId=tipo.Id,
-            Url=destino,              # ruta absoluta (o UNC si mapeas)
+            Url=stored.path,          # ruta absoluta (o UNC si mapeas)
         )
         db.add(adj)
         db.flush()  # para obtener adj.Id
+        FACTURAS_STORE.acquire(db, stored.path)
 
         # 4) Enlazar con Compra (si corresponde)
         if compra_id:
@@ -124,46 +125,76 @@ class ArchivoAdjuntoService:
 
         return adj.Id
 
-    def replace(self, db: Session, archivo_id: int, division_id: int, up: UploadFile) -> None:
-        adj = db.get(ArchivoAdjunto, archivo_id)
-        if not adj:
-            raise HTTPException(status_code=404, detail="Archivo no existe.")
-
-        original_name = _slugify_filename(up.filename or adj.Nombre)
-        _, ext = os.path.splitext(original_name)
-        ext = ext.lower()
-
-        tipo = _tipo_por_extension_factura(db, ext)
-        if not tipo:
-            raise HTTPException(status_code=400, detail=f"Extensión no permitida para factura: {ext or '(sin extensión)'}")
-
-        _ensure_dir(FACTURAS_DIR)
-        stamp = datetime.now().strftime("%Y%m%d%H%M%S%f")
-        final_name = f"{stamp}_{original_name}"
-        destino = os.path.join(FACTURAS_DIR, final_name)
-
-        data = _read_and_check_size(up)
-        with open(destino, "wb") as f:
-            f.write(data)
-
-        # (opcional) borrar archivo anterior físico:
-        # try:
-        #     prev = _map_unc_to_local(adj.Url or "")
-        #     if prev and os.path.exists(prev):
-        #         os.remove(prev)
-        # except Exception:
-        #     pass
+    def _update_replace(
+        self,
+        db: Session,
+        adj: ArchivoAdjunto,
+        division_id: int,
+        original_name: str,
+        tipo: TipoArchivo,
+        stored: StoredUpload,
+    ) -> None:
+        # el archivo anterior (si es blob) se libera; collect_garbage lo borra sin referencias
+        FACTURAS_STORE.swap(db, adj.Url, stored.path)
 
         now = datetime.now()
         adj.Nombre = original_name
-        adj.Url = destino
+        adj.Url = stored.path
         adj.DivisionId = division_id
         adj.TipoArchivoId = tipo.Id
         adj.UpdatedAt = now          # ← asegura NOT NULL
         adj.Version = (adj.Version or 0) + 1
         db.add(adj)
 
-    def get_by_factura_id(self, db: Session, factura_id: int) -> Tuple[bytes, str, str]:
+    def _get_adjunto(self, db: Session, archivo_id: int) -> ArchivoAdjunto:
+        adj = db.get(ArchivoAdjunto, archivo_id)
+        if not adj:
+            raise HTTPException(status_code=404, detail="Archivo no existe.")
+        return adj
+
+    # ---------- API síncrona ----------
+    def add_for_compra(self, db: Session, division_id: int, compra_id: int | None, up: UploadFile) -> int:
+        # 1) Validaciones básicas y normalización
+        original_name, tipo = self._resolve_tipo(db, up.filename)
+
+        # 2) Guardar archivo físico (por bloques, con corte temprano por tamaño; deduplicado por SHA-256)
+        stored = FACTURAS_STORE.put_upload(up, MAX_SIZE, MAX_SIZE_DETAIL)
+        return self._insert_for_compra(db, division_id, compra_id, original_name, tipo, stored)
+
+    def replace(self, db: Session, archivo_id: int, division_id: int, up: UploadFile) -> None:
+        adj = self._get_adjunto(db, archivo_id)
+        original_name, tipo = self._resolve_tipo(db, up.filename or adj.Nombre)
+
+        stored = FACTURAS_STORE.put_upload(up, MAX_SIZE, MAX_SIZE_DETAIL)
+        self._update_replace(db, adj, division_id, original_name, tipo, stored)
+
+    # ---------- API async (endpoints async def) ----------
+    # La BD (sync) va al threadpool de Starlette y la escritura del archivo al
+    # executor de archivos: un share SMB lento no bloquea el event loop ni los
+    # threads de requests. Devuelven también el StoredUpload (tamaño + SHA-256).
+    # Si la transacción falla el blob no se borra aquí (puede estar compartido):
+    # queda sin referencia y lo limpia collect_garbage.
+    async def add_for_compra_async(
+        self, db: Session, division_id: int, compra_id: int | None, up: UploadFile
+    ) -> Tuple[int, StoredUpload]:
+        original_name, tipo = await run_in_threadpool(self._resolve_tipo, db, up.filename)
+        stored = await FACTURAS_STORE.put_upload_async(up, MAX_SIZE, MAX_SIZE_DETAIL)
+        new_id = await run_in_threadpool(
+            self._insert_for_compra, db, division_id, compra_id, original_name, tipo, stored
+        )
+        return new_id, stored
+
+    async def replace_async(
+        self, db: Session, archivo_id: int, division_id: int, up: UploadFile
+    ) -> StoredUpload:
+        adj = await run_in_threadpool(self._get_adjunto, db, archivo_id)
+        original_name, tipo = await run_in_threadpool(self._resolve_tipo, db, up.filename or adj.Nombre)
+        stored = await FACTURAS_STORE.put_upload_async(up, MAX_SIZE, MAX_SIZE_DETAIL)
+        await run_in_threadpool(self._update_replace, db, adj, division_id, original_name, tipo, stored)
+        return stored
+
+    def get_file_by_factura_id(self, db: Session, factura_id: int) -> Tuple[str, str, str, str | None]:
+        """(ruta local, mime, nombre, sha256 si es blob) sin leer el archivo."""
         adj = db.query(ArchivoAdjunto).filter(ArchivoAdjunto.Id == factura_id).first()
         if not adj:
             raise HTTPException(status_code=404, detail="Archivo no existe.")
@@ -174,6 +205,9 @@ class ArchivoAdjuntoService:
 
         tipo = db.get(TipoArchivo, adj.TipoArchivoId) if adj.TipoArchivoId else None
         mime = (tipo.MimeType if tipo and tipo.MimeType else "application/octet-stream")
+        return path, mime, adj.Nombre or "factura", FACTURAS_STORE.sha_of(path)
 
+    def get_by_factura_id(self, db: Session, factura_id: int) -> Tuple[bytes, str, str]:
+        path, mime, nombre, _ = self.get_file_by_factura_id(db, factura_id)
         with open(path, "rb") as f:
-            return f.read(), mime, adj.Nombre or "factura"
+            return f.read(), mime, nombre
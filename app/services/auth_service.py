@@ -8,6 +8,8 @@ from fastapi import HTTPException, status
 from sqlalchemy import or_
 from sqlalchemy.orm import Session
 
+from app.core import auth_claims, session_store
+from app.core.config import settings
 from app.db.models.identity import AspNetUser
 from app.core.security import (
     create_access_token,
@@ -16,7 +18,7 @@ from app.core.security import (
     verify_password_any,
     hash_password,
 )
-from app.schemas.auth import UserPublic
+from app.schemas.auth import TokenResponse, UserPublic
 from app.utils.identity_password import is_aspnet_hash
 from app.core.roles import ADMIN as ROLE_ADMIN  # <-- constante "ADMINISTRADOR"
 
@@ -101,9 +103,56 @@ def handle_success_attempt(db: Session, user: AspNetUser):
     db.commit()
 
 
+# =============== Emisión de tokens ===============
+
+def _issue_tokens(
+    db: Session,
+    user: AspNetUser,
+    sid: Optional[str],
+    refresh_token: Optional[str] = None,
+) -> TokenResponse:
+    # versión de autorización antes que los roles (ver auth_claims.version_for_token)
+    auth_version = auth_claims.version_for_token(db, str(user.Id))
+    db.expire(user, ["roles"])
+    roles = [r.NormalizedName or r.Name for r in (user.roles or []) if (r.NormalizedName or r.Name)]
+    token_roles = [r for r in roles if r]
+    extra = {
+        "email": user.Email or "",
+        "username": user.UserName or "",
+        "nombres": user.Nombres,
+        "apellidos": user.Apellidos,
+        # versión de autorización firmada: habilita la ruta rápida en get_current_user
+        **auth_claims.signed_claims(str(user.Id), auth_version, token_roles),
+    }
+    if sid:
+        extra[session_store.CLAIM_SESSION] = sid
+    token = create_access_token(sub=str(user.Id), roles=token_roles, extra=extra)
+
+    user_public = UserPublic(
+        id=str(user.Id),
+        username=user.UserName,
+        email=user.Email,
+        nombres=user.Nombres,
+        apellidos=user.Apellidos,
+        roles=roles,
+    )
+    return TokenResponse(
+        access_token=token,
+        expires_in=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        refresh_token=refresh_token,
+        user=user_public,
+    )
+
+
 # =============== Login principal ===============
 
-def login_and_issue_token(db: Session, username_or_email: str, password: str):
+def login_and_issue_token(
+    db: Session,
+    username_or_email: str,
+    password: str,
+    ip: Optional[str] = None,
+    user_agent: Optional[str] = None,
+) -> TokenResponse:
     user = find_user_by_username_or_email(db, username_or_email)
 
     # Respuesta genérica para no filtrar existencia
@@ -133,19 +182,29 @@ def login_and_issue_token(db: Session, username_or_email: str, password: str):
     except Exception:
         db.rollback()
 
-    roles = [r.NormalizedName or r.Name for r in (user.roles or []) if (r.NormalizedName or r.Name)]
-    token = create_access_token(
-        sub=str(user.Id),
-        roles=[r for r in roles if r],
-        extra={"email": user.Email or "", "username": user.UserName or ""},
-    )
+    session = session_store.create_session(db, str(user.Id), ip=ip, user_agent=user_agent)
+    refresh_token, sid = (session[0], session[1]) if session else (None, None)
+    return _issue_tokens(db, user, sid, refresh_token)
 
-    user_public = UserPublic(
-        id=str(user.Id),
-        username=user.UserName,
-        email=user.Email,
-        nombres=user.Nombres,
-        apellidos=user.Apellidos,
-        roles=roles,
-    )
-    return token, user_public
+
+# =============== Refresh ===============
+
+def refresh_access_token(db: Session, refresh_token: str, ip: Optional[str] = None) -> TokenResponse:
+    """
+    Renueva el access token con un refresh token (rotado en cada uso).
+    No verifica contraseña: solo hash del secreto + políticas vigentes
+    (Active / lockout) del usuario.
+    """
+    new_refresh, sid, user_id, _ = session_store.rotate(db, refresh_token, ip=ip)
+
+    user = db.query(AspNetUser).filter(AspNetUser.Id == user_id).first()
+    if not user:
+        session_store.revoke(db, sid)
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Refresh token inválido")
+    try:
+        ensure_login_policies(user)
+    except HTTPException:
+        session_store.revoke(db, sid)
+        raise
+
+    return _issue_tokens(db, user, sid, new_refresh)
@@ -8,13 +8,15 @@ from sqlalchemy.orm import Session
 from sqlalchemy import func, case, literal, and_, or_
 from sqlalchemy.exc import IntegrityError
 
+from app.db import normalized
+
 # Se espera que los modelos tengan (Id, Nombre) y opcionalmente:
 # CreatedAt, UpdatedAt, DeletedAt, Version, Active, CreatedBy, ModifiedBy
 # Notas:
 # - Compatible con SQL Server: evitamos "NULLS LAST" en ORDER BY
 # - Control de concurrencia optimista via Version (si existe)
 # - Filtros seguros para Active (bit/boolean)
-# - Búsqueda case-insensitive y con trim
+# - Búsqueda case-insensitive y con trim (prefijo sobre NombreNorm si existe)
 # - Prevención de duplicados por Nombre (case-insensitive)
 # - Paginación con límites y metadatos
 # - Métodos utilitarios: restore/reactivate, toggle_active, hard_delete, bulk_upsert
@@ -48,6 +50,14 @@ class CatalogoSimpleService:
         like = f"%{(q or '').strip()}%"
         return func.lower(func.coalesce(col, "")).like(func.lower(like))
 
+    def _nombre_filter(self, db: Session, q: str):
+        """
+        Prefijo sargable sobre NombreNorm si la tabla la declara (app.db.normalized);
+        si no, el LIKE case-insensitive histórico.
+        """
+        cond = normalized.prefix_filter(db, self.model, "NombreNorm", q)
+        return cond if cond is not None else self._safe_like(self.model.Nombre, q)
+
     def _normalized_nombre(self, nombre: str | None) -> str:
         return (nombre or "").strip()
 
@@ -107,9 +117,13 @@ class CatalogoSimpleService:
         n = self._normalized_nombre(nombre)
         if not n:
             return
-        q = db.query(M.Id).filter(self._safe_like(M.Nombre, n))
-        # match exact (case-insensitive) tras normalizar
-        q = q.filter(func.trim(func.lower(M.Nombre)) == func.lower(n))
+        cond = normalized.equals_filter(db, M, "NombreNorm", n)
+        if cond is not None:
+            q = db.query(M.Id).filter(cond)
+        else:
+            q = db.query(M.Id).filter(self._safe_like(M.Nombre, n))
+            # match exact (case-insensitive) tras normalizar
+            q = q.filter(func.trim(func.lower(M.Nombre)) == func.lower(n))
         if exclude_id is not None:
             q = q.filter(M.Id != exclude_id)
         if db.query(q.exists()).scalar():
@@ -135,7 +149,7 @@ class CatalogoSimpleService:
 
         # Búsqueda
         if q:
-            query = query.filter(self._safe_like(M.Nombre, q))
+            query = query.filter(self._nombre_filter(db, q))
 
         # Total (usa subquery para evitar COUNT con ORDER costly)
         total = db.query(func.count(literal(1))).select_from(query.subquery()).scalar() or 0
@@ -182,7 +196,7 @@ class CatalogoSimpleService:
         query = db.query(M.Id, M.Nombre)
         query = self._filter_active(query, include_inactive=False)
         if q:
-            query = query.filter(self._safe_like(M.Nombre, q))
+            query = query.filter(self._nombre_filter(db, q))
 
         # Orden estable y compatible
         items = (
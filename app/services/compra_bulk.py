@@ -0,0 +1,320 @@
+# app/services/compra_bulk.py
+"""
+Ingesta masiva de compras (con sus items CompraMedidor).
+
+- Cada fila se valida con CompraCreate por separado: un error no tumba el lote,
+  queda en el resultado de esa fila.
+- UnidadId -> DivisionId se resuelve para todo el lote con una consulta por
+  conjunto (division_ids_from_unidades), con las mismas reglas que
+  division_id_from_unidad (sin inmueble / varios inmuebles / DivisionId distinto).
+- Encabezados: MERGE ... ON 1 = 0 con OUTPUT s.Rn, INSERTED.Id en tandas de
+  COMPRA_BULK_HEADER_CHUNK filas (bajo el límite de 2100 parámetros); el Rn
+  permite mapear cada Id a su fila sin depender del orden del OUTPUT.
+- Items: un solo executemany por tanda sobre CompraMedidor (fast_executemany).
+- Cada tanda corre en un SAVEPOINT. Con parcial=False cualquier error (de
+  validación o de BD) aborta el lote completo; con parcial=True una tanda que
+  falla en BD se reintenta fila a fila para aislar la fila culpable.
+- Solapes de periodo (COMPRAS_OVERLAP_POLICY) contra la BD y dentro del lote
+  con compra_overlap.check_batch; con "block" la fila queda con error
+  "periodo_solapado".
+- Los inserts van por Core (los hooks de auditoría y prorrateo no los ven): se
+  registra una sola fila de auditoría por lote con los Ids creados y se
+  recalcula el prorrateo mensual de la tanda.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+from app.db.models.audit import AuditLog
+from app.db.models.compra_medidor import CompraMedidor
+from app.schemas.compra import CompraCreate
+from app.services import compra_overlap, prorrateo
+from app.services.unidad_scope import division_ids_from_unidades
+
+Log = logging.getLogger(__name__)
+CM_TBL = CompraMedidor.__table__
+
+COMPRA_BULK_MAX = int(os.getenv("COMPRA_BULK_MAX", "10000"))
+COMPRA_BULK_HEADER_CHUNK = int(os.getenv("COMPRA_BULK_HEADER_CHUNK", "100"))
+
+# Columnas que vienen por fila (además de Rn). Auditoría/versión van como
+# parámetros comunes del lote.
+_ROW_COLS: Tuple[str, ...] = (
+    "Consumo", "InicioLectura", "FinLectura", "DivisionId", "EnergeticoId",
+    "FechaCompra", "Costo", "FacturaId", "NumeroClienteId", "UnidadMedidaId",
+    "Observacion", "EstadoValidacionId", "CreatedByDivisionId", "SinMedidor",
+)
+# columnas de texto: un VALUES con todo NULL se tipa como int y chocaría con TEXT
+_TEXT_COLS = {"Observacion", "EstadoValidacionId"}
+
+_MERGE_CACHE: Dict[int, Any] = {}
+
+
+def _merge_stmt(n: int):
+    """MERGE de inserción para `n` filas (cacheado por tamaño de tanda)."""
+    stmt = _MERGE_CACHE.get(n)
+    if stmt is not None:
+        return stmt
+    values = ",\n".join(
+        "(:rn_{i}, ".format(i=i) + ", ".join(f":{c}_{i}" for c in _ROW_COLS) + ")"
+        for i in range(n)
+    )
+    src_cols = ", ".join(_ROW_COLS)
+    ins_vals = ", ".join(
+        f"CAST(s.{c} AS NVARCHAR(MAX))" if c in _TEXT_COLS else f"s.{c}" for c in _ROW_COLS
+    )
+    stmt = text(f"""
+        MERGE INTO dbo.Compras AS t
+        USING (VALUES
+        {values}
+        ) AS s (Rn, {src_cols})
+        ON 1 = 0
+        WHEN NOT MATCHED THEN
+            INSERT (CreatedAt, UpdatedAt, Version, Active, CreatedBy, ModifiedBy, {src_cols})
+            VALUES (:now, :now, 0, 1, :by, :by, {ins_vals})
+        OUTPUT s.Rn, INSERTED.Id;
+    """)
+    _MERGE_CACHE[n] = stmt
+    return stmt
+
+
+def _validation_msg(ex: ValidationError) -> str:
+    parts = []
+    for e in ex.errors():
+        loc = ".".join(str(x) for x in e.get("loc") or ())
+        msg = str(e.get("msg") or "").removeprefix("Value error, ")
+        parts.append(f"{loc}: {msg}" if loc else msg)
+    return "; ".join(parts)[:1000]
+
+
+def _row_error(idx: int, code: str, msg: str) -> Dict[str, Any]:
+    return {"Indice": idx, "CompraId": None, "Codigo": code, "Error": msg}
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Validación
+# ─────────────────────────────────────────────────────────────────────────────
+def validate_rows(
+    db: Session,
+    rows: Iterable[Any],
+    allowed_division_ids: Optional[Set[int]] = None,
+) -> Tuple[List[Tuple[int, CompraCreate]], Dict[int, Dict[str, Any]]]:
+    """
+    Valida el lote. Retorna ([(indice, CompraCreate con DivisionId resuelto)], {indice: error}).
+    `allowed_division_ids` None = sin restricción de alcance (ADMINISTRADOR).
+    """
+    ok: List[Tuple[int, CompraCreate]] = []
+    errors: Dict[int, Dict[str, Any]] = {}
+
+    for idx, raw in enumerate(rows):
+        try:
+            data = raw if isinstance(raw, CompraCreate) else CompraCreate.model_validate(raw)
+        except ValidationError as ex:
+            errors[idx] = _row_error(idx, "validacion", _validation_msg(ex))
+            continue
+        ok.append((idx, data))
+
+    # UnidadId -> DivisionId para todo el lote en una consulta
+    inmuebles = division_ids_from_unidades(db, (d.UnidadId for _, d in ok if d.UnidadId is not None))
+
+    resolved: List[Tuple[int, CompraCreate]] = []
+    for idx, data in ok:
+        if data.UnidadId is not None:
+            divs = inmuebles.get(int(data.UnidadId)) or []
+            if not divs:
+                errors[idx] = _row_error(idx, "unidad_sin_inmueble", "Unidad no tiene inmueble asociado (UnidadesInmuebles vacío)")
+                continue
+            if len(divs) > 1:
+                errors[idx] = _row_error(idx, "unidad_multiple_inmuebles", "La unidad tiene más de un InmuebleId asociado (no esperado)")
+                continue
+            if data.DivisionId is not None and int(data.DivisionId) != divs[0]:
+                errors[idx] = _row_error(
+                    idx, "division_mismatch",
+                    f"DivisionId {int(data.DivisionId)} no coincide con el inmueble de la unidad ({divs[0]})",
+                )
+                continue
+            data.DivisionId = divs[0]
+
+        if allowed_division_ids is not None and int(data.DivisionId) not in allowed_division_ids:
+            errors[idx] = _row_error(idx, "forbidden_scope", "No tienes acceso a esta división.")
+            continue
+        resolved.append((idx, data))
+
+    return resolved, errors
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Inserción
+# ─────────────────────────────────────────────────────────────────────────────
+def _header_params(chunk: List[Tuple[int, CompraCreate]], now: datetime, created_by: Optional[str]) -> Dict[str, Any]:
+    params: Dict[str, Any] = {"now": now, "by": created_by}
+    for i, (idx, d) in enumerate(chunk):
+        params[f"rn_{i}"] = idx
+        params[f"Consumo_{i}"] = float(d.Consumo)
+        params[f"InicioLectura_{i}"] = d.InicioLectura
+        params[f"FinLectura_{i}"] = d.FinLectura
+        params[f"DivisionId_{i}"] = int(d.DivisionId)
+        params[f"EnergeticoId_{i}"] = int(d.EnergeticoId)
+        params[f"FechaCompra_{i}"] = d.FechaCompra
+        params[f"Costo_{i}"] = float(d.Costo)
+        params[f"FacturaId_{i}"] = d.FacturaId
+        params[f"NumeroClienteId_{i}"] = d.NumeroClienteId
+        params[f"UnidadMedidaId_{i}"] = d.UnidadMedidaId
+        params[f"Observacion_{i}"] = d.Observacion
+        params[f"EstadoValidacionId_{i}"] = d.EstadoValidacionId
+        params[f"CreatedByDivisionId_{i}"] = int(d.CreatedByDivisionId or d.DivisionId)
+        params[f"SinMedidor_{i}"] = bool(d.SinMedidor)
+    return params
+
+
+def _insert_chunk(
+    db: Session, chunk: List[Tuple[int, CompraCreate]], now: datetime, created_by: Optional[str]
+) -> Dict[int, int]:
+    """Inserta encabezados + items de la tanda. Retorna {indice: CompraId}."""
+    out = db.execute(_merge_stmt(len(chunk)), _header_params(chunk, now, created_by)).all()
+    ids = {int(rn): int(cid) for rn, cid in out}
+
+    items = [
+        {
+            "Consumo": float(it.Consumo),
+            "MedidorId": it.MedidorId,
+            "CompraId": ids[idx],
+            "ParametroMedicionId": it.ParametroMedicionId,
+            "UnidadMedidaId": it.UnidadMedidaId,
+        }
+        for idx, d in chunk
+        for it in (d.Items or [])
+    ]
+    if items:
+        db.execute(CM_TBL.insert(), items)
+    # los inserts Core no pasan por el after_flush del prorrateo
+    if prorrateo.is_available(db):
+        prorrateo.refresh(db, ids.values())
+    return ids
+
+
+def _audit_lote(db: Session, ids: List[int]) -> None:
+    meta = db.info.get("request_meta") or {}
+    actor = db.info.get("actor") or {}
+    db.add(
+        AuditLog(
+            action="create",
+            resource_type="Compra",
+            resource_id=f"lote:{min(ids)}-{max(ids)}",
+            http_method=meta.get("method"),
+            path=meta.get("path"),
+            status_code=meta.get("status_code"),
+            actor_id=actor.get("id"),
+            actor_username=actor.get("username"),
+            session_id=meta.get("session_id"),
+            request_id=meta.get("request_id"),
+            ip=meta.get("ip"),
+            user_agent=meta.get("user_agent"),
+            changes_json=json.dumps({"lote": len(ids), "CompraIds": ids}),
+            request_body_sha256=meta.get("request_body_sha256"),
+        )
+    )
+
+
+def ingest(
+    db: Session,
+    rows: List[Any],
+    created_by: Optional[str] = None,
+    allowed_division_ids: Optional[Set[int]] = None,
+    parcial: bool = False,
+) -> Dict[str, Any]:
+    """
+    Crea las compras del lote y retorna
+    {"Total", "Creadas", "ConError", "Resultados": [{Indice, CompraId, Codigo, Error}]}.
+
+    parcial=False: si alguna fila es inválida → 422 (no se crea ninguna);
+    si la BD rechaza una tanda → 409 y rollback completo.
+    """
+    if len(rows) > COMPRA_BULK_MAX:
+        raise HTTPException(status_code=400, detail=f"Máximo {COMPRA_BULK_MAX} compras por lote")
+
+    valid, errors = validate_rows(db, rows, allowed_division_ids)
+    blocked = compra_overlap.check_batch(
+        db,
+        [
+            (idx, d.NumeroClienteId, [it.MedidorId for it in (d.Items or [])], d.InicioLectura, d.FinLectura)
+            for idx, d in valid
+        ],
+    )
+    if blocked:
+        for idx, hit in blocked.items():
+            partes = []
+            if hit["CompraIds"]:
+                partes.append(f"compras {hit['CompraIds'][:20]}")
+            if hit["Indices"]:
+                partes.append(f"filas {hit['Indices'][:20]} del lote")
+            errors[idx] = _row_error(
+                idx, "periodo_solapado",
+                "El periodo de lectura se solapa con " + " y ".join(partes) + " (mismo cliente/medidor)",
+            )
+        valid = [(idx, d) for idx, d in valid if idx not in blocked]
+    if errors and not parcial:
+        raise HTTPException(
+            status_code=422,
+            detail={
+                "code": "lote_invalido",
+                "msg": f"{len(errors)} fila(s) con error; no se creó ninguna compra",
+                "Errores": [errors[k] for k in sorted(errors)],
+            },
+        )
+
+    now = datetime.utcnow()
+    created: Dict[int, int] = {}
+    size = max(1, COMPRA_BULK_HEADER_CHUNK)
+
+    try:
+        for i in range(0, len(valid), size):
+            chunk = valid[i:i + size]
+            try:
+                with db.begin_nested():
+                    created.update(_insert_chunk(db, chunk, now, created_by))
+                continue
+            except DBAPIError as ex:
+                if not parcial:
+                    raise
+                Log.warning("COMPRAS lote: tanda %s-%s rechazada (%s); reintento fila a fila", i, i + len(chunk) - 1, ex.orig)
+
+            for idx, d in chunk:
+                try:
+                    with db.begin_nested():
+                        created.update(_insert_chunk(db, [(idx, d)], now, created_by))
+                except DBAPIError as ex:
+                    Log.warning("COMPRAS lote: fila %s rechazada: %s", idx, ex.orig)
+                    errors[idx] = _row_error(idx, "error_bd", "La BD rechazó la fila (referencia inexistente o restricción)")
+
+        if created:
+            _audit_lote(db, sorted(created.values()))
+        db.commit()
+    except DBAPIError as ex:
+        db.rollback()
+        Log.warning("COMPRAS lote abortado: %s", ex.orig)
+        raise HTTPException(
+            status_code=409,
+            detail={
+                "code": "lote_rechazado",
+                "msg": "La BD rechazó el lote (referencia inexistente o restricción); no se creó ninguna compra",
+            },
+        )
+
+    results = [
+        {"Indice": idx, "CompraId": cid, "Codigo": None, "Error": None} for idx, cid in created.items()
+    ]
+    results.extend(errors.values())
+    results.sort(key=lambda r: r["Indice"])
+    Log.info("COMPRAS lote: %s filas, %s creadas, %s con error", len(rows), len(created), len(errors))
+    return {"Total": len(rows), "Creadas": len(created), "ConError": len(errors), "Resultados": results}
@@ -0,0 +1,331 @@
+# app/services/compra_overlap.py
+"""
+Detección de periodos de lectura solapados (facturas duplicadas o traslapadas)
+por NumeroCliente y por Medidor.
+
+- Solape = mismo NumeroClienteId (o mismo MedidorId en CompraMedidor) y
+  InicioLectura < otra.FinLectura AND otra.InicioLectura < FinLectura.
+  Compartir el día de corte (Fin de una = Inicio de la siguiente) NO es solape.
+- IntervalIndex: intervalos agrupados por clave, ordenados por inicio, con un
+  barrido (heap de fines activos) que emite todos los pares solapados en
+  O(n log n + pares). Se usa para el reporte por servicio (una consulta +
+  un barrido en memoria).
+- En create/update la verificación es una consulta acotada por clave y rango
+  (check_compra). COMPRAS_OVERLAP_POLICY: "warn" (default; solo log),
+  "block" (409 con las compras en conflicto) u "off".
+- Lotes (compra_bulk.ingest, y con él la importación de distribuidoras):
+  check_batch arma un IntervalIndex con las filas del lote más las compras
+  activas de sus clientes/medidores (una consulta, claves en #temp) y detecta
+  solapes contra la BD y entre filas del mismo lote; con "block" esas filas
+  quedan como error de fila.
+"""
+from __future__ import annotations
+
+import heapq
+import itertools
+import logging
+import os
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import bindparam, text
+from sqlalchemy.orm import Session
+
+from app.db import id_list
+
+Log = logging.getLogger(__name__)
+
+COMPRAS_OVERLAP_POLICY = os.getenv("COMPRAS_OVERLAP_POLICY", "warn").strip().lower()
+OVERLAP_REPORT_MAX = int(os.getenv("COMPRAS_OVERLAP_REPORT_MAX", "5000"))
+
+Key = Tuple[str, int]                          # ("NumeroCliente" | "Medidor", id)
+Interval = Tuple[datetime, datetime, int]      # (inicio, fin, CompraId)
+
+
+class IntervalIndex:
+    """Intervalos [inicio, fin) agrupados por clave."""
+
+    def __init__(self):
+        self._by_key: Dict[Key, List[Interval]] = defaultdict(list)
+
+    def add(self, key: Key, inicio: Optional[datetime], fin: Optional[datetime], compra_id: int) -> None:
+        if inicio is None or fin is None or fin < inicio:
+            return
+        self._by_key[key].append((inicio, fin, int(compra_id)))
+
+    def __len__(self) -> int:
+        return sum(len(v) for v in self._by_key.values())
+
+    def overlaps(self) -> Iterator[Tuple[Key, Interval, Interval]]:
+        """Pares (clave, a, b) con a.CompraId < b.CompraId que se solapan."""
+        for key, items in self._by_key.items():
+            if len(items) < 2:
+                continue
+            items.sort()
+            active: List[Tuple[datetime, int, Interval]] = []   # heap por fin
+            for cur in items:
+                ini = cur[0]
+                while active and active[0][0] <= ini:
+                    heapq.heappop(active)
+                for _, _, prev in active:
+                    if prev[2] == cur[2]:
+                        continue
+                    a, b = (prev, cur) if prev[2] < cur[2] else (cur, prev)
+                    yield key, a, b
+                heapq.heappush(active, (cur[1], cur[2], cur))
+
+
+def _pair_dto(a: Interval, b: Interval, claves: Sequence[str]) -> Dict[str, Any]:
+    ini = max(a[0], b[0])
+    fin = min(a[1], b[1])
+    return {
+        "CompraId": a[2],
+        "OtraCompraId": b[2],
+        "Claves": sorted(claves),
+        "InicioSolape": ini,
+        "FinSolape": fin,
+        "Dias": max(0, (fin - ini).days),
+    }
+
+
+def overlap_pairs(index: IntervalIndex, limit: int = OVERLAP_REPORT_MAX) -> Tuple[List[Dict[str, Any]], bool]:
+    """Pares únicos de compras solapadas (las claves en común se agrupan). Retorna (pares, truncado)."""
+    pairs: Dict[Tuple[int, int], Tuple[Interval, Interval, List[str]]] = {}
+    for key, a, b in index.overlaps():
+        pk = (a[2], b[2])
+        hit = pairs.get(pk)
+        if hit is None:
+            if len(pairs) >= limit:
+                return [_pair_dto(x, y, c) for x, y, c in pairs.values()], True
+            pairs[pk] = (a, b, [f"{key[0]}:{key[1]}"])
+        else:
+            hit[2].append(f"{key[0]}:{key[1]}")
+    return [_pair_dto(x, y, c) for x, y, c in pairs.values()], False
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Reporte por servicio
+# ─────────────────────────────────────────────────────────────────────────────
+def report_servicio(
+    db: Session,
+    servicio_id: int,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+) -> Dict[str, Any]:
+    """Solapes entre compras activas de las divisiones del servicio (una consulta + un barrido)."""
+    where = ["c.Active = 1", "d.ServicioId = :sid"]
+    params: Dict[str, Any] = {"sid": int(servicio_id)}
+    if desde is not None:
+        where.append("c.FinLectura > :desde")
+        params["desde"] = desde
+    if hasta is not None:
+        where.append("c.InicioLectura < :hasta")
+        params["hasta"] = hasta
+
+    rows = db.execute(
+        text(f"""
+            SELECT c.Id, c.NumeroClienteId, cm.MedidorId, c.InicioLectura, c.FinLectura
+            FROM dbo.Compras c WITH (NOLOCK)
+            JOIN dbo.Divisiones d WITH (NOLOCK) ON d.Id = c.DivisionId
+            LEFT JOIN dbo.CompraMedidor cm WITH (NOLOCK) ON cm.CompraId = c.Id
+            WHERE {" AND ".join(where)}
+        """),
+        params,
+    ).all()
+
+    index = IntervalIndex()
+    seen_nc: set[int] = set()
+    for cid, nc_id, med_id, ini, fin in rows:
+        # la compra se repite por cada item: el intervalo del cliente va una vez
+        if nc_id is not None and cid not in seen_nc:
+            seen_nc.add(cid)
+            index.add(("NumeroCliente", int(nc_id)), ini, fin, cid)
+        if med_id is not None:
+            index.add(("Medidor", int(med_id)), ini, fin, cid)
+
+    pares, truncado = overlap_pairs(index)
+    pares.sort(key=lambda p: (p["CompraId"], p["OtraCompraId"]))
+    return {
+        "ServicioId": int(servicio_id),
+        "Compras": len({r[0] for r in rows}),
+        "Solapes": len(pares),
+        "Truncado": truncado,
+        "Pares": pares,
+    }
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Verificación en create/update
+# ─────────────────────────────────────────────────────────────────────────────
+def find_overlapping(
+    db: Session,
+    numero_cliente_id: Optional[int],
+    medidor_ids: Iterable[int],
+    inicio: Optional[datetime],
+    fin: Optional[datetime],
+    exclude_id: Optional[int] = None,
+) -> List[int]:
+    """Ids de compras activas cuyo periodo se solapa por cliente o por medidor."""
+    mids = sorted({int(m) for m in medidor_ids if m is not None})
+    if inicio is None or fin is None or (numero_cliente_id is None and not mids):
+        return []
+    keys = []
+    if numero_cliente_id is not None:
+        keys.append("c.NumeroClienteId = :nc")
+    if mids:
+        keys.append(
+            "EXISTS (SELECT 1 FROM dbo.CompraMedidor cm WITH (NOLOCK)"
+            " WHERE cm.CompraId = c.Id AND cm.MedidorId IN :mids)"
+        )
+    stmt = text(f"""
+        SELECT c.Id
+        FROM dbo.Compras c WITH (NOLOCK)
+        WHERE c.Active = 1
+          AND c.Id <> :exclude
+          AND c.InicioLectura < :fin AND c.FinLectura > :ini
+          AND ({" OR ".join(keys)})
+        ORDER BY c.Id
+    """)
+    params: Dict[str, Any] = {"exclude": int(exclude_id or 0), "ini": inicio, "fin": fin}
+    if numero_cliente_id is not None:
+        params["nc"] = int(numero_cliente_id)
+    if mids:
+        stmt = stmt.bindparams(bindparam("mids", expanding=True))
+        params["mids"] = mids
+    return [int(x) for x in db.execute(stmt, params).scalars().all()]
+
+
+def check_compra(
+    db: Session,
+    numero_cliente_id: Optional[int],
+    medidor_ids: Iterable[int],
+    inicio: Optional[datetime],
+    fin: Optional[datetime],
+    exclude_id: Optional[int] = None,
+) -> List[int]:
+    """Aplica COMPRAS_OVERLAP_POLICY; retorna las compras solapadas (vacío si off)."""
+    if COMPRAS_OVERLAP_POLICY == "off":
+        return []
+    ids = find_overlapping(db, numero_cliente_id, medidor_ids, inicio, fin, exclude_id)
+    if not ids:
+        return ids
+    if COMPRAS_OVERLAP_POLICY == "block":
+        raise HTTPException(
+            status_code=409,
+            detail={
+                "code": "periodo_solapado",
+                "msg": "El periodo de lectura se solapa con otra(s) compra(s) del mismo cliente/medidor",
+                "CompraIds": ids[:50],
+            },
+        )
+    Log.warning(
+        "COMPRAS periodo solapado: compra=%s nc=%s %s..%s con %s",
+        exclude_id, numero_cliente_id, inicio, fin, ids[:20],
+    )
+    return ids
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Verificación de lotes
+# ─────────────────────────────────────────────────────────────────────────────
+BatchRow = Tuple[int, Optional[int], Iterable[int], Any, Any]   # (indice, NumeroClienteId, MedidorIds, inicio, fin)
+
+
+def _as_dt(v: Any) -> Optional[datetime]:
+    if v is None or v == "":
+        return None
+    if isinstance(v, datetime):
+        return v
+    if isinstance(v, date):
+        return datetime(v.year, v.month, v.day)
+    try:
+        return datetime.fromisoformat(str(v).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def find_overlapping_batch(db: Session, rows: Sequence[BatchRow]) -> Dict[int, Dict[str, List[int]]]:
+    """
+    Solapes de cada fila del lote contra compras activas y contra las demás
+    filas. Retorna {indice: {"CompraIds": [...], "Indices": [...]}} solo para
+    filas con conflicto; en "Indices" van las filas anteriores del lote (la
+    primera fila de un par queda libre, como si se hubieran creado en orden).
+    """
+    index = IntervalIndex()
+    ncs: set[int] = set()
+    mids: set[int] = set()
+    ini_min: Optional[datetime] = None
+    fin_max: Optional[datetime] = None
+    for idx, nc_id, medidor_ids, inicio, fin in rows:
+        ini, end = _as_dt(inicio), _as_dt(fin)
+        if ini is None or end is None or end < ini:
+            continue
+        ini_min = ini if ini_min is None or ini < ini_min else ini_min
+        fin_max = end if fin_max is None or end > fin_max else fin_max
+        pseudo = -(int(idx) + 1)          # filas del lote: ids negativos
+        if nc_id is not None:
+            ncs.add(int(nc_id))
+            index.add(("NumeroCliente", int(nc_id)), ini, end, pseudo)
+        for m in {int(m) for m in medidor_ids if m is not None}:
+            mids.add(m)
+            index.add(("Medidor", m), ini, end, pseudo)
+    if not len(index):
+        return {}
+
+    t_nc = id_list.load(db, ncs, "overlap_nc")
+    t_med = id_list.load(db, mids, "overlap_med")
+    existing = db.execute(
+        text(f"""
+            SELECT c.Id, c.NumeroClienteId, cm.MedidorId, c.InicioLectura, c.FinLectura
+            FROM dbo.Compras c WITH (NOLOCK)
+            LEFT JOIN dbo.CompraMedidor cm WITH (NOLOCK) ON cm.CompraId = c.Id
+            WHERE c.Active = 1
+              AND c.InicioLectura < :fin AND c.FinLectura > :ini
+              AND (c.NumeroClienteId IN (SELECT Id FROM {t_nc})
+                   OR cm.MedidorId IN (SELECT Id FROM {t_med}))
+        """),
+        {"ini": ini_min, "fin": fin_max},
+    ).all()
+    seen_nc: set[int] = set()
+    for cid, nc_id, med_id, ini, fin in existing:
+        if nc_id is not None and int(nc_id) in ncs and cid not in seen_nc:
+            seen_nc.add(cid)
+            index.add(("NumeroCliente", int(nc_id)), ini, fin, cid)
+        if med_id is not None and int(med_id) in mids:
+            index.add(("Medidor", int(med_id)), ini, fin, cid)
+
+    out: Dict[int, Dict[str, set]] = {}
+    for _, a, b in index.overlaps():
+        x, y = a[2], b[2]
+        if x >= 0 and y >= 0:
+            continue                       # dos compras existentes: fuera del alcance del lote
+        if x < 0 and y < 0:
+            # entre filas del lote: se marca la posterior
+            first, later = sorted((-x - 1, -y - 1))
+            hit = out.setdefault(later, {"CompraIds": set(), "Indices": set()})
+            hit["Indices"].add(first)
+            continue
+        idx, cid = (-x - 1, y) if x < 0 else (-y - 1, x)
+        out.setdefault(idx, {"CompraIds": set(), "Indices": set()})["CompraIds"].add(cid)
+    return {k: {n: sorted(v) for n, v in d.items()} for k, d in out.items()}
+
+
+def check_batch(db: Session, rows: Sequence[BatchRow]) -> Dict[int, Dict[str, List[int]]]:
+    """
+    Aplica COMPRAS_OVERLAP_POLICY al lote. Retorna las filas a rechazar
+    ({indice: conflictos}): vacío con "off" o "warn" (este solo loguea).
+    """
+    if COMPRAS_OVERLAP_POLICY == "off":
+        return {}
+    conflicts = find_overlapping_batch(db, rows)
+    if not conflicts:
+        return {}
+    if COMPRAS_OVERLAP_POLICY == "block":
+        return conflicts
+    Log.warning(
+        "COMPRAS lote con %s fila(s) de periodo solapado: %s",
+        len(conflicts), dict(itertools.islice(sorted(conflicts.items()), 20)),
+    )
+    return {}
@@ -8,12 +8,17 @@ from decimal import Decimal
 
 from fastapi import HTTPException
 from sqlalchemy.orm import Session
-from sqlalchemy import text, select, func, and_
+from sqlalchemy import bindparam, text, select, func, and_
 from sqlalchemy.orm import selectinload
 
+from app.db import id_list, normalized, returning
 from app.db.models.compra import Compra
 from app.db.models.compra_medidor import CompraMedidor
+from app.db.models.division import Division
 from app.services.unidad_scope import division_id_from_unidad
+from app.search import index as search_index
+from app.services import territorio
+from app.services import compra_overlap, prorrateo
 
 Log = logging.getLogger(__name__)
 CM_TBL = CompraMedidor.__table__
@@ -138,6 +143,65 @@ def _col_exists_cached(db: Session, schema: str, table: str, column: str) -> boo
 # ─────────────────────────────────────────────────────────────────────────────
 # CompraService
 # ─────────────────────────────────────────────────────────────────────────────
+# ─────────────────────────────────────────────────────────────────────────────
+# replace_items: MERGE por clave (MedidorId, ParametroMedicionId)
+# ─────────────────────────────────────────────────────────────────────────────
+_REPLACE_ITEMS_MAX = 400          # 5 parámetros por item (< 2100)
+_REPLACE_ITEMS_CACHE: Dict[int, Any] = {}
+
+
+def _replace_items_stmt(n: int):
+    """
+    MERGE sobre los items de una compra. El destino es un CTE filtrado por
+    CompraId (NOT MATCHED BY SOURCE solo borra items de esa compra) con Ord =
+    ocurrencia de la clave, para parear claves repetidas de forma estable.
+    Items pareados se actualizan en sitio (mismo Id); OUTPUT devuelve acción,
+    estado final y valores previos para contar cambios reales.
+    """
+    stmt = _REPLACE_ITEMS_CACHE.get(n)
+    if stmt is not None:
+        return stmt
+    values = ",\n".join(f"(:o{i}, :m{i}, :p{i}, :c{i}, :u{i})" for i in range(n))
+    stmt = text(f"""
+        WITH t AS (
+            SELECT Id, CompraId, MedidorId, ParametroMedicionId, Consumo, UnidadMedidaId,
+                   ROW_NUMBER() OVER (PARTITION BY MedidorId, ParametroMedicionId ORDER BY Id) AS Ord
+            FROM dbo.CompraMedidor WITH (UPDLOCK, HOLDLOCK)
+            WHERE CompraId = :cid
+        )
+        MERGE t
+        USING (VALUES
+        {values}
+        ) AS s (Ord, MedidorId, ParametroMedicionId, Consumo, UnidadMedidaId)
+        ON  t.Ord = s.Ord
+        AND (t.MedidorId = s.MedidorId OR (t.MedidorId IS NULL AND s.MedidorId IS NULL))
+        AND (t.ParametroMedicionId = s.ParametroMedicionId OR (t.ParametroMedicionId IS NULL AND s.ParametroMedicionId IS NULL))
+        WHEN MATCHED THEN
+            UPDATE SET Consumo = s.Consumo, UnidadMedidaId = s.UnidadMedidaId
+        WHEN NOT MATCHED BY TARGET THEN
+            INSERT (CompraId, MedidorId, ParametroMedicionId, Consumo, UnidadMedidaId)
+            VALUES (:cid, s.MedidorId, s.ParametroMedicionId, s.Consumo, s.UnidadMedidaId)
+        WHEN NOT MATCHED BY SOURCE THEN
+            DELETE
+        OUTPUT $action, INSERTED.Id, INSERTED.MedidorId, INSERTED.Consumo,
+               INSERTED.ParametroMedicionId, INSERTED.UnidadMedidaId,
+               DELETED.Consumo, DELETED.UnidadMedidaId;
+    """)
+    _REPLACE_ITEMS_CACHE[n] = stmt
+    return stmt
+
+
+def _replace_items_params(compra_id: int, src: List[Dict[str, Any]]) -> Dict[str, Any]:
+    params: Dict[str, Any] = {"cid": compra_id}
+    for i, r in enumerate(src):
+        params[f"o{i}"] = r["Ord"]
+        params[f"m{i}"] = r["MedidorId"]
+        params[f"p{i}"] = r["ParametroMedicionId"]
+        params[f"c{i}"] = r["Consumo"]
+        params[f"u{i}"] = r["UnidadMedidaId"]
+    return params
+
+
 class CompraService:
 
     # ======================================================================
@@ -248,7 +312,7 @@ class CompraService:
             return {"total": int(total or 0), "page": page, "page_size": page_size, "items": []}
 
         compra_ids = [int(c.Id) for c in compras]
-        ids_csv = ",".join(str(x) for x in compra_ids)
+        ids_t = id_list.load(db, compra_ids, "compra_ids")
 
         # --- Filtros extra (Servicio/Región/Medidor/NombreOpcional/Edificio) post-paginación
         extra_keep: Optional[set[int]] = None
@@ -262,7 +326,7 @@ class CompraService:
                         SELECT c.Id
                         FROM dbo.Compras c WITH (NOLOCK)
                         JOIN dbo.Divisiones d WITH (NOLOCK) ON d.Id = c.DivisionId
-                        WHERE c.Id IN ({ids_csv}) AND d.ServicioId = :sid
+                        WHERE c.Id IN (SELECT Id FROM {ids_t}) AND d.ServicioId = :sid
                         """
                     ),
                     {"sid": int(ServicioId)},
@@ -270,19 +334,22 @@ class CompraService:
                 extra_keep &= set(int(x) for x in rows)
 
             if RegionId is not None:
-                rows = db.execute(
-                    text(
-                        f"""
-                        SELECT c.Id
-                        FROM dbo.Compras c WITH (NOLOCK)
-                        JOIN dbo.Divisiones d WITH (NOLOCK) ON d.Id = c.DivisionId
-                        LEFT JOIN dbo.Edificios efi WITH (NOLOCK) ON efi.Id = d.EdificioId
-                        LEFT JOIN dbo.Comunas com WITH (NOLOCK) ON com.Id = efi.ComunaId
-                        WHERE c.Id IN ({ids_csv}) AND com.RegionId = :rid
-                        """
-                    ),
-                    {"rid": int(RegionId)},
-                ).scalars().all()
+                # comunas de la región desde el árbol en memoria (sin JOIN a dbo.Comunas)
+                comuna_ids = sorted(territorio.get(db).comuna_ids_of_region(RegionId))
+                rows = []
+                if comuna_ids:
+                    rows = db.execute(
+                        text(
+                            f"""
+                            SELECT c.Id
+                            FROM dbo.Compras c WITH (NOLOCK)
+                            JOIN dbo.Divisiones d WITH (NOLOCK) ON d.Id = c.DivisionId
+                            JOIN dbo.Edificios efi WITH (NOLOCK) ON efi.Id = d.EdificioId
+                            WHERE c.Id IN (SELECT Id FROM {ids_t}) AND efi.ComunaId IN :cids
+                            """
+                        ).bindparams(bindparam("cids", expanding=True)),
+                        {"cids": comuna_ids},
+                    ).scalars().all()
                 extra_keep &= set(int(x) for x in rows)
 
             if MedidorId is not None:
@@ -291,7 +358,7 @@ class CompraService:
                         f"""
                         SELECT DISTINCT cm.CompraId
                         FROM dbo.CompraMedidor cm WITH (NOLOCK)
-                        WHERE cm.CompraId IN ({ids_csv}) AND cm.MedidorId = :mid
+                        WHERE cm.CompraId IN (SELECT Id FROM {ids_t}) AND cm.MedidorId = :mid
                         """
                     ),
                     {"mid": int(MedidorId)},
@@ -305,7 +372,7 @@ class CompraService:
                         SELECT c.Id
                         FROM dbo.Compras c WITH (NOLOCK)
                         JOIN dbo.Divisiones d WITH (NOLOCK) ON d.Id = c.DivisionId
-                        WHERE c.Id IN ({ids_csv}) AND d.EdificioId = :eid
+                        WHERE c.Id IN (SELECT Id FROM {ids_t}) AND d.EdificioId = :eid
                         """
                     ),
                     {"eid": int(EdificioId)},
@@ -313,27 +380,34 @@ class CompraService:
                 extra_keep &= set(int(x) for x in rows)
 
             if NombreOpcional:
+                q_params = {"q": f"%{NombreOpcional}%"}
+                norm = normalized.prefix_sql(db, Division, "NombreNorm", NombreOpcional, "d", "q_norm")
+                if norm is not None:
+                    div_cond = norm[0]
+                    q_params.update(norm[1])
+                else:
+                    div_cond = "LOWER(ISNULL(d.Nombre,'')) LIKE LOWER(:q)"
                 rows = db.execute(
                     text(
                         f"""
                         SELECT c.Id
                         FROM dbo.Compras c WITH (NOLOCK)
                         LEFT JOIN dbo.Divisiones d WITH (NOLOCK) ON d.Id = c.DivisionId
-                        WHERE c.Id IN ({ids_csv})
+                        WHERE c.Id IN (SELECT Id FROM {ids_t})
                         AND (
                             LOWER(ISNULL(c.NombreOpcional,'')) LIKE LOWER(:q)
-                            OR LOWER(ISNULL(d.Nombre,'')) LIKE LOWER(:q)
+                            OR {div_cond}
                         )
                         """
                     ),
-                    {"q": f"%{NombreOpcional}%"},
+                    q_params,
                 ).scalars().all()
                 extra_keep &= set(int(x) for x in rows)
 
             compra_ids = [cid for cid in compra_ids if cid in extra_keep]
             if not compra_ids:
                 return {"total": int(total or 0), "page": page, "page_size": page_size, "items": []}
-            ids_csv = ",".join(str(x) for x in compra_ids)
+            ids_t = id_list.load(db, compra_ids, "compra_ids")
 
         # ---- Detección de columnas de dirección (una vez)
         has_efi_calle = _col_exists_cached(db, "dbo", "Edificios", "Calle")
@@ -365,25 +439,19 @@ class CompraService:
                     {edi_calle}                       AS EDI_Calle,
                     {edi_numero}                      AS EDI_Numero,
                     {edi_dirlib}                      AS EDI_DireccionLibre,
-                    com.Id                            AS COM_Id,
-                    com.Nombre                        AS COM_Nombre,
-                    com.RegionId                      AS COM_RegionId,
-                    r.Id                              AS R_Id,
-                    r.Nombre                          AS R_Nombre
+                    efi.ComunaId                      AS EDI_ComunaId
                 FROM dbo.Compras c       WITH (NOLOCK)
                 LEFT JOIN dbo.Divisiones d   WITH (NOLOCK) ON d.Id   = c.DivisionId
                 LEFT JOIN dbo.Servicios  s   WITH (NOLOCK) ON s.Id   = d.ServicioId
                 LEFT JOIN dbo.Instituciones i WITH (NOLOCK) ON i.Id  = s.InstitucionId
                 LEFT JOIN dbo.Energeticos e  WITH (NOLOCK) ON e.Id   = c.EnergeticoId
                 LEFT JOIN dbo.Edificios  efi WITH (NOLOCK) ON efi.Id = d.EdificioId
-                LEFT JOIN dbo.Comunas    com WITH (NOLOCK) ON com.Id = efi.ComunaId
-                LEFT JOIN dbo.Regiones   r   WITH (NOLOCK) ON r.Id   = com.RegionId
-                WHERE c.Id IN ({ids_csv})
+                WHERE c.Id IN (SELECT Id FROM {ids_t})
                 ORDER BY c.FechaCompra DESC, c.Id DESC
-                OPTION (RECOMPILE)
                 """
             )
         ).mappings().all()
+        tree = territorio.get(db)
 
         # ---- Items + Medidores (lote)
         has_numero = _col_exists_cached(db, "dbo", "Medidores", "Numero")
@@ -406,9 +474,8 @@ class CompraService:
                     {", ".join(med_fields)}
                 FROM dbo.CompraMedidor cm WITH (NOLOCK)
                 LEFT JOIN dbo.Medidores m WITH (NOLOCK) ON m.Id = cm.MedidorId
-                WHERE cm.CompraId IN ({ids_csv})
+                WHERE cm.CompraId IN (SELECT Id FROM {ids_t})
                 ORDER BY cm.Id
-                OPTION (RECOMPILE)
                 """
             )
         ).mappings().all()
@@ -440,14 +507,12 @@ class CompraService:
         for r in head_rows:
             cid = int(r["Id"])
             med_ids = medids_by_compra.get(cid, [])
+            geo = tree.comuna_region_info(r.get("EDI_ComunaId"))
             direccion = {
                 "Calle": r.get("EDI_Calle"),
                 "Numero": r.get("EDI_Numero"),
                 "DireccionLibre": r.get("EDI_DireccionLibre"),
-                "ComunaId": int(r["COM_Id"]) if r.get("COM_Id") is not None else None,
-                "ComunaNombre": r.get("COM_Nombre"),
-                "RegionId": int(r["R_Id"]) if r.get("R_Id") is not None else None,
-                "RegionNombre": r.get("R_Nombre"),
+                **geo,
             }
             nombre_opc = (
                 r.get("CompraNombreOpcional")
@@ -462,9 +527,7 @@ class CompraService:
                     "InstitucionId": int(r["InstitucionId"]) if r["InstitucionId"] is not None else None,
                     "InstitucionNombre": r.get("InstitucionNombre"),
                     "EnergeticoNombre": r.get("EnergeticoNombre"),
-                    "RegionId": int(r["COM_RegionId"])
-                    if r.get("COM_RegionId") is not None
-                    else (int(r["R_Id"]) if r.get("R_Id") is not None else None),
+                    "RegionId": geo["RegionId"],
                     "EdificioId": int(r["EdificioId"]) if r["EdificioId"] is not None else None,
                     "NombreOpcional": nombre_opc,
                     "UnidadReportaPMG": (bool(r["UnidadReportaPMG"]) if r.get("UnidadReportaPMG") is not None else None),
@@ -556,8 +619,11 @@ class CompraService:
         db: Session,
         data,
         created_by: Optional[str] = None
-    ) -> Tuple[Compra, List[CompraMedidor]]:
-
+    ) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """
+        Crea la compra y sus items. Cabecera e items vuelven del mismo INSERT
+        (OUTPUT INSERTED.*), sin refresh ni re-consulta: ({Compra}, [{Item}]).
+        """
         now = datetime.utcnow()
 
         unidad_id = getattr(data, "UnidadId", None)
@@ -574,31 +640,36 @@ class CompraService:
 
         created_by_div = getattr(data, "CreatedByDivisionId", None) or division_id
 
-        obj = Compra(
-            CreatedAt=now,
-            UpdatedAt=now,
-            Version=0,
-            Active=True,
-            CreatedBy=created_by,
-            ModifiedBy=created_by,
-            Consumo=data.Consumo,
-            InicioLectura=_to_dt(data.InicioLectura),
-            FinLectura=_to_dt(data.FinLectura),
-            DivisionId=int(division_id),
-            EnergeticoId=data.EnergeticoId,
-            FechaCompra=_to_dt(data.FechaCompra),
-            Costo=data.Costo,
-            FacturaId=data.FacturaId,
-            NumeroClienteId=data.NumeroClienteId,
-            UnidadMedidaId=data.UnidadMedidaId,
-            Observacion=data.Observacion,
-            EstadoValidacionId=data.EstadoValidacionId,
-            CreatedByDivisionId=created_by_div,
-            SinMedidor=data.SinMedidor,
+        compra_overlap.check_compra(
+            db,
+            data.NumeroClienteId,
+            [it.MedidorId for it in (getattr(data, "Items", None) or [])],
+            _to_dt(data.InicioLectura),
+            _to_dt(data.FinLectura),
         )
 
-        db.add(obj)
-        db.flush()
+        compra = returning.insert_one(db, Compra, {
+            "CreatedAt": now,
+            "UpdatedAt": now,
+            "Version": 0,
+            "Active": True,
+            "CreatedBy": created_by,
+            "ModifiedBy": created_by,
+            "Consumo": data.Consumo,
+            "InicioLectura": _to_dt(data.InicioLectura),
+            "FinLectura": _to_dt(data.FinLectura),
+            "DivisionId": int(division_id),
+            "EnergeticoId": data.EnergeticoId,
+            "FechaCompra": _to_dt(data.FechaCompra),
+            "Costo": data.Costo,
+            "FacturaId": data.FacturaId,
+            "NumeroClienteId": data.NumeroClienteId,
+            "UnidadMedidaId": data.UnidadMedidaId,
+            "Observacion": data.Observacion,
+            "EstadoValidacionId": data.EstadoValidacionId,
+            "CreatedByDivisionId": created_by_div,
+            "SinMedidor": data.SinMedidor,
+        })
 
         payload = []
         for it in (getattr(data, "Items", None) or []):
@@ -606,18 +677,19 @@ class CompraService:
                 {
                     "Consumo": float(it.Consumo),
                     "MedidorId": int(it.MedidorId) if it.MedidorId is not None else None,
-                    "CompraId": int(obj.Id),
+                    "CompraId": int(compra["Id"]),
                     "ParametroMedicionId": int(it.ParametroMedicionId) if it.ParametroMedicionId is not None else None,
                     "UnidadMedidaId": int(it.UnidadMedidaId) if it.UnidadMedidaId is not None else None,
                 }
             )
+        items = returning.insert_many(db, CompraMedidor, payload, audit=False)
 
-        if payload:
-            db.execute(CM_TBL.insert(), payload)
+        # el INSERT Core no pasa por el after_flush del prorrateo
+        if prorrateo.is_available(db):
+            prorrateo.refresh(db, [compra["Id"]])
 
         db.commit()
-        db.refresh(obj)
-        return obj, self._items_by_compra(db, obj.Id)
+        return compra, items
 
     def update(
         self,
@@ -650,6 +722,14 @@ class CompraService:
         for name, value in payload.items():
             setattr(obj, name, value)
 
+        if obj.Active and payload.keys() & {"InicioLectura", "FinLectura", "NumeroClienteId"}:
+            medidor_ids = db.execute(
+                select(CM_TBL.c.MedidorId).where(CM_TBL.c.CompraId == obj.Id)
+            ).scalars().all()
+            compra_overlap.check_compra(
+                db, obj.NumeroClienteId, medidor_ids, obj.InicioLectura, obj.FinLectura, exclude_id=obj.Id,
+            )
+
         obj.Version = (obj.Version or 0) + 1
         obj.UpdatedAt = datetime.utcnow()
         obj.ModifiedBy = modified_by
@@ -689,8 +769,30 @@ class CompraService:
         - Secciones extra (Items, Division, Servicio, etc.) como campos adyacentes
         """
         db.execute(text("SET TRANSACTION ISOLATION LEVEL READ UNCOMMITTED;"))
-        ctx = self.get_context(db, compra_id)
+        return self._full_from_context(self.get_context(db, compra_id))
+
+    def get_full_many(self, db: Session, compra_ids: List[int]) -> List[dict]:
+        """
+        get_full para N compras con un número fijo de sentencias: una para
+        cabeceras + referencias y una para items + Medidor FULL (las columnas
+        de Edificios/Medidores salen de caché por proceso).
+        Respeta el orden de `compra_ids` y omite los que no existen.
+        """
+        ids = list(dict.fromkeys(int(x) for x in compra_ids))
+        if not ids:
+            return []
+        stmt = text(self._context_select_sql(db, "c.Id IN :ids")).bindparams(bindparam("ids", expanding=True))
+        cabs = {int(r["C_Id"]): r for r in db.execute(stmt, {"ids": ids}).mappings().all()}
+        items = self._items_with_medidor_full_many(db, list(cabs))
+        tree = territorio.get(db)
+        return [
+            self._full_from_context(self._context_from_row(cabs[cid], items.get(cid, []), tree))
+            for cid in ids
+            if cid in cabs
+        ]
 
+    @staticmethod
+    def _full_from_context(ctx: dict) -> dict:
         required_root = [
             "Id", "DivisionId", "EnergeticoId", "NumeroClienteId", "FechaCompra", "Consumo", "Costo",
             "InicioLectura", "FinLectura", "FacturaId", "CreatedByDivisionId", "EstadoValidacionId",
@@ -743,7 +845,18 @@ class CompraService:
         - items + medidor FULL (todas las columnas)
         Usa LEFT JOIN + NOLOCK para asemejar .NET y reduce idas a la BD.
         """
+        cab = db.execute(
+            text(self._context_select_sql(db, "c.Id = :id")), {"id": compra_id}
+        ).mappings().first()
+        if not cab:
+            raise HTTPException(status_code=404, detail="Compra no encontrada")
+
+        # ✅ Items + Medidor FULL (sin duplicar bloques)
+        items = self._items_by_compra_with_medidor_full(db, compra_id)
+        return self._context_from_row(cab, items, territorio.get(db))
 
+    def _context_select_sql(self, db: Session, where: str) -> str:
+        """Cabecera + referencias (en UNA consulta) filtrada por `where` sobre c.*"""
         # ====== Detección dinámica de columnas para Dirección ======
         has_efi_calle = _col_exists_cached(db, "dbo", "Edificios", "Calle")
         has_efi_numero = _col_exists_cached(db, "dbo", "Edificios", "Numero")
@@ -762,29 +875,11 @@ class CompraService:
         else:
             edi_fields.append("NULL AS EDI_DireccionLibre")
         edi_fields.append("efi.ComunaId AS EDI_ComunaId" if has_efi_comuna else "NULL AS EDI_ComunaId")
-
-        # Campos de Comuna/Región (solo si podemos enlazar por ComunaId)
-        if has_efi_comuna:
-            com_fields = [
-                "com.Id       AS COM_Id",
-                "com.Nombre   AS COM_Nombre",
-                "com.RegionId AS COM_RegionId",
-            ]
-            reg_fields = [
-                "r.Id     AS R_Id",
-                "r.Nombre AS R_Nombre",
-            ]
-            com_join_sql = "LEFT JOIN dbo.Comunas com        WITH (NOLOCK) ON com.Id = efi.ComunaId"
-            reg_join_sql = "LEFT JOIN dbo.Regiones r         WITH (NOLOCK) ON r.Id   = com.RegionId"
-        else:
-            com_fields = ["NULL AS COM_Id", "NULL AS COM_Nombre", "NULL AS COM_RegionId"]
-            reg_fields = ["NULL AS R_Id", "NULL AS R_Nombre"]
-            com_join_sql = ""
-            reg_join_sql = ""
+        # Comuna/Región se resuelven desde el árbol territorial en memoria (sin JOIN)
 
         # ====== Cabecera + referencias (en UNA consulta) ======
-        select_sql = f"""
-            SELECT TOP 1
+        return f"""
+            SELECT
                 -- Compra
                 c.Id                  AS C_Id,
                 c.DivisionId          AS C_DivisionId,
@@ -821,10 +916,6 @@ class CompraService:
                 -- Edificio (+ Dirección directa)
                 {", ".join(edi_fields)},
 
-                -- Comuna / Región (si procede)
-                {", ".join(com_fields)},
-                {", ".join(reg_fields)},
-
                 -- Número de cliente
                 nc.Id           AS NC_Id,
                 nc.Numero       AS NC_Numero,
@@ -837,18 +928,13 @@ class CompraService:
             LEFT JOIN dbo.Servicios     s    WITH (NOLOCK) ON s.Id   = d.ServicioId
             LEFT JOIN dbo.Instituciones i    WITH (NOLOCK) ON i.Id   = s.InstitucionId
             LEFT JOIN dbo.Edificios     efi  WITH (NOLOCK) ON efi.Id = d.EdificioId
-            {com_join_sql}
-            {reg_join_sql}
             LEFT JOIN dbo.NumeroClientes nc  WITH (NOLOCK) ON nc.Id  = c.NumeroClienteId
             LEFT JOIN dbo.Energeticos   e    WITH (NOLOCK) ON e.Id   = c.EnergeticoId
-            WHERE c.Id = :id
-            OPTION (RECOMPILE)
+            WHERE {where}
         """
 
-        cab = db.execute(text(select_sql), {"id": compra_id}).mappings().first()
-        if not cab:
-            raise HTTPException(status_code=404, detail="Compra no encontrada")
-
+    @staticmethod
+    def _context_from_row(cab, items: List[Dict[str, Any]], tree) -> dict:
         # Normaliza compra base
         compra = {
             "Id": int(cab["C_Id"]),
@@ -885,32 +971,32 @@ class CompraService:
         servicio = {"Id": int(cab["S_Id"]), "ServicioNombre": cab["S_Nombre"]} if cab["S_Id"] is not None else None
         institucion = {"Id": int(cab["I_Id"]), "InstitucionNombre": cab["I_Nombre"]} if cab["I_Id"] is not None else None
 
+        com_node = tree.comuna(cab.get("EDI_ComunaId"))
+        reg_node = tree.region(com_node.RegionId) if com_node else None
+
         comuna = None
-        if cab.get("COM_Id") is not None:
+        if com_node is not None:
             comuna = {
-                "Id": int(cab["COM_Id"]),
-                "ComunaNombre": cab["COM_Nombre"],
-                "RegionId": int(cab["COM_RegionId"]) if cab["COM_RegionId"] is not None else None,
+                "Id": com_node.Id,
+                "ComunaNombre": com_node.Nombre,
+                "RegionId": com_node.RegionId,
             }
 
-        region = {"Id": int(cab["R_Id"]), "RegionNombre": cab["R_Nombre"]} if cab.get("R_Id") is not None else None
+        region = {"Id": reg_node.Id, "RegionNombre": reg_node.Nombre} if reg_node is not None else None
 
         numero_cliente = {"Id": int(cab["NC_Id"]), "NumeroClienteNumero": cab["NC_Numero"]} if cab["NC_Id"] is not None else None
         energetico = {"Id": int(cab["E_Id"]), "EnergeticoNombre": cab["E_Nombre"]} if cab["E_Id"] is not None else None
 
-        # ✅ Items + Medidor FULL (sin duplicar bloques)
-        items = self._items_by_compra_with_medidor_full(db, compra_id)
-
         # Dirección armada desde Edificios (+ Comuna/Región si hay FK)
         direccion = (
             {
                 "Calle": cab.get("EDI_Calle"),
                 "Numero": cab.get("EDI_Numero"),
                 "DireccionLibre": cab.get("EDI_DireccionLibre"),
-                "ComunaId": int(cab["COM_Id"]) if cab.get("COM_Id") is not None else None,
-                "ComunaNombre": cab.get("COM_Nombre"),
-                "RegionId": int(cab["R_Id"]) if cab.get("R_Id") is not None else None,
-                "RegionNombre": cab.get("R_Nombre"),
+                "ComunaId": comuna["Id"] if comuna else None,
+                "ComunaNombre": comuna["ComunaNombre"] if comuna else None,
+                "RegionId": region["Id"] if region else None,
+                "RegionNombre": region["RegionNombre"] if region else None,
             }
             if cab.get("EDI_Id") is not None
             else None
@@ -1001,27 +1087,41 @@ class CompraService:
             )
             params["medidor_id"] = int(medidor_id)
         if region_id is not None:
-            where_parts.append(
-                """
-                EXISTS (
-                    SELECT 1
-                    FROM dbo.Divisiones d WITH (NOLOCK)
-                    LEFT JOIN dbo.Edificios efi WITH (NOLOCK) ON efi.Id = d.EdificioId
-                    LEFT JOIN dbo.Comunas  com WITH (NOLOCK) ON com.Id = efi.ComunaId
-                    WHERE d.Id = c.DivisionId AND com.RegionId = :region_id
+            # comunas de la región desde el árbol en memoria (enteros propios: seguros en línea)
+            comuna_ids = sorted(territorio.get(db).comuna_ids_of_region(region_id))
+            if comuna_ids:
+                where_parts.append(
+                    f"""
+                    EXISTS (
+                        SELECT 1
+                        FROM dbo.Divisiones d WITH (NOLOCK)
+                        JOIN dbo.Edificios efi WITH (NOLOCK) ON efi.Id = d.EdificioId
+                        WHERE d.Id = c.DivisionId AND efi.ComunaId IN ({",".join(str(x) for x in comuna_ids)})
+                    )
+                    """
                 )
-                """
-            )
-            params["region_id"] = int(region_id)
+            else:
+                where_parts.append("1 = 0")
         if nombre_opcional:
-            where_parts.append(
-                """
-                EXISTS (SELECT 1 FROM dbo.Divisiones d WITH (NOLOCK)
-                        WHERE d.Id = c.DivisionId
-                        AND LOWER(ISNULL(d.Nombre,'')) LIKE LOWER(:nombre_opcional_like))
-                """
-            )
-            params["nombre_opcional_like"] = f"%{nombre_opcional}%"
+            cand = search_index.candidates_sql(db, search_index.ENTITY_DIVISION, nombre_opcional, "c.DivisionId")
+            if cand is not None:
+                where_parts.append(cand[0])
+                params.update(cand[1])
+            else:
+                norm = normalized.prefix_sql(db, Division, "NombreNorm", nombre_opcional, "d", "nombre_opcional_norm")
+                if norm is not None:
+                    div_cond = norm[0]
+                    params.update(norm[1])
+                else:
+                    div_cond = "LOWER(ISNULL(d.Nombre,'')) LIKE LOWER(:nombre_opcional_like)"
+                    params["nombre_opcional_like"] = f"%{nombre_opcional}%"
+                where_parts.append(
+                    f"""
+                    EXISTS (SELECT 1 FROM dbo.Divisiones d WITH (NOLOCK)
+                            WHERE d.Id = c.DivisionId
+                            AND {div_cond})
+                    """
+                )
 
         where_sql = " AND ".join(where_parts)
         size = max(1, min(100, page_size))  # ← límite coherente con el endpoint
@@ -1074,7 +1174,7 @@ class CompraService:
             return total, []
 
         compra_ids = [int(r["Id"]) for r in page_ids_rows]
-        ids_csv = ",".join(str(i) for i in compra_ids)
+        ids_t = id_list.load(db, compra_ids, "compra_ids")
 
         # ---- Fase B: enriquecer (ahora con InstitucionNombre + EnergeticoNombre)
         rows = db.execute(
@@ -1096,25 +1196,19 @@ class CompraService:
                     {edi_calle}                     AS EDI_Calle,
                     {edi_numero}                    AS EDI_Numero,
                     {edi_dirlib}                    AS EDI_DireccionLibre,
-                    com.Id                          AS COM_Id,
-                    com.Nombre                      AS COM_Nombre,
-                    com.RegionId                    AS COM_RegionId,
-                    r.Id                            AS R_Id,
-                    r.Nombre                        AS R_Nombre
+                    efi.ComunaId                    AS EDI_ComunaId
                 FROM dbo.Compras c       WITH (NOLOCK)
                 LEFT JOIN dbo.Divisiones d   WITH (NOLOCK) ON d.Id   = c.DivisionId
                 LEFT JOIN dbo.Servicios  s   WITH (NOLOCK) ON s.Id   = d.ServicioId
                 LEFT JOIN dbo.Instituciones i WITH (NOLOCK) ON i.Id  = s.InstitucionId
                 LEFT JOIN dbo.Energeticos e  WITH (NOLOCK) ON e.Id   = c.EnergeticoId
                 LEFT JOIN dbo.Edificios  efi WITH (NOLOCK) ON efi.Id = d.EdificioId
-                LEFT JOIN dbo.Comunas    com WITH (NOLOCK) ON com.Id = efi.ComunaId
-                LEFT JOIN dbo.Regiones   r   WITH (NOLOCK) ON r.Id   = com.RegionId
-                WHERE c.Id IN ({ids_csv})
+                WHERE c.Id IN (SELECT Id FROM {ids_t})
                 ORDER BY c.FechaCompra DESC, c.Id DESC
-                OPTION (RECOMPILE)
                 """
             )
         ).mappings().all()
+        tree = territorio.get(db)
 
         # ---- Items/Medidores para esos IDs (lote)
         has_numero = _col_exists_cached(db, "dbo", "Medidores", "Numero")
@@ -1137,9 +1231,8 @@ class CompraService:
                     {", ".join(medidor_fields)}
                 FROM dbo.CompraMedidor cm WITH (NOLOCK)
                 LEFT JOIN dbo.Medidores m WITH (NOLOCK) ON m.Id = cm.MedidorId
-                WHERE cm.CompraId IN ({ids_csv})
+                WHERE cm.CompraId IN (SELECT Id FROM {ids_t})
                 ORDER BY cm.Id
-                OPTION (RECOMPILE)
                 """
             )
         ).mappings().all()
@@ -1170,14 +1263,12 @@ class CompraService:
         for r in rows:
             cid = int(r["Id"])
             medidor_ids = medidor_ids_by_compra.get(cid, [])
+            geo = tree.comuna_region_info(r.get("EDI_ComunaId"))
             direccion = {
                 "Calle": r.get("EDI_Calle"),
                 "Numero": r.get("EDI_Numero"),
                 "DireccionLibre": r.get("EDI_DireccionLibre"),
-                "ComunaId": int(r["COM_Id"]) if r.get("COM_Id") is not None else None,
-                "ComunaNombre": r.get("COM_Nombre"),
-                "RegionId": int(r["R_Id"]) if r.get("R_Id") is not None else None,
-                "RegionNombre": r.get("R_Nombre"),
+                **geo,
             }
 
             compra_dict = {
@@ -1186,9 +1277,7 @@ class CompraService:
                 "InstitucionId": int(r["InstitucionId"]) if r["InstitucionId"] is not None else None,
                 "InstitucionNombre": r.get("InstitucionNombre"),
                 "EnergeticoNombre": r.get("EnergeticoNombre"),
-                "RegionId": int(r["COM_RegionId"])
-                if r.get("COM_RegionId") is not None
-                else (int(r["R_Id"]) if r.get("R_Id") is not None else None),
+                "RegionId": geo["RegionId"],
                 "EdificioId": int(r["EdificioId"]) if r["EdificioId"] is not None else None,
                 "NombreOpcional": r.get("DivisionNombre"),
                 "UnidadReportaPMG": bool(r["UnidadReportaPMG"]) if r.get("UnidadReportaPMG") is not None else None,
@@ -1232,62 +1321,82 @@ class CompraService:
         items_payload: List[dict],
         modified_by: Optional[str] = None,
     ) -> List[dict]:
+        """
+        Deja los items de la compra iguales al payload con un solo MERGE
+        (diff por (MedidorId, ParametroMedicionId); repetidos se parean por
+        orden de aparición vs. orden de Id). Los items que siguen existiendo
+        conservan su Id; solo se insertan/borran los que cambian de clave.
+        El estado final sale del OUTPUT del MERGE (sin re-leer la tabla).
+        """
         compra = self.get(db, compra_id)
 
-        # 1) Reemplazo total: borrar y reinsertar
-        db.execute(CM_TBL.delete().where(CM_TBL.c.CompraId == compra_id))
+        src: List[Dict[str, Any]] = []
+        seen: Dict[Tuple[Optional[int], Optional[int]], int] = {}
+        for it in items_payload or []:
+            med = int(it["MedidorId"]) if it.get("MedidorId") is not None else None
+            par = int(it["ParametroMedicionId"]) if it.get("ParametroMedicionId") is not None else None
+            seen[(med, par)] = seen.get((med, par), 0) + 1
+            src.append(
+                {
+                    "Ord": seen[(med, par)],
+                    "MedidorId": med,
+                    "ParametroMedicionId": par,
+                    "Consumo": float(it.get("Consumo") or 0),
+                    "UnidadMedidaId": int(it["UnidadMedidaId"]) if it.get("UnidadMedidaId") is not None else None,
+                }
+            )
+        if len(src) > _REPLACE_ITEMS_MAX:
+            raise HTTPException(status_code=400, detail=f"Máximo {_REPLACE_ITEMS_MAX} items por compra")
 
-        if items_payload:
-            batch = []
-            for it in items_payload:
-                batch.append(
-                    {
-                        "CompraId": compra_id,
-                        "MedidorId": int(it["MedidorId"]) if it.get("MedidorId") is not None else None,
-                        "Consumo": float(it.get("Consumo") or 0),
-                        "ParametroMedicionId": int(it["ParametroMedicionId"]) if it.get("ParametroMedicionId") is not None else None,
-                        "UnidadMedidaId": int(it["UnidadMedidaId"]) if it.get("UnidadMedidaId") is not None else None,
-                    }
-                )
-            if batch:
-                db.execute(CM_TBL.insert(), batch)
+        if src:
+            rows = db.execute(_replace_items_stmt(len(src)), _replace_items_params(compra_id, src)).all()
+        else:
+            rows = db.execute(
+                text("DELETE FROM dbo.CompraMedidor OUTPUT 'DELETE', NULL, NULL, NULL, NULL, NULL, NULL, NULL "
+                     "WHERE CompraId = :cid"),
+                {"cid": compra_id},
+            ).all()
+
+        final: List[dict] = []
+        changed = 0
+        for action, iid, med, consumo, par, um, old_consumo, old_um in rows:
+            if action == "DELETE":
+                changed += 1
+                continue
+            if action == "INSERT" or float(old_consumo or 0) != float(consumo or 0) or old_um != um:
+                changed += 1
+            final.append(
+                {
+                    "Id": int(iid),
+                    "Consumo": float(consumo or 0),
+                    "MedidorId": int(med) if med is not None else None,
+                    "ParametroMedicionId": int(par) if par is not None else None,
+                    "UnidadMedidaId": int(um) if um is not None else None,
+                }
+            )
 
-        # 2) Auditoría en Compra
-        compra.Version = (compra.Version or 0) + 1
-        compra.UpdatedAt = datetime.utcnow()
-        compra.ModifiedBy = modified_by
+        # Auditoría en Compra (solo si hubo cambios reales)
+        if changed:
+            compra.Version = (compra.Version or 0) + 1
+            compra.UpdatedAt = datetime.utcnow()
+            compra.ModifiedBy = modified_by
 
-        # 3) Commit primero (estado consistente)
         db.commit()
-
-        # 4) Leer estado final SIN NOLOCK (evita lecturas sucias)
-        rows = db.execute(
-            text(
-                """
-                SELECT Id, MedidorId, Consumo, ParametroMedicionId, UnidadMedidaId
-                FROM dbo.CompraMedidor
-                WHERE CompraId = :cid
-                ORDER BY Id
-                """
-            ),
-            {"cid": compra_id},
-        ).mappings().all()
-
-        return [
-            {
-                "Id": int(r["Id"]),
-                "Consumo": float(r["Consumo"] or 0),
-                "MedidorId": int(r["MedidorId"]) if r["MedidorId"] is not None else None,
-                "ParametroMedicionId": int(r["ParametroMedicionId"]) if r["ParametroMedicionId"] is not None else None,
-                "UnidadMedidaId": int(r["UnidadMedidaId"]) if r["UnidadMedidaId"] is not None else None,
-            }
-            for r in rows
-        ]
+        final.sort(key=lambda r: r["Id"])
+        return final
 
     # ======================================================================
     # Items + Medidor FULL (todas las columnas reales de dbo.Medidores)
     # ======================================================================
     def _items_by_compra_with_medidor_full(self, db: Session, compra_id: int) -> List[Dict[str, Any]]:
+        return self._items_with_medidor_full_many(db, [compra_id]).get(int(compra_id), [])
+
+    def _items_with_medidor_full_many(self, db: Session, compra_ids: List[int]) -> Dict[int, List[Dict[str, Any]]]:
+        """Items + Medidor FULL de varias compras en una consulta: {CompraId: [items]}."""
+        out: Dict[int, List[Dict[str, Any]]] = {}
+        if not compra_ids:
+            return out
+
         # Trae TODAS las columnas reales de dbo.Medidores (en orden)
         med_cols = _table_columns_cached(db, "dbo", "Medidores")
 
@@ -1305,14 +1414,12 @@ class CompraService:
                 {"," if med_select else ""} {med_select}
             FROM dbo.CompraMedidor cm WITH (NOLOCK)
             LEFT JOIN dbo.Medidores m WITH (NOLOCK) ON m.Id = cm.MedidorId
-            WHERE cm.CompraId = :id
-            ORDER BY cm.Id
-            OPTION (RECOMPILE)
+            WHERE cm.CompraId IN :ids
+            ORDER BY cm.CompraId, cm.Id
         """
+        stmt = text(sql).bindparams(bindparam("ids", expanding=True))
+        rows = db.execute(stmt, {"ids": [int(x) for x in compra_ids]}).mappings().all()
 
-        rows = db.execute(text(sql), {"id": compra_id}).mappings().all()
-
-        out: List[Dict[str, Any]] = []
         for r in rows:
             item: Dict[str, Any] = {
                 "Id": int(r["Id"]),
@@ -1330,6 +1437,6 @@ class CompraService:
                     med[c] = _json_safe(r.get(f"M_{c}"))
                 item["Medidor"] = med
 
-            out.append(item)
+            out.setdefault(item["CompraId"], []).append(item)
 
         return out
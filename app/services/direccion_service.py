@@ -5,6 +5,7 @@ from typing import Optional, Tuple, List
 from sqlalchemy.orm import Session
 from sqlalchemy import or_, case
 
+from app.db import normalized
 from app.db.models.direccion import Direccion
 from app.schemas.direcciones import DireccionCreate, DireccionUpdate
 
@@ -39,12 +40,16 @@ class DireccionService:
             q = q.filter(Direccion.ComunaId == comuna_id)
 
         if search:
-            like = f"%{search}%"
-            q = q.filter(or_(
-                Direccion.Calle.like(like),
-                Direccion.DireccionCompleta.like(like),
-                Direccion.Numero.like(like),
-            ))
+            cond = normalized.prefix_filter(self.db, Direccion, "DireccionNorm", search)
+            if cond is not None:
+                q = q.filter(cond)
+            else:
+                like = f"%{search}%"
+                q = q.filter(or_(
+                    Direccion.Calle.like(like),
+                    Direccion.DireccionCompleta.like(like),
+                    Direccion.Numero.like(like),
+                ))
 
         total = q.count()
         size = max(1, min(200, page_size))
@@ -0,0 +1,319 @@
+# app/services/distribuidora_import.py
+"""
+Importación de estados de cuenta de empresas distribuidoras (CSV / XLSX).
+
+- Índice en memoria: una sola consulta carga, para la distribuidora, todos sus
+  NumeroClientes activos con sus Medidores activos y arma
+  (NumeroCliente, MedidorNumero) -> (NumeroClienteId, MedidorId, DivisionId)
+  con claves norm_key (mismas reglas que el LOWER() de by_numcliente_and_numero).
+  Medidor.Numero es NVARCHAR(MAX) sin índice: así no hay un lookup por línea.
+- El archivo se lee en streaming (csv.reader / openpyxl read_only) y cada línea
+  se resuelve contra el índice; las emparejadas pasan a compra_bulk.ingest()
+  (MERGE en tandas + items con fast_executemany) y las demás se reportan.
+- Columnas (encabezado, sin distinguir mayúsculas/tildes/espacios):
+  NumeroCliente, Medidor, InicioLectura, FinLectura, Consumo, Costo y
+  opcionalmente FechaCompra (por defecto FinLectura) y Observacion.
+- XLSX requiere openpyxl (import perezoso: sin él, solo CSV).
+"""
+from __future__ import annotations
+
+import codecs
+import csv
+import itertools
+import logging
+import re
+from datetime import date, datetime
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Set, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.services import compra_bulk
+from app.utils.normalize import norm_key
+
+Log = logging.getLogger(__name__)
+
+# alias de encabezado (ya plegados con _col_key) -> columna canónica
+_HEADER_ALIASES: Dict[str, str] = {
+    "numerocliente": "NumeroCliente", "nrocliente": "NumeroCliente", "cliente": "NumeroCliente",
+    "numcliente": "NumeroCliente", "ncliente": "NumeroCliente",
+    "medidor": "Medidor", "numeromedidor": "Medidor", "nromedidor": "Medidor",
+    "medidornumero": "Medidor", "nummedidor": "Medidor", "nmedidor": "Medidor",
+    "iniciolectura": "InicioLectura", "lecturaanterior": "InicioLectura", "desde": "InicioLectura",
+    "finlectura": "FinLectura", "lecturaactual": "FinLectura", "hasta": "FinLectura",
+    "fechacompra": "FechaCompra", "fechaemision": "FechaCompra", "fecha": "FechaCompra",
+    "consumo": "Consumo",
+    "costo": "Costo", "monto": "Costo", "total": "Costo", "montototal": "Costo",
+    "observacion": "Observacion",
+}
+_REQUIRED = ("NumeroCliente", "Medidor", "InicioLectura", "FinLectura", "Consumo", "Costo")
+_COL_KEY_RE = re.compile(r"[^a-z0-9]+")
+_CSV_DELIMITERS = ";,\t|"
+
+# marca de clave repetida en el índice (dos medidores/clientes con el mismo número)
+_AMBIGUO = object()
+
+
+def _col_key(name: Any) -> str:
+    return _COL_KEY_RE.sub("", norm_key(str(name or "")))
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Índice de la distribuidora
+# ─────────────────────────────────────────────────────────────────────────────
+class DistribuidoraIndex:
+    """(NumeroCliente, MedidorNumero) -> (NumeroClienteId, MedidorId, DivisionId) de una distribuidora."""
+
+    def __init__(self, empresa_id: int, energetico_id: Optional[int]):
+        self.empresa_id = empresa_id
+        self.energetico_id = energetico_id
+        self.medidores: Dict[Tuple[str, str], Any] = {}
+        self.clientes: Dict[str, Any] = {}
+
+    @classmethod
+    def load(cls, db: Session, empresa_id: int) -> "DistribuidoraIndex":
+        rows = db.execute(
+            text("""
+                SELECT e.EnergeticoId, nc.Id, nc.Numero, nc.DivisionId,
+                       m.Id, m.Numero, m.DivisionId
+                FROM dbo.EmpresaDistribuidoras e WITH (NOLOCK)
+                LEFT JOIN dbo.NumeroClientes nc WITH (NOLOCK)
+                       ON nc.EmpresaDistribuidoraId = e.Id AND nc.Active = 1
+                LEFT JOIN dbo.Medidores m WITH (NOLOCK)
+                       ON m.NumeroClienteId = nc.Id AND m.Active = 1
+                WHERE e.Id = :eid
+            """),
+            {"eid": int(empresa_id)},
+        ).all()
+        if not rows:
+            raise HTTPException(status_code=404, detail="Empresa distribuidora no encontrada")
+
+        idx = cls(int(empresa_id), int(rows[0][0]) if rows[0][0] is not None else None)
+        for _, nc_id, nc_num, nc_div, m_id, m_num, m_div in rows:
+            if nc_id is None:
+                continue
+            ck = norm_key(nc_num)
+            prev = idx.clientes.get(ck)
+            if prev is None:
+                idx.clientes[ck] = int(nc_id)
+            elif prev is not _AMBIGUO and prev != int(nc_id):
+                idx.clientes[ck] = _AMBIGUO
+            if m_id is None:
+                continue
+            mk = (ck, norm_key(m_num))
+            div = m_div if m_div is not None else nc_div
+            val = (int(nc_id), int(m_id), int(div) if div is not None else None)
+            prev_m = idx.medidores.get(mk)
+            if prev_m is None:
+                idx.medidores[mk] = val
+            elif prev_m is not _AMBIGUO and prev_m[1] != val[1]:
+                idx.medidores[mk] = _AMBIGUO
+        Log.info(
+            "IMPORT distribuidora %s: índice con %s clientes / %s medidores",
+            empresa_id, len(idx.clientes), len(idx.medidores),
+        )
+        return idx
+
+    def resolve(self, numero_cliente: Any, medidor: Any) -> Tuple[Optional[Tuple[int, int, Optional[int]]], Optional[str]]:
+        """Retorna (ids, None) o (None, código de error)."""
+        ck = norm_key(str(numero_cliente or ""))
+        if not ck:
+            return None, "numero_cliente_vacio"
+        cli = self.clientes.get(ck)
+        if cli is None:
+            return None, "numero_cliente_no_encontrado"
+        if cli is _AMBIGUO:
+            return None, "numero_cliente_ambiguo"
+        hit = self.medidores.get((ck, norm_key(str(medidor or ""))))
+        if hit is None:
+            return None, "medidor_no_encontrado"
+        if hit is _AMBIGUO:
+            return None, "medidor_ambiguo"
+        if hit[2] is None:
+            return None, "medidor_sin_division"
+        return hit, None
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Lectura en streaming
+# ─────────────────────────────────────────────────────────────────────────────
+def _iter_csv(fileobj: BinaryIO) -> Iterator[List[Any]]:
+    src = codecs.getreader("utf-8-sig")(fileobj, errors="replace")
+    first = src.readline()
+    if not first:
+        return
+    delim = max(_CSV_DELIMITERS, key=first.count)
+    yield from csv.reader(itertools.chain([first], src), delimiter=delim)
+
+
+def _iter_xlsx(fileobj: BinaryIO) -> Iterator[List[Any]]:
+    try:
+        from openpyxl import load_workbook  # type: ignore
+    except ImportError:
+        raise HTTPException(status_code=415, detail="Soporte XLSX no disponible (falta openpyxl); envíe CSV")
+    wb = load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        for row in wb.worksheets[0].iter_rows(values_only=True):
+            yield list(row)
+    finally:
+        wb.close()
+
+
+def iter_rows(filename: str, fileobj: BinaryIO) -> Iterator[List[Any]]:
+    name = (filename or "").lower()
+    if name.endswith((".xlsx", ".xlsm")):
+        return _iter_xlsx(fileobj)
+    if name.endswith((".csv", ".txt")) or not name:
+        return _iter_csv(fileobj)
+    raise HTTPException(status_code=415, detail="Formato no soportado (use .csv o .xlsx)")
+
+
+def _num(v: Any) -> Optional[float]:
+    """
+    Acepta 1234.5, '1.234,5', '1234,5' y '$ 10.000' (formato chileno: con coma
+    decimal o con punto seguido de 3 dígitos, el punto es separador de miles).
+    """
+    if v is None or v == "":
+        return None
+    if isinstance(v, (int, float)):
+        return float(v)
+    s = re.sub(r"[^0-9,.\-]", "", str(v))
+    if "," in s:
+        s = s.replace(".", "").replace(",", ".")
+    elif s.count(".") > 1 or re.fullmatch(r"-?\d{1,3}\.\d{3}", s):
+        s = s.replace(".", "")
+    return float(s) if s not in ("", "-", ".") else None
+
+
+def _date(v: Any) -> Optional[datetime]:
+    if v is None or v == "":
+        return None
+    if isinstance(v, datetime):
+        return v
+    if isinstance(v, date):
+        return datetime(v.year, v.month, v.day)
+    s = str(v).strip()
+    for fmt in ("%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y", "%Y/%m/%d"):
+        try:
+            return datetime.strptime(s[:10], fmt)
+        except ValueError:
+            continue
+    raise ValueError(f"fecha inválida: {s!r}")
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Pipeline
+# ─────────────────────────────────────────────────────────────────────────────
+def _unmatched(linea: int, code: str, cols: Dict[str, Any], msg: Optional[str] = None) -> Dict[str, Any]:
+    return {
+        "Linea": linea,
+        "Codigo": code,
+        "Error": msg,
+        "NumeroCliente": None if cols.get("NumeroCliente") is None else str(cols.get("NumeroCliente")),
+        "Medidor": None if cols.get("Medidor") is None else str(cols.get("Medidor")),
+    }
+
+
+def import_file(
+    db: Session,
+    empresa_id: int,
+    filename: str,
+    fileobj: BinaryIO,
+    factura_id: int,
+    created_by: Optional[str] = None,
+    allowed_division_ids: Optional[Set[int]] = None,
+    unidad_medida_id: Optional[int] = None,
+    parcial: bool = False,
+) -> Dict[str, Any]:
+    """
+    Importa el archivo de la distribuidora: una compra (con un item) por línea.
+    Retorna {"Lineas", "Emparejadas", "SinEmparejar": [...], "Compras": resultado de ingest}.
+    Con parcial=False cualquier línea sin emparejar o inválida aborta (422).
+    """
+    index = DistribuidoraIndex.load(db, empresa_id)
+    if index.energetico_id is None:
+        raise HTTPException(status_code=409, detail="La empresa distribuidora no tiene EnergeticoId")
+
+    rows = iter_rows(filename, fileobj)
+    header = next(rows, None)
+    if header is None:
+        raise HTTPException(status_code=400, detail="Archivo vacío")
+    cols_pos: Dict[str, int] = {}
+    for pos, name in enumerate(header):
+        canon = _HEADER_ALIASES.get(_col_key(name))
+        if canon and canon not in cols_pos:
+            cols_pos[canon] = pos
+    missing = [c for c in _REQUIRED if c not in cols_pos]
+    if missing:
+        raise HTTPException(status_code=400, detail={"code": "columnas_faltantes", "Columnas": missing})
+
+    compras: List[Dict[str, Any]] = []
+    lineas: List[int] = []
+    unmatched: List[Dict[str, Any]] = []
+    total = 0
+
+    for linea, raw in enumerate(rows, start=2):
+        if not raw or all(v is None or str(v).strip() == "" for v in raw):
+            continue
+        total += 1
+        if total > compra_bulk.COMPRA_BULK_MAX:
+            raise HTTPException(status_code=400, detail=f"Máximo {compra_bulk.COMPRA_BULK_MAX} líneas por archivo")
+        cols = {c: (raw[p] if p < len(raw) else None) for c, p in cols_pos.items()}
+
+        ids, code = index.resolve(cols["NumeroCliente"], cols["Medidor"])
+        if code:
+            unmatched.append(_unmatched(linea, code, cols))
+            continue
+        nc_id, medidor_id, division_id = ids
+        try:
+            consumo = _num(cols["Consumo"])
+            inicio = _date(cols["InicioLectura"])
+            fin = _date(cols["FinLectura"])
+            fecha = _date(cols.get("FechaCompra")) or fin
+            compras.append({
+                "Consumo": consumo,
+                "Costo": _num(cols["Costo"]),
+                "InicioLectura": inicio,
+                "FinLectura": fin,
+                "FechaCompra": fecha,
+                "DivisionId": division_id,
+                "EnergeticoId": index.energetico_id,
+                "NumeroClienteId": nc_id,
+                "FacturaId": factura_id,
+                "UnidadMedidaId": unidad_medida_id,
+                "Observacion": (str(cols["Observacion"]).strip() or None) if cols.get("Observacion") is not None else None,
+                "SinMedidor": False,
+                "Items": [{"Consumo": consumo, "MedidorId": medidor_id, "UnidadMedidaId": unidad_medida_id}],
+            })
+            lineas.append(linea)
+        except ValueError as ex:
+            unmatched.append(_unmatched(linea, "formato", cols, str(ex)))
+
+    if unmatched and not parcial:
+        raise HTTPException(
+            status_code=422,
+            detail={
+                "code": "lineas_sin_emparejar",
+                "msg": f"{len(unmatched)} línea(s) sin emparejar; no se creó ninguna compra",
+                "SinEmparejar": unmatched,
+            },
+        )
+
+    try:
+        result = compra_bulk.ingest(
+            db, compras, created_by=created_by, allowed_division_ids=allowed_division_ids, parcial=parcial,
+        )
+    except HTTPException as ex:
+        if isinstance(ex.detail, dict) and "Errores" in ex.detail:
+            for e in ex.detail["Errores"]:
+                e["Linea"] = lineas[e["Indice"]]
+        raise
+
+    for r in result["Resultados"]:
+        r["Linea"] = lineas[r["Indice"]]
+    Log.info(
+        "IMPORT distribuidora %s: %s líneas, %s emparejadas, %s sin emparejar, %s compras creadas",
+        empresa_id, total, len(compras), len(unmatched), result["Creadas"],
+    )
+    return {"Lineas": total, "Emparejadas": len(compras), "SinEmparejar": unmatched, "Compras": result}
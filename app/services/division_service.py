@@ -5,16 +5,18 @@ from datetime import datetime
 from typing import Iterable, List, Optional, Dict, Any
 
 from fastapi import HTTPException, status
-from sqlalchemy import func, or_, select, cast, Integer
+from sqlalchemy import and_, func, or_, select, cast, Integer
 from sqlalchemy.orm import Session
 
+from app.db import returning
 from app.db.models.area import Area
 from app.db.models.direccion import Direccion
 from app.db.models.division import Division
 from app.db.models.piso import Piso
 from app.db.models.edificio import Edificio
-from app.db.models.comuna import Comuna
 from app.db.models.usuarios_divisiones import UsuarioDivision
+from app.search import index as search_index
+from app.services import territorio
 from app.schemas.division import (
     DivisionAniosDTO,
     DivisionDTO,
@@ -281,14 +283,19 @@ class DivisionService:
                 base = base.filter(or_(Division.ComunaId == comuna_id, Direccion.ComunaId == comuna_id))
 
             if q:
-                like = f"%{q}%"
-                base = base.filter(
-                    or_(
-                        func.coalesce(Division.Nombre, "").like(like),
-                        func.coalesce(Division.Direccion, "").like(like),
-                        func.coalesce(Direccion.DireccionCompleta, "").like(like),
+                # Índice de tokens (sargable); fallback al LIKE histórico si no está disponible
+                cand = search_index.candidates(db, search_index.ENTITY_DIVISION, q)
+                if cand is not None:
+                    base = base.filter(Division.Id.in_(cand))
+                else:
+                    like = f"%{q}%"
+                    base = base.filter(
+                        or_(
+                            func.coalesce(Division.Nombre, "").like(like),
+                            func.coalesce(Division.Direccion, "").like(like),
+                            func.coalesce(Direccion.DireccionCompleta, "").like(like),
+                        )
                     )
-                )
 
             log.debug(
                 "DIVISIONES.list[SLOW] → base listo (%.1f ms)",
@@ -462,7 +469,7 @@ class DivisionService:
         Devuelve (Id, Nombre) para picker:
         - Filtra por ServicioId si viene.
         - Filtra por q en Dirección preferida **o Nombre**.
-        - Opcionalmente filtra por RegionId usando Division -> Edificio -> Comuna.
+        - Opcionalmente filtra por RegionId usando Division -> Edificio -> comuna (árbol territorial).
         """
         DirPref = func.coalesce(Division.Direccion, Direccion.DireccionCompleta)
 
@@ -475,28 +482,32 @@ class DivisionService:
         if servicio_id is not None:
             qy = qy.filter(Division.ServicioId == servicio_id)
 
-        # 🔍 Filtro opcional por región (igual que ya tenías)
+        # 🔍 Filtro opcional por región (comunas de la región desde el árbol en memoria)
         if region_id is not None:
+            comuna_ids = sorted(territorio.get(db).comuna_ids_of_region(region_id))
             qy = (
                 qy.outerjoin(Edificio, Edificio.Id == Division.EdificioId)
-                .outerjoin(Comuna, Comuna.Id == Edificio.ComunaId)
                 .filter(
                     or_(
                         Division.RegionId == region_id,
-                        Comuna.RegionId == region_id,
+                        Edificio.ComunaId.in_(comuna_ids),
                     )
                 )
             )
 
         # 🔍 Búsqueda por texto: ahora Dirección **o Nombre**
         if q:
-            like = f"%{q}%"
-            qy = qy.filter(
-                or_(
-                    DirPref.like(like),
-                    func.coalesce(Division.Nombre, "").like(like),
+            cand = search_index.candidates(db, search_index.ENTITY_DIVISION, q)
+            if cand is not None:
+                qy = qy.filter(Division.Id.in_(cand))
+            else:
+                like = f"%{q}%"
+                qy = qy.filter(
+                    or_(
+                        DirPref.like(like),
+                        func.coalesce(Division.Nombre, "").like(like),
+                    )
                 )
-            )
 
         return qy.order_by(DirPref.asc(), Division.Id.asc()).all()
 
@@ -664,7 +675,7 @@ class DivisionService:
             db.rollback()
             raise
 
-    def set_active_cascada(self, db: Session, division_id: int, active: bool, user_id: str | None) -> Division:
+    def set_active_cascada(self, db: Session, division_id: int, active: bool, user_id: str | None) -> Dict[str, Any]:
         aj = AjusteService(db)
         if not aj.can_delete_unidad_pmg():
             accion = "activar" if active else "desactivar"
@@ -673,30 +684,18 @@ class DivisionService:
                 detail=f"No tienes permiso para {accion} la Unidad PMG (Ajustes.DeleteUnidadPMG = false).",
             )
 
-        d = self.get(db, division_id)
-        now = datetime.utcnow()
-
-        d.Active = bool(active)
-        d.UpdatedAt = now
-        d.ModifiedBy = user_id
-        d.Version = (d.Version or 0) + 1
-
-        pisos = db.query(Piso).filter(Piso.DivisionId == division_id).all()
-        for p in pisos:
-            p.Active = bool(active)
-            p.UpdatedAt = now
-            p.ModifiedBy = user_id
-            p.Version = (p.Version or 0) + 1
-
-            areas = db.query(Area).filter(Area.PisoId == p.Id).all()
-            for a in areas:
-                a.Active = bool(active)
-                a.UpdatedAt = now
-                a.ModifiedBy = user_id
-                a.Version = (a.Version or 0) + 1
-
+        # tres UPDATE ... OUTPUT (división, pisos, áreas): sin cargar objetos ni refresh
+        values = {"Active": bool(active), "UpdatedAt": datetime.utcnow(), "ModifiedBy": user_id}
+        d = returning.update_one(db, Division, division_id, values, bump_version=True)
+        if d is None:
+            raise HTTPException(status_code=404, detail="División no encontrada")
+        returning.update_where(db, Piso, "[DivisionId] = :div", {"div": division_id}, values, bump_version=True)
+        returning.update_where(
+            db, Area,
+            "[PisoId] IN (SELECT p.Id FROM dbo.Pisos p WHERE p.DivisionId = :div)",
+            {"div": division_id}, values, bump_version=True,
+        )
         db.commit()
-        db.refresh(d)
         return d
 
     def update_full(
@@ -756,17 +755,14 @@ class DivisionService:
             func.concat(Edificio.Calle, " ", Edificio.Numero),
         )
 
-        RegionPref = func.coalesce(
-            Direccion.RegionId,
-            Comuna.RegionId,
-            Division.RegionId,
-        )
+        # RegionPref = COALESCE(Direccion.RegionId, región de la comuna del Edificio, Division.RegionId);
+        # la región de la comuna sale del árbol territorial en memoria (sin JOIN a dbo.Comunas)
+        tree = territorio.get(db)
 
         base = (
             db.query(Division.Id)
             .outerjoin(Direccion, Direccion.Id == Division.DireccionInmuebleId)
             .outerjoin(Edificio, Edificio.Id == Division.EdificioId)
-            .outerjoin(Comuna, Comuna.Id == Edificio.ComunaId)
             .filter(cast(Division.Active, Integer) == 1)
         )
 
@@ -774,18 +770,33 @@ class DivisionService:
             base = base.filter(Division.ServicioId == servicio_id)
 
         if region_id is not None:
-            base = base.filter(RegionPref == region_id)
-
-        if q:
-            like = f"%{q}%"
+            comunas_region = sorted(tree.comuna_ids_of_region(region_id))
             base = base.filter(
                 or_(
-                    func.coalesce(Division.Nombre, "").like(like),
-                    func.coalesce(Division.Direccion, "").like(like),
-                    func.coalesce(Direccion.DireccionCompleta, "").like(like),
+                    Direccion.RegionId == region_id,
+                    and_(Direccion.RegionId.is_(None), Edificio.ComunaId.in_(comunas_region)),
+                    and_(
+                        Direccion.RegionId.is_(None),
+                        Edificio.ComunaId.is_(None),
+                        Division.RegionId == region_id,
+                    ),
                 )
             )
 
+        if q:
+            cand = search_index.candidates(db, search_index.ENTITY_DIVISION, q)
+            if cand is not None:
+                base = base.filter(Division.Id.in_(cand))
+            else:
+                like = f"%{q}%"
+                base = base.filter(
+                    or_(
+                        func.coalesce(Division.Nombre, "").like(like),
+                        func.coalesce(Division.Direccion, "").like(like),
+                        func.coalesce(Direccion.DireccionCompleta, "").like(like),
+                    )
+                )
+
         # total (COUNT) sin ORDER BY
         total = db.query(func.count()).select_from(base.subquery()).scalar() or 0
 
@@ -805,7 +816,8 @@ class DivisionService:
                     Division.Id.label("Id"),
                     Division.Nombre.label("Nombre"),
                     DireccionPref.label("Direccion"),
-                    RegionPref.label("RegionId"),
+                    Direccion.RegionId.label("DireccionRegionId"),
+                    Division.RegionId.label("DivisionRegionId"),
                     Division.ServicioId.label("ServicioId"),
                     # debug
                     Division.DireccionInmuebleId.label("DireccionInmuebleId"),
@@ -814,14 +826,29 @@ class DivisionService:
                 )
                 .outerjoin(Direccion, Direccion.Id == Division.DireccionInmuebleId)
                 .outerjoin(Edificio, Edificio.Id == Division.EdificioId)
-                .outerjoin(Comuna, Comuna.Id == Edificio.ComunaId)
                 .filter(Division.Id.in_(ids))
                 # re-orden global (Id DESC como el query)
                 .order_by(Division.Id.desc())
                 .all()
             )
 
-            items = [{k: v for k, v in row._mapping.items()} for row in rows]
+            for row in rows:
+                m = row._mapping
+                region_pref = m["DireccionRegionId"]
+                if region_pref is None:
+                    region_pref = tree.region_id_of_comuna(m["EdificioComunaId"])
+                if region_pref is None:
+                    region_pref = m["DivisionRegionId"]
+                items.append({
+                    "Id": m["Id"],
+                    "Nombre": m["Nombre"],
+                    "Direccion": m["Direccion"],
+                    "RegionId": region_pref,
+                    "ServicioId": m["ServicioId"],
+                    "DireccionInmuebleId": m["DireccionInmuebleId"],
+                    "DireccionComunaId": m["DireccionComunaId"],
+                    "EdificioComunaId": m["EdificioComunaId"],
+                })
 
         return {"total": total, "page": page, "page_size": size, "items": items}
     
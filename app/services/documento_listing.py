@@ -0,0 +1,297 @@
+# app/services/documento_listing.py
+"""
+Motor común de los listados paginados de documentos (/api/v1/documentos/*).
+
+- Una sola sentencia por página: filas + COUNT(*) OVER() (antes: COUNT,
+  página y otra consulta por las banderas del servicio).
+- Solo se proyectan las columnas que cada endpoint devuelve (sin hidratar
+  entidades polimórficas completas).
+- AnioDoc se traduce a rango sargable CreatedAt >= 1-ene AND < 1-ene siguiente
+  (EXTRACT(year ...) sobre la columna impedía usar índices).
+- Banderas NoRegistra* del servicio cacheadas por proceso hasta
+  SERVICIO_FLAGS_TTL_SECONDS; un flush que toque Servicio invalida la caché
+  local al hacer commit y los demás procesos la ven al vencer el TTL.
+- CATEGORIAS describe cada listado (tipos, columnas, si filtra por etapa); la
+  usan los endpoints por tipo y el tablero dashboard() (todas las categorías
+  en una consulta con ROW_NUMBER() OVER (PARTITION BY TipoDocumentoId ...)).
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from sqlalchemy import and_, event, func, null, or_, select
+from sqlalchemy.orm import Session
+
+from app.db.models.documento import Documento
+from app.db.models.servicio import Servicio
+from app.services.documento_service import CONSTANTS, DocumentoService
+
+DOC_TBL = Documento.__table__
+
+SERVICIO_FLAGS_TTL_SECONDS = float(os.getenv("SERVICIO_FLAGS_TTL_SECONDS", "30"))
+
+SERVICIO_FLAGS = (
+    "NoRegistraPoliticaAmbiental",
+    "NoRegistraDifusionInterna",
+    "NoRegistraActividadInterna",
+    "NoRegistraReutilizacionPapel",
+    "NoRegistraProcFormalPapel",
+    "NoRegistraDocResiduosCertificados",
+    "NoRegistraDocResiduosSistemas",
+    "NoRegistraProcBajaBienesMuebles",
+    "NoRegistraProcComprasSustentables",
+)
+
+
+ColumnSpec = Union[str, Tuple[str, str]]
+
+
+@dataclass
+class DocumentoPage:
+    items: List[dict]
+    total: int
+
+
+@dataclass(frozen=True)
+class Categoria:
+    tipos: Tuple[int, ...]
+    columns: Tuple[ColumnSpec, ...]
+    etapa: bool = False   # el endpoint acepta filtro Etapa
+
+
+# clave = ruta del endpoint de listado en /api/v1/documentos
+CATEGORIAS: Dict[str, Categoria] = {
+    "comite": Categoria(
+        (CONSTANTS["TIPO_DOCUMENTO_ACTA"],), ("Id", "Fecha", "AdjuntoNombre"), etapa=True),
+    "politica": Categoria(
+        (CONSTANTS["TIPO_DOCUMENTO_POLITICA"],), ("Id", "Fecha", "AdjuntoNombre"), etapa=True),
+    "difusiones": Categoria(
+        (CONSTANTS["TIPO_DOCUMENTO_DIFUSION"],), ("Id", "Fecha", "Cobertura"), etapa=True),
+    "procedimientos": Categoria(
+        (
+            CONSTANTS["TIPO_DOCUMENTO_PROCEDIMIENTO_PAPEL"],
+            CONSTANTS["TIPO_DOCUMENTO_PROCEDIMIENTO_RESIDUO"],
+            CONSTANTS["TIPO_DOCUMENTO_PROCEDIMIENTO_RESIDUO_SISTEMA"],
+            CONSTANTS["TIPO_DOCUMENTO_PROCEDIMIENTO_BAJA_BIENES"],
+            CONSTANTS["TIPO_DOCUMENTO_PROCEDIMIENTO_COMPRA_SUSTENTABLE"],
+            CONSTANTS["TIPO_DOCUMENTO_PROC_REUTILIZACION_PAPEL"],
+        ),
+        ("Id", ("Tipo", "TipoDocumentoId"), "Fecha", "AdjuntoNombre"),
+    ),
+    "charlas": Categoria(
+        (CONSTANTS["TIPO_DOCUMENTO_CHARLA"],), ("Id", "NParticipantes"), etapa=True),
+    "listado-colaboradores": Categoria(
+        (CONSTANTS["TIPO_DOCUMENTO_LISTADO_COLABORADORES"],),
+        ("Id", "TotalColaboradoresConcientizados", "TotalColaboradoresCapacitados"),
+    ),
+    "capacitados-mp": Categoria(
+        (CONSTANTS["TIPO_DOCUMENTO_CAPACITADOS_MP"],), ("Id", "TotalColaboradoresCapacitados")),
+    "gestion-compra-sustentable": Categoria(
+        (CONSTANTS["TIPO_DOCUMENTO_GESTION_COMPRA_SUSTENTABLE"],), ("Id", "NComprasRubros")),
+    "pac-e3": Categoria(
+        (CONSTANTS["TIPO_DOCUMENTO_PAC_E3"],), ("Id", "Fecha")),
+    "informes-da": Categoria(
+        (CONSTANTS["TIPO_DOCUMENTO_INFORME_DA"],), ("Id", "Fecha")),
+    "resoluciones": Categoria(
+        (CONSTANTS["TIPO_DOCUMENTO_RESOLUCION_APRUEBA_PLAN"],), ("Id", "Nresolucion", "Fecha")),
+}
+
+
+def year_range(anio: Optional[int]):
+    """Predicado sargable sobre CreatedAt para el año `anio` (None si anio <= 0)."""
+    if not anio or anio <= 0:
+        return None
+    desde = datetime(anio, 1, 1)
+    if anio >= 9999:
+        return DOC_TBL.c.CreatedAt >= desde
+    return and_(DOC_TBL.c.CreatedAt >= desde, DOC_TBL.c.CreatedAt < datetime(anio + 1, 1, 1))
+
+
+def _where(servicio_id: int, tipos: Sequence[int], etapa: Optional[int], anio: Optional[int]) -> list:
+    conds = [
+        DOC_TBL.c.Active == True,  # noqa: E712
+        DOC_TBL.c.ServicioId == servicio_id,
+        DOC_TBL.c.TipoDocumentoId == tipos[0] if len(tipos) == 1 else DOC_TBL.c.TipoDocumentoId.in_(list(tipos)),
+    ]
+    if etapa is not None:
+        conds.append(DOC_TBL.c.EtapaSEV_docs == etapa)
+    rng = year_range(anio)
+    if rng is not None:
+        conds.append(rng)
+    return conds
+
+
+def _key(spec: ColumnSpec) -> str:
+    return spec if isinstance(spec, str) else spec[0]
+
+
+def _column(spec: ColumnSpec):
+    # spec = "Columna" o ("Clave", "Columna"); columnas inexistentes en la
+    # tabla (campos históricos del DTO) salen como NULL
+    key, name = (spec, spec) if isinstance(spec, str) else spec
+    col = DOC_TBL.c.get(name)
+    return col.label(key) if col is not None else null().label(key)
+
+
+def list_page(
+    db: Session,
+    servicio_id: int,
+    tipos: Sequence[int],
+    columns: Sequence[ColumnSpec],
+    etapa: Optional[int] = None,
+    anio: Optional[int] = None,
+    page: int = 1,
+    page_size: int = 50,
+) -> DocumentoPage:
+    """
+    Página de documentos (CreatedAt DESC) con el total en la misma consulta.
+    `columns`: nombres de columnas de dbo.Documentos o pares (clave, columna);
+    cada ítem es un dict con esas claves.
+    """
+    conds = _where(servicio_id, tipos, etapa, anio)
+    stmt = (
+        select(*[_column(c) for c in columns], func.count().over().label("_total"))
+        .where(*conds)
+        .order_by(DOC_TBL.c.CreatedAt.desc(), DOC_TBL.c.Id.desc())
+        .offset((page - 1) * page_size)
+        .limit(page_size)
+    )
+    rows = db.execute(stmt).all()
+    if rows:
+        total = int(rows[0]._mapping["_total"])
+    elif page > 1:
+        # página fuera de rango: el total no viaja en ninguna fila
+        total = int(db.execute(select(func.count()).select_from(DOC_TBL).where(*conds)).scalar() or 0)
+    else:
+        total = 0
+    keys = [_key(c) for c in columns]
+    items = [{k: r._mapping[k] for k in keys} for r in rows]
+    return DocumentoPage(items=items, total=total)
+
+
+def list_categoria(
+    db: Session,
+    categoria: str,
+    servicio_id: int,
+    etapa: Optional[int] = None,
+    anio: Optional[int] = None,
+    page: int = 1,
+    page_size: int = 50,
+) -> DocumentoPage:
+    cat = CATEGORIAS[categoria]
+    return list_page(
+        db, servicio_id, cat.tipos, cat.columns,
+        etapa if cat.etapa else None, anio, page, page_size,
+    )
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Tablero: todas las categorías en una consulta
+# ─────────────────────────────────────────────────────────────────────────────
+def dashboard(
+    db: Session,
+    servicio_id: int,
+    etapa: Optional[int] = None,
+    anio: Optional[int] = None,
+    top_n: int = 5,
+) -> Dict[str, DocumentoPage]:
+    """
+    Total y últimos `top_n` documentos de cada categoría para un servicio.
+    Una sola consulta: ROW_NUMBER()/COUNT(*) OVER (PARTITION BY TipoDocumentoId)
+    sobre DocumentoService.q_by_servicio_tipo con todos los tipos; Etapa solo
+    filtra las categorías cuyo endpoint lo acepta. Las categorías de varios
+    tipos (procedimientos) se combinan en Python (top_n de cada tipo basta).
+    """
+    tipos = sorted({t for c in CATEGORIAS.values() for t in c.tipos})
+    q = DocumentoService(db).q_by_servicio_tipo(servicio_id, tipos)
+    if etapa is not None:
+        etapa_tipos = sorted({t for c in CATEGORIAS.values() if c.etapa for t in c.tipos})
+        q = q.filter(or_(DOC_TBL.c.TipoDocumentoId.notin_(etapa_tipos), DOC_TBL.c.EtapaSEV_docs == etapa))
+    rng = year_range(anio)
+    if rng is not None:
+        q = q.filter(rng)
+
+    names = {"TipoDocumentoId", "CreatedAt"}
+    for c in CATEGORIAS.values():
+        names.update(s if isinstance(s, str) else s[1] for s in c.columns)
+    cols = [DOC_TBL.c[n] for n in sorted(names) if n in DOC_TBL.c]
+    order = (DOC_TBL.c.CreatedAt.desc(), DOC_TBL.c.Id.desc())
+    sub = q.with_entities(
+        *cols,
+        func.row_number().over(partition_by=DOC_TBL.c.TipoDocumentoId, order_by=order).label("_rn"),
+        func.count().over(partition_by=DOC_TBL.c.TipoDocumentoId).label("_total"),
+    ).subquery()
+    rows = db.execute(select(sub).where(sub.c["_rn"] <= top_n)).all()
+
+    by_tipo: Dict[int, List] = {}
+    for r in rows:
+        by_tipo.setdefault(int(r.TipoDocumentoId), []).append(r._mapping)
+
+    out: Dict[str, DocumentoPage] = {}
+    for key, cat in CATEGORIAS.items():
+        merged = [m for t in cat.tipos for m in by_tipo.get(t, ())]
+        total = sum(int(by_tipo[t][0]["_total"]) for t in cat.tipos if t in by_tipo)
+        merged.sort(key=lambda m: (m["CreatedAt"], m["Id"]), reverse=True)
+        items = []
+        for m in merged[:top_n]:
+            item = {}
+            for spec in cat.columns:
+                k, n = (spec, spec) if isinstance(spec, str) else spec
+                item[k] = m.get(n)
+            items.append(item)
+        out[key] = DocumentoPage(items=items, total=total)
+    return out
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Banderas del servicio (cache por proceso con TTL)
+# ─────────────────────────────────────────────────────────────────────────────
+_FLAGS: Dict[int, Tuple[Dict[str, Optional[bool]], float]] = {}
+_LOCK = threading.Lock()
+
+
+def servicio_flags(db: Session, servicio_id: int) -> Optional[Dict[str, Optional[bool]]]:
+    """Banderas NoRegistra* del servicio (cacheadas SERVICIO_FLAGS_TTL_SECONDS), o None si no existe."""
+    sid = int(servicio_id)
+    now = time.monotonic()
+    hit = _FLAGS.get(sid)
+    if hit is not None and now - hit[1] < SERVICIO_FLAGS_TTL_SECONDS:
+        return hit[0]
+    row = db.execute(
+        select(*[getattr(Servicio, f) for f in SERVICIO_FLAGS]).where(Servicio.Id == sid)
+    ).first()
+    if row is None:
+        return None
+    flags = dict(row._mapping)
+    with _LOCK:
+        _FLAGS[sid] = (flags, now)
+    return flags
+
+
+def invalidate_flags() -> None:
+    with _LOCK:
+        _FLAGS.clear()
+
+
+@event.listens_for(Session, "after_flush")
+def documento_flags_after_flush(session: Session, flush_context):
+    for objs in (session.new, session.dirty, session.deleted):
+        if any(isinstance(o, Servicio) for o in objs):
+            session.info["servicio_flags_dirty"] = True
+            return
+
+
+@event.listens_for(Session, "after_commit")
+def documento_flags_after_commit(session: Session):
+    if session.info.pop("servicio_flags_dirty", False):
+        invalidate_flags()
+
+
+@event.listens_for(Session, "after_rollback")
+def documento_flags_after_rollback(session: Session):
+    session.info.pop("servicio_flags_dirty", None)
@@ -1,8 +1,9 @@
 from __future__ import annotations
 from datetime import datetime
-from typing import Type
-import base64, secrets
+from typing import Sequence, Type
+import os
 from app.core.config import settings
+from app.utils.blob_store import BlobStore
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 
@@ -36,22 +37,38 @@ CONSTANTS = {
 }
 
 UPLOAD_DIR = settings.FILES_DIR or "/tmp/gesp_documentos"
+# Adjuntos por contenido (SHA-256): un mismo PDF subido por N servicios se guarda una vez
+# GC: referenciado = fila activa de dbo.Documentos que lo nombra (delete() libera la referencia)
+_DOC_URL_COLS = ("AdjuntoUrl", "AdjuntoRespaldoUrl", "AdjuntoRespaldoUrlParticipativo", "AdjuntoRespaldoUrlCompromiso")
+DOCUMENTOS_STORE = BlobStore(
+    "documentos",
+    UPLOAD_DIR,
+    ref_queries=[
+        f"SELECT {c} FROM dbo.Documentos WITH (NOLOCK) WHERE Active = 1 AND {c} IS NOT NULL"
+        for c in _DOC_URL_COLS
+    ],
+)
 
 def ensure_dir(path: str):
     os.makedirs(path, exist_ok=True)
 
 def save_file_from_base64(b64: str, original_name: str | None) -> tuple[str, str]:
-    ensure_dir(UPLOAD_DIR)
+    """
+    Decodifica el adjunto por bloques al store de documentos.
+    Devuelve ("<sha256><ext>", nombre original); el primer valor va a *Url.
+    """
     ext = ""
     if original_name and "." in original_name:
         ext = "." + original_name.split(".")[-1]
-    token = secrets.token_hex(16)
-    gen_name = f"{token}{ext}"
-    full = os.path.join(UPLOAD_DIR, gen_name)
-    with open(full, "wb") as f:
-        f.write(base64.b64decode(b64))
+    stored = DOCUMENTOS_STORE.put_base64(b64)
+    gen_name = f"{stored.sha256}{ext}"
     return gen_name, original_name or gen_name
 
+def resolve_file_path(filename: str) -> str:
+    """Ruta física de un adjunto: blob por contenido o archivo histórico en UPLOAD_DIR."""
+    safe_name = os.path.basename(filename)
+    return DOCUMENTOS_STORE.resolve(safe_name) or os.path.join(UPLOAD_DIR, safe_name)
+
 class DocumentoService:
     def __init__(self, db: Session):
         self.db = db
@@ -71,23 +88,28 @@ class DocumentoService:
             TipoDocumentoId=tipo_id,
         )
         if data.Adjunto:
-            nombre, original = save_file_from_base64(data.Adjunto, data.AdjuntoPath)
-            obj.AdjuntoUrl = nombre
-            obj.AdjuntoNombre = original
+            self._set_adjunto(obj, "AdjuntoUrl", "AdjuntoNombre",
+                              save_file_from_base64(data.Adjunto, data.AdjuntoPath))
         self.db.add(obj)
         self.db.commit()
         self.db.refresh(obj)
         return obj
 
+    def _set_adjunto(self, obj: Documento, url_attr: str, nombre_attr: str, adj: tuple[str, str]) -> None:
+        # referencias del blob en la misma transacción que el documento
+        nombre, original = adj
+        DOCUMENTOS_STORE.swap(self.db, getattr(obj, url_attr, None), nombre)
+        setattr(obj, url_attr, nombre)
+        setattr(obj, nombre_attr, original)
+
     def _update_common(self, obj: Documento, data: DocumentoBaseIn, user_id: str) -> Documento:
         for k, v in data.model_dump(exclude_unset=True).items():
             if k in {"Adjunto", "AdjuntoPath"}:
                 continue
             setattr(obj, k, v)
         if data.Adjunto:
-            nombre, original = save_file_from_base64(data.Adjunto, data.AdjuntoPath)
-            obj.AdjuntoUrl = nombre
-            obj.AdjuntoNombre = original
+            self._set_adjunto(obj, "AdjuntoUrl", "AdjuntoNombre",
+                              save_file_from_base64(data.Adjunto, data.AdjuntoPath))
         obj.UpdatedAt = datetime.utcnow()
         obj.ModifiedBy = user_id
         obj.Version = (obj.Version or 0) + 1
@@ -108,14 +130,21 @@ class DocumentoService:
         obj.UpdatedAt = datetime.utcnow()
         obj.ModifiedBy = user_id
         obj.Version = (obj.Version or 0) + 1
+        # el documento inactivo deja de referenciar sus adjuntos (misma transacción)
+        for col in _DOC_URL_COLS:
+            DOCUMENTOS_STORE.release(self.db, getattr(obj, col, None))
         self.db.commit()
         return True
 
-    def q_by_servicio_tipo(self, servicio_id: int, tipo_id: int, etapa: int | None = None):
+    def q_by_servicio_tipo(self, servicio_id: int, tipo_id: int | Sequence[int], etapa: int | None = None):
+        tipo_filter = (
+            Documento.TipoDocumentoId == tipo_id if isinstance(tipo_id, int)
+            else Documento.TipoDocumentoId.in_(list(tipo_id))
+        )
         q = self.db.query(Documento).filter(
             Documento.Active == True,
             Documento.ServicioId == servicio_id,
-            Documento.TipoDocumentoId == tipo_id,
+            tipo_filter,
         )
         if etapa is not None:
             q = q.filter(Documento.EtapaSEV_docs == etapa)
@@ -145,9 +174,9 @@ class DocumentoService:
                        adj_part: tuple[str,str] | None = None) -> Documento:
         obj = self._new_doc(Politica, data, CONSTANTS["TIPO_DOCUMENTO_POLITICA"], user_id)
         if adj_rp:
-            obj.AdjuntoRespaldoUrl, obj.AdjuntoRespaldoNombre = adj_rp
+            self._set_adjunto(obj, "AdjuntoRespaldoUrl", "AdjuntoRespaldoNombre", adj_rp)
         if adj_part:
-            obj.AdjuntoRespaldoUrlParticipativo, obj.AdjuntoRespaldoNombreParticipativo = adj_part
+            self._set_adjunto(obj, "AdjuntoRespaldoUrlParticipativo", "AdjuntoRespaldoNombreParticipativo", adj_part)
         self.db.commit(); self.db.refresh(obj)
         return obj
     def actualizar_politica(self, doc_id: int, data: DocumentoBaseIn, user_id: str,
@@ -157,9 +186,9 @@ class DocumentoService:
         if not obj: return None
         obj = self._update_common(obj, data, user_id)
         if adj_rp:
-            obj.AdjuntoRespaldoUrl, obj.AdjuntoRespaldoNombre = adj_rp
+            self._set_adjunto(obj, "AdjuntoRespaldoUrl", "AdjuntoRespaldoNombre", adj_rp)
         if adj_part:
-            obj.AdjuntoRespaldoUrlParticipativo, obj.AdjuntoRespaldoNombreParticipativo = adj_part
+            self._set_adjunto(obj, "AdjuntoRespaldoUrlParticipativo", "AdjuntoRespaldoNombreParticipativo", adj_part)
         self.db.commit(); self.db.refresh(obj)
         return obj
 
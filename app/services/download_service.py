@@ -0,0 +1,134 @@
+# app/services/download_service.py
+"""
+Descargas de adjuntos (documentos y facturas) con caché HTTP y rangos.
+
+- ETag fuerte = SHA-256 del contenido cuando se conoce (blobs del almacén por
+  contenido, app.utils.blob_store); si no, el ETag mtime/tamaño de Starlette.
+- If-None-Match / If-Modified-Since => 304 sin abrir el archivo.
+- Nombres direccionados por contenido ('<sha>.pdf') nunca cambian de bytes:
+  Cache-Control immutable de un año. El resto se revalida (no-cache + ETag).
+- Range / If-Range (206, multipart) y HEAD los resuelve FileResponse.
+- Envío sin copia: si el servidor ASGI anuncia http.response.pathsend,
+  FileResponse entrega la ruta y el servidor usa sendfile. Detrás de nginx se
+  puede delegar con X-Accel-Redirect (DOWNLOAD_ACCEL_MAP="/ruta/local=/interno,...").
+"""
+from __future__ import annotations
+
+import logging
+import os
+import stat as stat_mod
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import FileResponse
+
+Log = logging.getLogger(__name__)
+
+CACHE_IMMUTABLE = "private, max-age=31536000, immutable"
+CACHE_REVALIDATE = "private, no-cache"
+
+
+def _parse_accel_map(raw: str) -> List[Tuple[str, str]]:
+    out: List[Tuple[str, str]] = []
+    for part in (raw or "").split(","):
+        if "=" not in part:
+            continue
+        local, internal = part.split("=", 1)
+        local, internal = local.strip().rstrip("/"), internal.strip().rstrip("/")
+        if local and internal:
+            out.append((local + "/", internal + "/"))
+    # prefijo más largo primero
+    return sorted(out, key=lambda t: len(t[0]), reverse=True)
+
+
+DOWNLOAD_ACCEL_MAP = _parse_accel_map(os.getenv("DOWNLOAD_ACCEL_MAP", ""))
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Comparación débil (RFC 9110 §13.1.2): ignora W/ y admite lista o '*'."""
+    if if_none_match.strip() == "*":
+        return True
+    target = etag[2:] if etag.startswith("W/") else etag
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == target:
+            return True
+    return False
+
+
+def _not_modified(request: Request, etag: Optional[str], mtime: float) -> bool:
+    inm = request.headers.get("if-none-match")
+    if inm is not None:
+        # si viene If-None-Match, If-Modified-Since se ignora
+        return etag is not None and _etag_matches(inm, etag)
+    ims = request.headers.get("if-modified-since")
+    if ims:
+        try:
+            return int(mtime) <= int(parsedate_to_datetime(ims).timestamp())
+        except (TypeError, ValueError, IndexError, OverflowError):
+            return False
+    return False
+
+
+def _accel_uri(path: str) -> Optional[str]:
+    full = os.path.abspath(path)
+    for local, internal in DOWNLOAD_ACCEL_MAP:
+        if full.startswith(local):
+            return internal + full[len(local):]
+    return None
+
+
+def file_response(
+    request: Request,
+    path: str,
+    *,
+    filename: Optional[str] = None,
+    media_type: Optional[str] = None,
+    sha256: Optional[str] = None,
+    immutable: bool = False,
+    headers: Optional[Dict[str, str]] = None,
+    not_found_status: int = 404,
+) -> Response:
+    """
+    Respuesta de descarga para `path` (200/206/304/416).
+    `sha256` (si se conoce) se usa como ETag; `immutable` solo para URLs cuyo
+    contenido no puede cambiar (nombres direccionados por contenido).
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        st = None
+    if st is None or not stat_mod.S_ISREG(st.st_mode):
+        raise HTTPException(status_code=not_found_status, detail="Archivo no encontrado")
+
+    base_headers: Dict[str, str] = dict(headers or {})
+    base_headers["Cache-Control"] = CACHE_IMMUTABLE if immutable else CACHE_REVALIDATE
+    if sha256:
+        base_headers["ETag"] = f'"{sha256}"'
+
+    resp = FileResponse(
+        path,
+        filename=filename,
+        media_type=media_type,
+        headers=base_headers,
+        stat_result=st,
+    )
+    etag = resp.headers.get("etag")
+
+    if _not_modified(request, etag, st.st_mtime):
+        keep = {k: v for k, v in base_headers.items() if k.lower() != "content-disposition"}
+        keep["ETag"] = etag
+        keep["Last-Modified"] = formatdate(st.st_mtime, usegmt=True)
+        return Response(status_code=304, headers=keep)
+
+    accel = _accel_uri(path)
+    if accel and request.method == "GET":
+        # nginx sirve el archivo (sendfile, Range incluidos) desde su location internal
+        accel_headers = {k: v for k, v in resp.headers.items() if k.lower() != "content-length"}
+        accel_headers["X-Accel-Redirect"] = accel
+        return Response(status_code=200, headers=accel_headers, media_type=resp.media_type)
+
+    return resp
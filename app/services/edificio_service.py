@@ -1,13 +1,24 @@
 # app/services/edificio_service.py
 from __future__ import annotations
-from typing import List, Optional
+import logging
+from typing import Dict, List, Optional
 from datetime import datetime
 
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_
+from sqlalchemy import func, and_, bindparam, text
+from sqlalchemy.exc import IntegrityError
 from fastapi import HTTPException
 
+from app.db import normalized
 from app.db.models.edificio import Edificio
+from app.utils.normalize import norm_key
+
+Log = logging.getLogger(__name__)
+
+# Tope de claves por sentencia (SQL Server admite 2100 parámetros)
+_KEY_CHUNK = 1000
+
+_KEY_AVAILABLE: Optional[bool] = None
 
 
 def _display_nombre(e: Edificio) -> str:
@@ -25,6 +36,38 @@ def _norm_str(s: Optional[str]) -> Optional[str]:
     return str(s).strip().lower()
 
 
+def edificio_address_key(
+    calle: Optional[str],
+    numero: Optional[str],
+    comuna_id: Optional[int],
+    direccion: Optional[str] = None,
+) -> Optional[str]:
+    """
+    Clave de dirección '<ComunaId>|<calle número>' plegada con norm_key; igual
+    a la columna calculada dbo.Edificios.DireccionKey (Calle vacía => Direccion).
+    None si no hay comuna (esas filas no participan del índice único).
+    """
+    if comuna_id is None:
+        return None
+    base = calle if calle not in (None, "") else (direccion or "")
+    return f"{int(comuna_id)}|{norm_key(base + ' ' + (numero or ''))}"
+
+
+def _key_available(db: Session) -> bool:
+    """True si dbo.Edificios.DireccionKey existe (se consulta una vez por proceso)."""
+    global _KEY_AVAILABLE
+    if _KEY_AVAILABLE is None:
+        try:
+            _KEY_AVAILABLE = db.execute(
+                text("SELECT COL_LENGTH(N'dbo.Edificios', N'DireccionKey')")
+            ).scalar() is not None
+        except Exception as ex:
+            Log.warning("EDIFICIOS DireccionKey no verificable: %s", ex)
+            return False
+        Log.info("EDIFICIOS columna DireccionKey disponible=%s", _KEY_AVAILABLE)
+    return _KEY_AVAILABLE
+
+
 class EdificioService:
     def list(
         self,
@@ -40,13 +83,17 @@ class EdificioService:
             query = query.filter(Edificio.Active == active)
 
         if q:
-            like = f"%{q.strip().lower()}%"
-            # Solo aplicamos lower() a columnas de texto
-            query = query.filter(
-                func.lower(func.coalesce(Edificio.Calle, "")).like(like) |
-                func.lower(func.coalesce(Edificio.Direccion, "")).like(like) |
-                func.lower(func.coalesce(Edificio.Numero, "")).like(like)
-            )
+            cond = normalized.prefix_filter(db, Edificio, "DireccionNorm", q)
+            if cond is not None:
+                query = query.filter(cond)
+            else:
+                like = f"%{q.strip().lower()}%"
+                # Solo aplicamos lower() a columnas de texto
+                query = query.filter(
+                    func.lower(func.coalesce(Edificio.Calle, "")).like(like) |
+                    func.lower(func.coalesce(Edificio.Direccion, "")).like(like) |
+                    func.lower(func.coalesce(Edificio.Numero, "")).like(like)
+                )
 
         if ComunaId is not None:
             query = query.filter(Edificio.ComunaId == ComunaId)
@@ -67,11 +114,15 @@ class EdificioService:
             query = query.filter(Edificio.ComunaId == ComunaId)
 
         if q:
-            like = f"%{q.strip().lower()}%"
-            query = query.filter(
-                func.lower(func.coalesce(Edificio.Calle, "")).like(like) |
-                func.lower(func.coalesce(Edificio.Direccion, "")).like(like)
-            )
+            cond = normalized.prefix_filter(db, Edificio, "DireccionNorm", q)
+            if cond is not None:
+                query = query.filter(cond)
+            else:
+                like = f"%{q.strip().lower()}%"
+                query = query.filter(
+                    func.lower(func.coalesce(Edificio.Calle, "")).like(like) |
+                    func.lower(func.coalesce(Edificio.Direccion, "")).like(like)
+                )
 
         rows = query.order_by(Edificio.Calle, Edificio.Numero, Edificio.Id).all()
         return [(e.Id, _display_nombre(e)) for e in rows]
@@ -89,23 +140,42 @@ class EdificioService:
         numero: str | None,
         comuna_id: int | None,
         exclude_id: int | None = None,
+        direccion: str | None = None,
     ) -> bool:
         """
         Verifica duplicados evitando SELECT EXISTS de nivel superior,
         que en SQL Server produce 'Incorrect syntax near EXISTS'.
         Usamos COUNT(*) (válido en SQL Server) sobre columnas de texto normalizadas.
         """
+        # Clave persistida con índice único (007_edificios_direccion_key.sql):
+        # misma regla que create_many (Calle vacía => Direccion)
+        key = edificio_address_key(calle, numero, comuna_id, direccion)
+        if key is not None and _key_available(db):
+            dup_id = db.execute(
+                text("""
+                    SELECT TOP 1 Id FROM dbo.Edificios WITH (NOLOCK)
+                    WHERE DireccionKey = :k AND ComunaId IS NOT NULL AND Id <> :ex
+                """),
+                {"k": key, "ex": int(exclude_id or 0)},
+            ).scalar()
+            return dup_id is not None
+
         calle_n  = _norm_str(calle)
         numero_n = _norm_str(numero)
 
         if calle_n is None or numero_n is None or comuna_id is None:
             return False
 
-        filters = [
-            func.lower(func.coalesce(Edificio.Calle, "")) == calle_n,
-            func.lower(func.coalesce(Edificio.Numero, "")) == numero_n,
-            Edificio.ComunaId == comuna_id,
-        ]
+        # Igualdad sobre DireccionNorm (indexada) si está disponible
+        norm_eq = normalized.equals_filter(db, Edificio, "DireccionNorm", f"{calle_n} {numero_n}")
+        if norm_eq is not None:
+            filters = [norm_eq, Edificio.ComunaId == comuna_id]
+        else:
+            filters = [
+                func.lower(func.coalesce(Edificio.Calle, "")) == calle_n,
+                func.lower(func.coalesce(Edificio.Numero, "")) == numero_n,
+                Edificio.ComunaId == comuna_id,
+            ]
         if exclude_id:
             filters.append(Edificio.Id != exclude_id)
 
@@ -122,7 +192,7 @@ class EdificioService:
         numero = (data.get("Numero") or "").strip()
         comuna = data.get("ComunaId")
 
-        if self._exists_same_address(db, calle, numero, comuna):
+        if self._exists_same_address(db, calle, numero, comuna, direccion=data.get("Direccion")):
             raise HTTPException(status_code=409, detail="Ya existe un edificio con esa dirección en la misma comuna.")
 
         now = datetime.utcnow()
@@ -139,10 +209,126 @@ class EdificioService:
         obj.Numero = numero
 
         db.add(obj)
-        db.commit()
+        try:
+            db.commit()
+        except IntegrityError:
+            # carrera contra UX_Edificios_DireccionKey
+            db.rollback()
+            raise HTTPException(status_code=409, detail="Ya existe un edificio con esa dirección en la misma comuna.")
         db.refresh(obj)
         return obj
 
+    # ---------- Alta en lote ----------
+    def _existing_keys(self, db: Session, keys: Dict[str, int]) -> Dict[str, int]:
+        """
+        {clave: Id} de edificios existentes para las claves pedidas.
+        `keys` es {clave: ComunaId}; sin la columna DireccionKey se calcula la
+        clave en Python sobre los edificios de esas comunas (una lectura).
+        """
+        if not keys:
+            return {}
+        found: Dict[str, int] = {}
+        if _key_available(db):
+            stmt = text("""
+                SELECT DireccionKey, MIN(Id) FROM dbo.Edificios WITH (NOLOCK)
+                WHERE ComunaId IS NOT NULL AND DireccionKey IN :keys
+                GROUP BY DireccionKey
+            """).bindparams(bindparam("keys", expanding=True))
+            all_keys = list(keys)
+            for i in range(0, len(all_keys), _KEY_CHUNK):
+                for k, eid in db.execute(stmt, {"keys": all_keys[i:i + _KEY_CHUNK]}).all():
+                    found[k] = int(eid)
+            return found
+
+        comunas = sorted(set(keys.values()))
+        for i in range(0, len(comunas), _KEY_CHUNK):
+            rows = (
+                db.query(Edificio.Id, Edificio.ComunaId, Edificio.Calle, Edificio.Numero, Edificio.Direccion)
+                  .filter(Edificio.ComunaId.in_(comunas[i:i + _KEY_CHUNK]))
+                  .all()
+            )
+            for eid, comuna_id, calle, numero, direccion in rows:
+                k = edificio_address_key(calle, numero, comuna_id, direccion)
+                if k in keys and (k not in found or eid < found[k]):
+                    found[k] = int(eid)
+        return found
+
+    def create_many(
+        self,
+        db: Session,
+        items: List[dict],
+        created_by: str | None,
+        parcial: bool = False,
+    ) -> dict:
+        """
+        Alta de un conjunto de edificios validado contra la clave de dirección
+        en una sola lectura. Conflictos: dirección ya existente o repetida
+        dentro del lote. Sin `parcial`, cualquier conflicto cancela el lote
+        (409 con la lista); con `parcial`, se crean los que no tienen conflicto.
+        """
+        prepared: List[dict] = []
+        keys: Dict[str, int] = {}
+        first_in_batch: Dict[str, int] = {}
+        conflictos: List[dict] = []
+
+        for idx, data in enumerate(items):
+            data = dict(data or {})
+            data["Calle"] = (data.get("Calle") or "").strip()
+            data["Numero"] = (data.get("Numero") or "").strip()
+            comuna = data.get("ComunaId")
+            key = edificio_address_key(data["Calle"], data["Numero"], comuna, data.get("Direccion"))
+            if key is not None:
+                if key in first_in_batch:
+                    conflictos.append({
+                        "Indice": idx, "Motivo": "duplicado_en_lote",
+                        "IndiceOriginal": first_in_batch[key], "EdificioId": None,
+                    })
+                    continue
+                first_in_batch[key] = idx
+                keys[key] = int(comuna)
+            prepared.append({"idx": idx, "key": key, "data": data})
+
+        existing = self._existing_keys(db, keys)
+        to_create: List[dict] = []
+        for p in prepared:
+            if p["key"] is not None and p["key"] in existing:
+                conflictos.append({
+                    "Indice": p["idx"], "Motivo": "existente",
+                    "IndiceOriginal": None, "EdificioId": existing[p["key"]],
+                })
+            else:
+                to_create.append(p)
+        conflictos.sort(key=lambda c: c["Indice"])
+
+        if conflictos and not parcial:
+            raise HTTPException(
+                status_code=409,
+                detail={"msg": "Hay edificios con dirección duplicada; no se creó ninguno.", "Conflictos": conflictos},
+            )
+
+        now = datetime.utcnow()
+        objs = [
+            Edificio(
+                CreatedAt=now, UpdatedAt=now, Version=1, Active=True,
+                CreatedBy=created_by, **p["data"],
+            )
+            for p in to_create
+        ]
+        if objs:
+            db.add_all(objs)
+            try:
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+                raise HTTPException(
+                    status_code=409,
+                    detail="Otro proceso creó edificios con la misma dirección; reintente el lote.",
+                )
+            for o in objs:
+                db.refresh(o)
+        Log.info("EDIFICIOS lote: %s creados, %s conflictos", len(objs), len(conflictos))
+        return {"Creados": objs, "Conflictos": conflictos}
+
     def update(self, db: Session, edificio_id: int, data: dict, modified_by: str | None) -> Edificio:
         obj = self.get(db, edificio_id)
 
@@ -150,7 +336,10 @@ class EdificioService:
         will_numero = (data.get("Numero", obj.Numero) or "").strip()
         will_comuna = data.get("ComunaId", obj.ComunaId)
 
-        if self._exists_same_address(db, will_calle, will_numero, will_comuna, exclude_id=obj.Id):
+        will_direccion = data.get("Direccion", obj.Direccion)
+        if self._exists_same_address(
+            db, will_calle, will_numero, will_comuna, exclude_id=obj.Id, direccion=will_direccion
+        ):
             raise HTTPException(status_code=409, detail="Ya existe otro edificio con esa dirección en la misma comuna.")
 
         for k, v in (data or {}).items():
@@ -164,7 +353,11 @@ class EdificioService:
         obj.UpdatedAt = datetime.utcnow()
         obj.Version = (obj.Version or 0) + 1
 
-        db.commit()
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            raise HTTPException(status_code=409, detail="Ya existe otro edificio con esa dirección en la misma comuna.")
         db.refresh(obj)
         return obj
 
@@ -7,6 +7,7 @@ from typing import Optional, Tuple, List
 from sqlalchemy import text, bindparam
 from sqlalchemy.orm import Session
 
+from app.db import normalized
 from app.db.models.division import Division
 from app.db.models.direccion import Direccion
 from app.db.models.unidad_inmueble import UnidadInmueble
@@ -19,6 +20,7 @@ from app.schemas.inmuebles import (
     InmuebleByAddressRequest,
 )
 from app.schemas.direcciones import DireccionDTO
+from app.search import index as search_index
 
 
 def _order_by_nombre_nulls_last_sql() -> str:
@@ -148,26 +150,37 @@ class InmuebleService:
 
         join_dir_for_filter = ""
         if direccion:
-            where_parts.append(
-                "(LOWER(ISNULL(di.Calle,'')) LIKE LOWER(:direccion_like) "
-                "OR LOWER(ISNULL(di.Numero,'')) LIKE LOWER(:direccion_like))"
-            )
-            params["direccion_like"] = f"%{direccion}%"
+            norm = normalized.prefix_sql(self.db, Direccion, "DireccionNorm", direccion, "di", "direccion_norm")
+            if norm is not None:
+                where_parts.append(norm[0])
+                params.update(norm[1])
+            else:
+                where_parts.append(
+                    "(LOWER(ISNULL(di.Calle,'')) LIKE LOWER(:direccion_like) "
+                    "OR LOWER(ISNULL(di.Numero,'')) LIKE LOWER(:direccion_like))"
+                )
+                params["direccion_like"] = f"%{direccion}%"
             join_dir_for_filter = (
                 "LEFT JOIN dbo.Direcciones di WITH (NOLOCK) ON di.Id = dv.DireccionInmuebleId"
             )
 
         if search:
-            where_parts.append(
-                "(LOWER(ISNULL(dv.Nombre,'')) LIKE LOWER(:like) "
-                "OR LOWER(ISNULL(dv.NroRol,'')) LIKE LOWER(:like) "
-                "OR LOWER(ISNULL(di.DireccionCompleta,'')) LIKE LOWER(:like))"
-            )
-            params["like"] = f"%{search}%"
-            if "di WITH (NOLOCK)" not in join_dir_for_filter:
-                join_dir_for_filter = (
-                    "LEFT JOIN dbo.Direcciones di WITH (NOLOCK) ON di.Id = dv.DireccionInmuebleId"
+            # Índice de tokens (Nombre, NroRol, dirección): no requiere JOIN para filtrar
+            cand = search_index.candidates_sql(self.db, search_index.ENTITY_DIVISION, search, "dv.Id")
+            if cand is not None:
+                where_parts.append(cand[0])
+                params.update(cand[1])
+            else:
+                where_parts.append(
+                    "(LOWER(ISNULL(dv.Nombre,'')) LIKE LOWER(:like) "
+                    "OR LOWER(ISNULL(dv.NroRol,'')) LIKE LOWER(:like) "
+                    "OR LOWER(ISNULL(di.DireccionCompleta,'')) LIKE LOWER(:like))"
                 )
+                params["like"] = f"%{search}%"
+                if "di WITH (NOLOCK)" not in join_dir_for_filter:
+                    join_dir_for_filter = (
+                        "LEFT JOIN dbo.Direcciones di WITH (NOLOCK) ON di.Id = dv.DireccionInmuebleId"
+                    )
 
         where_sql = " AND ".join(where_parts)
         size = max(1, min(200, page_size))
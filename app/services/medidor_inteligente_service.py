@@ -6,6 +6,7 @@ from typing import Iterable, Tuple, List, Optional
 from sqlalchemy.orm import Session
 from sqlalchemy import delete
 
+from app.db import returning
 from app.db.models.medidor_inteligente import MedidorInteligente
 from app.db.models.medidor_inteligente_links import (
     MedidorInteligenteDivision,
@@ -53,29 +54,41 @@ class MedidorInteligenteService:
         return [r[0] for r in divs], [r[0] for r in edis], [r[0] for r in srvs]
 
     # -------- escrituras --------
-    def create(self, db: Session, chilemedido_id: int, created_by: str | None) -> MedidorInteligente:
+    # (OUTPUT INSERTED: la fila vuelve de la misma sentencia, sin refresh)
+    def create(self, db: Session, chilemedido_id: int, created_by: str | None) -> dict:
         now = datetime.utcnow()
-        obj = MedidorInteligente(
-            CreatedAt=now, UpdatedAt=now, Version=0, Active=True,
-            CreatedBy=created_by, ModifiedBy=created_by,
-            ChileMedidoId=chilemedido_id,
-        )
-        db.add(obj)
+        row = returning.insert_one(db, MedidorInteligente, {
+            "CreatedAt": now, "UpdatedAt": now, "Version": 0, "Active": True,
+            "CreatedBy": created_by, "ModifiedBy": created_by,
+            "ChileMedidoId": chilemedido_id,
+        })
         db.commit()
-        db.refresh(obj)
-        return obj
+        return row
+
+    def update(
+        self,
+        db: Session,
+        med_int_id: int,
+        modified_by: str | None,
+        chilemedido_id: Optional[int] = None,
+        active: Optional[bool] = None,
+    ) -> dict:
+        values = {"UpdatedAt": datetime.utcnow(), "ModifiedBy": modified_by}
+        if chilemedido_id is not None:
+            values["ChileMedidoId"] = chilemedido_id
+        if active is not None:
+            values["Active"] = bool(active)
+        row = returning.update_one(db, MedidorInteligente, med_int_id, values, bump_version=True)
+        if row is None:
+            from fastapi import HTTPException
+            raise HTTPException(status_code=404, detail="No encontrado")
+        db.commit()
+        return row
 
     def update_chilemedido(
         self, db: Session, med_int_id: int, chilemedido_id: int, modified_by: str | None
-    ) -> MedidorInteligente:
-        obj = self.get(db, med_int_id)
-        obj.ChileMedidoId = chilemedido_id
-        obj.Version = (obj.Version or 0) + 1
-        obj.UpdatedAt = datetime.utcnow()
-        obj.ModifiedBy = modified_by
-        db.commit()
-        db.refresh(obj)
-        return obj
+    ) -> dict:
+        return self.update(db, med_int_id, modified_by, chilemedido_id=chilemedido_id)
 
     # --- reemplazos atómicos de vínculos ---
     def set_divisiones(self, db: Session, med_int_id: int, division_ids: Iterable[int]) -> list[int]:
@@ -89,15 +102,12 @@ class MedidorInteligenteService:
             }
             for d in (division_ids or [])
         ]
+        ids = []
         if payload:
-            db.execute(MID_TBL.insert(), payload)
+            stmt = MID_TBL.insert().returning(MID_TBL.c.DivisionId, sort_by_parameter_order=True)
+            ids = [r[0] for r in db.execute(stmt, payload).all()]
         db.commit()
-        rows = (
-            db.query(MedidorInteligenteDivision.DivisionId)
-            .filter(MedidorInteligenteDivision.MedidorInteligenteId == med_int_id)
-            .all()
-        )
-        return [r[0] for r in rows]
+        return ids
 
     def set_edificios(self, db: Session, med_int_id: int, edificio_ids: Iterable[int]) -> list[int]:
         db.execute(delete(MIE_TBL).where(MIE_TBL.c.MedidorInteligenteId == med_int_id))
@@ -110,15 +120,12 @@ class MedidorInteligenteService:
             }
             for eid in (edificio_ids or [])
         ]
+        ids = []
         if payload:
-            db.execute(MIE_TBL.insert(), payload)
+            stmt = MIE_TBL.insert().returning(MIE_TBL.c.EdificioId, sort_by_parameter_order=True)
+            ids = [r[0] for r in db.execute(stmt, payload).all()]
         db.commit()
-        rows = (
-            db.query(MedidorInteligenteEdificio.EdificioId)
-            .filter(MedidorInteligenteEdificio.MedidorInteligenteId == med_int_id)
-            .all()
-        )
-        return [r[0] for r in rows]
+        return ids
 
     def set_servicios(self, db: Session, med_int_id: int, servicio_ids: Iterable[int]) -> list[int]:
         db.execute(delete(MIS_TBL).where(MIS_TBL.c.MedidorInteligenteId == med_int_id))
@@ -131,12 +138,9 @@ class MedidorInteligenteService:
             }
             for sid in (servicio_ids or [])
         ]
+        ids = []
         if payload:
-            db.execute(MIS_TBL.insert(), payload)
+            stmt = MIS_TBL.insert().returning(MIS_TBL.c.ServicioId, sort_by_parameter_order=True)
+            ids = [r[0] for r in db.execute(stmt, payload).all()]
         db.commit()
-        rows = (
-            db.query(MedidorInteligenteServicio.ServicioId)
-            .filter(MedidorInteligenteServicio.MedidorInteligenteId == med_int_id)
-            .all()
-        )
-        return [r[0] for r in rows]
+        return ids
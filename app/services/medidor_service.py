@@ -6,7 +6,7 @@ from datetime import datetime
 from typing import Optional, Iterable, List, Dict, Any
 
 from fastapi import HTTPException
-from sqlalchemy import func, case, delete, true
+from sqlalchemy import func, case, delete, or_, true
 from sqlalchemy.orm import Session
 
 from app.db.models.medidor import Medidor
@@ -21,13 +21,21 @@ from app.db.models.institucion import Institucion
 from app.db.models.direccion import Direccion
 from app.db.models.edificio import Edificio
 
+from app.db.stats import page_total
 from app.schemas.medidor import MedidorListDTO
+from app.search import index as search_index
 
 MDIV_TBL = MedidorDivision.__table__
 
 log = logging.getLogger("medidores")
 
 
+# Columnas de la grilla (= campos de MedidorListDTO): se cargan como tuplas, sin ORM
+_LIST_COLUMNS = tuple(
+    getattr(Medidor, name).label(name) for name in MedidorListDTO.model_fields
+)
+
+
 def _order_by_numero_nulls_last():
     """
     SQL Server no soporta 'NULLS LAST'.
@@ -53,6 +61,8 @@ class MedidorService:
         servicio_id: Optional[int] = None,
         active: Optional[bool] = None,
         medidor_id: Optional[int] = None,
+        after_id: Optional[int] = None,
+        count: str = "exact",
     ) -> dict:
         """
         Soporta filtros:
@@ -62,18 +72,24 @@ class MedidorService:
           - institucion_id + servicio_id (via Divisiones → Servicios)
           - active
           - medidor_id (filtro directo por Id de medidor en la grilla)
+        Paginación:
+          - after_id: keyset por Id (next_after_id de la página anterior); sin él, OFFSET por page
+          - count: exact | estimate (sys.dm_db_partition_stats sin filtros, COUNT acotado con filtros) | none
         """
 
-        query = db.query(Medidor)
+        query = db.query(*_LIST_COLUMNS)
+        filtered = False
 
         # ✅ filtro directo por Id (cuando el usuario escribe el ID del medidor)
         #    Esto es para la grilla. El detalle FULL sigue estando en /{id}/detalle.
         if medidor_id is not None:
             query = query.filter(Medidor.Id == medidor_id)
+            filtered = True
 
         # ✅ active (MSSQL: usar == true() para compilar a "= 1")
         if active is not None:
             query = query.filter(Medidor.Active == (true() if active else 0))
+            filtered = True
 
         # ✅ filtro por institución/servicio via joins
         #    (Medidores no tiene InstitucionId directo)
@@ -86,46 +102,74 @@ class MedidorService:
                 query = query.filter(Servicio.InstitucionId == institucion_id)
             if servicio_id is not None:
                 query = query.filter(Servicio.Id == servicio_id)
+            filtered = True
 
         # Filtros clásicos
         if q:
-            like = f"%{q}%"
-            query = (
-                query.outerjoin(NumeroCliente, NumeroCliente.Id == Medidor.NumeroClienteId)
-                .filter(
-                    func.lower(func.coalesce(Medidor.Numero, "")).like(func.lower(like)) |
-                    func.lower(func.coalesce(NumeroCliente.NombreCliente, "")).like(func.lower(like))
+            filtered = True
+            # Índice de tokens: Numero del medidor o NombreCliente/Numero del cliente, sin JOIN
+            cand_med = search_index.candidates(db, search_index.ENTITY_MEDIDOR, q)
+            if cand_med is not None:
+                cand_nc = search_index.match_ids(search_index.ENTITY_NUMERO_CLIENTE, q)
+                query = query.filter(
+                    or_(Medidor.Id.in_(cand_med), Medidor.NumeroClienteId.in_(cand_nc))
+                )
+            else:
+                like = f"%{q}%"
+                query = (
+                    query.outerjoin(NumeroCliente, NumeroCliente.Id == Medidor.NumeroClienteId)
+                    .filter(
+                        func.lower(func.coalesce(Medidor.Numero, "")).like(func.lower(like)) |
+                        func.lower(func.coalesce(NumeroCliente.NombreCliente, "")).like(func.lower(like))
+                    )
                 )
-            )
 
         if numero_cliente_id is not None:
             query = query.filter(Medidor.NumeroClienteId == numero_cliente_id)
+            filtered = True
 
         if division_id is not None:
             query = query.filter(Medidor.DivisionId == division_id)
+            filtered = True
 
-        # Total antes de paginar
+        # 🚀 Orden sargable por PK para paginación rápida (Numero es TEXT/NVARCHAR(MAX))
         t0 = time.perf_counter()
-        total = query.count()
+        page_q = query
+        if after_id is not None:
+            page_q = page_q.filter(Medidor.Id > after_id)
+        page_q = page_q.order_by(Medidor.Id.asc())
+        if after_id is None:
+            page_q = page_q.offset((page - 1) * page_size)
+        # una fila extra para saber si hay página siguiente
+        rows = page_q.limit(page_size + 1).all()
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
         t1 = time.perf_counter()
 
-        # 🚀 Orden sargable por PK para paginación rápida (Numero es TEXT/NVARCHAR(MAX))
-        rows = (
-            query.order_by(Medidor.Id.asc())
-            .offset((page - 1) * page_size)
-            .limit(page_size)
-            .all()
+        items = [MedidorListDTO.model_validate(r._mapping) for r in rows]
+        next_after_id = int(rows[-1].Id) if has_more and rows else None
+
+        # Total según modo
+        total, total_estimated = page_total(
+            db, count, query,
+            page=page, page_size=page_size, n_items=len(items), has_more=has_more,
+            keyset=after_id is not None, table="dbo.Medidores", filtered=filtered,
         )
         t2 = time.perf_counter()
 
-        items = [MedidorListDTO.model_validate(x) for x in rows]
-
         log.info(
-            "[medidores] count=%s en %.3fs | fetch page=%s size=%s en %.3fs",
-            total, (t1 - t0), page, page_size, (t2 - t1),
+            "[medidores] fetch page=%s size=%s after_id=%s en %.3fs | count(%s)=%s en %.3fs",
+            page, page_size, after_id, (t1 - t0), count, total, (t2 - t1),
         )
 
-        return {"total": total, "page": page, "page_size": page_size, "items": items}
+        return {
+            "total": total,
+            "page": page,
+            "page_size": page_size,
+            "items": items,
+            "next_after_id": next_after_id,
+            "total_estimated": total_estimated,
+        }
 
     def by_division(self, db: Session, division_id: int):
         return (
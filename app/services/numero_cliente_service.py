@@ -7,6 +7,7 @@ from sqlalchemy import func, text
 from fastapi import HTTPException
 
 from app.db.models.numero_cliente import NumeroCliente
+from app.services import territorio
 
 
 class NumeroClienteService:
@@ -142,15 +143,21 @@ class NumeroClienteService:
                 s.Nombre AS ServicioNombre,
                 s.InstitucionId,
                 d.EdificioId,
-                COALESCE(comE.RegionId, comD.RegionId) AS RegionId
+                e.ComunaId AS EdificioComunaId,
+                d.ComunaId AS DivisionComunaId
             FROM dbo.Divisiones d WITH (NOLOCK)
             LEFT JOIN dbo.Servicios s WITH (NOLOCK) ON s.Id = d.ServicioId
             LEFT JOIN dbo.Edificios e WITH (NOLOCK) ON e.Id = d.EdificioId
-            LEFT JOIN dbo.Comunas  comE WITH (NOLOCK) ON comE.Id = e.ComunaId
-            LEFT JOIN dbo.Comunas  comD WITH (NOLOCK) ON comD.Id = d.ComunaId
             WHERE d.Id = :div_id
         """), {"div_id": int(base["DivisionId"])}).mappings().first() or {}
 
+        # región: comuna del edificio y, si no, la de la división (árbol en memoria)
+        tree = territorio.get(db)
+        region_id = (
+            tree.region_id_of_comuna(ctx.get("EdificioComunaId"))
+            or tree.region_id_of_comuna(ctx.get("DivisionComunaId"))
+        )
+
         # dirección desde Edificios
         direccion = None
         if ctx.get("EdificioId"):
@@ -159,24 +166,20 @@ class NumeroClienteService:
                     e.Direccion AS DireccionLibre,
                     e.Calle     AS Calle,
                     e.Numero    AS Numero,
-                    e.ComunaId  AS ComunaId,
-                    com.Nombre  AS ComunaNombre,
-                    reg.Id      AS RegionId,
-                    reg.Nombre  AS RegionNombre
+                    e.ComunaId  AS ComunaId
                 FROM dbo.Edificios e WITH (NOLOCK)
-                LEFT JOIN dbo.Comunas  com WITH (NOLOCK) ON com.Id = e.ComunaId
-                LEFT JOIN dbo.Regiones reg WITH (NOLOCK) ON reg.Id = com.RegionId
                 WHERE e.Id = :eid
             """), {"eid": int(ctx["EdificioId"])}).mappings().first()
             if dirrow:
+                geo = tree.comuna_region_info(dirrow.get("ComunaId"))
                 direccion = {
                     "DireccionLibre": dirrow.get("DireccionLibre"),
                     "Calle":          dirrow.get("Calle"),
                     "Numero":         dirrow.get("Numero"),
                     "ComunaId":       dirrow.get("ComunaId"),
-                    "ComunaNombre":   dirrow.get("ComunaNombre"),
-                    "RegionId":       dirrow.get("RegionId"),
-                    "RegionNombre":   dirrow.get("RegionNombre"),
+                    "ComunaNombre":   geo["ComunaNombre"],
+                    "RegionId":       geo["RegionId"],
+                    "RegionNombre":   geo["RegionNombre"],
                 }
 
         # armar respuesta
@@ -197,6 +200,6 @@ class NumeroClienteService:
             "ServicioNombre": ctx.get("ServicioNombre"),
             "InstitucionId": ctx.get("InstitucionId"),
             "EdificioId": ctx.get("EdificioId"),
-            "RegionId": ctx.get("RegionId"),
+            "RegionId": region_id,
             "Direccion": direccion,
         }
@@ -11,6 +11,7 @@ from sqlalchemy import and_, or_
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
 
+from app.core import session_store
 from app.db.models.user import User  # AspNetUser alias
 from app.db.models.password_reset import PasswordResetToken
 from app.utils.hash import Hash  # bcrypt para password
@@ -189,6 +190,9 @@ def consume_reset_token(db: Session, token_raw: str, new_password: str) -> None:
             if sec_col:
                 setattr(user, sec_col, secrets.token_hex(16))
 
+        # Cerrar sesiones abiertas (refresh tokens) del usuario
+        session_store.revoke_user(db, str(prt.UserId))
+
         # Marcar token como usado
         prt.UsedAt = now
 
@@ -0,0 +1,320 @@
+# app/services/prorrateo.py
+"""
+Prorrateo mensual de compras por periodo de lectura (dbo.CompraProrrateoMensual).
+
+- Cada compra activa reparte Consumo/Costo entre los meses calendario que cubre
+  [InicioLectura, FinLectura] (días inclusive) en proporción a los días de cada
+  mes. Una factura 15-dic → 14-ene queda 17/31 en diciembre y 14/31 en enero.
+  Sin periodo válido, todo va al mes de FechaCompra (criterio histórico).
+- El último mes recibe el resto, así la suma de las filas es exactamente el
+  Consumo/Costo de la compra.
+- La tabla se mantiene incrementalmente: un listener after_flush recalcula
+  solo las compras creadas/borradas o con campos relevantes modificados,
+  dentro de la misma transacción (igual que app/search/hooks.py); si falla,
+  falla el flush y la escritura de la compra se revierte. Los inserts
+  Core (compra_bulk) llaman refresh() directamente.
+- Backfill/reparación: rebuild() por keyset, en un hilo aparte
+  (POST /api/v1/reportes/prorrateo/rebuild → start_rebuild()). Cada lote borra e inserta su rango de
+  Compras.Id en su propia transacción (sin TRUNCATE): la tabla nunca queda
+  vacía y las escrituras concurrentes se serializan por lock con el lote.
+- Los reportes (serie_mensual, brechas) leen la tabla solo si is_ready(): el
+  primer rebuild completo marca dbo.CompraProrrateoEstado.ConstruidoAt; antes
+  de eso agrupan por FechaCompra. El mantenimiento incremental solo requiere
+  que la tabla exista (is_available()).
+
+DDL: app/db/sql/008_compra_prorrateo_mensual.sql
+"""
+from __future__ import annotations
+
+import calendar
+import logging
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import bindparam, event, inspect, text
+from sqlalchemy.orm import Session
+
+from app.db.models.compra import Compra
+from app.db.session import SessionLocal
+
+Log = logging.getLogger(__name__)
+
+PRORRATEO_ENABLED = os.getenv("PRORRATEO_ENABLED", "1") == "1"
+# mientras la tabla no esté construida, cada cuánto se vuelve a leer la marca
+PRORRATEO_READY_RECHECK_SECONDS = float(os.getenv("PRORRATEO_READY_RECHECK_SECONDS", "60"))
+
+# Campos de Compra que cambian el prorrateo
+_FIELDS = (
+    "InicioLectura", "FinLectura", "FechaCompra", "Consumo", "Costo",
+    "DivisionId", "EnergeticoId", "NumeroClienteId", "Active",
+)
+_ID_CHUNK = 1000
+_AVAILABLE: Optional[bool] = None
+_READY: Optional[bool] = None
+_READY_CHECKED_AT = 0.0
+_REBUILD_LOCK = threading.Lock()
+
+_SQL_SOURCE = """
+    SELECT Id, DivisionId, EnergeticoId, NumeroClienteId,
+           InicioLectura, FinLectura, FechaCompra, Consumo, Costo
+    FROM dbo.Compras{hint}
+    WHERE Active = 1 AND {where}
+"""
+_INSERT = text("""
+    INSERT INTO dbo.CompraProrrateoMensual
+        (CompraId, Periodo, DivisionId, EnergeticoId, NumeroClienteId, Dias, Fraccion, Consumo, Costo)
+    VALUES (:CompraId, :Periodo, :DivisionId, :EnergeticoId, :NumeroClienteId, :Dias, :Fraccion, :Consumo, :Costo)
+""")
+
+
+def is_available(db) -> bool:
+    """True si dbo.CompraProrrateoMensual existe (se consulta una vez por proceso)."""
+    global _AVAILABLE
+    if not PRORRATEO_ENABLED:
+        return False
+    if _AVAILABLE is None:
+        try:
+            row = db.execute(text("SELECT OBJECT_ID(N'dbo.CompraProrrateoMensual', N'U')")).scalar()
+            _AVAILABLE = row is not None
+        except Exception as ex:
+            Log.warning("PRORRATEO is_available falló: %s", ex)
+            return False
+        Log.info("PRORRATEO tabla mensual disponible=%s", _AVAILABLE)
+    return _AVAILABLE
+
+
+def is_ready(db) -> bool:
+    """
+    True si la tabla existe y un rebuild completo ya la pobló (los reportes
+    pueden leerla). Un False se vuelve a consultar cada
+    PRORRATEO_READY_RECHECK_SECONDS; un True queda fijo en el proceso.
+    """
+    global _READY, _READY_CHECKED_AT
+    if not is_available(db):
+        return False
+    if _READY:
+        return True
+    now = time.monotonic()
+    if _READY is not None and now - _READY_CHECKED_AT < PRORRATEO_READY_RECHECK_SECONDS:
+        return False
+    _READY_CHECKED_AT = now
+    try:
+        built = db.execute(
+            text("SELECT ConstruidoAt FROM dbo.CompraProrrateoEstado WITH (NOLOCK) WHERE Id = 1")
+        ).scalar()
+    except Exception as ex:
+        Log.warning("PRORRATEO is_ready falló: %s", ex)
+        _READY = False
+        return False
+    _READY = built is not None
+    if _READY:
+        Log.info("PRORRATEO tabla mensual construida (%s)", built)
+    return _READY
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Cálculo
+# ─────────────────────────────────────────────────────────────────────────────
+def _as_date(v) -> Optional[date]:
+    if v is None:
+        return None
+    return v.date() if isinstance(v, datetime) else v
+
+
+def split_months(
+    inicio, fin, fecha_compra, consumo: float, costo: float
+) -> List[Tuple[date, int, float, float, float]]:
+    """
+    [(primer día del mes, días, fracción, consumo, costo), ...] para un periodo.
+    Días inclusive en ambos extremos.
+    """
+    consumo = float(consumo or 0)
+    costo = float(costo or 0)
+    ini, end = _as_date(inicio), _as_date(fin)
+    if ini is None or end is None or end < ini:
+        f = _as_date(fecha_compra) or ini or end
+        if f is None:
+            return []
+        return [(f.replace(day=1), 0, 1.0, consumo, costo)]
+
+    total = (end - ini).days + 1
+    out: List[Tuple[date, int, float, float, float]] = []
+    acc_c = acc_k = 0.0
+    cur = ini
+    while cur <= end:
+        last = cur.replace(day=calendar.monthrange(cur.year, cur.month)[1])
+        seg_end = min(last, end)
+        dias = (seg_end - cur).days + 1
+        frac = dias / total
+        if seg_end == end:
+            c, k = consumo - acc_c, costo - acc_k
+        else:
+            c, k = consumo * frac, costo * frac
+            acc_c += c
+            acc_k += k
+        out.append((cur.replace(day=1), dias, frac, c, k))
+        cur = seg_end + timedelta(days=1)
+    return out
+
+
+def _rows_for(compras: Iterable) -> List[Dict[str, Any]]:
+    payload: List[Dict[str, Any]] = []
+    for cid, div, ene, nc, ini, fin, fc, consumo, costo in compras:
+        for periodo, dias, frac, c, k in split_months(ini, fin, fc, consumo, costo):
+            payload.append({
+                "CompraId": int(cid),
+                "Periodo": periodo,
+                "DivisionId": int(div),
+                "EnergeticoId": int(ene),
+                "NumeroClienteId": int(nc) if nc is not None else None,
+                "Dias": dias,
+                "Fraccion": frac,
+                "Consumo": c,
+                "Costo": k,
+            })
+    return payload
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Escritura
+# ─────────────────────────────────────────────────────────────────────────────
+def refresh(conn, compra_ids: Iterable[int]) -> int:
+    """
+    Recalcula el prorrateo de las compras indicadas (borra + inserta).
+    `conn` puede ser Session o Connection. Compras inactivas o inexistentes
+    quedan sin filas. Retorna filas escritas.
+    """
+    ids = sorted({int(i) for i in compra_ids if i is not None})
+    if not ids:
+        return 0
+    delete = text(
+        "DELETE FROM dbo.CompraProrrateoMensual WITH (HOLDLOCK) WHERE CompraId IN :ids"
+    ).bindparams(bindparam("ids", expanding=True))
+    source = text(_SQL_SOURCE.format(hint="", where="Id IN :ids")).bindparams(bindparam("ids", expanding=True))
+    written = 0
+    for i in range(0, len(ids), _ID_CHUNK):
+        chunk = ids[i:i + _ID_CHUNK]
+        conn.execute(delete, {"ids": chunk})
+        payload = _rows_for(conn.execute(source, {"ids": chunk}).all())
+        if payload:
+            conn.execute(_INSERT, payload)
+            written += len(payload)
+    return written
+
+
+def rebuild(db: Session, batch_size: int = 5000) -> int:
+    """
+    Reconstruye la tabla por keyset sobre Compras.Id, sin vaciarla. Cada lote,
+    en su propia transacción:
+      1. lee las compras activas del rango con HOLDLOCK (nadie las modifica
+         hasta el commit del lote),
+      2. borra las filas de prorrateo del rango (last, hasta] e inserta las
+         recalculadas.
+    Un flush concurrente sobre esas compras espera al lote (o el lote a él) en
+    vez de chocar en la PK. Al final borra filas huérfanas más allá del último
+    Id y marca dbo.CompraProrrateoEstado.ConstruidoAt. Retorna filas escritas.
+    """
+    source = text(
+        _SQL_SOURCE.format(hint=" WITH (HOLDLOCK)", where="Id > :last")
+        + " ORDER BY Id OFFSET 0 ROWS FETCH NEXT :n ROWS ONLY"
+    )
+    delete_range = text(
+        "DELETE FROM dbo.CompraProrrateoMensual WITH (HOLDLOCK) WHERE CompraId > :last AND CompraId <= :upto"
+    )
+    # más allá del último lote solo sobran filas de compras borradas/inactivas;
+    # las compras nuevas creadas durante el rebuild ya trae su prorrateo el flush
+    delete_tail = text("""
+        DELETE p FROM dbo.CompraProrrateoMensual p WITH (HOLDLOCK)
+        WHERE p.CompraId > :last
+          AND NOT EXISTS (SELECT 1 FROM dbo.Compras c WHERE c.Id = p.CompraId AND c.Active = 1)
+    """)
+    last_id = 0
+    total = 0
+    try:
+        while True:
+            rows = db.execute(source, {"last": last_id, "n": int(batch_size)}).all()
+            if not rows:
+                break
+            upto = int(rows[-1][0])
+            db.execute(delete_range, {"last": last_id, "upto": upto})
+            payload = _rows_for(rows)
+            if payload:
+                db.execute(_INSERT, payload)
+                total += len(payload)
+            db.commit()
+            last_id = upto
+        db.execute(delete_tail, {"last": last_id})
+        db.execute(text("UPDATE dbo.CompraProrrateoEstado SET ConstruidoAt = SYSUTCDATETIME() WHERE Id = 1"))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    Log.info("PRORRATEO rebuild → %s filas", total)
+    return total
+
+
+def rebuild_running() -> bool:
+    return _REBUILD_LOCK.locked()
+
+
+def _rebuild_worker(batch_size: int) -> None:
+    db = SessionLocal()
+    try:
+        rebuild(db, batch_size=batch_size)
+    except Exception:
+        Log.exception("PRORRATEO rebuild falló")
+    finally:
+        db.close()
+        _REBUILD_LOCK.release()
+
+
+def start_rebuild(batch_size: int = 5000) -> bool:
+    """
+    Lanza rebuild() en un hilo con su propia Session y retorna de inmediato.
+    False si ya hay uno corriendo en este proceso.
+    """
+    if not _REBUILD_LOCK.acquire(blocking=False):
+        return False
+    try:
+        threading.Thread(
+            target=_rebuild_worker, args=(int(batch_size),), name="prorrateo-rebuild", daemon=True
+        ).start()
+    except Exception:
+        _REBUILD_LOCK.release()
+        raise
+    return True
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Mantenimiento incremental
+# ─────────────────────────────────────────────────────────────────────────────
+@event.listens_for(Session, "after_flush")
+def prorrateo_after_flush(session: Session, flush_context):
+    if not PRORRATEO_ENABLED:
+        return
+    ids: Set[int] = set()
+    for obj in session.new:
+        if isinstance(obj, Compra) and obj.Id is not None:
+            ids.add(int(obj.Id))
+    for obj in session.deleted:
+        if isinstance(obj, Compra) and obj.Id is not None:
+            ids.add(int(obj.Id))
+    for obj in session.dirty:
+        if isinstance(obj, Compra) and obj.Id is not None:
+            state = inspect(obj)
+            if any(state.attrs[f].history.has_changes() for f in _FIELDS):
+                ids.add(int(obj.Id))
+    if not ids:
+        return
+    try:
+        conn = session.connection()
+        if is_available(conn):
+            refresh(conn, ids)
+    except Exception:
+        # la tabla derivada no puede quedar desfasada en silencio: la escritura falla y se revierte
+        Log.exception("PRORRATEO after_flush no pudo actualizar compras %s", sorted(ids)[:20])
+        raise
+
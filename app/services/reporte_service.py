@@ -1,14 +1,15 @@
 from __future__ import annotations
-from datetime import datetime
-from typing import Optional, List, Dict
+from datetime import date, datetime
+from typing import Optional, List, Dict, Iterable
 
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, select, exists
+from sqlalchemy import bindparam, func, and_, select, exists, text
 
 from app.db.models.compra import Compra
 from app.db.models.compra_medidor import CompraMedidor
 from app.db.models.medidor import Medidor
 from app.db.models.numero_cliente import NumeroCliente
+from app.services import prorrateo
 
 
 def _to_dt(s: str | None) -> datetime | None:
@@ -22,8 +23,37 @@ def _to_dt(s: str | None) -> datetime | None:
 
 class ReporteService:
     def serie_mensual(
-        self, db: Session, division_id: int, energetico_id: int, desde: str, hasta: str
+        self,
+        db: Session,
+        division_id: int,
+        energetico_id: int,
+        desde: str,
+        hasta: str,
+        prorrateado: bool = True,
     ) -> List[Dict]:
+        """
+        Serie mensual de Consumo/Costo. Con prorrateado=True (y la tabla
+        construida) cada compra se reparte según su periodo de lectura;
+        si no, se agrupa por el mes de FechaCompra.
+        """
+        if prorrateado and prorrateo.is_ready(db):
+            rows = db.execute(
+                text("""
+                    SELECT YEAR(Periodo) AS Anio, MONTH(Periodo) AS Mes,
+                           SUM(Consumo), SUM(Costo)
+                    FROM dbo.CompraProrrateoMensual WITH (NOLOCK)
+                    WHERE DivisionId = :div AND EnergeticoId = :ene
+                      AND Periodo >= :desde AND Periodo < :hasta
+                    GROUP BY YEAR(Periodo), MONTH(Periodo)
+                    ORDER BY Anio, Mes
+                """),
+                {"div": division_id, "ene": energetico_id, "desde": _to_dt(desde), "hasta": _to_dt(hasta)},
+            ).all()
+            return [
+                {"Anio": int(r[0]), "Mes": int(r[1]), "Consumo": float(r[2] or 0), "Costo": float(r[3] or 0)}
+                for r in rows
+            ]
+
         y = func.extract("year", Compra.FechaCompra).label("anio")
         m = func.extract("month", Compra.FechaCompra).label("mes")
         rows = (
@@ -208,3 +238,135 @@ class ReporteService:
         cons, cost = float(cons or 0), float(cost or 0)
         cu = (cost / cons) if cons else 0.0
         return {"ConsumoTotal": cons, "CostoTotal": cost, "CostoUnitario": cu}
+
+    # ------------------------------------------------------------------
+    # Cobertura / brechas de periodos
+    # ------------------------------------------------------------------
+    def brechas(
+        self,
+        db: Session,
+        desde: date,
+        hasta: date,
+        servicio_id: Optional[int] = None,
+        institucion_id: Optional[int] = None,
+        nivel: str = "numero_cliente",
+        servicio_ids: Optional[Iterable[int]] = None,
+    ) -> Dict:
+        """
+        Meses sin compra por NumeroCliente (o Medidor) activo del servicio/institución.
+
+        Anti-join de un calendario de meses [desde, hasta) contra la cobertura:
+        con dbo.CompraProrrateoMensual, un mes está cubierto si alguna compra
+        activa tiene fila prorrateada en él (por cabecera o por item de medidor);
+        sin la tabla, si su periodo de lectura toca el mes.
+        `servicio_ids` acota a los servicios del gestor (None = sin límite).
+        """
+        where = ["x.Active = 1"]
+        params: Dict = {"desde": desde, "hasta": hasta}
+        if servicio_id is not None:
+            where.append("d.ServicioId = :sid")
+            params["sid"] = int(servicio_id)
+        if institucion_id is not None:
+            where.append("s.InstitucionId = :iid")
+            params["iid"] = int(institucion_id)
+        allowed = sorted({int(x) for x in servicio_ids}) if servicio_ids is not None else None
+        if allowed is not None:
+            if not allowed:
+                return {"Nivel": nivel, "Meses": 0, "Total": 0, "ConBrechas": 0, "Items": []}
+            where.append("d.ServicioId IN :allowed")
+            params["allowed"] = allowed
+
+        prorr = prorrateo.is_ready(db)
+        if nivel == "medidor":
+            sujetos = """
+                SELECT x.Id, x.Numero, COALESCE(x.DivisionId, nc.DivisionId) AS DivisionId, x.NumeroClienteId
+                FROM dbo.Medidores x WITH (NOLOCK)
+                JOIN dbo.NumeroClientes nc WITH (NOLOCK) ON nc.Id = x.NumeroClienteId
+                JOIN dbo.Divisiones d WITH (NOLOCK) ON d.Id = COALESCE(x.DivisionId, nc.DivisionId)
+                JOIN dbo.Servicios s WITH (NOLOCK) ON s.Id = d.ServicioId
+            """
+            if prorr:
+                cubierto = """
+                    SELECT 1 FROM dbo.CompraMedidor cm WITH (NOLOCK)
+                    JOIN dbo.CompraProrrateoMensual p WITH (NOLOCK) ON p.CompraId = cm.CompraId
+                    WHERE cm.MedidorId = su.Id AND p.Periodo = m.Periodo
+                """
+            else:
+                cubierto = """
+                    SELECT 1 FROM dbo.CompraMedidor cm WITH (NOLOCK)
+                    JOIN dbo.Compras co WITH (NOLOCK) ON co.Id = cm.CompraId
+                    WHERE cm.MedidorId = su.Id AND co.Active = 1
+                      AND co.InicioLectura < DATEADD(MONTH, 1, m.Periodo) AND co.FinLectura >= m.Periodo
+                """
+        else:
+            nivel = "numero_cliente"
+            sujetos = """
+                SELECT x.Id, x.Numero, x.DivisionId, x.Id AS NumeroClienteId
+                FROM dbo.NumeroClientes x WITH (NOLOCK)
+                JOIN dbo.Divisiones d WITH (NOLOCK) ON d.Id = x.DivisionId
+                JOIN dbo.Servicios s WITH (NOLOCK) ON s.Id = d.ServicioId
+            """
+            if prorr:
+                cubierto = """
+                    SELECT 1 FROM dbo.CompraProrrateoMensual p WITH (NOLOCK)
+                    WHERE p.NumeroClienteId = su.Id AND p.Periodo = m.Periodo
+                    UNION ALL
+                    SELECT 1 FROM dbo.Medidores me WITH (NOLOCK)
+                    JOIN dbo.CompraMedidor cm WITH (NOLOCK) ON cm.MedidorId = me.Id
+                    JOIN dbo.CompraProrrateoMensual p WITH (NOLOCK) ON p.CompraId = cm.CompraId
+                    WHERE me.NumeroClienteId = su.Id AND p.Periodo = m.Periodo
+                """
+            else:
+                cubierto = """
+                    SELECT 1 FROM dbo.Compras co WITH (NOLOCK)
+                    WHERE co.NumeroClienteId = su.Id AND co.Active = 1
+                      AND co.InicioLectura < DATEADD(MONTH, 1, m.Periodo) AND co.FinLectura >= m.Periodo
+                """
+
+        stmt = text(f"""
+            WITH meses AS (
+                SELECT CAST(:desde AS DATE) AS Periodo
+                UNION ALL
+                SELECT DATEADD(MONTH, 1, Periodo) FROM meses
+                WHERE DATEADD(MONTH, 1, Periodo) < :hasta
+            ),
+            su AS (
+                {sujetos}
+                WHERE {" AND ".join(where)}
+            )
+            SELECT su.Id, su.Numero, su.DivisionId, su.NumeroClienteId, m.Periodo
+            FROM su
+            CROSS JOIN meses m
+            WHERE NOT EXISTS ({cubierto})
+            ORDER BY su.Id, m.Periodo
+            OPTION (MAXRECURSION 0)
+        """)
+        if allowed is not None:
+            stmt = stmt.bindparams(bindparam("allowed", expanding=True))
+        total_stmt = text(f"""
+            SELECT COUNT(*) FROM ({sujetos} WHERE {" AND ".join(where)}) su
+        """)
+        if allowed is not None:
+            total_stmt = total_stmt.bindparams(bindparam("allowed", expanding=True))
+
+        items: Dict[int, Dict] = {}
+        for sid_, numero, div, ncid, periodo in db.execute(stmt, params).all():
+            it = items.get(int(sid_))
+            if it is None:
+                it = items[int(sid_)] = {
+                    "Id": int(sid_),
+                    "Numero": numero,
+                    "DivisionId": int(div) if div is not None else None,
+                    "NumeroClienteId": int(ncid) if ncid is not None else None,
+                    "MesesFaltantes": [],
+                }
+            it["MesesFaltantes"].append(periodo.strftime("%Y-%m"))
+
+        meses = (hasta.year - desde.year) * 12 + (hasta.month - desde.month)
+        return {
+            "Nivel": nivel,
+            "Meses": max(0, meses),
+            "Total": int(db.execute(total_stmt, params).scalar() or 0),
+            "ConBrechas": len(items),
+            "Items": list(items.values()),
+        }
@@ -6,7 +6,7 @@ from typing import Iterable, Set
 from uuid import uuid4
 
 from app.db.models.identity import AspNetUser, AspNetRole, AspNetUserRole
-from app.core import roles as R
+from app.core import auth_claims, roles as R
 
 def _norm(name: str) -> str:
     return (name or "").strip().upper()
@@ -69,6 +69,7 @@ class RoleService:
         role.Name = new_name.strip()
         role.NormalizedName = _norm(new_name)
         role.Nombre = _nombre_amigable(role.NormalizedName)
+        self._bump_role_users(db, role.Id)   # los tokens llevan el nombre del rol
         db.commit()
         db.refresh(role)
         return role
@@ -77,10 +78,16 @@ class RoleService:
         role = db.get(AspNetRole, role_id)
         if not role:
             raise HTTPException(status_code=404, detail="Rol no encontrado")
+        self._bump_role_users(db, role_id)
         db.execute(delete(AspNetUserRole).where(AspNetUserRole.RoleId == role_id))
         db.delete(role)
         db.commit()
 
+    def _bump_role_users(self, db: Session, role_id: str) -> None:
+        user_ids = db.scalars(select(AspNetUserRole.UserId).where(AspNetUserRole.RoleId == role_id)).all()
+        for uid in set(user_ids):
+            auth_claims.bump(db, uid)
+
     # ---------- User ↔ Roles ----------
     def list_user_roles(self, db: Session, user_id: str) -> list[str]:
         q = (
@@ -104,6 +111,7 @@ class RoleService:
         ).first()
         if not exists:
             db.add(AspNetUserRole(UserId=user_id, RoleId=role.Id))
+            auth_claims.bump(db, user_id)   # tokens emitidos antes vuelven a validarse contra BD
             db.commit()
         return self.list_user_roles(db, user_id)
 
@@ -115,6 +123,7 @@ class RoleService:
             AspNetUserRole.UserId == user_id,
             AspNetUserRole.RoleId == role.Id
         ))
+        auth_claims.bump(db, user_id)
         db.commit()
         return self.list_user_roles(db, user_id)
 
@@ -134,6 +143,7 @@ class RoleService:
             role = self.get_role_by_name(db, name)
             if role:
                 db.add(AspNetUserRole(UserId=user_id, RoleId=role.Id))
+        auth_claims.bump(db, user_id)
         db.commit()
         return self.list_user_roles(db, user_id)
 
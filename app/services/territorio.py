@@ -0,0 +1,225 @@
+# app/services/territorio.py
+"""
+Árbol territorial en memoria (comuna → provincia → región, con nombres).
+
+Regiones, provincias y comunas casi nunca cambian: se cargan una vez por
+proceso (startup o primer uso) en una estructura inmutable y los servicios
+resuelven nombres y ancestros desde aquí en vez de unir dbo.Comunas /
+dbo.Provincias / dbo.Regiones en cada fila.
+
+- get(db) devuelve el árbol vigente (lo carga si no existe o si tiene más de
+  TERRITORIO_TTL_SECONDS).
+- Cualquier flush que toque Region/Comuna invalida el árbol local al hacer
+  commit; los demás procesos lo recargan al vencer el TTL (se publica por
+  reemplazo atómico).
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Dict, FrozenSet, List, Mapping, Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from app.db.models.comuna import Comuna, Region
+
+Log = logging.getLogger(__name__)
+
+TERRITORIO_TTL_SECONDS = float(os.getenv("TERRITORIO_TTL_SECONDS", "300"))
+
+
+@dataclass(frozen=True)
+class RegionNode:
+    Id: int
+    Nombre: str
+    Numero: Optional[int]
+    Posicion: Optional[int]
+
+
+@dataclass(frozen=True)
+class ProvinciaNode:
+    Id: int
+    RegionId: int
+    Nombre: str
+
+
+@dataclass(frozen=True)
+class ComunaNode:
+    Id: int
+    ProvinciaId: int
+    RegionId: int
+    Nombre: str
+
+
+class TerritoryTree:
+    """Índices inmutables por Id y por padre; no se modifica tras construirse."""
+
+    def __init__(
+        self,
+        regiones: List[RegionNode],
+        provincias: List[ProvinciaNode],
+        comunas: List[ComunaNode],
+    ):
+        self.regiones: Mapping[int, RegionNode] = MappingProxyType({r.Id: r for r in regiones})
+        self.provincias: Mapping[int, ProvinciaNode] = MappingProxyType({p.Id: p for p in provincias})
+        self.comunas: Mapping[int, ComunaNode] = MappingProxyType({c.Id: c for c in comunas})
+
+        by_region: Dict[int, List[ComunaNode]] = {}
+        prov_by_region: Dict[int, List[ProvinciaNode]] = {}
+        for c in comunas:
+            by_region.setdefault(c.RegionId, []).append(c)
+        for p in provincias:
+            prov_by_region.setdefault(p.RegionId, []).append(p)
+
+        self._comuna_ids_by_region: Mapping[int, FrozenSet[int]] = MappingProxyType(
+            {rid: frozenset(c.Id for c in cs) for rid, cs in by_region.items()}
+        )
+        self._comunas_by_region: Mapping[int, tuple] = MappingProxyType(
+            {rid: tuple(sorted(cs, key=lambda c: (c.Nombre or "", c.Id))) for rid, cs in by_region.items()}
+        )
+        self._provincias_by_region: Mapping[int, tuple] = MappingProxyType(
+            {rid: tuple(sorted(ps, key=lambda p: (p.Nombre or "", p.Id))) for rid, ps in prov_by_region.items()}
+        )
+
+    # ---------- nodos ----------
+    def region(self, region_id: Optional[int]) -> Optional[RegionNode]:
+        return self.regiones.get(int(region_id)) if region_id is not None else None
+
+    def provincia(self, provincia_id: Optional[int]) -> Optional[ProvinciaNode]:
+        return self.provincias.get(int(provincia_id)) if provincia_id is not None else None
+
+    def comuna(self, comuna_id: Optional[int]) -> Optional[ComunaNode]:
+        return self.comunas.get(int(comuna_id)) if comuna_id is not None else None
+
+    # ---------- ancestros ----------
+    def region_id_of_comuna(self, comuna_id: Optional[int]) -> Optional[int]:
+        c = self.comuna(comuna_id)
+        return c.RegionId if c else None
+
+    def region_of_comuna(self, comuna_id: Optional[int]) -> Optional[RegionNode]:
+        return self.region(self.region_id_of_comuna(comuna_id))
+
+    # ---------- hijos ----------
+    def comuna_ids_of_region(self, region_id: Optional[int]) -> FrozenSet[int]:
+        if region_id is None:
+            return frozenset()
+        return self._comuna_ids_by_region.get(int(region_id), frozenset())
+
+    def comunas_of_region(self, region_id: int) -> tuple:
+        return self._comunas_by_region.get(int(region_id), ())
+
+    def provincias_of_region(self, region_id: int) -> tuple:
+        return self._provincias_by_region.get(int(region_id), ())
+
+    def regiones_ordenadas(self) -> List[RegionNode]:
+        """Igual que el endpoint histórico: ORDER BY Posicion (NULL primero)."""
+        return sorted(
+            self.regiones.values(),
+            key=lambda r: (r.Posicion is not None, r.Posicion or 0, r.Id),
+        )
+
+    # ---------- helpers para DTOs ----------
+    def comuna_region_info(self, comuna_id: Optional[int]) -> Dict[str, object]:
+        """{"ComunaId","ComunaNombre","RegionId","RegionNombre"} (None si no calza)."""
+        c = self.comuna(comuna_id)
+        r = self.region(c.RegionId) if c else None
+        return {
+            "ComunaId": c.Id if c else None,
+            "ComunaNombre": c.Nombre if c else None,
+            "RegionId": c.RegionId if c else None,
+            "RegionNombre": r.Nombre if r else None,
+        }
+
+
+_TREE: Optional[TerritoryTree] = None
+_LOADED_AT = 0.0
+_LOCK = threading.Lock()
+
+
+def load(db) -> TerritoryTree:
+    """Lee las tres tablas completas (son catálogos pequeños) y publica el árbol."""
+    global _TREE, _LOADED_AT
+    regiones = [
+        RegionNode(int(r.Id), r.Nombre, r.Numero, r.Posicion)
+        for r in db.execute(text(
+            "SELECT Id, Nombre, Numero, Posicion FROM dbo.Regiones WITH (NOLOCK)"
+        )).all()
+    ]
+    provincias = [
+        ProvinciaNode(int(p.Id), int(p.RegionId), p.Nombre)
+        for p in db.execute(text(
+            "SELECT Id, RegionId, Nombre FROM dbo.Provincias WITH (NOLOCK)"
+        )).all()
+    ]
+    comunas = [
+        ComunaNode(int(c.Id), int(c.ProvinciaId), int(c.RegionId), c.Nombre)
+        for c in db.execute(text(
+            "SELECT Id, ProvinciaId, RegionId, Nombre FROM dbo.Comunas WITH (NOLOCK)"
+        )).all()
+    ]
+    tree = TerritoryTree(regiones, provincias, comunas)
+    _TREE = tree
+    _LOADED_AT = time.monotonic()
+    Log.info(
+        "TERRITORIO cargado: %s regiones, %s provincias, %s comunas",
+        len(regiones), len(provincias), len(comunas),
+    )
+    return tree
+
+
+def _fresh() -> bool:
+    return _TREE is not None and time.monotonic() - _LOADED_AT < TERRITORIO_TTL_SECONDS
+
+
+def get(db) -> TerritoryTree:
+    """Árbol vigente; si no hay (arranque o invalidado) o venció el TTL lo carga con `db`."""
+    tree = _TREE
+    if tree is not None and _fresh():
+        return tree
+    with _LOCK:
+        if _fresh():
+            return _TREE
+        try:
+            return load(db)
+        except Exception as ex:
+            if _TREE is None:
+                raise
+            # mejor un árbol vencido que botar la lectura: se reintenta en la próxima
+            Log.warning("TERRITORIO no se pudo recargar (se usa el anterior): %s", ex)
+            return _TREE
+
+
+def invalidate() -> None:
+    global _TREE
+    _TREE = None
+    Log.info("TERRITORIO invalidado; se recarga en la próxima lectura")
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Invalidación ante escrituras de catálogo (ORM)
+# ─────────────────────────────────────────────────────────────────────────────
+_WATCHED = (Region, Comuna)
+
+
+@event.listens_for(Session, "after_flush")
+def territorio_after_flush(session: Session, flush_context):
+    for objs in (session.new, session.dirty, session.deleted):
+        if any(isinstance(o, _WATCHED) for o in objs):
+            session.info["territorio_dirty"] = True
+            return
+
+
+@event.listens_for(Session, "after_commit")
+def territorio_after_commit(session: Session):
+    if session.info.pop("territorio_dirty", False):
+        invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def territorio_after_rollback(session: Session):
+    session.info.pop("territorio_dirty", None)
@@ -1,7 +1,9 @@
 # app/services/unidad_scope.py
 from __future__ import annotations
 
-from sqlalchemy import text
+from typing import Dict, List
+
+from sqlalchemy import bindparam, text
 from sqlalchemy.orm import Session
 from fastapi import HTTPException
 
@@ -39,3 +41,24 @@ def division_id_from_unidad(db: Session, unidad_id: int) -> int:
         )
 
     return int(rows[0][0])
+
+
+def division_ids_from_unidades(db: Session, unidad_ids, chunk: int = 1000) -> Dict[int, List[int]]:
+    """
+    Versión por conjunto de division_id_from_unidad: UnidadId -> [InmuebleId, ...]
+    en una consulta por cada `chunk` ids. Unidades sin fila no aparecen; el
+    llamador decide (404/409) por fila igual que la versión unitaria.
+    """
+    ids = sorted({int(x) for x in unidad_ids if x is not None})
+    out: Dict[int, List[int]] = {}
+    if not ids:
+        return out
+    stmt = text("""
+        SELECT UnidadId, InmuebleId
+        FROM dbo.UnidadesInmuebles WITH (NOLOCK)
+        WHERE UnidadId IN :ids
+    """).bindparams(bindparam("ids", expanding=True))
+    for i in range(0, len(ids), chunk):
+        for uid, inm in db.execute(stmt, {"ids": ids[i:i + chunk]}).all():
+            out.setdefault(int(uid), []).append(int(inm))
+    return out
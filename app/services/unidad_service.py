@@ -1,14 +1,19 @@
 # app/services/unidad_service.py
 from __future__ import annotations
 
-from typing import List, Optional, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
 from datetime import datetime
 
-from sqlalchemy import select, text
+from sqlalchemy import and_, exists, or_, select, text
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 
-from app.db.models.unidad import Unidad  # y UnidadInmueble si lo usas en otros lados
+from app.db.models.unidad import Unidad, UnidadInmueble
+from app.db.models.division import Division
+from app.db.models.direccion import Direccion
+from app.db import id_list
+from app.db.stats import page_total
+from app.utils.cursor import decode_cursor, encode_cursor
 
 from app.schemas.unidad import (
     UnidadDTO,
@@ -30,60 +35,42 @@ from app.services.inmueble_service import InmuebleService
 # ---------------------- Helpers ----------------------
 _ACTIVE_CANDIDATES = ("Active", "Activo", "IsActive", "Enabled")
 
-def _sql_pisos_origen() -> str:
-    return """
-    DECLARE @uid INT = :uid;
-
-    ;WITH pisos AS (
-        -- A) Pisos directos
-        SELECT DISTINCT
-            p.Id        AS PisoId,
-            p.DivisionId,
-            'pisos'     AS origen,
-            1           AS prio
-        FROM dbo.UnidadesPisos up
-        JOIN dbo.Pisos p ON p.Id = up.PisoId
-        WHERE up.UnidadId = @uid
-
-        UNION ALL
-
-        -- B) Pisos indirectos por áreas
-        SELECT DISTINCT
-            p.Id        AS PisoId,
-            p.DivisionId,
-            'areas'     AS origen,
-            2           AS prio
-        FROM dbo.UnidadesAreas ua
-        JOIN dbo.Areas a ON a.Id = ua.AreaId
-        JOIN dbo.Pisos p ON p.Id = a.PisoId
-        WHERE ua.UnidadId = @uid
-    )
-    SELECT PisoId, DivisionId, origen, prio
-    FROM pisos
-    """
+# Vínculos de N unidades en una sola lectura (inmuebles, pisos directos y áreas).
+# Kind: 'I' = UnidadesInmuebles, 'P' = UnidadesPisos, 'A' = UnidadesAreas.
+# RefOk = el piso/área vinculado existe; PisoOk = el piso del área existe.
+_SQL_EXPAND_LINKS = """
+;WITH u AS (
+    SELECT Id FROM dbo.Unidades WITH (NOLOCK) WHERE Id IN (SELECT Id FROM #unidad_ids)
+)
+SELECT 'I' AS Kind, ui.UnidadId, ui.InmuebleId AS Id,
+       CAST(NULL AS BIGINT) AS PisoId, CAST(NULL AS BIGINT) AS DivisionId,
+       CAST(NULL AS NVARCHAR(MAX)) AS Nombre, 1 AS RefOk, 0 AS PisoOk
+FROM dbo.UnidadesInmuebles ui WITH (NOLOCK)
+JOIN u ON u.Id = ui.UnidadId
 
-def _sql_division_principal() -> str:
-    return """
-    DECLARE @uid INT = :uid;
+UNION ALL
 
-    ;WITH divs AS (
-      SELECT DISTINCT p.DivisionId, 'pisos' AS origen, 1 AS prio
-      FROM dbo.UnidadesPisos up
-      JOIN dbo.Pisos p ON p.Id = up.PisoId
-      WHERE up.UnidadId = @uid AND p.DivisionId IS NOT NULL
+SELECT 'P', up.UnidadId, up.PisoId,
+       p.Id, p.DivisionId,
+       NULL, CASE WHEN p.Id IS NULL THEN 0 ELSE 1 END, CASE WHEN p.Id IS NULL THEN 0 ELSE 1 END
+FROM dbo.UnidadesPisos up WITH (NOLOCK)
+JOIN u ON u.Id = up.UnidadId
+LEFT JOIN dbo.Pisos p WITH (NOLOCK) ON p.Id = up.PisoId
 
-      UNION ALL
+UNION ALL
+
+SELECT 'A', ua.UnidadId, ua.AreaId,
+       a.PisoId, p.DivisionId,
+       a.Nombre, CASE WHEN a.Id IS NULL THEN 0 ELSE 1 END, CASE WHEN p.Id IS NULL THEN 0 ELSE 1 END
+FROM dbo.UnidadesAreas ua WITH (NOLOCK)
+JOIN u ON u.Id = ua.UnidadId
+LEFT JOIN dbo.Areas a WITH (NOLOCK) ON a.Id = ua.AreaId
+LEFT JOIN dbo.Pisos p WITH (NOLOCK) ON p.Id = a.PisoId
+"""
+
+# Los IDs viajan en #unidad_ids (app/db/id_list): una sentencia de texto fijo por lista
+_EXPAND_IDS = "unidad_ids"
 
-      SELECT DISTINCT p.DivisionId, 'areas' AS origen, 2 AS prio
-      FROM dbo.UnidadesAreas ua
-      JOIN dbo.Areas a ON a.Id = ua.AreaId
-      JOIN dbo.Pisos p ON p.Id = a.PisoId
-      WHERE ua.UnidadId = @uid AND p.DivisionId IS NOT NULL
-    )
-    SELECT TOP 1 DivisionId, origen
-    FROM divs
-    ORDER BY prio
-    """
 
 def _coerce_boolish_to_bool(v) -> Optional[bool]:
     if v is None or v == "":
@@ -101,36 +88,6 @@ def _coerce_boolish_to_bool(v) -> Optional[bool]:
     except Exception:
         return None
     
-def _sql_areas_by_unidad() -> str:
-    return """
-    DECLARE @uid INT = :uid;
-
-    ;WITH pisos AS (
-        SELECT DISTINCT p.Id AS PisoId
-        FROM dbo.UnidadesPisos up
-        JOIN dbo.Pisos p ON p.Id = up.PisoId
-        WHERE up.UnidadId = @uid
-
-        UNION
-
-        SELECT DISTINCT a.PisoId
-        FROM dbo.UnidadesAreas ua
-        JOIN dbo.Areas a ON a.Id = ua.AreaId
-        WHERE ua.UnidadId = @uid
-    )
-    SELECT DISTINCT
-        a.Id     AS AreaId,
-        a.Nombre AS AreaNombre,
-        a.PisoId
-    FROM dbo.Areas a
-    JOIN pisos px ON px.PisoId = a.PisoId
-    WHERE EXISTS (
-        SELECT 1
-        FROM dbo.UnidadesAreas ua
-        WHERE ua.UnidadId = @uid AND ua.AreaId = a.Id
-    )
-    """
-
 def _now() -> datetime:
     return datetime.now()
 
@@ -296,35 +253,79 @@ def _map_unidad_to_listdto(
     )
 
 
-def _lazy_models():
+def _group_links(rows) -> Dict[int, dict]:
+    """Agrupa las filas de _SQL_EXPAND_LINKS por UnidadId."""
+    out: Dict[int, dict] = {}
+    for kind, uid, rid, piso_id, div_id, nombre, ref_ok, piso_ok in rows:
+        g = out.setdefault(int(uid), {"inmuebles": [], "pisos": [], "areas": []})
+        if kind == "I":
+            g["inmuebles"].append(int(rid))
+        elif kind == "P":
+            g["pisos"].append((int(rid), int(div_id) if div_id is not None else None, bool(ref_ok)))
+        else:
+            g["areas"].append((
+                int(rid),
+                nombre,
+                int(piso_id) if piso_id is not None else None,
+                int(div_id) if div_id is not None else None,
+                bool(ref_ok),
+                bool(piso_ok),
+            ))
+    return out
+
+
+def _build_expand(links: dict) -> Tuple[List[pisoDTO], Optional[UnidadDivisionDTO]]:
     """
-    Importa UnidadPiso y UnidadArea SOLO si existen en tu proyecto
-    (para no romper si están en otro lado o no existen).
+    Árbol de pisos/áreas y división principal de una unidad:
+    - Pisos directos (UnidadesPisos) ganan a los indirectos por áreas (Prio 1 vs 2).
+    - División principal = la del primer piso por prioridad con DivisionId.
     """
-    UnidadPiso = None
-    UnidadArea = None
-
-    try:
-        from app.db.models.unidad_piso import UnidadPiso as _UP  # type: ignore
-        UnidadPiso = _UP
-    except Exception:
-        try:
-            from app.db.models.unidad import UnidadPiso as _UP  # type: ignore
-            UnidadPiso = _UP
-        except Exception:
-            UnidadPiso = None
-
-    try:
-        from app.db.models.unidad_area import UnidadArea as _UA  # type: ignore
-        UnidadArea = _UA
-    except Exception:
-        try:
-            from app.db.models.unidad import UnidadArea as _UA  # type: ignore
-            UnidadArea = _UA
-        except Exception:
-            UnidadArea = None
+    pisos_map: Dict[int, pisoDTO] = {}
+    divs: List[Tuple[int, int, str]] = []
+
+    for pid, div_id, ref_ok in links["pisos"]:
+        if not ref_ok:
+            continue
+        pisos_map[pid] = pisoDTO(
+            Id=pid, NumeroPisoNombre=None, Checked=True,
+            DivisionId=div_id, Origen="pisos", Prio=1, Areas=[],
+        )
+        if div_id is not None:
+            divs.append((1, div_id, "pisos"))
+
+    areas_seen: set[int] = set()
+    area_dtos: List[AreaDTO] = []
+    for aid, nombre, piso_id, div_id, ref_ok, piso_ok in sorted(links["areas"], key=lambda t: t[0]):
+        if not ref_ok or piso_id is None:
+            continue
+        if piso_ok:
+            if piso_id not in pisos_map:
+                pisos_map[piso_id] = pisoDTO(
+                    Id=piso_id, NumeroPisoNombre=None, Checked=True,
+                    DivisionId=div_id, Origen="areas", Prio=2, Areas=[],
+                )
+            if div_id is not None:
+                divs.append((2, div_id, "areas"))
+        if aid in areas_seen:
+            continue
+        areas_seen.add(aid)
+        area_dtos.append(AreaDTO(Id=aid, Nombre=nombre, PisoId=piso_id))
+
+    for a in area_dtos:
+        if a.PisoId not in pisos_map:
+            # el área apunta a un piso que no existe en dbo.Pisos
+            pisos_map[a.PisoId] = pisoDTO(
+                Id=a.PisoId, NumeroPisoNombre=None, Checked=True,
+                DivisionId=None, Origen="areas", Prio=2, Areas=[],
+            )
+        pisos_map[a.PisoId].Areas.append(a)
 
-    return UnidadPiso, UnidadArea
+    pisos_out = sorted(pisos_map.values(), key=lambda x: ((x.Prio or 99), x.Id))
+    division = None
+    if divs:
+        _, div_id, origen = min(divs, key=lambda t: t[0])
+        division = UnidadDivisionDTO(Id=div_id, Origen=origen)
+    return pisos_out, division
 
 
 # ---------------------- Servicio ----------------------
@@ -500,36 +501,30 @@ class UnidadService:
             raise ValueError("Unidad no encontrada o inactiva")
 
         dto = _map_unidad_to_dto(u)
-
-        # ✅ Inmuebles por SQL directo a la tabla REAL (según tu SSMS)
-        inm_ids = self.list_inmuebles_ids(unidad_id)
-        dto.Inmuebles = [InmuebleTopDTO(Id=i, TipoInmueble=0) for i in inm_ids]
-
-        # Pisos/Areas desde pivotes si existieran
-        UnidadPiso, UnidadArea = _lazy_models()
-
-        if UnidadPiso is not None:
-            piso_ids = [
-                r.PisoId
-                for r in self.db.scalars(
-                    select(UnidadPiso).where(UnidadPiso.UnidadId == unidad_id)
-                ).all()
-            ]
-            dto.Pisos = [pisoDTO(Id=int(p), NumeroPisoNombre=None, Checked=True) for p in piso_ids]
-
-        if UnidadArea is not None:
-            area_ids = [
-                r.AreaId
-                for r in self.db.scalars(
-                    select(UnidadArea).where(UnidadArea.UnidadId == unidad_id)
-                ).all()
-            ]
-            dto.Areas = [AreaDTO(Id=int(a), Nombre=None) for a in area_ids]
-
+        links = self._load_links([unidad_id]).get(unidad_id)
+        if links:
+            dto.Inmuebles = [InmuebleTopDTO(Id=i, TipoInmueble=0) for i in links["inmuebles"]]
+            dto.Pisos = [pisoDTO(Id=p[0], NumeroPisoNombre=None, Checked=True) for p in links["pisos"]]
+            dto.Areas = [AreaDTO(Id=a[0], Nombre=None) for a in links["areas"]]
         return dto
 
     # ---------- LIST ----------
-    def list_filter(self, f: UnidadFilterDTO, page: int, page_size: int) -> Page[UnidadListDTO]:
+    def list_filter(
+        self,
+        f: UnidadFilterDTO,
+        page: int,
+        page_size: int,
+        cursor: Optional[str] = None,
+        count: str = "exact",
+    ) -> Page[UnidadListDTO]:
+        """
+        Listado filtrado ordenado por (Nombre, Id).
+        - Región: EXISTS correlacionado (UnidadesInmuebles → Divisiones → Direcciones),
+          sin materializar IDs en Python.
+        - cursor: keyset sobre (Nombre, Id) (meta.next_cursor de la página anterior);
+          sin cursor se mantiene OFFSET por `page` (compatibilidad).
+        - count: exact | estimate (metadatos o COUNT acotado) | none (sin COUNT).
+        """
         q = self.db.query(Unidad)
         q = _q_filter_active(q, getattr(f, "Active", None))
 
@@ -543,34 +538,64 @@ class UnidadService:
             q = q.filter(Unidad.InstitucionResponsableId == f.InstitucionId)
 
         if f.RegionId:
-            sql = text(
-                """
-                SELECT DISTINCT ui.UnidadId
-                FROM dbo.UnidadesInmuebles ui
-                JOIN dbo.Divisiones d ON d.Id = ui.InmuebleId
-                JOIN dbo.Direcciones di ON di.Id = d.DireccionId
-                WHERE di.RegionId = :region_id
-                """
+            q = q.filter(
+                exists()
+                .where(UnidadInmueble.UnidadId == Unidad.Id)
+                .where(Division.Id == UnidadInmueble.InmuebleId)
+                .where(Direccion.Id == Division.DireccionInmuebleId)
+                .where(Direccion.RegionId == f.RegionId)
             )
-            ids = [row[0] for row in self.db.execute(sql, {"region_id": f.RegionId}).all()]
-            if ids:
-                q = q.filter(Unidad.Id.in_(ids))
+
+        filtered = q
+
+        after = decode_cursor(cursor, 2)
+        if after is not None:
+            after_nombre, after_id = after[0], int(after[1])
+            # SQL Server ordena NULL primero en ASC
+            if after_nombre is None:
+                q = q.filter(or_(
+                    and_(Unidad.Nombre.is_(None), Unidad.Id > after_id),
+                    Unidad.Nombre.isnot(None),
+                ))
             else:
-                q = q.filter(False)
-
-        total: int = q.count()
-        items: List[Unidad] = (
-            q.order_by(Unidad.Nombre)
-            .offset((page - 1) * page_size)
-            .limit(page_size)
-            .all()
+                q = q.filter(or_(
+                    Unidad.Nombre > after_nombre,
+                    and_(Unidad.Nombre == after_nombre, Unidad.Id > after_id),
+                ))
+
+        q = q.order_by(Unidad.Nombre, Unidad.Id)
+        if after is None:
+            q = q.offset((page - 1) * page_size)
+        # una fila extra para saber si hay página siguiente
+        rows: List[Unidad] = q.limit(page_size + 1).all()
+        has_more = len(rows) > page_size
+        items = rows[:page_size]
+
+        next_cursor = encode_cursor(items[-1].Nombre, int(items[-1].Id)) if has_more and items else None
+
+        total, total_estimated = page_total(
+            self.db, count, filtered,
+            page=page, page_size=page_size, n_items=len(items), has_more=has_more,
+            keyset=after is not None,
+            table="dbo.Unidades",
+            filtered=any([
+                f.Unidad, f.ServicioId, f.InstitucionId, f.RegionId,
+                getattr(f, "Active", None) is not None,
+            ]),
         )
 
         data = [_map_unidad_to_listdto(u) for u in items]
         pages = (total + page_size - 1) // page_size
         return Page[UnidadListDTO](
             data=data,
-            meta=PageMeta(total=total, page=page, page_size=page_size, pages=pages),
+            meta=PageMeta(
+                total=total,
+                page=page,
+                page_size=page_size,
+                pages=pages,
+                next_cursor=next_cursor,
+                total_estimated=total_estimated,
+            ),
         )
 
     # ---------- Asociados por usuario ----------
@@ -587,7 +612,8 @@ class UnidadService:
             )
             ids = [row[0] for row in self.db.execute(sql, {"user_id": user_id}).all()]
             if ids:
-                q = q.filter(Unidad.Id.in_(ids))
+                t = id_list.load(self.db, ids, _EXPAND_IDS)
+                q = q.filter(Unidad.Id.in_(id_list.select_ids(t)))
             else:
                 return []
 
@@ -629,6 +655,70 @@ class UnidadService:
         ).all()
         return [int(r[0]) for r in rows]
 
+    def _load_links(self, unidad_ids: Iterable[int]) -> Dict[int, dict]:
+        """Inmuebles, pisos y áreas vinculados a N unidades (una sentencia sobre #unidad_ids)."""
+        id_list.load(self.db, unidad_ids, _EXPAND_IDS)
+        return _group_links(self.db.execute(text(_SQL_EXPAND_LINKS)).all())
+
+    def get_many_with_expand(
+        self, unidad_ids: Iterable[int], inmuebles_detalle: bool = False
+    ) -> List[UnidadWithInmueblesDTO]:
+        """
+        Expand de varias unidades con lecturas fijas: Unidades + vínculos
+        (inmuebles/pisos/áreas). Omite IDs inexistentes o inactivos y respeta
+        el orden pedido. InmueblesDetallados solo con inmuebles_detalle=True
+        (InmuebleService.get, una vez por inmueble distinto).
+        """
+        ids = list(dict.fromkeys(int(i) for i in unidad_ids))
+        if not ids:
+            return []
+
+        t = id_list.load(self.db, ids, _EXPAND_IDS)
+        unidades: Dict[int, Unidad] = {}
+        for u in self.db.scalars(select(Unidad).where(Unidad.Id.in_(id_list.select_ids(t)))):
+            if _ACTIVE_NAME and not getattr(u, _ACTIVE_NAME):
+                continue
+            unidades[int(u.Id)] = u
+        if not unidades:
+            return []
+
+        links_by_uid = self._load_links(unidades.keys())
+        empty = {"inmuebles": [], "pisos": [], "areas": []}
+
+        det_cache: Dict[int, Optional[InmuebleDTO]] = {}
+        isvc = InmuebleService(self.db) if inmuebles_detalle else None
+
+        out: List[UnidadWithInmueblesDTO] = []
+        for uid in ids:
+            u = unidades.get(uid)
+            if u is None:
+                continue
+            links = links_by_uid.get(uid, empty)
+            base = _map_unidad_to_dto(u)
+            base.Inmuebles = [InmuebleTopDTO(Id=i, TipoInmueble=0) for i in links["inmuebles"]]
+
+            pisos_out, division = _build_expand(links)
+            base.Pisos = pisos_out
+            base.Areas = [a for p in pisos_out for a in (p.Areas or [])]  # plano, opcional
+
+            det: List[InmuebleDTO] = []
+            if isvc is not None:
+                for iid in links["inmuebles"]:
+                    if iid not in det_cache:
+                        try:
+                            det_cache[iid] = isvc.get(iid)
+                        except Exception:
+                            det_cache[iid] = None
+                    if det_cache[iid]:
+                        det.append(det_cache[iid])
+
+            out.append(UnidadWithInmueblesDTO(
+                **base.model_dump(),
+                InmueblesDetallados=det,
+                Division=division,
+            ))
+        return out
+
     def get_with_expand(self, unidad_id: int) -> UnidadWithInmueblesDTO:
         """
         ✅ Expand REAL:
@@ -638,96 +728,7 @@ class UnidadService:
         - Áreas ligadas a la unidad (con PisoId)
         - InmueblesDetallados (si existen vínculos)
         """
-        base = self.get(unidad_id)  # mantiene tu validación Active + mapping
-
-        # 1) Inmuebles IDs (si aplica)
-        inm_ids = self.list_inmuebles_ids(unidad_id)
-        base.Inmuebles = [InmuebleTopDTO(Id=i, TipoInmueble=0) for i in inm_ids]
-
-        # 2) Division principal
-        div_row = self.db.execute(text(_sql_division_principal()), {"uid": unidad_id}).first()
-        division = None
-        if div_row:
-            division = UnidadDivisionDTO(Id=int(div_row[0]), Origen=str(div_row[1]))
-        # NOTA: si no hay división, queda None
-
-        # 3) Pisos con origen/prio/división (incluye indirectos por áreas)
-        piso_rows = self.db.execute(text(_sql_pisos_origen()), {"uid": unidad_id}).all()
-
-        # Armamos dict por PisoId
-        pisos_map: dict[int, pisoDTO] = {}
-        for r in piso_rows:
-            pid = int(r[0])
-            div_id = int(r[1]) if r[1] is not None else None
-            origen = str(r[2]) if r[2] is not None else None
-            prio = int(r[3]) if r[3] is not None else None
-
-            # si viene repetido, nos quedamos con el de menor prio (pisos=1 gana)
-            if pid in pisos_map and pisos_map[pid].Prio is not None and prio is not None:
-                if prio >= (pisos_map[pid].Prio or 999):
-                    continue
-
-            pisos_map[pid] = pisoDTO(
-                Id=pid,
-                NumeroPisoNombre=None,  # si quieres, luego lo consultamos desde dbo.Pisos
-                Checked=True,
-                DivisionId=div_id,
-                Origen=origen,
-                Prio=prio,
-                Areas=[],
-            )
-
-        # 4) Áreas ligadas a la unidad (con PisoId) y asignarlas al piso
-        area_rows = self.db.execute(text(_sql_areas_by_unidad()), {"uid": unidad_id}).all()
-
-        for r in area_rows:
-            aid = int(r[0])         # AreaId
-            aname = r[1]            # AreaNombre
-            piso_id = int(r[2]) if r[2] is not None else None
-
-            a_dto = AreaDTO(Id=aid, Nombre=aname, PisoId=piso_id)
-
-            # asegura que el piso exista en el mapa (aunque viniera solo por áreas)
-            if piso_id is not None and piso_id not in pisos_map:
-                pisos_map[piso_id] = pisoDTO(
-                    Id=piso_id,
-                    NumeroPisoNombre=None,
-                    Checked=True,
-                    DivisionId=None,
-                    Origen="areas",
-                    Prio=2,
-                    Areas=[],
-                )
-
-            if piso_id is not None:
-                pisos_map[piso_id].Areas.append(a_dto)
-
-        # 5) Ordenar pisos por prio y por Id (estable)
-        pisos_out = sorted(
-            pisos_map.values(),
-            key=lambda x: ((x.Prio or 99), x.Id),
-        )
-
-        # 6) (Opcional) Detalle de inmuebles
-        det: List[InmuebleDTO] = []
-        if inm_ids:
-            isvc = InmuebleService(self.db)
-            for iid in inm_ids:
-                try:
-                    d = isvc.get(iid)
-                    if d:
-                        det.append(d)
-                except Exception:
-                    continue
-
-        # 7) Setear en base (sin “mentir” con vacíos)
-        base.Pisos = pisos_out
-        base.Areas = [a for p in pisos_out for a in (p.Areas or [])]  # plano, opcional
-
-        # 8) Devolver DTO expand
-        return UnidadWithInmueblesDTO(
-            **base.model_dump(),
-            InmueblesDetallados=det,
-            Division=division,
-        )
-
+        res = self.get_many_with_expand([unidad_id], inmuebles_detalle=True)
+        if not res:
+            raise ValueError("Unidad no encontrada o inactiva")
+        return res[0]
@@ -6,6 +6,7 @@ from sqlalchemy import text
 from sqlalchemy.orm import Session
 from fastapi import HTTPException
 
+from app.db import id_list
 from app.db.models.unidad import Unidad
 from app.db.models.area import Area  # asumiendo que existe app.db.models.area.Area
 
@@ -113,10 +114,9 @@ class UnidadesAreasService:
             return {"created": [], "reassigned": [], "not_found": []}
 
         # Verificar cuáles áreas existen
+        t = id_list.load(self.db, areas, "area_ids")
         rows = self.db.execute(
-            text("SELECT Id FROM dbo.Areas WITH (NOLOCK) WHERE Id IN :ids")
-            .bindparams(),
-            {"ids": tuple(areas)},
+            text(f"SELECT Id FROM dbo.Areas WITH (NOLOCK) WHERE Id IN (SELECT Id FROM {t})")
         ).all()
         existentes = {int(r[0]) for r in rows}
         not_found = [a for a in areas if a not in existentes]
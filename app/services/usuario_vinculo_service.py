@@ -8,9 +8,11 @@ from sqlalchemy.orm import Session
 from sqlalchemy import delete, select, distinct
 from fastapi import HTTPException
 
+from app.core import auth_claims, session_store
 from app.schemas.auth import UserPublic
 from app.core.roles import ADMIN  # "ADMINISTRADOR"
 
+from app.db import returning
 from app.db.models.identity import AspNetUser, AspNetRole, AspNetUserRole
 from app.db.models.usuarios_instituciones import UsuarioInstitucion
 from app.db.models.usuarios_divisiones import UsuarioDivision
@@ -102,17 +104,23 @@ class UsuarioVinculoService:
     # ==========================================================
     # Replace sets (sin scope)
     # ==========================================================
+    @staticmethod
+    def _replace_links(db: Session, model, user_id: str, col: str, ids: list[int]) -> list[int]:
+        """
+        DELETE + INSERT ... OUTPUT INSERTED.<col> y commit: retorna lo persistido
+        sin volver a consultar la tabla.
+        """
+        db.execute(delete(model).where(model.UsuarioId == user_id))
+        rows = returning.insert_many(db, model, [{"UsuarioId": user_id, col: i} for i in ids])
+        db.commit()
+        return [r[col] for r in rows]
+
     def set_instituciones(self, db: Session, user_id: str, ids: list[int]) -> list[int]:
         self._ensure_user(db, user_id)
         norm_ids = self._normalize_ids(ids)
         Log.info("set_instituciones user_id=%s raw_ids=%s norm_ids=%s", user_id, ids, norm_ids)
 
-        db.execute(delete(UsuarioInstitucion).where(UsuarioInstitucion.UsuarioId == user_id))
-        for i in norm_ids:
-            db.add(UsuarioInstitucion(UsuarioId=user_id, InstitucionId=i))
-        db.commit()
-
-        final_ids = [r.InstitucionId for r in db.query(UsuarioInstitucion).filter_by(UsuarioId=user_id).all()]
+        final_ids = self._replace_links(db, UsuarioInstitucion, user_id, "InstitucionId", norm_ids)
         Log.info("set_instituciones user_id=%s persisted_ids=%s", user_id, final_ids)
         return final_ids
 
@@ -121,12 +129,7 @@ class UsuarioVinculoService:
         norm_ids = self._normalize_ids(ids)
         Log.info("set_servicios user_id=%s raw_ids=%s norm_ids=%s", user_id, ids, norm_ids)
 
-        db.execute(delete(UsuarioServicio).where(UsuarioServicio.UsuarioId == user_id))
-        for i in norm_ids:
-            db.add(UsuarioServicio(UsuarioId=user_id, ServicioId=i))
-        db.commit()
-
-        final_ids = [r.ServicioId for r in db.query(UsuarioServicio).filter_by(UsuarioId=user_id).all()]
+        final_ids = self._replace_links(db, UsuarioServicio, user_id, "ServicioId", norm_ids)
         Log.info("set_servicios user_id=%s persisted_ids=%s", user_id, final_ids)
         return final_ids
 
@@ -135,36 +138,20 @@ class UsuarioVinculoService:
         norm_ids = self._normalize_ids(ids)
         Log.info("set_divisiones user_id=%s raw_ids=%s norm_ids=%s", user_id, ids, norm_ids)
 
-        db.execute(delete(UsuarioDivision).where(UsuarioDivision.UsuarioId == user_id))
-        for i in norm_ids:
-            db.add(UsuarioDivision(UsuarioId=user_id, DivisionId=i))
-        db.commit()
-
-        final_ids = [r.DivisionId for r in db.query(UsuarioDivision).filter_by(UsuarioId=user_id).all()]
+        final_ids = self._replace_links(db, UsuarioDivision, user_id, "DivisionId", norm_ids)
         Log.info("set_divisiones user_id=%s persisted_ids=%s", user_id, final_ids)
         return final_ids
 
     def set_unidades(self, db: Session, user_id: str, ids: list[int]) -> list[int]:
         """
-        Reemplaza unidades vinculadas y además loguea explícitamente
-        lo que quedó en la tabla inmediatamente después del commit.
+        Reemplaza unidades vinculadas y loguea explícitamente lo que quedó
+        en la tabla (las filas que devolvió el OUTPUT del INSERT).
         """
         self._ensure_user(db, user_id)
         norm_ids = self._normalize_ids(ids)
         Log.info("set_unidades user_id=%s raw_ids=%s norm_ids=%s", user_id, ids, norm_ids)
 
-        db.execute(delete(UsuarioUnidad).where(UsuarioUnidad.UsuarioId == user_id))
-        for i in norm_ids:
-            db.add(UsuarioUnidad(UsuarioId=user_id, UnidadId=i))
-        db.commit()
-
-        rows = db.execute(
-            select(UsuarioUnidad.UsuarioId, UsuarioUnidad.UnidadId)
-            .where(UsuarioUnidad.UsuarioId == user_id)
-        ).all()
-        Log.info("set_unidades user_id=%s rows_after_commit=%s", user_id, rows)
-
-        final_ids = [r.UnidadId for r in db.query(UsuarioUnidad).filter_by(UsuarioId=user_id).all()]
+        final_ids = self._replace_links(db, UsuarioUnidad, user_id, "UnidadId", norm_ids)
         Log.info("set_unidades user_id=%s persisted_ids=%s", user_id, final_ids)
         return final_ids
 
@@ -293,8 +280,10 @@ class UsuarioVinculoService:
         user.Active = bool(active)
         user.UpdatedAt = datetime.utcnow()
         user.ModifiedBy = actor_id
+        auth_claims.bump(db, user_id)   # tokens emitidos antes vuelven a validarse contra BD
+        if not active:
+            session_store.revoke_user(db, user_id)
         db.commit()
-        db.refresh(user)
         Log.info("set_active user_id=%s active=%s actor_id=%s", user_id, active, actor_id)
         return user
 
@@ -381,11 +370,15 @@ class UsuarioVinculoService:
             raise HTTPException(status_code=400, detail=f"Roles no existen: {missing}")
 
         db.execute(delete(AspNetUserRole).where(AspNetUserRole.UserId == user_id))
-        for rid in role_ids:
-            db.add(AspNetUserRole(UserId=user_id, RoleId=rid))
+        inserted = returning.insert_many(
+            db, AspNetUserRole, [{"UserId": user_id, "RoleId": rid} for rid in role_ids]
+        )
+        auth_claims.bump(db, user_id)
         db.commit()
 
-        return self._roles_by_user(db, user_id)
+        # nombres desde la lectura de roles + lo que devolvió el OUTPUT (sin re-consultar)
+        names = {rid: name for rid, name, _ in rows}
+        return sorted(names[r["RoleId"]] for r in inserted)
 
     # ==========================================================
     # ✅ VINCULADOS POR SERVICIO (SCOPED) + ServicioIds (en común)
@@ -0,0 +1,309 @@
+# app/utils/blob_store.py
+"""
+Almacén de archivos direccionado por contenido (SHA-256) con conteo de
+referencias, compartido por documentos y facturas.
+
+- Cada contenido se guarda una sola vez en <root>/blobs/ab/cd/<sha256>; un
+  mismo PDF subido por muchos servicios ocupa un único archivo físico.
+- La escritura reutiliza app.utils.uploads.copy_stream (por bloques, SHA-256
+  al vuelo, temporal + os.replace); si el blob ya existe se descarta el
+  temporal y solo se actualiza su mtime.
+- Base64Reader decodifica base64 por bloques (objeto tipo archivo), sin
+  materializar el payload completo en bytes.
+- dbo.FileBlobs lleva RefCount por (Store, Sha256). acquire()/release() se
+  ejecutan en la misma transacción que la fila que referencia el archivo.
+- collect_garbage() decide "referenciado" también por las columnas *Url de
+  las tablas dueñas (ref_queries): un blob sin fila en dbo.FileBlobs (subido
+  antes de 003 o por un worker sin la tabla) se conserva si alguna fila lo
+  referencia. Sin ref_queries el store no borra nada.
+- Si dbo.FileBlobs no existe, acquire/release no hacen nada y nunca se borra
+  un blob (la deduplicación sigue funcionando).
+
+Las rutas históricas (nombres aleatorios / con timestamp) siguen siendo
+válidas: sha_of() devuelve None para ellas y se tratan como antes.
+
+DDL: app/db/sql/003_file_blobs.sql
+"""
+from __future__ import annotations
+
+import base64
+import logging
+import os
+import re
+import secrets
+import sys
+import time
+from typing import List, Optional, Sequence, Set
+
+from fastapi import UploadFile
+from sqlalchemy import bindparam, text
+
+from app.utils.uploads import CHUNK_SIZE, StoredUpload, _reject_declared_size, copy_stream, run_file_io
+
+Log = logging.getLogger(__name__)
+
+# Periodo mínimo en RefCount = 0 antes de borrar un blob (cubre subidas en curso
+# que encontraron el blob existente y aún no hacen commit de su referencia).
+BLOB_GC_GRACE_SECONDS = int(os.getenv("BLOB_GC_GRACE_SECONDS", str(24 * 3600)))
+
+_SHA_NAME_RE = re.compile(r"^([0-9a-f]{64})(\.[A-Za-z0-9]{1,16})?$")
+_B64_JUNK_RE = re.compile(r"[^A-Za-z0-9+/]")
+
+_AVAILABLE: Optional[bool] = None
+
+
+def refcount_available(db) -> bool:
+    """True si dbo.FileBlobs existe (se consulta una vez por proceso)."""
+    global _AVAILABLE
+    if _AVAILABLE is None:
+        try:
+            row = db.execute(text("SELECT OBJECT_ID(N'dbo.FileBlobs', N'U')")).scalar()
+            _AVAILABLE = row is not None
+        except Exception as ex:
+            Log.warning("BLOBS refcount_available falló: %s", ex)
+            return False
+        Log.info("BLOBS tabla de referencias disponible=%s", _AVAILABLE)
+    return _AVAILABLE
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Decodificación base64 por bloques
+# ─────────────────────────────────────────────────────────────────────────────
+class Base64Reader:
+    """
+    Objeto tipo archivo (read(n)) que decodifica un str base64 por tramos.
+    Igual que base64.b64decode(s) (modo no estricto): ignora caracteres fuera
+    del alfabeto (saltos de línea, espacios) y un prefijo data:...;base64,.
+    """
+
+    def __init__(self, data: str, chunk_chars: int = (CHUNK_SIZE // 3) * 4):
+        if data.startswith("data:"):
+            comma = data.find(",")
+            if comma != -1:
+                data = data[comma + 1:]
+        self._data = data
+        self._pos = 0
+        self._chunk_chars = chunk_chars
+        self._carry = ""
+        self._buf = b""
+        self._done = False
+
+    def _fill(self) -> None:
+        while not self._buf and not self._done:
+            raw = self._data[self._pos:self._pos + self._chunk_chars]
+            self._pos += len(raw)
+            if not raw:
+                self._done = True
+                tail = self._carry
+                self._carry = ""
+                if tail:
+                    # relleno implícito, como b64decode con '=' ya descartado
+                    self._buf = base64.b64decode(tail + "=" * (-len(tail) % 4))
+                return
+            # el '=' solo aparece al final: se descarta y se rellena al cerrar
+            clean = self._carry + _B64_JUNK_RE.sub("", raw)
+            usable = len(clean) - (len(clean) % 4)
+            self._carry = clean[usable:]
+            if usable:
+                self._buf = base64.b64decode(clean[:usable])
+
+    def read(self, n: int = -1) -> bytes:
+        if n is None or n < 0:
+            out = bytearray()
+            while True:
+                self._fill()
+                if not self._buf:
+                    return bytes(out)
+                out += self._buf
+                self._buf = b""
+        self._fill()
+        out, self._buf = self._buf[:n], self._buf[n:]
+        return out
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Store
+# ─────────────────────────────────────────────────────────────────────────────
+class BlobStore:
+    def __init__(self, name: str, root: str, ref_queries: Sequence[str] = ()):
+        """
+        ref_queries: SELECT de una columna con las referencias vigentes
+        (nombres/rutas de archivo) de las tablas que usan este store.
+        """
+        self.name = name
+        self.root = root
+        self.blobs_dir = os.path.join(root, "blobs")
+        self.ref_queries = tuple(ref_queries)
+
+    # ---------- rutas ----------
+    def path_for(self, sha: str) -> str:
+        return os.path.join(self.blobs_dir, sha[:2], sha[2:4], sha)
+
+    @staticmethod
+    def sha_of(ref: Optional[str]) -> Optional[str]:
+        """SHA-256 de una referencia (nombre '<sha>.ext' o ruta de blob); None si es histórica."""
+        if not ref:
+            return None
+        m = _SHA_NAME_RE.match(os.path.basename(ref.replace("\\", "/")))
+        return m.group(1) if m else None
+
+    def resolve(self, ref: Optional[str]) -> Optional[str]:
+        """Ruta física del blob para `ref`, o None si `ref` no es de este store."""
+        sha = self.sha_of(ref)
+        return self.path_for(sha) if sha else None
+
+    # ---------- escritura ----------
+    def put_stream(self, src, max_size: Optional[int] = None, too_large_detail: Optional[str] = None) -> StoredUpload:
+        """Guarda `src` (bloqueante) y devuelve el StoredUpload del blob final."""
+        incoming = os.path.join(self.blobs_dir, ".incoming", secrets.token_hex(16))
+        kwargs = {"too_large_detail": too_large_detail} if too_large_detail else {}
+        tmp = copy_stream(src, incoming, max_size or sys.maxsize, **kwargs)
+
+        final = self.path_for(tmp.sha256)
+        try:
+            if os.path.exists(final):
+                os.remove(tmp.path)
+                os.utime(final)  # protege el blob de un GC concurrente
+            else:
+                os.makedirs(os.path.dirname(final), exist_ok=True)
+                os.replace(tmp.path, final)
+        except BaseException:
+            try:
+                os.remove(tmp.path)
+            except OSError:
+                pass
+            raise
+        return StoredUpload(path=final, size=tmp.size, sha256=tmp.sha256)
+
+    def put_base64(self, b64: str, max_size: Optional[int] = None) -> StoredUpload:
+        return self.put_stream(Base64Reader(b64), max_size)
+
+    def put_upload(self, up: UploadFile, max_size: int, too_large_detail: str) -> StoredUpload:
+        _reject_declared_size(up, max_size, too_large_detail)
+        up.file.seek(0)
+        return self.put_stream(up.file, max_size, too_large_detail)
+
+    async def put_upload_async(self, up: UploadFile, max_size: int, too_large_detail: str) -> StoredUpload:
+        """Igual que put_upload, pero la E/S corre en el executor de archivos."""
+        _reject_declared_size(up, max_size, too_large_detail)
+        up.file.seek(0)
+        return await run_file_io(self.put_stream, up.file, max_size, too_large_detail)
+
+    # ---------- referencias (misma transacción que la fila dueña) ----------
+    def acquire(self, db, ref: Optional[str]) -> None:
+        sha = self.sha_of(ref)
+        if not sha or not refcount_available(db):
+            return
+        try:
+            size = os.path.getsize(self.path_for(sha))
+        except OSError:
+            size = None
+        db.execute(
+            text("""
+                MERGE dbo.FileBlobs WITH (HOLDLOCK) AS t
+                USING (SELECT :store AS Store, :sha AS Sha256) AS s
+                   ON t.Store = s.Store AND t.Sha256 = s.Sha256
+                WHEN MATCHED THEN
+                    UPDATE SET RefCount = t.RefCount + 1, UpdatedAt = SYSUTCDATETIME()
+                WHEN NOT MATCHED THEN
+                    INSERT (Store, Sha256, Size, RefCount, CreatedAt, UpdatedAt)
+                    VALUES (:store, :sha, :size, 1, SYSUTCDATETIME(), SYSUTCDATETIME());
+            """),
+            {"store": self.name, "sha": sha, "size": size},
+        )
+
+    def release(self, db, ref: Optional[str]) -> None:
+        sha = self.sha_of(ref)
+        if not sha or not refcount_available(db):
+            return
+        db.execute(
+            text("""
+                UPDATE dbo.FileBlobs
+                   SET RefCount = CASE WHEN RefCount > 0 THEN RefCount - 1 ELSE 0 END,
+                       UpdatedAt = SYSUTCDATETIME()
+                 WHERE Store = :store AND Sha256 = :sha
+            """),
+            {"store": self.name, "sha": sha},
+        )
+
+    def swap(self, db, old_ref: Optional[str], new_ref: Optional[str]) -> None:
+        """Reemplazo de adjunto: suma la nueva referencia y libera la anterior."""
+        if old_ref == new_ref:
+            return
+        self.acquire(db, new_ref)
+        self.release(db, old_ref)
+
+    # ---------- limpieza ----------
+    def _url_references(self, db) -> Set[str]:
+        """SHA-256 referenciados desde las columnas *Url de las tablas dueñas."""
+        shas: Set[str] = set()
+        for q in self.ref_queries:
+            for (ref,) in db.execute(text(q)):
+                sha = self.sha_of(ref)
+                if sha:
+                    shas.add(sha)
+        return shas
+
+    def collect_garbage(self, db, grace_seconds: int = BLOB_GC_GRACE_SECONDS) -> List[str]:
+        """
+        Borra blobs sin referencias hace más de `grace_seconds`.
+        Referenciado = fila en dbo.FileBlobs con RefCount > 0, o nombre presente
+        en alguna columna *Url de las tablas dueñas (ref_queries). Un blob sin
+        fila pero referenciado por Url se conserva.
+        Primero se eliminan las filas (commit) y luego los archivos; un blob
+        tocado por put_stream dentro del periodo de gracia se conserva.
+        """
+        if not refcount_available(db):
+            return []
+        if not self.ref_queries:
+            Log.warning("BLOBS gc %s sin ref_queries: no se borra nada", self.name)
+            return []
+
+        url_refs = self._url_references(db)
+        zero = [
+            r[0].strip() for r in db.execute(
+                text("""
+                    SELECT Sha256 FROM dbo.FileBlobs
+                     WHERE Store = :store AND RefCount = 0
+                       AND UpdatedAt < DATEADD(SECOND, -:grace, SYSUTCDATETIME())
+                """),
+                {"store": self.name, "grace": int(grace_seconds)},
+            ).all()
+        ]
+        stale = [sha for sha in zero if sha not in url_refs]
+        if len(stale) < len(zero):
+            Log.warning(
+                "BLOBS gc %s: %s blobs con RefCount = 0 siguen referenciados por Url (se conservan)",
+                self.name, len(zero) - len(stale),
+            )
+        delete = text("""
+            DELETE FROM dbo.FileBlobs
+             WHERE Store = :store AND RefCount = 0 AND Sha256 IN :shas
+        """).bindparams(bindparam("shas", expanding=True))
+        for i in range(0, len(stale), 1000):
+            db.execute(delete, {"store": self.name, "shas": stale[i:i + 1000]})
+        db.commit()
+
+        referenced = url_refs | {
+            r[0].strip() for r in db.execute(
+                text("SELECT Sha256 FROM dbo.FileBlobs WITH (NOLOCK) WHERE Store = :store"),
+                {"store": self.name},
+            ).all()
+        }
+
+        removed: List[str] = []
+        cutoff = time.time() - grace_seconds
+        for dirpath, dirnames, filenames in os.walk(self.blobs_dir):
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+            for fn in filenames:
+                if not _SHA_NAME_RE.match(fn) or fn in referenced:
+                    continue
+                path = os.path.join(dirpath, fn)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        removed.append(fn)
+                except OSError as ex:
+                    Log.warning("BLOBS no se pudo borrar %s: %s", path, ex)
+        Log.info("BLOBS gc %s → %s blobs borrados", self.name, len(removed))
+        return removed
@@ -0,0 +1,31 @@
+# app/utils/cursor.py
+"""
+Cursores opacos para paginación keyset: la última clave de orden de la página
+((Nombre, Id), (Id,), ...) se serializa como JSON en base64 url-safe.
+"""
+from __future__ import annotations
+
+import base64
+import json
+from typing import Any, Optional, Tuple
+
+from fastapi import HTTPException
+
+
+def encode_cursor(*values: Any) -> str:
+    raw = json.dumps(list(values), separators=(",", ":"), ensure_ascii=False, default=str)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str], arity: int) -> Optional[Tuple[Any, ...]]:
+    """Tupla con `arity` valores, None si no hay cursor; 400 si es inválido."""
+    if not cursor:
+        return None
+    try:
+        pad = "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(cursor + pad).decode("utf-8"))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    if not isinstance(values, list) or len(values) != arity:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    return tuple(values)
@@ -0,0 +1,21 @@
+# app/utils/id_params.py
+"""
+Listas de IDs en query string para endpoints en lote: acepta ?ids=1,2,3,
+?ids=1&ids=2 o mezclas de ambos.
+"""
+from __future__ import annotations
+
+from typing import Iterable, List
+
+from fastapi import HTTPException
+
+
+def parse_ids(raw_ids: Iterable[str], max_ids: int) -> List[int]:
+    """Enteros en el orden recibido; 400 si alguno no es entero o si son más de `max_ids`."""
+    try:
+        parsed = [int(x) for raw in raw_ids for x in raw.split(",") if x.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids debe ser una lista de enteros")
+    if len(parsed) > max_ids:
+        raise HTTPException(status_code=400, detail=f"Máximo {max_ids} ids por solicitud")
+    return parsed
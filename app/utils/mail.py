@@ -1,7 +1,6 @@
 # app/utils/mail.py
 from __future__ import annotations
-import logging, smtplib
-from email.message import EmailMessage
+import logging
 
 log = logging.getLogger(__name__)
 
@@ -19,39 +18,42 @@ except Exception:
         MAIL_SSL = False
     settings = _S()
 
+RESET_SUBJECT = "Restablecer contraseña"
+
+
+def is_configured() -> bool:
+    """True si hay MAIL_SERVER y MAIL_FROM (si no, los correos solo se loguean)."""
+    return bool(getattr(settings, "MAIL_SERVER", None) and getattr(settings, "MAIL_FROM", None))
+
+
+def _reset_body(reset_link: str) -> str:
+    return (
+        f"Hola,\n\nPara restablecer tu contraseña haz clic en el siguiente enlace:\n{reset_link}\n\n"
+        "Si no solicitaste este cambio, ignora este mensaje."
+    )
+
+
 def send_password_reset_email(to_email: str, reset_link: str) -> None:
     """
+    Encola el correo (app.utils.mail_queue) y retorna de inmediato; el envío,
+    la conexión SMTP reutilizada y los reintentos quedan en el worker.
+    Sin MAIL_SPOOL_PATH se envía en línea por SMTP (sin reintentos).
     Si MAIL_* no está configurado, no falla: solo loguea el enlace.
     """
-    if not getattr(settings, "MAIL_SERVER", None) or not getattr(settings, "MAIL_FROM", None):
+    if not is_configured():
         log.warning(
             "send_password_reset_email(): MAIL_* no configurado. NO se envía correo. "
             "to=%s link=%s", to_email, reset_link
         )
         return
 
-    msg = EmailMessage()
-    msg["Subject"] = "Restablecer contraseña"
-    msg["From"] = settings.MAIL_FROM
-    msg["To"] = to_email
-    msg.set_content(
-        f"Hola,\n\nPara restablecer tu contraseña haz clic en el siguiente enlace:\n{reset_link}\n\n"
-        "Si no solicitaste este cambio, ignora este mensaje."
-    )
-
-    try:
-        if getattr(settings, "MAIL_SSL", False):
-            with smtplib.SMTP_SSL(settings.MAIL_SERVER, int(getattr(settings, "MAIL_PORT", 465))) as s:
-                if getattr(settings, "MAIL_USERNAME", None):
-                    s.login(settings.MAIL_USERNAME, settings.MAIL_PASSWORD)
-                s.send_message(msg)
-        else:
-            with smtplib.SMTP(settings.MAIL_SERVER, int(getattr(settings, "MAIL_PORT", 587))) as s:
-                if getattr(settings, "MAIL_TLS", True):
-                    s.starttls()
-                if getattr(settings, "MAIL_USERNAME", None):
-                    s.login(settings.MAIL_USERNAME, settings.MAIL_PASSWORD)
-                s.send_message(msg)
-        log.info("Correo de reset enviado a %s", to_email)
-    except Exception as e:
-        log.exception("Fallo enviando correo de reset a %s: %s", to_email, e)
+    from app.utils import mail_queue
+    if not mail_queue.is_configured():
+        try:
+            mail_queue.send_now(to_email, RESET_SUBJECT, _reset_body(reset_link))
+            log.info("Correo de reset enviado a %s (envío directo: MAIL_SPOOL_PATH no configurado)", to_email)
+        except Exception as e:
+            log.exception("Fallo enviando correo de reset a %s: %s", to_email, e)
+        return
+    job_id = mail_queue.enqueue(to_email, RESET_SUBJECT, _reset_body(reset_link))
+    log.info("Correo de reset encolado para %s (trabajo %s)", to_email, job_id)
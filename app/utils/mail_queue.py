@@ -0,0 +1,340 @@
+# app/utils/mail_queue.py
+"""
+Cola de correo saliente en segundo plano.
+
+- enqueue() persiste el mensaje en un spool SQLite local (MAIL_SPOOL_PATH) y
+  retorna de inmediato: el endpoint no espera al servidor SMTP.
+- Un hilo worker por proceso toma lotes de trabajos vencidos (MAIL_BATCH_SIZE),
+  reutiliza una conexión SMTP abierta (STARTTLS/login una vez; se cierra tras
+  MAIL_SMTP_IDLE_SECONDS sin uso) y reintenta con backoff exponencial + jitter
+  hasta MAIL_MAX_ATTEMPTS; después el trabajo queda en estado 'dead' (log).
+- Varios workers de uvicorn comparten el spool: cada lote se reclama con un
+  lease (BEGIN IMMEDIATE + locked_until); si un proceso muere a mitad de envío,
+  el trabajo vuelve a estar disponible al vencer el lease.
+- El spool contiene enlaces de reseteo:
+  * MAIL_SPOOL_PATH debe apuntar a un volumen persistente y privado (no
+    /tmp). Sin él no hay cola (is_configured() = False): app.utils.mail
+    envía en línea con send_now(), sin reintentos.
+  * El archivo se crea con O_EXCL y permisos 0600; si ya existe se abre sin
+    seguir enlaces simbólicos (O_NOFOLLOW) y se rechaza si no es un archivo
+    regular del mismo usuario.
+  * Cada trabajo se borra apenas se envía; al quedar 'dead' se le borra el
+    cuerpo (solo quedan destinatario, asunto y error) y los 'dead' con más de
+    MAIL_DEAD_RETENTION_SECONDS se eliminan.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import random
+import smtplib
+import sqlite3
+import stat
+import threading
+import time
+from email.message import EmailMessage
+from typing import Callable, List, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+MAIL_SPOOL_PATH = os.getenv("MAIL_SPOOL_PATH") or None
+MAIL_BATCH_SIZE = int(os.getenv("MAIL_BATCH_SIZE", "20"))
+MAIL_MAX_ATTEMPTS = int(os.getenv("MAIL_MAX_ATTEMPTS", "8"))
+MAIL_RETRY_BASE_SECONDS = float(os.getenv("MAIL_RETRY_BASE_SECONDS", "15"))
+MAIL_RETRY_MAX_SECONDS = float(os.getenv("MAIL_RETRY_MAX_SECONDS", "3600"))
+MAIL_SMTP_IDLE_SECONDS = float(os.getenv("MAIL_SMTP_IDLE_SECONDS", "60"))
+MAIL_POLL_SECONDS = float(os.getenv("MAIL_POLL_SECONDS", "5"))
+MAIL_LEASE_SECONDS = float(os.getenv("MAIL_LEASE_SECONDS", "300"))
+MAIL_DEAD_RETENTION_SECONDS = float(os.getenv("MAIL_DEAD_RETENTION_SECONDS", str(7 * 86400)))
+
+_REDACTED = "[redactado]"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS mail_jobs (
+    id           INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at   REAL    NOT NULL,
+    next_attempt REAL    NOT NULL,
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    status       TEXT    NOT NULL DEFAULT 'pending',   -- pending | dead
+    locked_until REAL    NOT NULL DEFAULT 0,
+    to_addr      TEXT    NOT NULL,
+    subject      TEXT    NOT NULL,
+    body         TEXT    NOT NULL,
+    last_error   TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_mail_jobs_due ON mail_jobs (status, next_attempt);
+"""
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = False
+
+
+def is_configured() -> bool:
+    return bool(MAIL_SPOOL_PATH)
+
+
+def _ensure_spool_file(path: str) -> None:
+    """Crea el spool 0600 (O_EXCL) o valida el existente sin seguir symlinks."""
+    parent = os.path.dirname(path) or "."
+    os.makedirs(parent, mode=0o700, exist_ok=True)
+    nofollow = getattr(os, "O_NOFOLLOW", 0)
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_RDWR | nofollow, 0o600)
+    except FileExistsError:
+        fd = os.open(path, os.O_RDWR | nofollow)   # ELOOP si es un symlink
+    try:
+        st = os.fstat(fd)
+        if not stat.S_ISREG(st.st_mode):
+            raise RuntimeError(f"MAIL_SPOOL_PATH no es un archivo regular: {path}")
+        if hasattr(os, "geteuid") and st.st_uid != os.geteuid():
+            raise RuntimeError(f"MAIL_SPOOL_PATH pertenece a otro usuario: {path}")
+        if st.st_mode & 0o077:
+            os.fchmod(fd, 0o600)
+    finally:
+        os.close(fd)
+
+
+def _conn() -> sqlite3.Connection:
+    """Conexión SQLite por hilo (autocommit; transacciones explícitas)."""
+    global _initialized
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        return conn
+    if not MAIL_SPOOL_PATH:
+        raise RuntimeError("MAIL_SPOOL_PATH no configurado: se requiere una ruta persistente para la cola de correo")
+    with _init_lock:
+        if not _initialized:
+            _ensure_spool_file(MAIL_SPOOL_PATH)
+    conn = sqlite3.connect(MAIL_SPOOL_PATH, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    with _init_lock:
+        if not _initialized:
+            conn.executescript(_SCHEMA)
+            _initialized = True
+    _local.conn = conn
+    return conn
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Encolado
+# ─────────────────────────────────────────────────────────────────────────────
+def enqueue(to_addr: str, subject: str, body: str) -> int:
+    """Persiste el correo en el spool y despierta al worker. Retorna el id del trabajo."""
+    now = time.time()
+    cur = _conn().execute(
+        "INSERT INTO mail_jobs (created_at, next_attempt, to_addr, subject, body) VALUES (?, ?, ?, ?, ?)",
+        (now, now, to_addr, subject, body),
+    )
+    _worker.start()
+    _worker.wake()
+    return int(cur.lastrowid)
+
+
+def _claim_batch(limit: int) -> List[Tuple]:
+    conn = _conn()
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        rows = conn.execute(
+            "SELECT id, attempts, to_addr, subject, body FROM mail_jobs "
+            "WHERE status = 'pending' AND next_attempt <= ? AND locked_until <= ? "
+            "ORDER BY next_attempt LIMIT ?",
+            (now, now, limit),
+        ).fetchall()
+        if rows:
+            conn.executemany(
+                "UPDATE mail_jobs SET locked_until = ? WHERE id = ?",
+                [(now + MAIL_LEASE_SECONDS, r[0]) for r in rows],
+            )
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return rows
+
+
+def _mark_sent(job_id: int) -> None:
+    _conn().execute("DELETE FROM mail_jobs WHERE id = ?", (job_id,))
+
+
+def _mark_failed(job_id: int, attempts: int, error: str) -> None:
+    attempts += 1
+    if attempts >= MAIL_MAX_ATTEMPTS:
+        conn = _conn()
+        conn.execute(
+            "UPDATE mail_jobs SET attempts = ?, status = 'dead', locked_until = 0, last_error = ?, body = ? "
+            "WHERE id = ?",
+            (attempts, error[:1000], _REDACTED, job_id),
+        )
+        conn.execute(
+            "DELETE FROM mail_jobs WHERE status = 'dead' AND created_at < ?",
+            (time.time() - MAIL_DEAD_RETENTION_SECONDS,),
+        )
+        log.error("MAIL trabajo %s descartado tras %s intentos: %s", job_id, attempts, error)
+        return
+    delay = min(MAIL_RETRY_BASE_SECONDS * (2 ** (attempts - 1)), MAIL_RETRY_MAX_SECONDS)
+    delay *= random.uniform(0.8, 1.2)
+    _conn().execute(
+        "UPDATE mail_jobs SET attempts = ?, next_attempt = ?, locked_until = 0, last_error = ? WHERE id = ?",
+        (attempts, time.time() + delay, error[:1000], job_id),
+    )
+    log.warning("MAIL trabajo %s falló (intento %s), reintento en %.0fs: %s", job_id, attempts, delay, error)
+
+
+def stats() -> dict:
+    rows = _conn().execute("SELECT status, COUNT(*) FROM mail_jobs GROUP BY status").fetchall()
+    return {s: int(n) for s, n in rows}
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Conexión SMTP reutilizable
+# ─────────────────────────────────────────────────────────────────────────────
+class SmtpPool:
+    """Una conexión SMTP por worker, abierta bajo demanda y cerrada por inactividad."""
+
+    def __init__(self, settings_getter: Callable[[], object]):
+        self._settings = settings_getter
+        self._smtp: Optional[smtplib.SMTP] = None
+        self._last_used = 0.0
+
+    def _open(self) -> smtplib.SMTP:
+        s = self._settings()
+        host = s.MAIL_SERVER
+        if getattr(s, "MAIL_SSL", False):
+            smtp = smtplib.SMTP_SSL(host, int(getattr(s, "MAIL_PORT", 465) or 465), timeout=30)
+        else:
+            smtp = smtplib.SMTP(host, int(getattr(s, "MAIL_PORT", 587) or 587), timeout=30)
+            if getattr(s, "MAIL_TLS", True):
+                smtp.starttls()
+        if getattr(s, "MAIL_USERNAME", None):
+            smtp.login(s.MAIL_USERNAME, s.MAIL_PASSWORD)
+        return smtp
+
+    def send(self, msg: EmailMessage) -> None:
+        if self._smtp is None:
+            self._smtp = self._open()
+        try:
+            self._smtp.send_message(msg)
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            # la conexión reutilizada pudo caerse: un reintento con conexión nueva
+            self.close()
+            self._smtp = self._open()
+            self._smtp.send_message(msg)
+        self._last_used = time.monotonic()
+
+    def close_if_idle(self) -> None:
+        if self._smtp is not None and time.monotonic() - self._last_used > MAIL_SMTP_IDLE_SECONDS:
+            self.close()
+
+    def close(self) -> None:
+        smtp, self._smtp = self._smtp, None
+        if smtp is None:
+            return
+        try:
+            smtp.quit()
+        except Exception:
+            try:
+                smtp.close()
+            except Exception:
+                pass
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Worker
+# ─────────────────────────────────────────────────────────────────────────────
+def _settings():
+    from app.utils.mail import settings
+    return settings
+
+
+class MailWorker:
+    def __init__(self):
+        self._thread: Optional[threading.Thread] = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._pool = SmtpPool(_settings)
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="mail-worker", daemon=True)
+            self._thread.start()
+            log.info("MAIL worker iniciado (spool=%s)", MAIL_SPOOL_PATH)
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stop.set()
+        self._wake.set()
+        t = self._thread
+        if t is not None:
+            t.join(timeout)
+        self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                sent = self.run_once()
+            except Exception as ex:
+                log.exception("MAIL worker error: %s", ex)
+                sent = 0
+            if sent < MAIL_BATCH_SIZE:
+                self._pool.close_if_idle()
+                self._wake.wait(MAIL_POLL_SECONDS)
+                self._wake.clear()
+        self._pool.close()
+
+    def run_once(self) -> int:
+        """Procesa un lote de trabajos vencidos. Retorna cuántos tomó."""
+        rows = _claim_batch(MAIL_BATCH_SIZE)
+        for job_id, attempts, to_addr, subject, body in rows:
+            if self._stop.is_set():
+                # los no enviados vuelven a quedar disponibles al vencer el lease
+                break
+            msg = build_message(to_addr, subject, body)
+            try:
+                self._pool.send(msg)
+            except Exception as ex:
+                self._pool.close()
+                _mark_failed(job_id, attempts, f"{type(ex).__name__}: {ex}")
+                continue
+            _mark_sent(job_id)
+            log.info("MAIL enviado a %s (trabajo %s)", to_addr, job_id)
+        return len(rows)
+
+
+def send_now(to_addr: str, subject: str, body: str) -> None:
+    """Envío directo sin spool: una conexión SMTP para este mensaje, sin reintentos."""
+    pool = SmtpPool(_settings)
+    try:
+        pool.send(build_message(to_addr, subject, body))
+    finally:
+        pool.close()
+
+
+def build_message(to_addr: str, subject: str, body: str) -> EmailMessage:
+    msg = EmailMessage()
+    msg["Subject"] = subject
+    msg["From"] = _settings().MAIL_FROM
+    msg["To"] = to_addr
+    msg.set_content(body)
+    return msg
+
+
+_worker = MailWorker()
+
+
+def start_worker() -> None:
+    _worker.start()
+
+
+def stop_worker() -> None:
+    _worker.stop()
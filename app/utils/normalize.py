@@ -0,0 +1,104 @@
+# app/utils/normalize.py
+from __future__ import annotations
+
+import re
+import unicodedata
+from typing import List
+
+# Tokens: secuencias alfanuméricas ya plegadas (sin tildes, minúsculas)
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_WS_RE = re.compile(r"\s+")
+
+# Largo máximo de un token indexado (columna NVARCHAR(64) en dbo.SearchTokens)
+MAX_TOKEN_LEN = 64
+
+
+def fold(value: str | None) -> str:
+    """
+    Pliega un texto para búsqueda:
+    - quita tildes/diacríticos ("Valparaíso" -> "valparaiso")
+    - minúsculas
+    - colapsa espacios y recorta extremos
+    """
+    if not value:
+        return ""
+    s = unicodedata.normalize("NFKD", str(value))
+    s = "".join(ch for ch in s if not unicodedata.combining(ch))
+    s = _WS_RE.sub(" ", s.lower()).strip()
+    return s
+
+
+def tokenize(*values: str | None) -> List[str]:
+    """
+    Tokens únicos (en orden de aparición) de uno o más textos ya plegados.
+    "Av. Brasil 1450, Valparaíso" -> ["av", "brasil", "1450", "valparaiso"]
+    """
+    seen: set[str] = set()
+    out: List[str] = []
+    for v in values:
+        for tok in _TOKEN_RE.findall(fold(v)):
+            tok = tok[:MAX_TOKEN_LEN]
+            if tok not in seen:
+                seen.add(tok)
+                out.append(tok)
+    return out
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Claves normalizadas (columnas calculadas *Norm en SQL Server)
+# ─────────────────────────────────────────────────────────────────────────────
+# Mapa de plegado compartido por norm_key() y sql_norm_expr(): la columna
+# persistida y el parámetro de búsqueda se calculan con las mismas reglas.
+NORM_FOLD_MAP = {
+    "á": "a", "à": "a", "â": "a", "ä": "a", "ã": "a",
+    "é": "e", "è": "e", "ê": "e", "ë": "e",
+    "í": "i", "ì": "i", "î": "i", "ï": "i",
+    "ó": "o", "ò": "o", "ô": "o", "ö": "o", "õ": "o",
+    "ú": "u", "ù": "u", "û": "u", "ü": "u",
+    "ñ": "n", "ç": "c",
+}
+_NORM_TABLE = str.maketrans(NORM_FOLD_MAP)
+_NORM_CTRL_WS = ("\t", "\r", "\n")
+_NORM_SPACES_RE = re.compile(r" +")
+
+# Largo de las columnas *Norm (NVARCHAR(400), indexable)
+NORM_MAX_LEN = 400
+
+
+def norm_key(value: str | None) -> str:
+    """
+    Clave normalizada de un texto, idéntica a la columna calculada *Norm:
+    minúsculas, sin tildes, tab/CR/LF como espacio, espacios colapsados,
+    sin espacios en los extremos y truncada a NORM_MAX_LEN.
+    "  Av. Libertador  O'Higgins " -> "av. libertador o'higgins"
+    """
+    if not value:
+        return ""
+    s = str(value).lower().translate(_NORM_TABLE)
+    for ch in _NORM_CTRL_WS:
+        s = s.replace(ch, " ")
+    s = _NORM_SPACES_RE.sub(" ", s).strip(" ")
+    return s[:NORM_MAX_LEN]
+
+
+def norm_prefix(value: str | None) -> str:
+    """Patrón LIKE 'clave%' (sargable) con comodines escapados para ESCAPE '\\'."""
+    k = norm_key(value)
+    k = k.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_").replace("[", "\\[")
+    return f"{k}%"
+
+
+def sql_norm_expr(col_sql: str) -> str:
+    """
+    Expresión T-SQL determinista equivalente a norm_key() sobre `col_sql`
+    (se usa en el DDL de las columnas calculadas PERSISTED).
+    El plegado corre con collation binaria para que REPLACE sea exacto.
+    """
+    e = f"LOWER({col_sql}) COLLATE Latin1_General_100_BIN2"
+    for ch in _NORM_CTRL_WS:
+        e = f"REPLACE({e}, NCHAR({ord(ch)}), N' ')"
+    for src, dst in NORM_FOLD_MAP.items():
+        e = f"REPLACE({e}, N'{src}', N'{dst}')"
+    # Colapso de espacios: ' ' -> ' ·', '· ' -> '', '·' -> '' (marcador NCHAR(1))
+    e = f"REPLACE(REPLACE(REPLACE({e}, N' ', N' ' + NCHAR(1)), NCHAR(1) + N' ', N''), NCHAR(1), N'')"
+    return f"CAST(LTRIM(RTRIM({e})) AS NVARCHAR({NORM_MAX_LEN}))"
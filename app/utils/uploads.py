@@ -0,0 +1,123 @@
+# app/utils/uploads.py
+"""
+Escritura de uploads en disco (posiblemente un share SMB) sin cargar el
+archivo completo en memoria:
+
+- copia por bloques desde UploadFile.file con control de tamaño acumulado
+  (corta apenas se supera el máximo, sin leer el resto);
+- calcula SHA-256 mientras escribe;
+- escribe a un temporal en el mismo directorio y publica con os.replace
+  (atómico: nunca queda un archivo final a medio escribir);
+- la versión async corre en un executor propio y acotado (FILE_IO_WORKERS),
+  así un share lento no consume el threadpool de requests.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Callable, Optional
+
+from fastapi import HTTPException, UploadFile
+
+Log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+FILE_IO_WORKERS = int(os.getenv("FILE_IO_WORKERS", "4"))
+
+_FILE_IO_EXECUTOR = ThreadPoolExecutor(max_workers=FILE_IO_WORKERS, thread_name_prefix="file-io")
+
+
+@dataclass(frozen=True)
+class StoredUpload:
+    path: str
+    size: int
+    sha256: str
+
+
+class UploadTooLarge(HTTPException):
+    def __init__(self, detail: str):
+        super().__init__(status_code=400, detail=detail)
+
+
+def copy_stream(
+    src: BinaryIO,
+    dest_path: str,
+    max_size: int,
+    too_large_detail: str = "El archivo supera el tamaño máximo permitido.",
+    chunk_size: int = CHUNK_SIZE,
+) -> StoredUpload:
+    """
+    Copia `src` a `dest_path` por bloques (bloqueante).
+    Lanza UploadTooLarge (400) apenas se supera `max_size`; el temporal se borra.
+    """
+    dest_dir = os.path.dirname(dest_path) or "."
+    Path(dest_dir).mkdir(parents=True, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(dir=dest_dir, prefix=".upload-", suffix=".part")
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = src.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadTooLarge(too_large_detail)
+                hasher.update(chunk)
+                out.write(chunk)
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp_path, dest_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    return StoredUpload(path=dest_path, size=size, sha256=hasher.hexdigest())
+
+
+def save_upload(up: UploadFile, dest_path: str, max_size: int, too_large_detail: str = "El archivo supera el tamaño máximo permitido.") -> StoredUpload:
+    """Versión síncrona (para servicios llamados desde endpoints def)."""
+    _reject_declared_size(up, max_size, too_large_detail)
+    up.file.seek(0)
+    return copy_stream(up.file, dest_path, max_size, too_large_detail)
+
+
+async def save_upload_async(up: UploadFile, dest_path: str, max_size: int, too_large_detail: str = "El archivo supera el tamaño máximo permitido.") -> StoredUpload:
+    """Igual que save_upload, pero la E/S corre en el executor de archivos."""
+    _reject_declared_size(up, max_size, too_large_detail)
+    up.file.seek(0)
+    return await run_file_io(copy_stream, up.file, dest_path, max_size, too_large_detail)
+
+
+async def run_file_io(fn: Callable, *args):
+    """Ejecuta E/S de archivos bloqueante en el executor dedicado."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_FILE_IO_EXECUTOR, fn, *args)
+
+
+def remove_quietly(path: Optional[str]) -> None:
+    """Borra un archivo recién escrito cuando la transacción de BD falla."""
+    if not path:
+        return
+    try:
+        os.remove(path)
+    except OSError as ex:
+        Log.warning("No se pudo borrar %s: %s", path, ex)
+
+
+def _reject_declared_size(up: UploadFile, max_size: int, detail: str) -> None:
+    # Starlette informa el tamaño ya recibido en el spool; si excede, no copiamos nada
+    size = getattr(up, "size", None)
+    if size is not None and size > max_size:
+        raise UploadTooLarge(detail)